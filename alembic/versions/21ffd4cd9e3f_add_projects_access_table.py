@@ -0,0 +1,73 @@
+"""Add the projects_access table
+
+Revision ID: 21ffd4cd9e3f
+Revises: d43da7281823
+Create Date: 2017-12-21 09:47:12.603418
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '21ffd4cd9e3f'
+down_revision = 'd43da7281823'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    ''' Create the projects_access table and fill it from the owner of the
+    projects, the user_projects and the projects_groups tables.
+    '''
+    op.create_table(
+        'projects_access',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column(
+            'user_id', sa.Integer,
+            sa.ForeignKey(
+                'users.id', onupdate='CASCADE', ondelete='CASCADE'),
+            nullable=False),
+        sa.Column(
+            'project_id', sa.Integer,
+            sa.ForeignKey(
+                'projects.id', onupdate='CASCADE', ondelete='CASCADE'),
+            nullable=False),
+        sa.Column(
+            'group_id', sa.Integer,
+            sa.ForeignKey(
+                'pagure_group.id', onupdate='CASCADE', ondelete='CASCADE'),
+            nullable=True),
+        sa.Column('access', sa.String(255), nullable=False),
+    )
+    op.create_index(
+        'projects_access_user_id_access_idx', 'projects_access',
+        ['user_id', 'access'])
+    op.create_index(
+        'ix_projects_access_project_id', 'projects_access', ['project_id'])
+
+    op.execute('''
+INSERT INTO projects_access (user_id, project_id, group_id, access)
+SELECT user_id, id, NULL, 'owner' FROM projects
+UNION
+SELECT user_id, project_id, NULL, access FROM user_projects
+UNION
+SELECT pagure_group.user_id, projects_groups.project_id,
+       projects_groups.group_id, projects_groups.access
+FROM projects_groups
+JOIN pagure_group ON pagure_group.id = projects_groups.group_id
+WHERE pagure_group.group_type = 'user'
+UNION
+SELECT pagure_user_group.user_id, projects_groups.project_id,
+       projects_groups.group_id, projects_groups.access
+FROM projects_groups
+JOIN pagure_group ON pagure_group.id = projects_groups.group_id
+JOIN pagure_user_group ON pagure_user_group.group_id = pagure_group.id
+WHERE pagure_group.group_type = 'user'
+''')
+
+
+def downgrade():
+    ''' Drop the projects_access table.
+    '''
+    op.drop_index('ix_projects_access_project_id', 'projects_access')
+    op.drop_index('projects_access_user_id_access_idx', 'projects_access')
+    op.drop_table('projects_access')
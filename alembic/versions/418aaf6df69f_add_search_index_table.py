@@ -0,0 +1,117 @@
+"""Add the search_index table
+
+Revision ID: 418aaf6df69f
+Revises: 21ffd4cd9e3f
+Create Date: 2017-12-22 11:02:45.317094
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '418aaf6df69f'
+down_revision = '21ffd4cd9e3f'
+
+import collections
+
+from alembic import op
+import sqlalchemy as sa
+
+
+PG_INDEX = '''
+CREATE INDEX search_index_document_idx ON search_index USING gin ((
+    setweight(to_tsvector('english'::regconfig, title), 'A') ||
+    setweight(to_tsvector('english'::regconfig, content), 'B')
+))
+'''
+
+# Kind of tickets -> (table, content column, comment table, column linking
+# the comments to the ticket)
+KINDS = {
+    'issue': (
+        'issues', 'content', 'issue_comments', 'issue_uid'),
+    'pull_request': (
+        'pull_requests', 'initial_comment', 'pull_request_comments',
+        'pull_request_uid'),
+}
+
+
+def upgrade():
+    ''' Create the search_index table, its full-text index and fill it
+    with the issues and pull-requests and their comments.
+    '''
+    op.create_table(
+        'search_index',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column(
+            'project_id', sa.Integer,
+            sa.ForeignKey(
+                'projects.id', onupdate='CASCADE', ondelete='CASCADE'),
+            nullable=False),
+        sa.Column('kind', sa.String(32), nullable=False),
+        sa.Column('ticket_uid', sa.String(32), nullable=False),
+        sa.Column('title', sa.Text, nullable=False),
+        sa.Column('content', sa.Text, nullable=False),
+        sa.UniqueConstraint(
+            'kind', 'ticket_uid', name='search_index_kind_ticket_uid_key'),
+    )
+    op.create_index(
+        'ix_search_index_project_id', 'search_index', ['project_id'])
+
+    conn = op.get_bind()
+    dialect = conn.dialect.name
+    if dialect == 'postgresql':
+        op.execute(PG_INDEX)
+
+    table = sa.table(
+        'search_index',
+        sa.column('project_id'),
+        sa.column('kind'),
+        sa.column('ticket_uid'),
+        sa.column('title'),
+        sa.column('content'),
+    )
+    for kind, (tickets, content, comments, ticket_uid) in KINDS.items():
+        texts = collections.defaultdict(list)
+        query = sa.text(
+            'SELECT %s, comment FROM %s WHERE notification = :false '
+            'ORDER BY id' % (ticket_uid, comments))
+        for uid, comment in conn.execute(query, false=False):
+            texts[uid].append(comment)
+
+        query = sa.text('SELECT uid, project_id, title, %s FROM %s' % (
+            content, tickets))
+        rows = [
+            {
+                'project_id': project_id,
+                'kind': kind,
+                'ticket_uid': uid,
+                'title': title or '',
+                'content': '\n\n'.join([text or ''] + texts[uid]),
+            }
+            for uid, project_id, title, text in conn.execute(query)
+        ]
+        if rows:
+            op.bulk_insert(table, rows)
+
+    if dialect == 'sqlite':
+        try:
+            op.execute(
+                'CREATE VIRTUAL TABLE search_index_fts '
+                'USING fts5(title, content)')
+        except sa.exc.OperationalError:
+            # FTS5 is not available, pagure will search using LIKE
+            pass
+        else:
+            op.execute(
+                'INSERT INTO search_index_fts (rowid, title, content) '
+                'SELECT id, title, content FROM search_index')
+
+
+def downgrade():
+    ''' Drop the search_index table and its full-text index.
+    '''
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS search_index_fts')
+    elif op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX search_index_document_idx')
+    op.drop_index('ix_search_index_project_id', 'search_index')
+    op.drop_table('search_index')
@@ -0,0 +1,41 @@
+"""Add the merge_status cache key to the pull_requests table
+
+Revision ID: d43da7281823
+Revises: 46df6466b8fa
+Create Date: 2017-12-20 10:14:32.118902
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd43da7281823'
+down_revision = '46df6466b8fa'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    ''' Add the columns merge_status_commit, merge_status_target and
+    merge_conflicts to the table pull_requests.
+    '''
+    op.add_column(
+        'pull_requests',
+        sa.Column('merge_status_commit', sa.Text, nullable=True)
+    )
+    op.add_column(
+        'pull_requests',
+        sa.Column('merge_status_target', sa.Text, nullable=True)
+    )
+    op.add_column(
+        'pull_requests',
+        sa.Column('merge_conflicts', sa.Text, nullable=True)
+    )
+
+
+def downgrade():
+    ''' Remove the columns merge_status_commit, merge_status_target and
+    merge_conflicts from the table pull_requests.
+    '''
+    op.drop_column('pull_requests', 'merge_conflicts')
+    op.drop_column('pull_requests', 'merge_status_target')
+    op.drop_column('pull_requests', 'merge_status_commit')
@@ -159,6 +159,17 @@ pagure-logcom contains the service that logs commits into the database so that
 the activity calendar heatmap is filled.
 
 
+%package            hookrunner
+Summary:            The hook runner service for pagure
+BuildArch:          noarch
+
+BuildRequires:      systemd-devel
+%{?systemd_requires}
+%description        hookrunner
+pagure-hookrunner contains the service running the git hooks of the projects
+without starting a new process loading pagure for every hook.
+
+
 %package            loadjson
 Summary:            The loadjson service for pagure
 BuildArch:          noarch
@@ -262,6 +273,13 @@ install -p -m 755 pagure-loadjson/pagure_loadjson_server.py \
 install -p -m 644 pagure-loadjson/pagure_loadjson.service \
     $RPM_BUILD_ROOT/%{_unitdir}/pagure_loadjson.service
 
+# Install the hookrunner service
+mkdir -p $RPM_BUILD_ROOT/%{_libexecdir}/pagure-hookrunner
+install -p -m 755 pagure-hookrunner/pagure_hookrunner_server.py \
+    $RPM_BUILD_ROOT/%{_libexecdir}/pagure-hookrunner/pagure_hookrunner_server.py
+install -p -m 644 pagure-hookrunner/pagure_hookrunner.service \
+    $RPM_BUILD_ROOT/%{_unitdir}/pagure_hookrunner.service
+
 
 %post
 %systemd_post pagure_worker.service
@@ -277,6 +295,8 @@ install -p -m 644 pagure-loadjson/pagure_loadjson.service \
 %systemd_post pagure_logcom.service
 %post loadjson
 %systemd_post pagure_loadjson.service
+%post hookrunner
+%systemd_post pagure_hookrunner.service
 
 %preun
 %systemd_post pagure_worker.service
@@ -292,6 +312,8 @@ install -p -m 644 pagure-loadjson/pagure_loadjson.service \
 %systemd_preun pagure_logcom.service
 %preun loadjson
 %systemd_preun pagure_loadjson.service
+%preun hookrunner
+%systemd_preun pagure_hookrunner.service
 
 %postun
 %systemd_post pagure_worker.service
@@ -307,6 +329,8 @@ install -p -m 644 pagure-loadjson/pagure_loadjson.service \
 %systemd_postun_with_restart pagure_logcom.service
 %postun loadjson
 %systemd_postun_with_restart pagure_loadjson.service
+%postun hookrunner
+%systemd_postun_with_restart pagure_hookrunner.service
 
 
 %files
@@ -365,6 +389,12 @@ install -p -m 644 pagure-loadjson/pagure_loadjson.service \
 %{_unitdir}/pagure_loadjson.service
 
 
+%files hookrunner
+%license LICENSE
+%{_libexecdir}/pagure-hookrunner/
+%{_unitdir}/pagure_hookrunner.service
+
+
 %changelog
 * Thu Dec 21 2017 Pierre-Yves Chibon <pingou@pingoured.fr> - 3.13.2-1
 - Update to 3.13.2
@@ -8,8 +8,8 @@
    Pierre-Yves Chibon <pingou@pingoured.fr>
 
 
-This server listens to message sent via redis and send the corresponding
-web-hook request.
+This server processes the messages queued in redis and triggers the
+corresponding CI builds.
 
 Using this mechanism, we no longer block the main application if the
 receiving end is offline or so.
@@ -17,14 +17,10 @@ receiving end is offline or so.
 """
 
 from __future__ import print_function
-import json
 import logging
 import os
 import requests
 
-import trollius
-import trollius_redis
-
 
 _log = logging.getLogger(__name__)
 
@@ -36,40 +32,32 @@ if 'PAGURE_CONFIG' not in os.environ \
 
 import pagure
 import pagure.lib
+import pagure.lib.work_queue
 
 
-@trollius.coroutine
-def handle_messages():
-    ''' Handles connecting to redis and acting upon messages received.
-    In this case, it means triggering a build on jenkins based on the
-    information provided.
-    '''
+def message_key(data):
+    """ Return the key of a message, the messages about the same pull-request
+    are processed together. """
+    return data['pr']['uid']
 
-    host = pagure.APP.config.get('REDIS_HOST', '0.0.0.0')
-    port = pagure.APP.config.get('REDIS_PORT', 6379)
-    dbname = pagure.APP.config.get('REDIS_DB', 0)
-    connection = yield trollius.From(trollius_redis.Connection.create(
-        host=host, port=port, db=dbname))
 
-    # Create subscriber.
-    subscriber = yield trollius.From(connection.start_subscribe())
-
-    # Subscribe to channel.
-    yield trollius.From(subscriber.subscribe(['pagure.ci']))
+def handle_messages(messages):
+    ''' Acts upon messages received from the queue.
+    In this case, it means triggering a build on jenkins based on the
+    information provided.
 
-    # Inside a while loop, wait for incoming events.
-    while True:
-        reply = yield trollius.From(subscriber.next_published())
-        _log.info(
-            'Received: %s on channel: %s',
-            repr(reply.value), reply.channel)
-        data = json.loads(reply.value)
-
-        pr_id = data['pr']['id']
-        pr_uid = data['pr']['uid']
-        branch = data['pr']['branch_from']
-        _log.info('Looking for PR: %s', pr_uid)
-        session = pagure.lib.create_session(pagure.APP.config['DB_URL'])
+    The messages given all concern the same pull-request (see
+    ``message_key``), a single build is triggered for them.
+    '''
+    data = messages[-1]
+    _log.info('Received %s messages about: %s', len(messages), repr(data))
+
+    pr_id = data['pr']['id']
+    pr_uid = data['pr']['uid']
+    branch = data['pr']['branch_from']
+    _log.info('Looking for PR: %s', pr_uid)
+    session = pagure.lib.create_session(pagure.APP.config['DB_URL'])
+    try:
         request = pagure.lib.get_request_by_uid(session, pr_uid)
 
         _log.info('PR retrieved: %s', request)
@@ -77,8 +65,7 @@ def handle_messages():
         if not request:
             _log.warning(
                 'No request could be found from the message %s', data)
-            session.close()
-            continue
+            return
 
         _log.info(
             "Trigger on %s PR #%s from %s: %s",
@@ -109,28 +96,21 @@ def handle_messages():
                 _log.debug('Request timed-out: %s' % err)
         else:
             _log.warning('Un-supported CI type')
-
-        session.close()
-        _log.info('Ready for another')
+    finally:
+        session.remove()
+    _log.info('Ready for another')
 
 
 def main():
-    ''' Start the main async loop. '''
+    ''' Process the messages of the queue until interrupted. '''
 
     try:
-        loop = trollius.get_event_loop()
-        tasks = [
-            trollius.async(handle_messages()),
-        ]
-        loop.run_until_complete(trollius.wait(tasks))
-        loop.run_forever()
+        pagure.lib.work_queue.run_workers(
+            pagure.lib.work_queue.CI, 'pagure-ci', handle_messages,
+            key=message_key)
     except KeyboardInterrupt:
         pass
-    except trollius.ConnectionResetError:
-        pass
 
-    _log.info("End Connection")
-    loop.close()
     _log.info("End")
 
 
@@ -145,11 +125,6 @@ if __name__ == '__main__':
     shellhandler = logging.StreamHandler()
     shellhandler.setLevel(logging.DEBUG)
 
-    aslog = logging.getLogger("asyncio")
-    aslog.setLevel(logging.DEBUG)
-    aslog = logging.getLogger("trollius")
-    aslog.setLevel(logging.DEBUG)
-
     shellhandler.setFormatter(formatter)
     _log.addHandler(shellhandler)
     main()
@@ -19,12 +19,16 @@ nc localhost 8080
 
 """
 
+import collections
+import json
 import logging
 import os
+import threading
+import time
 import urlparse
 
-import redis
 import trollius
+import trollius_redis
 
 log = logging.getLogger(__name__)
 
@@ -40,10 +44,125 @@ import pagure.lib  # noqa: E402
 from pagure.exceptions import PagureEvException  # noqa: E402
 
 SERVER = None
-POOL = redis.ConnectionPool(
-    host=pagure.APP.config['REDIS_HOST'],
-    port=pagure.APP.config['REDIS_PORT'],
-    db=pagure.APP.config['REDIS_DB'])
+
+# Number of seconds between two pings sent to a client
+PING_INTERVAL = 5
+# Number of seconds the object a path points to is cached
+CACHE_TTL = 60
+# Maximum number of paths cached
+CACHE_SIZE = 10000
+
+
+class Clients(object):
+    """ The clients connected to the server, grouped by the uid of the
+    object (ticket or pull-request) they follow. """
+
+    def __init__(self):
+        # uid -> set of StreamWriter
+        self.channels = collections.defaultdict(set)
+
+    def add(self, uid, client):
+        self.channels[uid].add(client)
+
+    def remove(self, uid, client):
+        clients = self.channels.get(uid)
+        if clients is None:
+            return
+        clients.discard(client)
+        if not clients:
+            del self.channels[uid]
+
+    def get(self, uid):
+        return list(self.channels.get(uid, ()))
+
+    def __len__(self):
+        return sum(len(clients) for clients in self.channels.values())
+
+    def stats(self):
+        """ Return the number of clients connected for each uid. """
+        return dict(
+            (uid, len(clients)) for uid, clients in self.channels.items())
+
+
+class TimerWheel(object):
+    """ A timer wheel sending pings to the clients: the clients are spread
+    over one slot per second and, every second, the clients of the next
+    slot are pinged. Each client is thus pinged every ``len(slots)``
+    seconds without having one timer per client.
+    """
+
+    def __init__(self, nslots):
+        self.slots = [set() for _ in range(nslots)]
+        self.position = 0
+        # client -> index of its slot
+        self._index = {}
+
+    def add(self, client):
+        # Put the client in the slot which will be handled last
+        idx = (self.position - 1) % len(self.slots)
+        self.slots[idx].add(client)
+        self._index[client] = idx
+
+    def remove(self, client):
+        idx = self._index.pop(client, None)
+        if idx is not None:
+            self.slots[idx].discard(client)
+
+    def tick(self):
+        """ Move to the next slot and return its clients. """
+        clients = list(self.slots[self.position])
+        self.position = (self.position + 1) % len(self.slots)
+        return clients
+
+
+class ObjectResolver(object):
+    """ Resolve the path requested by a client into the uid of the object
+    (ticket or pull-request) to follow, caching the result (including
+    failures) for ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, size=CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        # path -> (expiration time, uid, error)
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, path):
+        try:
+            return (get_obj_from_path(path).uid, None)
+        except PagureEvException as err:
+            return (None, err.message)
+        finally:
+            pagure.SESSION.remove()
+
+    def resolve(self, path):
+        """ Return the uid of the object the specified path points to.
+
+        :raises PagureEvException: if the path is invalid or points to an
+            object that cannot be followed.
+
+        """
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(path)
+        if cached is None or cached[0] < now:
+            uid, error = self._lookup(path)
+            cached = (now + self.ttl, uid, error)
+            with self._lock:
+                self._cache.pop(path, None)
+                self._cache[path] = cached
+                while len(self._cache) > self.size:
+                    self._cache.popitem(last=False)
+
+        if cached[2] is not None:
+            raise PagureEvException(cached[2])
+        return cached[1]
+
+
+CLIENTS = Clients()
+WHEEL = TimerWheel(PING_INTERVAL)
+RESOLVER = ObjectResolver()
 
 
 def _get_issue(repo, objid):
@@ -193,8 +312,11 @@ def handle_client(client_reader, client_writer):
 
     url = urlparse.urlsplit(data[1])
 
+    loop = trollius.get_event_loop()
     try:
-        obj = get_obj_from_path(url.path)
+        # Do not block the other clients while querying the database
+        uid = yield trollius.From(loop.run_in_executor(
+            None, RESOLVER.resolve, url.path))
     except PagureEvException as err:
         log.warning(err.message)
         return
@@ -211,31 +333,15 @@ def handle_client(client_reader, client_writer):
         "Access-Control-Allow-Origin: %s\n\n" % origin
     ).encode())
 
-
-    conn = redis.Redis(connection_pool=POOL)
-    subscriber = conn.pubsub(ignore_subscribe_messages=True)
-
+    CLIENTS.add(uid, client_writer)
+    WHEEL.add(client_writer)
     try:
-        subscriber.subscribe('pagure.%s' % obj.uid)
-
-        # Inside a while loop, wait for incoming events.
-        oncall = 0
+        # The messages and pings are sent by dispatch_messages and
+        # send_pings, we just wait for the client to leave.
         while True:
-            msg = subscriber.get_message()
-            if msg is None:
-                # Send a ping to see if the client is still alive
-                if oncall >= 5:
-                    # Only send a ping once every 5 seconds
-                    client_writer.write(('event: ping\n\n').encode())
-                    oncall = 0
-                oncall += 1
-                yield trollius.From(client_writer.drain())
-                yield trollius.From(trollius.sleep(1))
-            else:
-                log.info("Sending %s", msg['data'])
-                client_writer.write(('data: %s\n\n' % msg['data']).encode())
-                yield trollius.From(client_writer.drain())
-
+            data = yield trollius.From(client_reader.read(1024))
+            if not data:
+                break
     except OSError:
         log.info("Client closed connection")
     except trollius.ConnectionResetError as err:
@@ -246,20 +352,65 @@ def handle_client(client_reader, client_writer):
     finally:
         # Wathever happens, close the connection.
         log.info("Client left. Goodbye!")
-        subscriber.close()
+        CLIENTS.remove(uid, client_writer)
+        WHEEL.remove(client_writer)
         client_writer.close()
 
 
+def _send(client, message):
+    """ Send the specified message to the specified client. """
+    try:
+        client.write(message)
+    except Exception:
+        log.exception("ERROR: Could not write to client")
+        client.close()
+
+
+@trollius.coroutine
+def dispatch_messages():
+    """ Subscribe to all the channels of pagure in redis and forward the
+    messages received to the clients following them. """
+    host = pagure.APP.config.get('REDIS_HOST', '0.0.0.0')
+    port = pagure.APP.config.get('REDIS_PORT', 6379)
+    dbname = pagure.APP.config.get('REDIS_DB', 0)
+    connection = yield trollius.From(trollius_redis.Connection.create(
+        host=host, port=port, db=dbname))
+
+    subscriber = yield trollius.From(connection.start_subscribe())
+    yield trollius.From(subscriber.psubscribe(['pagure.*']))
+
+    while True:
+        reply = yield trollius.From(subscriber.next_published())
+        uid = reply.channel[len('pagure.'):]
+        clients = CLIENTS.get(uid)
+        if not clients:
+            continue
+        log.info("Sending %s to %s clients", reply.value, len(clients))
+        message = ('data: %s\n\n' % reply.value).encode('utf-8')
+        for client in clients:
+            _send(client, message)
+
+
+def send_pings():
+    """ Ping the clients of the current slot of the timer wheel to see if
+    they are still alive, then schedule the next run in one second. """
+    for client in WHEEL.tick():
+        _send(client, ('event: ping\n\n').encode())
+    trollius.get_event_loop().call_later(1, send_pings)
+
+
 @trollius.coroutine
 def stats(client_reader, client_writer):
 
     try:
-        log.info('Clients: %s', SERVER.active_count)
+        log.info('Clients: %s', len(CLIENTS))
         client_writer.write((
             "HTTP/1.0 200 OK\n"
             "Cache: nocache\n\n"
         ).encode())
-        client_writer.write(('data: %s\n\n' % SERVER.active_count).encode())
+        client_writer.write(('data: %s\n\n' % len(CLIENTS)).encode())
+        client_writer.write(
+            ('data: %s\n\n' % json.dumps(CLIENTS.stats())).encode())
         yield trollius.From(client_writer.drain())
 
     except trollius.ConnectionResetError as err:
@@ -282,6 +433,8 @@ def main():
         SERVER = loop.run_until_complete(coro)
         log.info(
             'Serving server at {}'.format(SERVER.sockets[0].getsockname()))
+        trollius.async(dispatch_messages())
+        loop.call_later(1, send_pings)
         if pagure.APP.config.get('EV_STATS_PORT'):
             stats_coro = trollius.start_server(
                 stats,
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+
+This server runs the git hooks of the projects on behalf of the
+``post-receive`` and ``pre-receive`` dispatchers, which forward them over a
+UNIX socket.
+
+Using this mechanism, we no longer start a python process importing pagure
+(so creating the application and connecting to the database) for every
+hook of every push.
+
+"""
+
+from __future__ import print_function
+import errno
+import logging
+import os
+import signal
+import socket
+import stat
+import sys
+
+
+_log = logging.getLogger(__name__)
+
+if 'PAGURE_CONFIG' not in os.environ \
+        and os.path.exists('/etc/pagure/pagure.cfg'):
+    print('Using configuration file `/etc/pagure/pagure.cfg`')
+    os.environ['PAGURE_CONFIG'] = '/etc/pagure/pagure.cfg'
+
+
+import pagure
+import pagure.lib
+import pagure.lib.hook_runner
+
+
+def serve(server):
+    ''' Run the hooks requested over the connections accepted on the
+    specified socket, one at a time. This does not return. '''
+    while True:
+        try:
+            conn, _ = server.accept()
+        except socket.error as err:
+            if err.errno == errno.EINTR:
+                continue
+            raise
+        try:
+            pagure.lib.hook_runner.handle(conn)
+        except Exception:
+            _log.exception('Could not run the hooks')
+        finally:
+            conn.close()
+
+
+def spawn(server):
+    ''' Start a worker process and return its pid. '''
+    pid = os.fork()
+    if pid:
+        return pid
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        serve(server)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os._exit(0)
+
+
+def bind(path):
+    ''' Return a socket listening on the specified path, only the user
+    running the server can connect to it. '''
+    try:
+        os.unlink(path)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o077)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(umask)
+    os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+    server.listen(128)
+    return server
+
+
+def main():
+    ''' Start the workers and start new ones if they die. '''
+    path = pagure.APP.config.get(
+        'HOOKRUNNER_SOCKET', '/var/run/pagure-hookrunner/hookrunner.sock')
+
+    # Load what the hooks use before starting the workers, so they share it
+    pagure.lib.hook_runner.warm_up()
+    server = bind(path)
+    _log.info('Listening on %s', path)
+
+    def terminate(signum, frame):
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGTERM, terminate)
+
+    workers = set()
+    try:
+        for _ in range(pagure.APP.config.get('HOOKRUNNER_WORKERS', 4)):
+            workers.add(spawn(server))
+        while True:
+            pid, status = os.wait()
+            if pid not in workers:
+                continue
+            workers.discard(pid)
+            _log.warning(
+                'Worker %s exited with status %s, starting a new one',
+                pid, status)
+            workers.add(spawn(server))
+    except KeyboardInterrupt:
+        pass
+
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+    server.close()
+    os.unlink(path)
+    _log.info("End")
+
+
+if __name__ == '__main__':
+    formatter = logging.Formatter(
+        "%(asctime)s %(levelname)s [%(module)s:%(lineno)d] %(message)s")
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    # setup console logging
+    _log.setLevel(logging.DEBUG)
+    shellhandler = logging.StreamHandler()
+    shellhandler.setLevel(logging.DEBUG)
+
+    shellhandler.setFormatter(formatter)
+    _log.addHandler(shellhandler)
+    sys.exit(main())
@@ -22,10 +22,9 @@ from __future__ import print_function
 import json
 import logging
 import os
+import time
 import traceback
 import inspect
-import trollius
-import trollius_redis
 
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -40,7 +39,17 @@ if 'PAGURE_CONFIG' not in os.environ \
 import pagure
 import pagure.exceptions
 import pagure.lib
+import pagure.lib.git
 import pagure.lib.notify
+import pagure.lib.work_queue
+
+
+# The connection to redis, to record which files were loaded
+REDIS = None
+# The files loaded, by project, are recorded for a day to resume the loads
+# which were interrupted, when the messages are processed again
+CHECKPOINT_KEY = 'pagure.loadjson.%s'
+CHECKPOINT_TTL = 24 * 3600
 
 
 def format_callstack():
@@ -65,33 +74,56 @@ def get_files_to_load(title, new_commits_list, abspath):
 
     _log.info('%s: Retrieve the list of files changed' % title)
     file_list = []
-    new_commits_list.reverse()
-    n = len(new_commits_list)
-    for idx, commit in enumerate(new_commits_list):
-        if (idx % 100) == 0:
-            _log.info(
-                'Loading files change in commits for %s: %s/%s',
-                title, idx, n)
-        if commit == new_commits_list[0]:
-            filenames = pagure.lib.git.read_git_lines(
-                ['diff-tree', '--no-commit-id', '--name-only', '-r', '--root',
-                    commit], abspath)
-        else:
-            filenames = pagure.lib.git.read_git_lines(
-                ['diff-tree', '--no-commit-id', '--name-only', '-r', commit],
-                abspath)
-        for line in filenames:
-            if line.strip():
-                file_list.append(line.strip())
-
-    return file_list
-
-
-@trollius.coroutine
-def handle_messages():
-    ''' Handles connecting to redis and acting upon messages received.
+    for path in pagure.lib.git.get_changed_paths(abspath, new_commits_list):
+        if path.strip():
+            file_list.append(path.strip())
+
+    return sorted(file_list)
+
+
+def get_checkpoint(project):
+    """ Return the files of the specified project recently loaded in the
+    database, as a dict of the identifier of the blob loaded keyed by their
+    path. """
+    if REDIS is None:
+        return {}
+    loaded = {}
+    for path, blob_id in REDIS.hgetall(
+            CHECKPOINT_KEY % project.fullname).items():
+        loaded[path.decode('utf-8')] = blob_id.decode('utf-8')
+    return loaded
+
+
+def save_checkpoint(project, loaded):
+    """ Record that the specified files were loaded in the database, so they
+    are not loaded again if the messages are processed anew. """
+    if REDIS is None or not loaded:
+        return
+    key = CHECKPOINT_KEY % project.fullname
+    pipe = REDIS.pipeline()
+    pipe.hmset(key, loaded)
+    pipe.expire(key, CHECKPOINT_TTL)
+    pipe.execute()
+
+
+def message_key(data):
+    """ Return the key of a message, the messages loading the same type of
+    data in the same project for the same user are processed together. """
+    project = data['project']
+    username = project['user']['name'] if project['parent'] else None
+    return (
+        project['name'], project['namespace'], username, data['data_type'],
+        data['agent'])
+
+
+def handle_messages(messages):
+    ''' Acts upon messages received from the queue.
     In this case, it means logging into the DB the commits specified in the
-    message for the specified repo.
+    messages for the specified repo.
+
+    The messages given all concern the same project, type of data and agent
+    (see ``message_key``): the files changed by all their commits are loaded
+    once and a single report is sent.
 
     The currently accepted message format looks like:
 
@@ -117,54 +149,35 @@ def handle_messages():
         }
 
     '''
-
-    host = pagure.APP.config.get('REDIS_HOST', '0.0.0.0')
-    port = pagure.APP.config.get('REDIS_PORT', 6379)
-    dbname = pagure.APP.config.get('REDIS_DB', 0)
-    connection = yield trollius.From(trollius_redis.Connection.create(
-        host=host, port=port, db=dbname))
-
-    # Create subscriber.
-    subscriber = yield trollius.From(connection.start_subscribe())
-
-    # Subscribe to channel.
-    yield trollius.From(subscriber.subscribe(['pagure.loadjson']))
-
-    # Inside a while loop, wait for incoming events.
-    while True:
-        reply = yield trollius.From(subscriber.next_published())
-        _log.info(
-            'Received: %s on channel: %s',
-            repr(reply.value), reply.channel)
-        _log.info('Loading the json')
-        data = json.loads(reply.value)
-        _log.info('Done: loading the json')
-
-        commits = data['commits']
-        abspath = data['abspath']
-        repo = data['project']['name']
-        username = data['project']['user']['name'] \
-            if data['project']['parent'] else None
-        namespace = data['project']['namespace']
-        data_type = data['data_type']
-        agent = data['agent']
-
-        if data_type not in ['ticket', 'pull-request']:
-            _log.info('Invalid data_type retrieved: %s', data_type)
-            continue
-
-        session = pagure.lib.create_session(pagure.APP.config['DB_URL'])
-
+    data = messages[-1]
+    _log.info('Received %s messages about: %s', len(messages), repr(data))
+
+    # The commits are listed from the most recent one, so are those of the
+    # most recent pushes
+    commits = []
+    for message in reversed(messages):
+        for commit in message['commits']:
+            if commit not in commits:
+                commits.append(commit)
+    abspath = data['abspath']
+    repo, namespace, username, data_type, agent = message_key(data)
+
+    if data_type not in ['ticket', 'pull-request']:
+        _log.info('Invalid data_type retrieved: %s', data_type)
+        return
+
+    session = pagure.lib.create_session(pagure.APP.config['DB_URL'])
+    try:
         _log.info('Looking for project: %s%s of user: %s',
-                 '%s/' % namespace if namespace else '',
-                 repo, username)
+                  '%s/' % namespace if namespace else '',
+                  repo, username)
         project = pagure.lib._get_project(
             session, repo, user=username, namespace=namespace,
             case=pagure.APP.config.get('CASE_SENSITIVE', False))
 
         if not project:
             _log.info('No project found')
-            continue
+            return
 
         _log.info('Found project: %s', project.fullname)
 
@@ -172,90 +185,108 @@ def handle_messages():
             '%s: Processing %s commits in %s', project.fullname,
             len(commits), abspath)
 
-        file_list = set(get_files_to_load(project.fullname, commits, abspath))
+        file_list = get_files_to_load(project.fullname, commits, abspath)
         n = len(file_list)
         _log.info('%s files to process' % n)
-        mail_body = []
 
-        for idx, filename in enumerate(file_list):
+        loaded = get_checkpoint(project)
+        if loaded:
             _log.info(
-                'Loading: %s: %s -- %s/%s', project.fullname, filename,
-                idx+1, n)
-            tmp = 'Loading: %s -- %s/%s' % (filename, idx+1, n)
-            json_data = None
-            data = ''.join(
-                pagure.lib.git.read_git_lines(
-                    ['show', 'HEAD:%s' % filename], abspath))
-            if data and not filename.startswith('files/'):
-                try:
-                    json_data = json.loads(data)
-                except ValueError:
-                    pass
-            if json_data:
-                try:
-                    if data_type == 'ticket':
-                        pagure.lib.git.update_ticket_from_git(
-                            session,
-                            reponame=repo,
-                            namespace=namespace,
-                            username=username,
-                            issue_uid=filename,
-                            json_data=json_data,
-                            agent=agent,
-                        )
-                        tmp += ' ... ... Done'
-                except Exception as err:
-                    _log.info('data: %s', json_data)
-                    session.rollback()
-                    _log.exception(err)
-                    tmp += ' ... ... FAILED\n'
-                    tmp += format_callstack()
-                    break
-                finally:
-                    mail_body.append(tmp)
-            else:
-                tmp += ' ... ... SKIPPED - No JSON data'
-                mail_body.append(tmp)
+                '%s: Resuming the load, %s files already loaded',
+                project.fullname, len(loaded))
+
+        # The status of the files processed and the blob identifier of
+        # those to load
+        status = {}
+        blob_ids = {}
+
+        def _tickets():
+            """ Yield the (uid, json_data) of the tickets to load. """
+            blobs = pagure.lib.git.read_blobs(abspath, file_list)
+            for filename, blob_id, data in blobs:
+                if blob_id is not None and loaded.get(filename) == blob_id:
+                    status[filename] = 'SKIPPED - Already loaded'
+                    continue
+                json_data = None
+                if data and not filename.startswith('files/'):
+                    try:
+                        json_data = json.loads(data)
+                    except ValueError:
+                        pass
+                if not json_data:
+                    status[filename] = 'SKIPPED - No JSON data'
+                    continue
+                blob_ids[filename] = blob_id
+                yield filename, json_data
+
+        if data_type == 'ticket':
+            start = time.time()
+            batches = pagure.lib.git.update_tickets_from_git(
+                session,
+                reponame=repo,
+                namespace=namespace,
+                username=username,
+                tickets=_tickets(),
+                agent=agent,
+                batch_size=pagure.APP.config.get('LOADJSON_BATCH_SIZE', 100),
+            )
+            for batch in batches:
+                checkpoint = {}
+                for filename, err in batch:
+                    if err is None:
+                        status[filename] = 'Done'
+                        checkpoint[filename] = blob_ids[filename]
+                    else:
+                        status[filename] = 'FAILED\n' + format_callstack()
+                save_checkpoint(project, checkpoint)
+                _log.info(
+                    'Loading: %s -- %s/%s files processed (%.1f files/s)',
+                    project.fullname, len(status), n,
+                    len(status) / max(time.time() - start, 0.001))
 
+        mail_body = []
+        for idx, filename in enumerate(file_list):
+            tmp = 'Loading: %s -- %s/%s' % (filename, idx + 1, n)
+            if filename in status:
+                tmp += ' ... ... %s' % status[filename]
+            mail_body.append(tmp)
+            if status.get(filename, '').startswith('FAILED'):
+                break
+
+        session.commit()
+        _log.info(
+            'Emailing results for %s to %s', project.fullname, agent)
         try:
-            session.commit()
-            _log.info(
-                'Emailing results for %s to %s', project.fullname, agent)
-            try:
-                if not agent:
-                    raise pagure.exceptions.PagureException(
-                        'No agent found: %s' % agent)
-                user_obj = pagure.lib.get_user(session, agent)
-                pagure.lib.notify.send_email(
-                    '\n'.join(mail_body),
-                    'Issue import report',
-                    user_obj.default_email)
-            except pagure.exceptions.PagureException as err:
-                _log.exception('Could not find user %s' % agent)
-        except SQLAlchemyError as err:  # pragma: no cover
-            session.rollback()
-        finally:
-            session.close()
-        _log.info('Ready for another')
+            if not agent:
+                raise pagure.exceptions.PagureException(
+                    'No agent found: %s' % agent)
+            user_obj = pagure.lib.get_user(session, agent)
+            pagure.lib.notify.send_email(
+                '\n'.join(mail_body),
+                'Issue import report',
+                user_obj.default_email)
+        except pagure.exceptions.PagureException:
+            _log.exception('Could not find user %s' % agent)
+    except SQLAlchemyError:  # pragma: no cover
+        session.rollback()
+        raise
+    finally:
+        session.remove()
+    _log.info('Ready for another')
 
 
 def main():
-    ''' Start the main async loop. '''
+    ''' Process the messages of the queue until interrupted. '''
+    global REDIS
+    REDIS = pagure.lib.work_queue.get_redis()
 
     try:
-        loop = trollius.get_event_loop()
-        tasks = [
-            trollius.async(handle_messages()),
-        ]
-        loop.run_until_complete(trollius.wait(tasks))
-        loop.run_forever()
+        pagure.lib.work_queue.run_workers(
+            pagure.lib.work_queue.LOADJSON, 'pagure-loadjson',
+            handle_messages, key=message_key)
     except KeyboardInterrupt:
         pass
-    except trollius.ConnectionResetError:
-        pass
 
-    _log.info("End Connection")
-    loop.close()
     _log.info("End")
 
 
@@ -270,11 +301,6 @@ if __name__ == '__main__':
     shellhandler = logging.StreamHandler()
     shellhandler.setLevel(logging.DEBUG)
 
-    aslog = logging.getLogger("asyncio")
-    aslog.setLevel(logging.DEBUG)
-    aslog = logging.getLogger("trollius")
-    aslog.setLevel(logging.DEBUG)
-
     # Turn down the logs coming from python-markdown
     mklog = logging.getLogger("MARKDOWN")
     mklog.setLevel(logging.WARN)
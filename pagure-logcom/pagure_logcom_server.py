@@ -8,7 +8,7 @@
    Pierre-Yves Chibon <pingou@pingoured.fr>
 
 
-This server listens to message sent via redis post commits and log the
+This server processes the messages queued in redis post commits and log the
 user's activity in the database.
 
 Using this mechanism, we no longer need to block the git push until all the
@@ -18,14 +18,10 @@ time can be really time-consuming).
 """
 
 from __future__ import print_function
-import json
 import logging
 import os
 from sqlalchemy.exc import SQLAlchemyError
 
-import trollius
-import trollius_redis
-
 
 _log = logging.getLogger(__name__)
 
@@ -37,13 +33,24 @@ if 'PAGURE_CONFIG' not in os.environ \
 
 import pagure
 import pagure.lib
+import pagure.lib.work_queue
+
+
+def message_key(data):
+    """ Return the key of a message, the messages about the same branch of
+    the same project are processed together. """
+    project = data['project']
+    username = project['user']['name'] if project['parent'] else None
+    return (project['name'], project['namespace'], username, data['branch'])
 
 
-@trollius.coroutine
-def handle_messages():
-    ''' Handles connecting to redis and acting upon messages received.
+def handle_messages(messages):
+    ''' Acts upon messages received from the queue.
     In this case, it means logging into the DB the commits specified in the
-    message for the default repo or sending commit notification emails.
+    messages for the default repo or sending commit notification emails.
+
+    The messages given all concern the same branch of the same project (see
+    ``message_key``), their commits are processed together.
 
     The currently accepted message format looks like:
 
@@ -69,48 +76,31 @@ def handle_messages():
         }
 
     '''
-
-    host = pagure.APP.config.get('REDIS_HOST', '0.0.0.0')
-    port = pagure.APP.config.get('REDIS_PORT', 6379)
-    dbname = pagure.APP.config.get('REDIS_DB', 0)
-    connection = yield trollius.From(trollius_redis.Connection.create(
-        host=host, port=port, db=dbname))
-
-    # Create subscriber.
-    subscriber = yield trollius.From(connection.start_subscribe())
-
-    # Subscribe to channel.
-    yield trollius.From(subscriber.subscribe(['pagure.logcom']))
-
-    # Inside a while loop, wait for incoming events.
-    while True:
-        reply = yield trollius.From(subscriber.next_published())
-        _log.info(
-            'Received: %s on channel: %s',
-            repr(reply.value), reply.channel)
-        data = json.loads(reply.value)
-
-        commits = data['commits']
-        abspath = data['abspath']
-        branch = data['branch']
-        default_branch = data['default_branch']
-        repo = data['project']['name']
-        username = data['project']['user']['name'] \
-            if data['project']['parent'] else None
-        namespace = data['project']['namespace']
-
-        session = pagure.lib.create_session(pagure.APP.config['DB_URL'])
-
+    data = messages[-1]
+    _log.info('Received %s messages about: %s', len(messages), repr(data))
+
+    commits = []
+    for message in messages:
+        for commit in message['commits']:
+            if commit not in commits:
+                commits.append(commit)
+    abspath = data['abspath']
+    branch = data['branch']
+    default_branch = data['default_branch']
+    repo, namespace, username, _ = message_key(data)
+
+    session = pagure.lib.create_session(pagure.APP.config['DB_URL'])
+    try:
         _log.info('Looking for project: %s%s of %s',
-                 '%s/' % namespace if namespace else '',
-                 repo, username)
+                  '%s/' % namespace if namespace else '',
+                  repo, username)
         project = pagure.lib._get_project(
-            pagure.SESSION, repo, user=username, namespace=namespace,
+            session, repo, user=username, namespace=namespace,
             case=pagure.APP.config.get('CASE_SENSITIVE', False))
 
         if not project:
             _log.info('No project found')
-            continue
+            return
 
         _log.info('Found project: %s', project.fullname)
 
@@ -125,32 +115,25 @@ def handle_messages():
         pagure.lib.notify.notify_new_commits(
             abspath, project, branch, commits)
 
-        try:
-            session.commit()
-        except SQLAlchemyError as err:  # pragma: no cover
-            session.rollback()
-        finally:
-            session.close()
-        _log.info('Ready for another')
+        session.commit()
+    except SQLAlchemyError:  # pragma: no cover
+        session.rollback()
+        raise
+    finally:
+        session.remove()
+    _log.info('Ready for another')
 
 
 def main():
-    ''' Start the main async loop. '''
+    ''' Process the messages of the queue until interrupted. '''
 
     try:
-        loop = trollius.get_event_loop()
-        tasks = [
-            trollius.async(handle_messages()),
-        ]
-        loop.run_until_complete(trollius.wait(tasks))
-        loop.run_forever()
+        pagure.lib.work_queue.run_workers(
+            pagure.lib.work_queue.LOGCOM, 'pagure-logcom',
+            handle_messages, key=message_key)
     except KeyboardInterrupt:
         pass
-    except trollius.ConnectionResetError:
-        pass
 
-    _log.info("End Connection")
-    loop.close()
     _log.info("End")
 
 
@@ -165,11 +148,6 @@ if __name__ == '__main__':
     shellhandler = logging.StreamHandler()
     shellhandler.setLevel(logging.DEBUG)
 
-    aslog = logging.getLogger("asyncio")
-    aslog.setLevel(logging.DEBUG)
-    aslog = logging.getLogger("trollius")
-    aslog.setLevel(logging.DEBUG)
-
     shellhandler.setFormatter(formatter)
     _log.addHandler(shellhandler)
     main()
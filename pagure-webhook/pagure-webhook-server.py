@@ -7,8 +7,8 @@
    Pierre-Yves Chibon <pingou@pingoured.fr>
 
 
-This server listens to message sent via redis and send the corresponding
-web-hook request.
+This server processes the notifications queued in redis and send the
+corresponding web-hook requests.
 
 Using this mechanism, we no longer block the main application if the
 receiving end is offline or so.
@@ -16,22 +16,15 @@ receiving end is offline or so.
 """
 
 from __future__ import print_function
-import datetime
-import hashlib
-import hmac
-import json
+import concurrent.futures
 import logging
 import os
-import requests
+import socket
 import time
-import uuid
 
-import six
 import trollius
 import trollius_redis
 
-from kitchen.text.converters import to_bytes
-
 
 log = logging.getLogger(__name__)
 
@@ -44,68 +37,164 @@ if 'PAGURE_CONFIG' not in os.environ \
 
 import pagure
 import pagure.lib
-from pagure.exceptions import PagureEvException
-
-_i = 0
-
-
-def call_web_hooks(project, topic, msg, urls):
-    ''' Sends the web-hook notification. '''
-    log.info(
-        "Processing project: %s - topic: %s", project.fullname, topic)
-    log.debug('msg: %s', msg)
-
-    # Send web-hooks notification
-    global _i
-    _i += 1
-    year = datetime.datetime.now().year
-    if isinstance(topic, six.text_type):
-        topic = to_bytes(topic, encoding='utf8', nonstring="passthru")
-    msg['pagure_instance'] = pagure.APP.config['APP_URL']
-    msg['project_fullname'] = project.fullname
-    msg = dict(
-        topic=topic.decode('utf-8'),
-        msg=msg,
-        timestamp=int(time.time()),
-        msg_id=str(year) + '-' + str(uuid.uuid4()),
-        i=_i,
-    )
-
-    content = json.dumps(msg)
-    hashhex = hmac.new(
-        str(project.hook_token), content, hashlib.sha1).hexdigest()
-    hashhex256 = hmac.new(
-        str(project.hook_token), content, hashlib.sha256).hexdigest()
-    headers = {
-        'X-Pagure': pagure.APP.config['APP_URL'],
-        'X-Pagure-project': project.fullname,
-        'X-Pagure-Signature': hashhex,
-        'X-Pagure-Signature-256': hashhex256,
-        'X-Pagure-Topic': topic,
-        'Content-Type': 'application/json',
-    }
-    for url in urls:
-        url = url.strip()
-        log.info('Calling url %s' % url)
+import pagure.lib.webhook
+import pagure.lib.work_queue
+from pagure.lib.webhook import DELIVERED, FAILED
+
+# Maximum number of notifications waiting to be sent to an endpoint, the
+# next ones are kept for later
+QUEUE_SIZE = 100
+# Interval, in seconds, at which the delivery metrics are logged
+METRICS_INTERVAL = 60
+
+SESSION = None
+HOOKS = None
+DISPATCHER = None
+CONSUMER = None
+
+
+def _load_hooks(fullname):
+    """ Return the web-hook settings of the specified project, this is ran
+    in a worker thread. """
+    try:
+        return pagure.lib.webhook.get_hooks(SESSION, fullname)
+    finally:
+        SESSION.remove()
+
+
+class Entries(object):
+    """ Entries of the queue whose deliveries are not all settled yet: sent,
+    rejected or stored to be retried. """
+
+    def __init__(self, ids, count):
+        self.ids = ids
+        self.count = count
+
+
+class Dispatcher(object):
+    """ Send the notifications to the endpoints via a pool of worker
+    threads.
+
+    Each endpoint has its own queue of notifications, which are sent one at
+    a time, so a slow endpoint does not delay the others.
+
+    The entries of the queue the notifications come from are acknowledged
+    once all their deliveries are settled, so the deliveries queued in
+    memory or being sent when the server stops are sent again once it
+    restarts.
+    """
+
+    def __init__(self, loop, executor, retries, metrics, consumer):
+        self.loop = loop
+        self.executor = executor
+        self.retries = retries
+        self.metrics = metrics
+        self.consumer = consumer
+        self.queues = {}
+        self.breakers = {}
+
+    @trollius.coroutine
+    def ack(self, ids):
+        """ Acknowledge the specified entries of the queue. """
         try:
-            req = requests.post(
-                url,
-                headers=headers,
-                data=content,
-                timeout=60,
+            yield trollius.From(
+                self.loop.run_in_executor(None, self.consumer.ack, ids))
+        except Exception:
+            log.exception('ERROR: Could not acknowledge %s', ids)
+
+    def settled(self, entries):
+        """ Record that one of the deliveries of the specified entries is
+        settled, and acknowledge them if it was the last one. """
+        if entries is None:
+            # A retry, its entries were acknowledged already
+            return
+        entries.count -= 1
+        if not entries.count:
+            trollius.async(self.ack(entries.ids), loop=self.loop)
+
+    def submit(self, delivery, entries=None):
+        """ Queue the specified delivery.
+
+        :arg delivery: the delivery to send, see
+            ``pagure.lib.webhook.new_delivery``
+        :kwarg entries: the Entries of the queue the delivery comes from,
+            None for a retry
+
+        """
+        url = delivery['url']
+        queue = self.queues.get(url)
+        if queue is None:
+            queue = self.queues[url] = trollius.Queue(
+                maxsize=QUEUE_SIZE, loop=self.loop)
+            self.breakers[url] = pagure.lib.webhook.CircuitBreaker(
+                threshold=pagure.APP.config.get(
+                    'WEBHOOK_BREAKER_THRESHOLD', 5),
+                cooldown=pagure.APP.config.get(
+                    'WEBHOOK_BREAKER_COOLDOWN', 300),
             )
-            if not req:
-                log.info(
-                    'An error occured while querying: %s - '
-                    'Error code: %s' % (url, req.status_code))
-        except (requests.exceptions.RequestException, Exception) as err:
+            trollius.async(self.process(url, queue), loop=self.loop)
+
+        try:
+            queue.put_nowait((delivery, entries))
+        except trollius.QueueFull:
+            log.info('Too many notifications pending for %s', url)
+            self.retries.add(
+                delivery, time.time() + pagure.lib.webhook.retry_delay(1))
+            self.settled(entries)
+
+    def retry(self, delivery):
+        """ Keep the specified delivery to be retried later, unless it was
+        attempted too many times already. """
+        if delivery['attempt'] >= pagure.APP.config.get(
+                'WEBHOOK_MAX_ATTEMPTS', 5):
             log.info(
-                'An error occured while querying: %s - Error: %s' % (
-                    url, err))
+                'Giving up on notifying %s after %s attempts',
+                delivery['url'], delivery['attempt'])
+            return
+        self.retries.add(
+            delivery,
+            time.time() + pagure.lib.webhook.retry_delay(delivery['attempt']))
+
+    @trollius.coroutine
+    def process(self, url, queue):
+        """ Send the notifications queued for the specified endpoint. """
+        breaker = self.breakers[url]
+        timeout = pagure.APP.config.get('WEBHOOK_TIMEOUT', 60)
+        while True:
+            delivery, entries = yield trollius.From(queue.get())
+            if not breaker.allow():
+                # The endpoint keeps failing, try again once it had time
+                # to recover
+                self.retries.add(delivery, breaker.opened_until)
+                self.settled(entries)
+                continue
+
+            start = time.time()
+            try:
+                outcome = yield trollius.From(self.loop.run_in_executor(
+                    self.executor, pagure.lib.webhook.deliver,
+                    delivery, timeout))
+            except Exception:
+                log.exception('ERROR: Exception while notifying %s', url)
+                outcome = FAILED
+            self.metrics.record(url, outcome, time.time() - start)
+
+            delivery['attempt'] += 1
+            if outcome == FAILED:
+                breaker.record_failure()
+                self.retry(delivery)
+            else:
+                breaker.record_success()
+                if outcome == DELIVERED and delivery['attempt'] > 1:
+                    log.info(
+                        'Notified %s after %s attempts', url,
+                        delivery['attempt'])
+            self.settled(entries)
 
 
 @trollius.coroutine
-def handle_messages():
+def handle_invalidations():
+    """ Forget the web-hook settings of the projects which changed. """
     host = pagure.APP.config.get('REDIS_HOST', '0.0.0.0')
     port = pagure.APP.config.get('REDIS_PORT', 6379)
     dbname = pagure.APP.config.get('REDIS_DB', 0)
@@ -116,7 +205,8 @@ def handle_messages():
     subscriber = yield trollius.From(connection.start_subscribe())
 
     # Subscribe to channel.
-    yield trollius.From(subscriber.subscribe(['pagure.hook']))
+    yield trollius.From(subscriber.subscribe(
+        [pagure.lib.webhook.INVALIDATE_CHANNEL]))
 
     # Inside a while loop, wait for incoming events.
     while True:
@@ -124,45 +214,121 @@ def handle_messages():
         log.info(
             'Received: %s on channel: %s',
             repr(reply.value), reply.channel)
-        data = json.loads(reply.value)
-        username = None
-        if data['project'].startswith('forks'):
-            username, projectname = data['project'].split('/', 2)[1:]
-        else:
-            projectname = data['project']
+        HOOKS.invalidate(reply.value)
 
-        namespace = None
-        if '/' in projectname:
-            namespace, projectname = projectname.split('/', 1)
 
-        log.info(
-            'Searching %s/%s/%s' % (username, namespace, projectname))
-        session = pagure.lib.create_session(pagure.APP.config['DB_URL'])
-        project = pagure.lib._get_project(
-            session=session, name=projectname, user=username,
-            namespace=namespace,
-            case=pagure.APP.config.get('CASE_SENSITIVE', False))
-        if not project:
-            log.info('No project found with these criteria')
-            session.close()
-            continue
-        urls = project.settings.get('Web-hooks')
-        session.close()
-        if not urls:
-            log.info('No URLs set: %s' % urls)
+@trollius.coroutine
+def handle_messages(consumer):
+    """ Read the notifications from the queue and dispatch them to the
+    web-hooks of their project. """
+    loop = trollius.get_event_loop()
+    # The queue is read in a worker thread, not to block the deliveries
+    yield trollius.From(loop.run_in_executor(None, consumer.setup))
+    while True:
+        try:
+            messages = yield trollius.From(
+                loop.run_in_executor(None, consumer.read))
+        except Exception:
+            log.exception('ERROR: Could not read the notifications')
+            yield trollius.From(trollius.sleep(1))
             continue
-        urls = urls.split('\n')
-        log.info('Got the project, going to the webhooks')
-        call_web_hooks(project, data['topic'], data['msg'], urls)
+
+        for batch in pagure.lib.work_queue.group_messages(
+                messages, key=lambda data: data['project']):
+            fullname = batch[0][1]['project']
+            log.info('Received %s notifications for %s', len(batch), fullname)
+            start = time.time()
+            try:
+                # Do not block the deliveries while querying the database
+                hooks = yield trollius.From(loop.run_in_executor(
+                    None, HOOKS.get, fullname))
+            except Exception:
+                log.exception('ERROR: Could not retrieve %s', fullname)
+                yield trollius.From(
+                    loop.run_in_executor(None, consumer.fail, batch))
+                consumer.stats.record(
+                    len(batch), time.time() - start, failed=True)
+                continue
+
+            deliveries = []
+            if not hooks:
+                log.info('No project found with these criteria')
+            elif not hooks['urls']:
+                log.info('No URLs set: %s' % hooks['urls'])
+            else:
+                log.info('Got the project, going to the webhooks')
+                for _, data in batch:
+                    content, headers = pagure.lib.webhook.build_request(
+                        hooks, data['topic'], data['msg'])
+                    for url in hooks['urls']:
+                        deliveries.append(pagure.lib.webhook.new_delivery(
+                            url, content, headers))
+
+            ids = [entry_id for entry_id, _ in batch]
+            if deliveries:
+                # The entries are acknowledged once their deliveries are
+                # sent or stored to be retried
+                entries = Entries(ids, len(deliveries))
+                for delivery in deliveries:
+                    DISPATCHER.submit(delivery, entries)
+            else:
+                yield trollius.From(DISPATCHER.ack(ids))
+            consumer.stats.record(len(batch), time.time() - start)
+
+
+def retry_deliveries():
+    """ Queue the deliveries to retry by now, then schedule the next run in
+    one second. """
+    try:
+        for delivery in DISPATCHER.retries.pop_due():
+            DISPATCHER.submit(delivery)
+    except Exception:
+        log.exception('ERROR: Could not retrieve the deliveries to retry')
+    trollius.get_event_loop().call_later(1, retry_deliveries)
+
+
+def report_metrics():
+    """ Log and store the delivery metrics, then schedule the next run. """
+    try:
+        report = DISPATCHER.metrics.publish(pagure.lib.REDIS)
+        for url, stats in sorted(report.items()):
+            log.info(
+                'Endpoint %s - delivered: %s, rejected: %s, failed: %s, '
+                'latency avg: %.3fs, max: %.3fs', url, stats['delivered'],
+                stats['rejected'], stats['failed'], stats['latency_avg'],
+                stats['latency_max'])
+        log.info('Deliveries to retry: %s', len(DISPATCHER.retries))
+        pagure.lib.work_queue.report_metrics(
+            CONSUMER.redis, CONSUMER.stream, CONSUMER.group, CONSUMER.stats)
+    except Exception:
+        log.exception('ERROR: Could not report the metrics')
+    trollius.get_event_loop().call_later(METRICS_INTERVAL, report_metrics)
 
 
 def main():
-    server = None
+    global SESSION, HOOKS, DISPATCHER, CONSUMER
+
+    SESSION = pagure.lib.create_session(pagure.APP.config['DB_URL'])
+    HOOKS = pagure.lib.webhook.HooksCache(_load_hooks)
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=pagure.APP.config.get('WEBHOOK_WORKERS', 10))
+
     try:
         loop = trollius.get_event_loop()
+        CONSUMER = pagure.lib.work_queue.Consumer(
+            pagure.lib.work_queue.get_redis(),
+            pagure.lib.work_queue.WEBHOOK, 'pagure-webhook',
+            socket.gethostname())
+        DISPATCHER = Dispatcher(
+            loop, executor,
+            pagure.lib.webhook.RetryStore(pagure.lib.REDIS),
+            pagure.lib.webhook.Metrics(), CONSUMER)
         tasks = [
-            trollius.async(handle_messages()),
+            trollius.async(handle_invalidations()),
+            trollius.async(handle_messages(CONSUMER)),
         ]
+        loop.call_later(1, retry_deliveries)
+        loop.call_later(METRICS_INTERVAL, report_metrics)
         loop.run_until_complete(trollius.wait(tasks))
         loop.run_forever()
     except KeyboardInterrupt:
@@ -171,6 +337,7 @@ def main():
         pass
 
     log.info("End Connection")
+    executor.shutdown(wait=False)
     loop.close()
     log.info("End")
 
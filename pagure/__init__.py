@@ -17,7 +17,6 @@ __api_version__ = '0.22'
 
 
 import datetime  # noqa: E402
-import gc  # noqa: E402
 import logging  # noqa: E402
 import logging.config  # noqa: E402
 import os  # noqa: E402
@@ -40,11 +39,13 @@ else:
     perfrepo = None
 
 import pagure.exceptions  # noqa: E402
+import pagure.request_globals  # noqa: E402
 
 logging.basicConfig()
 
 # Create the application.
 APP = MultiStaticFlask('pagure')
+APP.app_ctx_globals_class = pagure.request_globals.LazyGlobals
 
 if perfrepo:
     # Do this as early as possible.
@@ -98,6 +99,7 @@ import pagure.doc_utils  # noqa: E402
 import pagure.forms  # noqa: E402
 import pagure.lib  # noqa: E402
 import pagure.lib.git  # noqa: E402
+import pagure.lib.repo  # noqa: E402
 import pagure.login_forms  # noqa: E402
 import pagure.mail_logging  # noqa: E402
 import pagure.proxy  # noqa: E402
@@ -225,10 +227,13 @@ if APP.config.get('PAGURE_AUTH', None) == 'oidc':
             )
 
 SESSION = pagure.lib.create_session(APP.config['DB_URL'])
+REPO_POOL = pagure.lib.repo.RepositoryPool(
+    size=APP.config.get('REPO_POOL_SIZE', 32))
 REDIS = None
 if APP.config['EVENTSOURCE_SOURCE'] \
         or APP.config['WEBHOOK'] \
-        or APP.config.get('PAGURE_CI_SERVICES'):
+        or APP.config.get('PAGURE_CI_SERVICES') \
+        or APP.config.get('GIT_METADATA_BATCH_DELAY'):
     pagure.lib.set_redis(
         host=APP.config['REDIS_HOST'],
         port=APP.config['REDIS_PORT'],
@@ -351,14 +356,7 @@ def is_repo_admin(repo_obj):
     if is_admin():
         return True
 
-    usergrps = [
-        usr.user
-        for grp in repo_obj.admin_groups
-        for usr in grp.users]
-
-    return user == repo_obj.user.user or (
-        user in [usr.user for usr in repo_obj.admins]
-    ) or (user in usergrps)
+    return pagure.lib.acl_cache.has_access(user, repo_obj, 'admin')
 
 
 def is_repo_committer(repo_obj):
@@ -386,14 +384,7 @@ def is_repo_committer(repo_obj):
                 else:
                     return True
 
-    usergrps = [
-        usr.user
-        for grp in repo_obj.committer_groups
-        for usr in grp.users]
-
-    return user == repo_obj.user.user or (
-        user in [usr.user for usr in repo_obj.committers]
-    ) or (user in usergrps)
+    return pagure.lib.acl_cache.has_access(user, repo_obj, 'commit')
 
 
 def is_repo_user(repo_obj):
@@ -406,14 +397,7 @@ def is_repo_user(repo_obj):
     if is_admin():
         return True
 
-    usergrps = [
-        usr.user
-        for grp in repo_obj.groups
-        for usr in grp.users]
-
-    return user == repo_obj.user.user or (
-        user in [usr.user for usr in repo_obj.users]
-    ) or (user in usergrps)
+    return pagure.lib.acl_cache.has_access(user, repo_obj, 'ticket')
 
 
 def get_authorized_project(session, project_name, user=None, namespace=None):
@@ -538,13 +522,6 @@ def set_variables():
     if repo:
         flask.g.repo = pagure.get_authorized_project(
             SESSION, repo, user=username, namespace=namespace)
-        if authenticated():
-            flask.g.repo_forked = pagure.get_authorized_project(
-                SESSION, repo, user=flask.g.fas_user.username,
-                namespace=namespace)
-            flask.g.repo_starred = pagure.lib.has_starred(
-                SESSION, flask.g.repo, user=flask.g.fas_user.username,
-            )
 
         if not flask.g.repo \
                 and APP.config.get('OLD_VIEW_COMMIT_ENABLED', False) \
@@ -557,17 +534,34 @@ def set_variables():
             flask.abort(404, 'Project not found')
 
         flask.g.reponame = get_repo_path(flask.g.repo)
-        flask.g.repo_obj = pygit2.Repository(flask.g.reponame)
-        flask.g.repo_admin = is_repo_admin(flask.g.repo)
-        flask.g.repo_committer = is_repo_committer(flask.g.repo)
-        flask.g.repo_user = is_repo_user(flask.g.repo)
-        flask.g.branches = sorted(flask.g.repo_obj.listall_branches())
 
-        repouser = flask.g.repo.user.user if flask.g.repo.is_fork else None
+        # The following are only computed if the endpoint or its template
+        # use them, see pagure.request_globals
+        project = flask.g.repo
+        if authenticated():
+            user = flask.g.fas_user.username
+            flask.g.set_lazy(
+                'repo_forked', lambda: pagure.get_authorized_project(
+                    SESSION, repo, user=user, namespace=namespace))
+            flask.g.set_lazy(
+                'repo_starred', lambda: pagure.lib.has_starred(
+                    SESSION, project, user=user))
+
+        flask.g.set_lazy('repo_obj', lambda: open_repo(flask.g.reponame))
+        flask.g.set_lazy('repo_admin', lambda: is_repo_admin(project))
+        flask.g.set_lazy(
+            'repo_committer', lambda: is_repo_committer(project))
+        flask.g.set_lazy('repo_user', lambda: is_repo_user(project))
+        flask.g.set_lazy(
+            'branches',
+            lambda: sorted(flask.g.repo_obj.listall_branches()))
+
+        repouser = project.user.user if project.is_fork else None
         fas_user = flask.g.fas_user if authenticated() else None
-        flask.g.repo_watch_levels = pagure.lib.get_watch_level_on_repo(
-            SESSION, fas_user, flask.g.repo.name,
-            repouser=repouser, namespace=namespace)
+        flask.g.set_lazy(
+            'repo_watch_levels', lambda: pagure.lib.get_watch_level_on_repo(
+                SESSION, fas_user, project.name,
+                repouser=repouser, namespace=namespace))
 
     items_per_page = APP.config['ITEM_PER_PAGE']
     flask.g.offset = 0
@@ -743,6 +737,27 @@ def get_repo_path(repo):
     return repopath
 
 
+def open_repo(path):
+    """ Return a pygit2.Repository object for the git repository at the
+    specified path.
+
+    The object comes from the pool of opened repositories (REPO_POOL) and
+    is released back into it at the end of the request, so the same object
+    is returned for the same path within one request.
+    Outside of a request (even within an application context, which does
+    not release the repositories), a new pygit2.Repository object is
+    returned.
+    """
+    if not flask.has_request_context():
+        return pygit2.Repository(path)
+
+    handles = flask.g.setdefault('_repo_handles', {})
+    path = os.path.abspath(path)
+    if path not in handles:
+        handles[path] = REPO_POOL.checkout(path)
+    return handles[path]
+
+
 def get_remote_repo_path(remote_git, branch_from, ignore_non_exist=False):
     """ Return the path of the remote git repository corresponding to the
     provided information.
@@ -881,11 +896,25 @@ def shutdown_session(exception=None):
 
 # pylint: disable=unused-argument
 @APP.teardown_request
-def gcollect(exception=None):
-    """ Runs a garbage collection to get rid of any open pygit2 handles.
+def release_repos(exception=None):
+    """ Release the git repositories opened during the request back into
+    the pool, they will be closed explicitly if they do not fit in it.
 
+    This replaces running a full garbage collection after each request to
+    get rid of the open pygit2 handles.
     Details: https://pagure.io/pagure/issue/2302"""
-    gc.collect()
+    handles = flask.g.pop('_repo_handles', {})
+    for repo_obj in handles.values():
+        REPO_POOL.release(repo_obj)
+
+
+# pylint: disable=unused-argument
+@APP.teardown_request
+def report_lazy_globals(exception=None):
+    """ Record which of the request attributes set lazily by
+    ``set_variables`` have been computed for the endpoint called. """
+    pagure.request_globals.record_request(
+        flask.request.endpoint, flask.g)
 
 
 if perfrepo:
@@ -120,7 +120,7 @@ def check_api_acls(acls, optional=False):
 
     token_auth = False
     if token_str:
-        token = pagure.lib.get_api_token(SESSION, token_str)
+        token = pagure.lib.acl_cache.get_api_token(SESSION, token_str)
         if token and not token.expired:
             if acls and set(token.acls_list).intersection(set(acls)):
                 token_auth = True
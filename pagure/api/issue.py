@@ -393,6 +393,19 @@ def api_view_issues(repo, username=None, namespace=None):
     |               |         |              |   ``asc`` or ``desc``.    |
     |               |         |              |   Default: ``desc``       |
     +---------------+---------+--------------+---------------------------+
+    | ``search_     | string  | Optional     | | Words to search in the  |
+    | pattern``     |         |              |   title, content and      |
+    |               |         |              |   comments of the issues, |
+    |               |         |              |   words between quotes    |
+    |               |         |              |   are searched as a       |
+    |               |         |              |   phrase. The most        |
+    |               |         |              |   relevant issues are     |
+    |               |         |              |   returned first unless   |
+    |               |         |              |   ``order`` is specified. |
+    |               |         |              |   ``key:value`` words     |
+    |               |         |              |   filter on the custom    |
+    |               |         |              |   fields of the issues    |
+    +---------------+---------+--------------+---------------------------+
 
     Sample response
     ^^^^^^^^^^^^^^^
@@ -407,6 +420,7 @@ def api_view_issues(repo, username=None, namespace=None):
             'no_stones': null,
             'order': null,
             'priority': null,
+            'search_pattern': null,
             "since": null,
             "status": "Closed",
             "tags": [
@@ -454,9 +468,12 @@ def api_view_issues(repo, username=None, namespace=None):
     priority = flask.request.args.get('priority', None)
     since = flask.request.args.get('since', None)
     order = flask.request.args.get('order', None)
+    search_pattern = flask.request.args.get('search_pattern', None)
     status = flask.request.args.get('status', None)
     tags = flask.request.args.getlist('tags')
     tags = [tag.strip() for tag in tags if tag.strip()]
+    custom_search, pattern = pagure.lib.tokenize_search_string(
+        search_pattern)
 
     priority_key = None
     if priority:
@@ -495,7 +512,12 @@ def api_view_issues(repo, username=None, namespace=None):
         'priority': priority_key,
         'order': order,
         'no_milestones': no_stones,
+        'search_pattern': pattern,
+        'custom_search': custom_search,
     }
+    if pattern and order:
+        # Sort the results by date rather than by relevance
+        params['order_key'] = 'date_created'
 
     if status is not None:
         if status.lower() == 'all':
@@ -537,6 +559,7 @@ def api_view_issues(repo, username=None, namespace=None):
             'no_stones': no_stones,
             'order': order,
             'priority': priority,
+            'search_pattern': search_pattern,
             'since': since,
             'status': status,
             'tags': tags,
@@ -85,6 +85,29 @@ GIT_URL_GIT = 'git://pagure.org/'
 # Number of items displayed per page
 ITEM_PER_PAGE = 48
 
+# Number of seconds the html rendered from markdown is cached for (0 disables
+# the cache) and number of renderings cached per process when redis is not
+# used
+MARKDOWN_CACHE_TTL = 3600
+MARKDOWN_CACHE_SIZE = 1000
+
+# Number of seconds the API tokens and the access of the users to the
+# projects are cached for (0 disables the cache) and number of entries cached
+# per process when redis is not used
+ACL_CACHE_TTL = 60
+ACL_CACHE_SIZE = 1000
+
+# Number of seconds the counts of the issue list are kept, and maximum
+# number of counts kept, when redis is not configured
+ISSUE_FACETS_CACHE_TTL = 300
+ISSUE_FACETS_CACHE_SIZE = 1000
+
+# Number of seconds the weekly history of the opened issues and
+# pull-requests is kept, and maximum number of histories kept, when redis is
+# not configured
+HISTORY_STATS_CACHE_TTL = 300
+HISTORY_STATS_CACHE_SIZE = 1000
+
 # Maximum size of the uploaded content
 MAX_CONTENT_LENGTH = 4 * 1024 * 1024  # 4 megabytes
 
@@ -97,10 +120,42 @@ CELERY_CONFIG = {}
 # Redis configuration
 EVENTSOURCE_SOURCE = None
 WEBHOOK = False
+# Number of web-hook notifications sent concurrently
+WEBHOOK_WORKERS = 10
+# Number of seconds to wait for a web-hook endpoint to answer
+WEBHOOK_TIMEOUT = 60
+# Number of attempts at sending a web-hook notification, and number of
+# seconds to wait before the first retry (doubled at every retry)
+WEBHOOK_MAX_ATTEMPTS = 5
+WEBHOOK_RETRY_DELAY = 30
+# Number of failures in a row after which a web-hook endpoint is no longer
+# called, and for how many seconds
+WEBHOOK_BREAKER_THRESHOLD = 5
+WEBHOOK_BREAKER_COOLDOWN = 300
 REDIS_HOST = '0.0.0.0'
 REDIS_PORT = 6379
 REDIS_DB = 0
 EVENTSOURCE_PORT = 8080
+# Number of threads processing the messages queued for each of the
+# pagure-logcom, pagure-loadjson and pagure-ci servers
+QUEUE_WORKERS = 2
+# Maximum number of messages a queue consumer reads at once
+QUEUE_BATCH_SIZE = 20
+# Number of attempts at processing a queued message before it is moved to
+# the ``<queue>.failed`` queue, and number of seconds between the attempts
+QUEUE_MAX_ATTEMPTS = 5
+QUEUE_RETRY_DELAY = 30
+# Number of seconds after which the messages a queue consumer did not
+# acknowledge are claimed by the other consumers of its group
+QUEUE_CLAIM_IDLE = 600
+# Number of messages waiting in a queue from which a warning is logged,
+# and logged again at each multiple of it
+QUEUE_BACKLOG_WARNING = 10000
+# Approximate maximum number of messages kept in the ``<queue>.failed``
+# queues
+QUEUE_FAILED_MAXLEN = 100000
+# Number of tickets pagure-loadjson loads in the database per transaction
+LOADJSON_BATCH_SIZE = 100
 
 # Folder containing to the git repos
 GIT_FOLDER = os.path.join(
@@ -110,6 +165,16 @@ GIT_FOLDER = os.path.join(
     'repos'
 )
 
+# Number of opened git repositories kept around, per process, to be re-used
+# across requests
+REPO_POOL_SIZE = 32
+
+# Use the commit-graph index stored in the git repositories to compute the
+# commits ahead/behind between branches and repositories
+COMMIT_GRAPH = True
+# Number of commit-graph indexes kept in memory, per process
+COMMIT_GRAPH_CACHE_SIZE = 32
+
 # Folder containing the docs repos
 DOCS_FOLDER = os.path.join(
     os.path.abspath(os.path.dirname(__file__)),
@@ -134,6 +199,16 @@ REQUESTS_FOLDER = os.path.join(
     'requests'
 )
 
+# Commit the JSON representation of the tickets and pull-requests directly
+# into the bare git repositories above instead of using a clone
+GIT_METADATA_IN_MEMORY = True
+# Number of times to retry updating these repos if they changed meanwhile
+GIT_METADATA_MAX_RETRIES = 5
+# Number of seconds during which the updates to the tickets and
+# pull-requests of a project are collected to be committed together in
+# these repos, ``None`` commits each update on its own (requires redis)
+GIT_METADATA_BATCH_DELAY = None
+
 # Folder containing the clones for the remote pull-requests
 REMOTE_GIT_FOLDER = os.path.join(
     os.path.abspath(os.path.dirname(__file__)),
@@ -183,11 +258,26 @@ GITOLITE_KEYDIR = None
 # Backend to use to write down the gitolite configuration file
 GITOLITE_BACKEND = 'gitolite3'
 
+# Folder, relative to the one of GITOLITE_CONFIG, in which to write the
+# gitolite configuration of each project in its own file (if None, the
+# configuration of all the projects is written in GITOLITE_CONFIG)
+GITOLITE_FRAGMENTS_FOLDER = None
+
 # Path to the gitolite.rc file
 GL_RC = None
 # Path to the /bin directory where the gitolite tools can be found
 GL_BINDIR = None
 
+# UNIX socket on which the hook runner (pagure-hookrunner) listens, the
+# git hooks find it via the PAGURE_HOOKRUNNER_SOCKET environment variable
+# which defaults to the same path
+HOOKRUNNER_SOCKET = '/var/run/pagure-hookrunner/hookrunner.sock'
+# Number of hooks the hook runner runs concurrently
+HOOKRUNNER_WORKERS = 4
+# Number of seconds after which the hook runner kills a hook ran in a
+# sub-process
+HOOKRUNNER_HOOK_TIMEOUT = 600
+
 
 # SMTP settings
 SMTP_SERVER = 'localhost'
@@ -198,6 +288,23 @@ SMTP_SSL = False
 SMTP_USERNAME = None
 SMTP_PASSWORD = None
 
+# Send the emails from the pagure_worker instead of during the request
+EMAIL_ASYNC = True
+# The celery queue to send the emails to (if None the default queue is used)
+EMAIL_CELERY_QUEUE = None
+# How the emails are delivered: `smtp` or `maildir`
+EMAIL_BACKEND = 'smtp'
+# The maildir to store the emails in if EMAIL_BACKEND is `maildir`
+EMAIL_MAILDIR = None
+# Number of attempts and initial delay (in seconds) between them when the
+# emails could not be sent
+EMAIL_MAX_RETRIES = 5
+EMAIL_RETRY_DELAY = 60
+
+# The celery queue to send the (low priority) computation of the merge status
+# of the pull-requests to (if None the default queue is used)
+MERGE_STATUS_CELERY_QUEUE = None
+
 
 # Email used to sent emails
 FROM_EMAIL = 'pagure@pagure.org'
@@ -5,7 +5,6 @@
 """
 from __future__ import print_function
 
-import json
 import os
 import sys
 
@@ -18,8 +17,10 @@ if 'PAGURE_CONFIG' not in os.environ \
 
 import pagure  # noqa: E402
 import pagure.exceptions  # noqa: E402
+import pagure.lib.commit_graph  # noqa: E402
 import pagure.lib.link  # noqa: E402
 import pagure.lib.tasks  # noqa: E402
+import pagure.lib.work_queue  # noqa: E402
 
 from pagure.lib import REDIS  # noqa: E402
 
@@ -41,6 +42,9 @@ def run_as_post_receive_hook():
         pagure.SESSION, repo, user=username, namespace=namespace,
         case=pagure.APP.config.get('CASE_SENSITIVE', False))
 
+    new_heads = []
+    branches = []
+    default_branch_updated = False
     for line in sys.stdin:
         if pagure.APP.config.get('HOOK_DEBUG', False):
             print(line)
@@ -65,7 +69,13 @@ def run_as_post_receive_hook():
                   "pagure hook")
             return
 
+        if refname.startswith('refs/heads/'):
+            new_heads.append(newrev)
+            branches.append(refname.replace('refs/heads/', '', 1))
+
         refname = refname.replace('refs/heads/', '')
+        if refname == default_branch:
+            default_branch_updated = True
         commits = pagure.lib.git.get_revs_between(
             oldrev, newrev, abspath, refname)
 
@@ -77,15 +87,16 @@ def run_as_post_receive_hook():
                 print('Sending to redis to send commit notification emails')
             # If REDIS is enabled, notify subscribed users that there are new
             # commits to this project
-            REDIS.publish(
-                'pagure.logcom',
-                json.dumps({
+            pagure.lib.work_queue.publish(
+                REDIS,
+                pagure.lib.work_queue.LOGCOM,
+                {
                     'project': project.to_json(public=True),
                     'abspath': abspath,
                     'branch': refname,
                     'default_branch': default_branch,
                     'commits': commits,
-                })
+                }
             )
         else:
             print('Hook not configured to connect to pagure-logcom')
@@ -125,8 +136,21 @@ def run_as_post_receive_hook():
                 )
             print()
 
-    # Schedule refresh of all opened PRs
-    pagure.lib.tasks.refresh_pr_cache.delay(project.name, namespace, username)
+    # Add the new commits to the commit-graph index
+    if new_heads and pagure.lib.commit_graph.enabled():
+        try:
+            pagure.lib.commit_graph.update_commit_graph(
+                pygit2.Repository(abspath), heads=new_heads)
+        except Exception as err:
+            print('Could not update the commit-graph: %s' % err)
+
+    # Process the new commits of the default branch in the commit stats
+    if default_branch_updated:
+        pagure.lib.tasks.commits_author_stats.delay(abspath)
+
+    # Schedule refresh of the opened PRs from or against the updated branches
+    pagure.lib.tasks.refresh_pr_cache.delay(
+        project.name, namespace, username, branches=branches)
 
     pagure.SESSION.remove()
 
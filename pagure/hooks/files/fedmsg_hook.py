@@ -24,7 +24,11 @@ print("Emitting a message to the fedmsg bus.")
 config = fedmsg.config.load_config([], None)
 config['active'] = True
 config['endpoints']['relay_inbound'] = config['relay_inbound']
-fedmsg.init(name='relay_inbound', **config)
+try:
+    fedmsg.init(name='relay_inbound', **config)
+except ValueError:
+    # Already initialized, by a previous run in the hook runner
+    pass
 
 
 seen = []
@@ -60,10 +64,13 @@ for line in sys.stdin.readlines():
     if not project:
         project = project_name
 
+    # Look up each author once, however many commits they pushed
+    names = {}
+    for commit_info in pagure.lib.git.read_commits(abspath, revs):
+        names.setdefault(commit_info.author_email, commit_info.author)
+
     auths = set()
-    for rev in revs:
-        email = pagure.lib.git.get_author_email(rev, abspath)
-        name = pagure.lib.git.get_author(rev, abspath)
+    for email, name in names.items():
         author = pagure.lib.search_user(pagure.SESSION, email=email) or name
         auths.add(author)
 
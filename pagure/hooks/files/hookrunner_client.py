@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Forward a git hook to the pagure hook runner (pagure-hookrunner).
+
+This is called by the ``post-receive`` and ``pre-receive`` dispatchers,
+it sends the environment, working directory, arguments and input of the
+hook to the hook runner over a UNIX socket and prints the output of the
+hooks it runs.
+
+It does not import pagure, to start quickly. The socket is read from the
+``PAGURE_HOOKRUNNER_SOCKET`` environment variable, it must match the
+``HOOKRUNNER_SOCKET`` configuration key of the hook runner.
+
+If the hook runner cannot be reached, or the request cannot be sent to it
+(for example if the environment is not valid UTF-8), this exits with the
+status 75 so the dispatcher runs the hooks itself.
+"""
+
+from __future__ import print_function
+
+import base64
+import json
+import os
+import socket
+import struct
+import sys
+
+
+SOCKET = os.environ.get(
+    'PAGURE_HOOKRUNNER_SOCKET',
+    '/var/run/pagure-hookrunner/hookrunner.sock')
+# sysexits.h's EX_TEMPFAIL
+UNAVAILABLE = 75
+_HEADER = struct.Struct('!cI')
+
+
+def _read(conn, size):
+    """ Read exactly ``size`` bytes from the socket. """
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise EOFError('Connection closed by the hook runner')
+        data += chunk
+    return data
+
+
+def _write(stream, data):
+    stream = getattr(stream, 'buffer', stream)
+    stream.write(data)
+    stream.flush()
+
+
+def main(args):
+    hookname, args = args[0], args[1:]
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin).read()
+
+    # The ref names in the input are arbitrary bytes
+    request = {
+        'hook': hookname,
+        'args': args,
+        'cwd': os.getcwd(),
+        'env': dict(os.environ),
+        'stdin': base64.b64encode(stdin).decode('ascii'),
+    }
+    try:
+        request = json.dumps(request).encode('utf-8')
+    except (UnicodeError, ValueError):
+        return UNAVAILABLE
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(SOCKET)
+    except socket.error:
+        return UNAVAILABLE
+
+    conn.sendall(request + b'\n')
+    conn.shutdown(socket.SHUT_WR)
+
+    try:
+        while True:
+            kind, length = _HEADER.unpack(_read(conn, _HEADER.size))
+            data = _read(conn, length)
+            if kind == b'x':
+                return int(data)
+            _write(sys.stderr if kind == b'2' else sys.stdout, data)
+    except (EOFError, socket.error) as err:
+        # The hooks may have been partly ran, do not run them again
+        print('The hook runner failed: %s' % err, file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
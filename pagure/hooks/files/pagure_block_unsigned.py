@@ -45,14 +45,15 @@ def run_as_pre_receive_hook():
                   "hook to block unsigned commits")
             return
 
-        commits = pagure.lib.git.get_revs_between(
-            oldrev, newrev, abspath, refname)
-        for commit in commits:
+        commits = pagure.lib.git.read_commits(
+            abspath, pagure.lib.git.iter_revs_between(
+                oldrev, newrev, abspath, refname))
+        for commit_info in commits:
+            commit = commit_info.commit
             if pagure.APP.config.get('HOOK_DEBUG', False):
                 print('Processing commit: %s' % commit)
             signed = False
-            for line in pagure.lib.git.read_git_lines(
-                    ['log', '--no-walk', commit], abspath):
+            for line in commit_info.message.splitlines():
                 if line.lower().strip().startswith('signed-off-by'):
                     signed = True
                     break
@@ -7,6 +7,7 @@ relates to an issue.
 
 from __future__ import print_function
 
+import datetime
 import logging
 import os
 import sys
@@ -30,40 +31,77 @@ _log = logging.getLogger(__name__)
 abspath = os.path.abspath(os.environ['GIT_DIR'])
 
 
-def generate_revision_change_log(new_commits_list):
-
-    print('Detailed log of new commits:\n\n')
-    commitid = None
-    for line in pagure.lib.git.read_git_lines(
-            ['log', '--no-walk'] + new_commits_list + ['--'], abspath):
-        if line.startswith('commit'):
-            commitid = line.split('commit ')[-1]
-
-        line = line.strip()
+_DAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+_MONTHS = [
+    'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct',
+    'Nov', 'Dec']
+
+
+def format_log(commit_info):
+    """ Return the lines ``git log`` shows for the specified commit. """
+    date = datetime.datetime.utcfromtimestamp(
+        commit_info.author_time + commit_info.author_offset * 60)
+    offset = abs(commit_info.author_offset)
+    lines = ['commit %s' % commit_info.commit]
+    if len(commit_info.parents) > 1:
+        lines.append('Merge: %s' % ' '.join(
+            parent[:7] for parent in commit_info.parents))
+    lines.append('Author: %s <%s>' % (
+        commit_info.author, commit_info.author_email))
+    lines.append('Date:   %s %s %d %s %d %s%02d%02d' % (
+        _DAYS[date.weekday()], _MONTHS[date.month - 1], date.day,
+        date.strftime('%H:%M:%S'), date.year,
+        '-' if commit_info.author_offset < 0 else '+',
+        offset // 60, offset % 60))
+    lines.append('')
+    lines.extend(
+        '    %s' % line if line else line
+        for line in commit_info.message.rstrip('\n').split('\n'))
+    # As git would print them
+    return [line.encode('utf-8') for line in lines]
 
-        print('*', line)
-        for relation in pagure.lib.link.get_relation(
-                pagure.SESSION,
-                pagure.lib.git.get_repo_name(abspath),
-                pagure.lib.git.get_username(abspath),
-                pagure.lib.git.get_repo_namespace(abspath),
-                line,
-                'fixes',
-                include_prs=True):
-            fixes_relation(commitid, relation,
-                           pagure.APP.config.get('APP_URL'))
-
-        for issue in pagure.lib.link.get_relation(
-                pagure.SESSION,
-                pagure.lib.git.get_repo_name(abspath),
-                pagure.lib.git.get_username(abspath),
-                pagure.lib.git.get_repo_namespace(abspath),
-                line,
-                'relates'):
-            relates_commit(commitid, issue, pagure.APP.config.get('APP_URL'))
 
+def generate_revision_change_log(new_commits_list):
 
-def relates_commit(commitid, issue, app_url=None):
+    print('Detailed log of new commits:\n\n')
+    repo_name = pagure.lib.git.get_repo_name(abspath)
+    username = pagure.lib.git.get_username(abspath)
+    namespace = pagure.lib.git.get_repo_namespace(abspath)
+    for idx, commit_info in enumerate(
+            pagure.lib.git.read_commits(abspath, new_commits_list)):
+        commitid = commit_info.commit
+        lines = format_log(commit_info)
+        if idx:
+            lines.insert(0, '')
+        for line in lines:
+            line = line.strip()
+
+            print('*', line)
+            for relation in pagure.lib.link.get_relation(
+                    pagure.SESSION,
+                    repo_name,
+                    username,
+                    namespace,
+                    line,
+                    'fixes',
+                    include_prs=True):
+                fixes_relation(commitid, relation,
+                               pagure.APP.config.get('APP_URL'),
+                               author_email=commit_info.author_email)
+
+            for issue in pagure.lib.link.get_relation(
+                    pagure.SESSION,
+                    repo_name,
+                    username,
+                    namespace,
+                    line,
+                    'relates'):
+                relates_commit(commitid, issue,
+                               pagure.APP.config.get('APP_URL'),
+                               author_email=commit_info.author_email)
+
+
+def relates_commit(commitid, issue, app_url=None, author_email=None):
     ''' Add a comment to an issue that this commit relates to it. '''
 
     url = '../%s' % commitid[:8]
@@ -78,8 +116,10 @@ def relates_commit(commitid, issue, app_url=None):
     comment = ''' Commit [%s](%s) relates to this ticket''' % (
         commitid[:8], url)
 
-    user = os.environ.get(
-        'GL_USER', pagure.lib.git.get_author_email(commitid, abspath))
+    user = os.environ.get('GL_USER')
+    if user is None:
+        user = author_email \
+            or pagure.lib.git.get_author_email(commitid, abspath)
 
     try:
         pagure.lib.add_issue_comment(
@@ -97,7 +137,7 @@ def relates_commit(commitid, issue, app_url=None):
         _log.exception(err)
 
 
-def fixes_relation(commitid, relation, app_url=None):
+def fixes_relation(commitid, relation, app_url=None, author_email=None):
     ''' Add a comment to an issue or PR that this commit fixes it and update
     the status if the commit is in the master branch. '''
 
@@ -113,8 +153,10 @@ def fixes_relation(commitid, relation, app_url=None):
     comment = ''' Commit [%s](%s) fixes this %s''' % (
         commitid[:8], url, relation.isa)
 
-    user = os.environ.get(
-        'GL_USER', pagure.lib.git.get_author_email(commitid, abspath))
+    user = os.environ.get('GL_USER')
+    if user is None:
+        user = author_email \
+            or pagure.lib.git.get_author_email(commitid, abspath)
 
     try:
         if relation.isa == 'issue':
@@ -29,13 +29,11 @@ def get_files_to_load(new_commits_list):
     print('Files changed by new commits:\n')
     file_list = []
     new_commits_list.reverse()
-    for commit in new_commits_list:
-        filenames = pagure.lib.git.read_git_lines(
-            ['diff-tree', '--no-commit-id', '--name-only', '-r', commit],
-            abspath)
-        for line in filenames:
-            if line.strip():
-                file_list.append(line.strip())
+    for commit in pagure.lib.git.read_commits(
+            abspath, new_commits_list, paths=True):
+        for path in commit.paths:
+            if path.strip():
+                file_list.append(path.strip())
 
     return file_list
 
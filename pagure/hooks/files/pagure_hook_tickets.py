@@ -6,7 +6,6 @@ the information pushed in the tickets git repository.
 """
 from __future__ import print_function
 
-import json
 import os
 import sys
 
@@ -18,6 +17,7 @@ if 'PAGURE_CONFIG' not in os.environ \
 
 import pagure  # noqa: E402
 import pagure.lib.git  # noqa: E402
+import pagure.lib.work_queue  # noqa: E402
 
 from pagure.lib import REDIS  # noqa: E402
 
@@ -63,15 +63,16 @@ def run_as_post_receive_hook():
 
         if REDIS:
             print('Sending to redis to load the data')
-            REDIS.publish(
-                'pagure.loadjson',
-                json.dumps({
+            pagure.lib.work_queue.publish(
+                REDIS,
+                pagure.lib.work_queue.LOADJSON,
+                {
                     'project': project.to_json(public=True),
                     'abspath': abspath,
                     'commits': commits,
                     'data_type': 'ticket',
                     'agent': os.environ.get('GL_USER'),
-                })
+                }
             )
             print(
                 'A report will be emailed to you once the load is finished')
@@ -13,6 +13,7 @@ Internal endpoints.
 import collections
 import logging
 import os
+import struct
 
 import flask
 import pygit2
@@ -26,6 +27,7 @@ import pagure  # noqa: E402
 import pagure.exceptions  # noqa: E402
 import pagure.forms  # noqa: E402
 import pagure.lib  # noqa: E402
+import pagure.lib.commit_graph  # noqa: E402
 import pagure.lib.git  # noqa: E402
 import pagure.lib.tasks  # noqa: E402
 import pagure.ui.fork  # noqa: E402
@@ -209,19 +211,11 @@ def mergeable_request_pull():
         response.status_code = 404
         return response
 
-    if request.merge_status and not force:
-        return flask.jsonify({
-            'code': request.merge_status,
-            'short_code': MERGE_OPTIONS[request.merge_status]['short_code'],
-            'message': MERGE_OPTIONS[request.merge_status]['message']})
-
     try:
-        merge_status = pagure.lib.git.merge_pull_request(
+        merge_status, conflicts = pagure.lib.git.get_merge_status(
             session=pagure.SESSION,
             request=request,
-            username=None,
-            request_folder=None,
-            domerge=False)
+            force=force)
     except pygit2.GitError as err:
         response = flask.jsonify({
             'code': 'CONFLICTS', 'message': err.message})
@@ -236,7 +230,8 @@ def mergeable_request_pull():
     return flask.jsonify({
         'code': merge_status,
         'short_code': MERGE_OPTIONS[merge_status]['short_code'],
-        'message': MERGE_OPTIONS[merge_status]['message']})
+        'message': MERGE_OPTIONS[merge_status]['message'],
+        'conflicts': conflicts})
 
 
 @PV.route('/pull-request/ready', methods=['POST'])
@@ -269,7 +264,7 @@ def get_pull_request_ready_branch():
         return response
 
     reponame = pagure.get_repo_path(repo)
-    repo_obj = pygit2.Repository(reponame)
+    repo_obj = pagure.open_repo(reponame)
     if repo.is_fork:
         if not repo.parent.settings.get('pull_requests', True):
             response = flask.jsonify({
@@ -280,7 +275,7 @@ def get_pull_request_ready_branch():
             return response
 
         parentreponame = pagure.get_repo_path(repo.parent)
-        parent_repo_obj = pygit2.Repository(parentreponame)
+        parent_repo_obj = pagure.open_repo(parentreponame)
     else:
         if not repo.settings.get('pull_requests', True):
             response = flask.jsonify({
@@ -417,6 +412,18 @@ def get_ticket_template(repo, namespace=None, username=None):
     return response
 
 
+def _commit_only_in_branch(repo_obj, commit_id, branch, compare_branch):
+    """ Return whether the specified commit is in the specified branch but
+    not in the branch it is compared to, using the commit-graph index.
+    """
+    branch_head = branch.get_object().hex
+    compare_head = compare_branch.get_object().hex
+    return pagure.lib.commit_graph.is_ancestor(
+        repo_obj, commit_id, branch_head) \
+        and not pagure.lib.commit_graph.is_ancestor(
+            repo_obj, commit_id, compare_head)
+
+
 @PV.route('/branches/commit/', methods=['POST'])
 def get_branches_of_commit():
     """ Return the list of branches that have the specified commit in
@@ -463,7 +470,7 @@ def get_branches_of_commit():
         response.status_code = 404
         return response
 
-    repo_obj = pygit2.Repository(repopath)
+    repo_obj = pagure.open_repo(repopath)
 
     try:
         commit_id in repo_obj
@@ -482,11 +489,22 @@ def get_branches_of_commit():
     else:
         compare_branch = None
 
+    use_graph = pagure.lib.commit_graph.enabled()
     for branchname in repo_obj.listall_branches():
         branch = repo_obj.lookup_branch(branchname)
 
         if not repo_obj.is_empty and len(repo_obj.listall_branches()) > 1:
 
+            if compare_branch and use_graph:
+                try:
+                    if _commit_only_in_branch(
+                            repo_obj, commit_id, branch, compare_branch):
+                        branches.append(branchname)
+                    continue
+                except (KeyError, IOError, OSError, struct.error) as err:
+                    _log.info('Could not use the commit-graph: %s', err)
+                    use_graph = False
+
             merge_commit = None
 
             if compare_branch:
@@ -567,7 +585,7 @@ def get_branches_head():
         response.status_code = 404
         return response
 
-    repo_obj = pygit2.Repository(repopath)
+    repo_obj = pagure.open_repo(repopath)
 
     branches = {}
     if not repo_obj.is_empty and repo_obj.listall_branches() > 1:
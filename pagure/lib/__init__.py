@@ -28,6 +28,7 @@ import logging
 import os
 import tempfile
 import subprocess
+import threading
 import urlparse
 import uuid
 import markdown
@@ -36,6 +37,7 @@ from math import ceil
 import copy
 
 import bleach
+import flask
 import redis
 import six
 import sqlalchemy
@@ -49,10 +51,18 @@ from flask import url_for
 
 import pagure
 import pagure.exceptions
+import pagure.lib.acl_cache
+import pagure.lib.fulltext
 import pagure.lib.git
+import pagure.lib.history_stats
+import pagure.lib.issue_facets
 import pagure.lib.login
+import pagure.lib.markdown_cache
 import pagure.lib.notify
 import pagure.lib.plugins
+import pagure.lib.project_access
+import pagure.lib.webhook
+import pagure.lib.work_queue
 import pagure.pfmarkdown
 from pagure.lib import model
 from pagure.lib import tasks
@@ -83,6 +93,15 @@ def set_pagure_ci(services):
     PAGURE_CI = services
 
 
+def _commit(session, commit=True):
+    """ Commit the session, or only flush it if the changes are committed
+    later on, together with others. """
+    if commit:
+        session.commit()
+    else:
+        session.flush()
+
+
 def get_user(session, key):
     """ Searches for a user in the database for a given username or email.
     """
@@ -319,8 +338,9 @@ def create_user_ssh_keys_on_disk(user, gitolite_keydir):
 
 
 def add_issue_comment(session, issue, comment, user, ticketfolder,
-                      notify=True, date_created=None, notification=False):
-    ''' Add a comment to an issue. '''
+                      notify=True, date_created=None, notification=False,
+                      commit=True):
+    ''' Add a comment to an issue, see ``new_issue`` for ``commit``. '''
     user_obj = get_user(session, user)
 
     issue_comment = model.IssueComment(
@@ -334,13 +354,13 @@ def add_issue_comment(session, issue, comment, user, ticketfolder,
     session.add(issue)
     session.add(issue_comment)
     # Make sure we won't have SQLAlchemy error before we continue
-    session.commit()
+    _commit(session, commit)
 
     pagure.lib.git.update_git(
         issue, repo=issue.project, repofolder=ticketfolder)
 
     if not notification:
-        log_action(session, 'commented', issue, user_obj)
+        log_action(session, 'commented', issue, user_obj, commit=commit)
 
     if notify:
         pagure.lib.notify.notify_new_comment(issue_comment, user=user_obj)
@@ -503,8 +523,9 @@ def add_tag_obj(session, obj, tags, user, gitfolder):
 
 
 def add_issue_assignee(session, issue, assignee, user, ticketfolder,
-                       notify=True):
-    ''' Add an assignee to an issue, in other words, assigned an issue. '''
+                       notify=True, commit=True):
+    ''' Add an assignee to an issue, in other words, assigned an issue.
+    See ``new_issue`` for ``commit``. '''
     user_obj = get_user(session, user)
 
     old_assignee = issue.assignee
@@ -513,7 +534,7 @@ def add_issue_assignee(session, issue, assignee, user, ticketfolder,
         issue.assignee_id = None
         issue.last_updated = datetime.datetime.utcnow()
         session.add(issue)
-        session.commit()
+        _commit(session, commit)
         pagure.lib.git.update_git(
             issue, repo=issue.project, repofolder=ticketfolder)
 
@@ -548,7 +569,7 @@ def add_issue_assignee(session, issue, assignee, user, ticketfolder,
     if issue.assignee_id != assignee_obj.id:
         issue.assignee_id = assignee_obj.id
         session.add(issue)
-        session.commit()
+        _commit(session, commit)
         pagure.lib.git.update_git(
             issue, repo=issue.project, repofolder=ticketfolder)
 
@@ -920,6 +941,8 @@ def edit_issue_tags(
             model.TagColored.tag_color: new_tag_color
         }
     )
+    # Bulk updates do not trigger the ORM events
+    pagure.lib.issue_facets.invalidate(project.id)
 
     issues = session.query(
         model.Issue
@@ -1243,10 +1266,10 @@ def add_pull_request_comment(session, request, commit, tree_id, filename,
         if notification and request.status == 'Open' \
             and PAGURE_CI and request.project.ci_hook\
                 and not request.project.private:
-            REDIS.publish('pagure.ci', json.dumps({
+            pagure.lib.work_queue.publish(REDIS, pagure.lib.work_queue.CI, {
                 'ci_type': request.project.ci_hook.ci_type,
                 'pr': request.to_json(public=True, with_comments=False)
-            }))
+            })
 
     pagure.lib.notify.log(
         request.project,
@@ -1261,10 +1284,10 @@ def add_pull_request_comment(session, request, commit, tree_id, filename,
     if trigger_ci and comment.strip().lower() in trigger_ci:
         # Send notification to the CI server
         if REDIS and PAGURE_CI and request.project.ci_hook:
-            REDIS.publish('pagure.ci', json.dumps({
+            pagure.lib.work_queue.publish(REDIS, pagure.lib.work_queue.CI, {
                 'ci_type': request.project.ci_hook.ci_type,
                 'pr': request.to_json(public=True, with_comments=False)
-            }))
+            })
 
     return 'Comment added'
 
@@ -1556,8 +1579,12 @@ def new_project(session, user, name, blacklist, allowed_prefix,
 def new_issue(session, repo, title, content, user, ticketfolder, issue_id=None,
               issue_uid=None, private=False, status=None, close_status=None,
               notify=True, date_created=None, milestone=None, priority=None,
-              assignee=None, tags=None):
-    ''' Create a new issue for the specified repo. '''
+              assignee=None, tags=None, commit=True):
+    ''' Create a new issue for the specified repo.
+
+    When ``commit`` is False, the changes are only flushed, to be committed
+    along with others.
+    '''
     user_obj = get_user(session, user)
 
     # Only store the priority if there is one in the project
@@ -1619,12 +1646,12 @@ def new_issue(session, repo, title, content, user, ticketfolder, issue_id=None,
             )
             session.add(dbobjtag)
 
-    session.commit()
+    _commit(session, commit)
 
     pagure.lib.git.update_git(
         issue, repo=repo, repofolder=ticketfolder)
 
-    log_action(session, 'created', issue, user_obj)
+    log_action(session, 'created', issue, user_obj, commit=commit)
 
     if notify:
         pagure.lib.notify.notify_new_issue(issue, user=user_obj)
@@ -1729,10 +1756,10 @@ def new_pull_request(session, branch_from,
     # Send notification to the CI server
     if REDIS and PAGURE_CI and request.project.ci_hook \
             and not request.project.private:
-        REDIS.publish('pagure.ci', json.dumps({
+        pagure.lib.work_queue.publish(REDIS, pagure.lib.work_queue.CI, {
             'ci_type': request.project.ci_hook.ci_type,
             'pr': request.to_json(public=True, with_comments=False)
-        }))
+        })
 
     # Create the ref from the start
     tasks.sync_pull_ref.delay(
@@ -1762,7 +1789,7 @@ def new_tag(session, tag_name, tag_description, tag_color, project_id):
 def edit_issue(session, issue, ticketfolder, user, repo=None,
                title=None, content=None, status=None,
                close_status=Unspecified, priority=Unspecified,
-               milestone=Unspecified, private=None):
+               milestone=Unspecified, private=None, commit=True):
     ''' Edit the specified issue.
 
     :arg session: the session to use to connect to the database.
@@ -1779,6 +1806,8 @@ def edit_issue(session, issue, ticketfolder, user, repo=None,
     :kwarg priority: the new priority of the issue if it's being changed
     :kwarg milestone: the new milestone of the issue if it's being changed
     :kwarg private: the new private of the issue if it's being changed
+    :kwarg commit: whether the action logged when the status changes is
+        committed or only flushed, to be committed along with other changes
 
     '''
     user_obj = get_user(session, user)
@@ -1865,7 +1894,8 @@ def edit_issue(session, issue, ticketfolder, user, repo=None,
         issue, repo=issue.project, repofolder=ticketfolder)
 
     if 'status' in edit:
-        log_action(session, issue.status.lower(), issue, user_obj)
+        log_action(
+            session, issue.status.lower(), issue, user_obj, commit=commit)
         pagure.lib.notify.notify_status_change_issue(issue, user_obj)
 
     if not issue.private and edit:
@@ -2039,8 +2069,13 @@ def search_projects(
         session, username=None,
         fork=None, tags=None, namespace=None, pattern=None,
         start=None, limit=None, count=False, sort=None,
-        exclude_groups=None, private=None, owner=None):
+        exclude_groups=None, private=None, owner=None, acl=None):
     '''List existing projects
+
+    When ``username`` is specified, only the projects this user has commit
+    access to are returned, or if ``acl`` is specified, the projects this
+    user has the specified access to ('main admin', 'admin', 'commit' or
+    'ticket').
     '''
     projects = session.query(
         sqlalchemy.distinct(model.Project.id)
@@ -2052,74 +2087,39 @@ def search_projects(
     elif owner is not None:
         projects = projects.join(model.User).filter(model.User.user == owner)
     elif username is not None:
+        # The projects the user has access to, as owner, directly or via
+        # one of their groups
         projects = projects.filter(
-            # User created the project
-            sqlalchemy.and_(
-                model.User.user == username,
-                model.User.id == model.Project.user_id,
-            )
-        )
-        sub_q2 = session.query(
-            model.Project.id
+            model.ProjectAccess.project_id == model.Project.id
         ).filter(
-            # User got admin or commit right
-            sqlalchemy.and_(
-                model.User.user == username,
-                model.User.id == model.ProjectUser.user_id,
-                model.ProjectUser.project_id == model.Project.id,
-                sqlalchemy.or_(
-                    model.ProjectUser.access == 'admin',
-                    model.ProjectUser.access == 'commit',
-                )
-            )
-        )
-        sub_q3 = session.query(
-            model.Project.id
+            model.ProjectAccess.user_id == model.User.id
         ).filter(
-            # User created a group that has admin or commit right
-            sqlalchemy.and_(
-                model.User.user == username,
-                model.PagureGroup.user_id == model.User.id,
-                model.PagureGroup.group_type == 'user',
-                model.PagureGroup.id == model.ProjectGroup.group_id,
-                model.Project.id == model.ProjectGroup.project_id,
-                sqlalchemy.or_(
-                    model.ProjectGroup.access == 'admin',
-                    model.ProjectGroup.access == 'commit',
-                )
-            )
-        )
-        sub_q4 = session.query(
-            model.Project.id
+            model.User.user == username
         ).filter(
-            # User is part of a group that has admin or commit right
-            sqlalchemy.and_(
-                model.User.user == username,
-                model.PagureUserGroup.user_id == model.User.id,
-                model.PagureUserGroup.group_id == model.PagureGroup.id,
-                model.PagureGroup.group_type == 'user',
-                model.PagureGroup.id == model.ProjectGroup.group_id,
-                model.Project.id == model.ProjectGroup.project_id,
-                sqlalchemy.or_(
-                    model.ProjectGroup.access == 'admin',
-                    model.ProjectGroup.access == 'commit',
-                )
-
-            )
+            model.ProjectAccess.access.in_(
+                pagure.lib.project_access.ACCESS_LEVELS[acl or 'commit'])
         )
 
+        if acl:
+            # Only consider the access given directly to the user
+            projects = projects.filter(
+                model.ProjectAccess.group_id == None  # noqa: E711
+            )
         # Exclude projects that the user has accessed via a group that we
         # do not want to include
-        if exclude_groups:
-            sub_q3 = sub_q3.filter(
-                model.PagureGroup.group_name.notin_(exclude_groups)
+        elif exclude_groups:
+            excluded = session.query(
+                model.PagureGroup.id
+            ).filter(
+                model.PagureGroup.group_name.in_(exclude_groups)
             )
-            sub_q4 = sub_q4.filter(
-                model.PagureGroup.group_name.notin_(exclude_groups)
+            projects = projects.filter(
+                sqlalchemy.or_(
+                    model.ProjectAccess.group_id == None,  # noqa: E711
+                    model.ProjectAccess.group_id.notin_(excluded.subquery()),
+                )
             )
 
-        projects = projects.union(sub_q2).union(sub_q3).union(sub_q4)
-
     if not private:
         projects = projects.filter(
             model.Project.private == False  # noqa: E712
@@ -2250,78 +2250,15 @@ def _get_project(session, name, user=None, namespace=None, case=False):
     return query.first()
 
 
-def search_issues(
+def _get_issues_query(
         session, repo=None, issueid=None, issueuid=None, status=None,
         closed=False, tags=None, assignee=None, author=None, private=None,
-        priority=None, milestones=None, count=False, offset=None,
-        limit=None, search_pattern=None, custom_search=None,
-        updated_after=None, no_milestones=None, order='desc',
-        order_key=None):
-    ''' Retrieve one or more issues associated to a project with the given
-    criterias.
-
-    Watch out that the closed argument is incompatible with the status
-    argument. The closed argument will return all the issues whose status
-    is not 'Open', otherwise it will return the issues having the specified
-    status.
-    The `tags` argument can be used to filter the issues returned based on
-    a certain tag.
-    If the `issueid` argument is specified a single Issue object (or None)
-    will be returned instead of a list of Issue objects.
-
-    :arg session: the session to use to connect to the database.
-    :arg repo: a Project object to which the issues should be associated
-    :type repo: pagure.lib.model.Project
-    :kwarg issueid: the identifier of the issue to look for
-    :type issueid: int or None
-    :kwarg issueuid: the unique identifier of the issue to look for
-    :type issueuid: str or None
-    :kwarg status: the status of the issue to look for (incompatible with
-        the `closed` argument).
-    :type status: str or None
-    :kwarg closed: a boolean indicating whether the issue to retrieve are
-        closed or open (incompatible with the `status` argument).
-    :type closed: bool or None
-    :kwarg tags: a tag the issue(s) returned should be associated with
-    :type tags: str or list(str) or None
-    :kwarg assignee: the name of the user assigned to the issues to search
-    :type assignee: str or None
-    :kwarg author: the name of the user who created the issues to search
-    :type author: str or None
-    :kwarg private: boolean or string to use to include or exclude private
-        tickets. Defaults to False.
-        If False: private tickets are excluded
-        If None: private tickets are included
-        If user name is specified: private tickets reported by that user
-        are included.
-    :type private: False, None or str
-    :kwarg priority: the priority of the issues to search
-    :type priority: int or None
-    :kwarg milestones: a milestone the issue(s) returned should be
-        associated with.
-    :type milestones: str or list(str) or None
-    :kwarg count: a boolean to specify if the method should return the list
-        of Issues or just do a COUNT query.
-    :type count: boolean
-    :kwarg search_pattern: a string to search in issues title
-    :type search_pattern: str or None
-    :kwarg custom_search: a dictionary of key/values to be used when
-        searching issues with a custom key constraint
-    :type custom_search: dict or None
-    :kwarg updated_after: datetime's date format (e.g. 2016-11-15) used to
-        filter issues updated after that date
-    :type updated_after: str or None
-    :kwarg no_milestones: Request issues that do not have a milestone set yet
-    :type None, True, or False
-    :kwarg order: Order issues in 'asc' or 'desc' order.
-    :type order: None, str
-    :kwarg order_key: Order issues by database column
-    :type order_key: None, str
-
-    :return: A single Issue object if issueid is specified, a list of Project
-        objects otherwise.
-    :rtype: Project or [Project]
-
+        priority=None, milestones=None, search_pattern=None,
+        custom_search=None, updated_after=None, no_milestones=None):
+    ''' Return the query retrieving the issues matching the given
+    criterias, see search_issues, as well as the full-text search matches
+    (or None if no `search_pattern` was specified) to order them by
+    relevance.
     '''
     query = session.query(
         sqlalchemy.distinct(model.Issue.uid)
@@ -2406,18 +2343,10 @@ def search_issues(
                 model.TagColored.tag.in_(notags)
             )
         # Adjust the main query based on the parameters specified
-        if ytags and not notags:
+        if ytags:
             query = query.filter(model.Issue.uid.in_(sub_q2))
-        elif not ytags and notags:
+        if notags:
             query = query.filter(~model.Issue.uid.in_(sub_q3))
-        elif ytags and notags:
-            final_set = set(
-                [i[0] for i in sub_q2.all()]
-            ) - set(
-                [i[0] for i in sub_q3.all()]
-            )
-            if final_set:
-                query = query.filter(model.Issue.uid.in_(list(final_set)))
 
     if assignee is not None:
         if str(assignee).lower() not in ['false', '0', 'true', '1']:
@@ -2541,10 +2470,100 @@ def search_issues(
             model.Issue.project_id == repo.id
         )
 
-    if search_pattern is not None:
-        query = query.filter(
-            model.Issue.title.ilike('%%%s%%' % search_pattern)
-        )
+    matches = None
+    if search_pattern:
+        matches = pagure.lib.fulltext.search(
+            session, 'issue', search_pattern,
+            project_id=repo.id if repo is not None else None)
+        query = query.join(
+            matches, matches.c.ticket_uid == model.Issue.uid)
+
+    return query, matches
+
+
+def search_issues(
+        session, repo=None, issueid=None, issueuid=None, status=None,
+        closed=False, tags=None, assignee=None, author=None, private=None,
+        priority=None, milestones=None, count=False, offset=None,
+        limit=None, search_pattern=None, custom_search=None,
+        updated_after=None, no_milestones=None, order='desc',
+        order_key=None):
+    ''' Retrieve one or more issues associated to a project with the given
+    criterias.
+
+    Watch out that the closed argument is incompatible with the status
+    argument. The closed argument will return all the issues whose status
+    is not 'Open', otherwise it will return the issues having the specified
+    status.
+    The `tags` argument can be used to filter the issues returned based on
+    a certain tag.
+    If the `issueid` argument is specified a single Issue object (or None)
+    will be returned instead of a list of Issue objects.
+
+    :arg session: the session to use to connect to the database.
+    :arg repo: a Project object to which the issues should be associated
+    :type repo: pagure.lib.model.Project
+    :kwarg issueid: the identifier of the issue to look for
+    :type issueid: int or None
+    :kwarg issueuid: the unique identifier of the issue to look for
+    :type issueuid: str or None
+    :kwarg status: the status of the issue to look for (incompatible with
+        the `closed` argument).
+    :type status: str or None
+    :kwarg closed: a boolean indicating whether the issue to retrieve are
+        closed or open (incompatible with the `status` argument).
+    :type closed: bool or None
+    :kwarg tags: a tag the issue(s) returned should be associated with
+    :type tags: str or list(str) or None
+    :kwarg assignee: the name of the user assigned to the issues to search
+    :type assignee: str or None
+    :kwarg author: the name of the user who created the issues to search
+    :type author: str or None
+    :kwarg private: boolean or string to use to include or exclude private
+        tickets. Defaults to False.
+        If False: private tickets are excluded
+        If None: private tickets are included
+        If user name is specified: private tickets reported by that user
+        are included.
+    :type private: False, None or str
+    :kwarg priority: the priority of the issues to search
+    :type priority: int or None
+    :kwarg milestones: a milestone the issue(s) returned should be
+        associated with.
+    :type milestones: str or list(str) or None
+    :kwarg count: a boolean to specify if the method should return the list
+        of Issues or just do a COUNT query.
+    :type count: boolean
+    :kwarg search_pattern: words to search in the title, the content and
+        the comments of the issues, words between quotes are searched as a
+        phrase. Unless an `order_key` is specified, the most relevant
+        issues are returned first.
+    :type search_pattern: str or None
+    :kwarg custom_search: a dictionary of key/values to be used when
+        searching issues with a custom key constraint
+    :type custom_search: dict or None
+    :kwarg updated_after: datetime's date format (e.g. 2016-11-15) used to
+        filter issues updated after that date
+    :type updated_after: str or None
+    :kwarg no_milestones: Request issues that do not have a milestone set yet
+    :type None, True, or False
+    :kwarg order: Order issues in 'asc' or 'desc' order.
+    :type order: None, str
+    :kwarg order_key: Order issues by database column
+    :type order_key: None, str
+
+    :return: A single Issue object if issueid is specified, a list of Project
+        objects otherwise.
+    :rtype: Project or [Project]
+
+    '''
+    query, matches = _get_issues_query(
+        session, repo=repo, issueid=issueid, issueuid=issueuid,
+        status=status, closed=closed, tags=tags, assignee=assignee,
+        author=author, private=private, priority=priority,
+        milestones=milestones, search_pattern=search_pattern,
+        custom_search=custom_search, updated_after=updated_after,
+        no_milestones=no_milestones)
 
     column = model.Issue.date_created
     if order_key:
@@ -2571,6 +2590,10 @@ def search_issues(
     if str(column.type) == 'TEXT':
         column = func.lower(column)
 
+    if matches is not None and not order_key:
+        # Most relevant issues first
+        query = query.order_by(desc(matches.c.rank))
+
     # The priority is sorted differently because it is by weight and the lower
     # the number, the higher the priority
     if (order_key != 'priority' and order == 'asc') or \
@@ -2593,6 +2616,43 @@ def search_issues(
     return output
 
 
+def get_issue_facets(
+        session, repo, tags=None, assignee=None, author=None, private=None,
+        priority=None, milestones=None, search_pattern=None,
+        custom_search=None, no_milestones=None):
+    ''' Return the number of issues of a project matching the given
+    criterias per status and per tag, see search_issues for the meaning of
+    the arguments.
+
+    The counts are retrieved with a single query and memoized until one of
+    the issues of the project changes, the number of issues having a given
+    status or tag can then be obtained using
+    `pagure.lib.issue_facets.count` and `pagure.lib.issue_facets.count_tags`.
+
+    '''
+    if isinstance(tags, basestring):
+        tags = [tags]
+    if isinstance(milestones, basestring):
+        milestones = [milestones]
+    filters = {
+        'tags': sorted(tags or []),
+        'assignee': assignee,
+        'author': author,
+        'private': private,
+        'priority': priority,
+        'milestones': sorted(milestones or []),
+        'search_pattern': search_pattern,
+        'custom_search': custom_search,
+        'no_milestones': no_milestones,
+    }
+    query, _ = _get_issues_query(
+        session, repo=repo, tags=tags, assignee=assignee, author=author,
+        private=private, priority=priority, milestones=milestones,
+        search_pattern=search_pattern, custom_search=custom_search,
+        no_milestones=no_milestones)
+    return pagure.lib.issue_facets.get_facets(repo, query, filters)
+
+
 def get_tags_of_project(session, project, pattern=None):
     ''' Returns the list of tags associated with the issues of a project.
     '''
@@ -2643,7 +2703,8 @@ def get_colored_tag(session, tag, project_id):
 def search_pull_requests(
         session, requestid=None, project_id=None, project_id_from=None,
         status=None, author=None, assignee=None, count=False,
-        offset=None, limit=None, updated_after=None, branch_from=None):
+        offset=None, limit=None, updated_after=None, branch_from=None,
+        search_pattern=None):
     ''' Retrieve the specified issue
     '''
 
@@ -2731,6 +2792,12 @@ def search_pull_requests(
             model.PullRequest.branch_from == branch_from
         )
 
+    if search_pattern:
+        matches = pagure.lib.fulltext.search(
+            session, 'pull_request', search_pattern, project_id=project_id)
+        query = query.join(
+            matches, matches.c.ticket_uid == model.PullRequest.uid)
+
     if requestid:
         output = query.first()
     elif count:
@@ -2791,20 +2858,56 @@ def close_pull_request(session, request, user, requestfolder, merged=True):
     )
 
 
-def reset_status_pull_request(session, project):
-    ''' Reset the status of all opened Pull-Requests of a project.
+def reset_status_pull_request(session, project, branches=None):
+    ''' Reset the merge status of the opened Pull-Requests of a project.
+
+    :arg session: the session to use to connect to the database.
+    :arg project: the project whose pull-requests should be reset
+    :kwarg branches: if specified, only reset the pull-requests opened
+        against or from one of these branches of the project
+    :return: the list of the uid of the pull-requests that were reset
+
     '''
-    session.query(
-        model.PullRequest
-    ).filter(
-        model.PullRequest.project_id == project.id
+    if branches is not None and not branches:
+        return []
+
+    query = session.query(
+        model.PullRequest.uid
     ).filter(
         model.PullRequest.status == 'Open'
-    ).update(
-        {model.PullRequest.merge_status: None}
     )
 
+    if branches is None:
+        query = query.filter(
+            model.PullRequest.project_id == project.id
+        )
+    else:
+        query = query.filter(
+            sqlalchemy.or_(
+                sqlalchemy.and_(
+                    model.PullRequest.project_id == project.id,
+                    model.PullRequest.branch.in_(branches)
+                ),
+                sqlalchemy.and_(
+                    model.PullRequest.project_id_from == project.id,
+                    model.PullRequest.branch_from.in_(branches)
+                ),
+            )
+        )
+
+    uids = [row.uid for row in query]
+    if uids:
+        session.query(
+            model.PullRequest
+        ).filter(
+            model.PullRequest.uid.in_(uids)
+        ).update(
+            {model.PullRequest.merge_status: None},
+            synchronize_session=False
+        )
+
     session.commit()
+    return uids
 
 
 def add_attachment(repo, issue, attachmentfolder, user, filename, filestream):
@@ -3067,9 +3170,10 @@ def avatar_url_from_email(email, size=64, default='retro', dns=False):
             hashhex, query)
 
 
-def update_tags(session, obj, tags, username, gitfolder):
+def update_tags(session, obj, tags, username, gitfolder, commit=True):
     """ Update the tags of a specified object (adding or removing them).
     This object can be either an issue or a project.
+    See ``new_issue`` for ``commit``.
 
     """
     if isinstance(tags, basestring):
@@ -3100,14 +3204,15 @@ def update_tags(session, obj, tags, username, gitfolder):
         messages.append('%s **un**tagged with: %s' % (
             obj.isa.capitalize(), ', '.join(sorted(torm))))
 
-    session.commit()
+    _commit(session, commit)
 
     return messages
 
 
 def update_dependency_issue(
-        session, repo, issue, depends, username, ticketfolder):
+        session, repo, issue, depends, username, ticketfolder, commit=True):
     """ Update the dependency of a specified issue (adding or removing them)
+    See ``new_issue`` for ``commit``.
 
     """
     if isinstance(depends, basestring):
@@ -3155,14 +3260,15 @@ def update_dependency_issue(
             ticketfolder=ticketfolder,
         )
 
-    session.commit()
+    _commit(session, commit)
     return messages
 
 
 def update_blocked_issue(
-        session, repo, issue, blocks, username, ticketfolder):
+        session, repo, issue, blocks, username, ticketfolder, commit=True):
     """ Update the upstream dependency of a specified issue (adding or
     removing them)
+    See ``new_issue`` for ``commit``.
 
     """
     if isinstance(blocks, basestring):
@@ -3189,7 +3295,7 @@ def update_blocked_issue(
             user=username,
             ticketfolder=ticketfolder,
         )
-        session.commit()
+        _commit(session, commit)
 
     # Remove issue blocked
     for block in sorted([int(i) for i in torm]):
@@ -3212,7 +3318,7 @@ def update_blocked_issue(
             ticketfolder=ticketfolder,
         )
 
-    session.commit()
+    _commit(session, commit)
     return messages
 
 
@@ -3657,9 +3763,24 @@ def _convert_markdown(md_processor, text):
     return md_processor.convert(text)
 
 
-def text2markdown(text, extended=True, readme=False):
-    """ Simple text to html converter using the markdown library.
+_MD_PROCESSORS = threading.local()
+
+
+def _get_markdown_processor(extended=True, readme=False):
+    """ Return the markdown processor to use with the specified options.
+
+    Building a processor is costly so they are re-used across calls, one
+    per thread since they are not thread-safe.
     """
+    key = (extended, readme, pagure.APP.config.get('ENABLE_TICKETS', True))
+    processors = getattr(_MD_PROCESSORS, 'processors', None)
+    if processors is None:
+        processors = _MD_PROCESSORS.processors = {}
+    if key in processors:
+        md_processor = processors[key]
+        md_processor.reset()
+        return md_processor
+
     extensions = [
         'markdown.extensions.def_list',
         'markdown.extensions.fenced_code',
@@ -3694,17 +3815,48 @@ def text2markdown(text, extended=True, readme=False):
             }
         }
     )
+    processors[key] = md_processor
+    return md_processor
 
-    if text:
+
+def _get_markdown_context():
+    """ Return what, besides the text, the rendering of the markdown depends
+    on: the configuration and the page being rendered. """
+    context = [pagure.APP.config.get('APP_URL')]
+    if flask.has_request_context():
+        context.append(flask.request.url_root)
+        context.extend(pagure.pfmarkdown._get_ns_repo_user())
+    return context
+
+
+def text2markdown(text, extended=True, readme=False):
+    """ Simple text to html converter using the markdown library.
+
+    The html is memoized, see pagure.lib.markdown_cache.
+    """
+    if not text:
+        return ''
+
+    key = pagure.lib.markdown_cache.get_key(
+        text, extended, readme, _get_markdown_context())
+    html = pagure.lib.markdown_cache.get(key)
+    if html is not None:
+        return html
+
+    md_processor = _get_markdown_processor(extended, readme)
+    with pagure.lib.markdown_cache.recording() as rendering:
         try:
-            text = _convert_markdown(md_processor, text)
+            html = _convert_markdown(md_processor, text)
         except Exception:
             _log.debug(
                 'A markdown error occured while processing: ``%s``',
                 str(text))
-        return clean_input(text)
+            rendering.cacheable = False
+            html = text
+        html = clean_input(html)
 
-    return ''
+    pagure.lib.markdown_cache.store(key, html, rendering)
+    return html
 
 
 def filter_img_src(name, value):
@@ -3718,13 +3870,8 @@ def filter_img_src(name, value):
     return False
 
 
-def clean_input(text, ignore=None):
-    """ For a given html text, escape everything we do not want to support
-    to avoid potential security breach.
-    """
-    if ignore and not isinstance(ignore, (tuple, set, list)):
-        ignore = [ignore]
-
+def _get_bleach_version():
+    """ Return the version of bleach as a tuple. """
     bleach_v = bleach.__version__.split('.')
     for idx, val in enumerate(bleach_v):
         try:
@@ -3732,30 +3879,45 @@ def clean_input(text, ignore=None):
         except ValueError:  # pragma: no cover
             pass
         bleach_v[idx] = val
-
-    attrs = bleach.ALLOWED_ATTRIBUTES.copy()
-    attrs['table'] = ['class']
-    attrs['span'] = ['class', 'id']
-    attrs['div'] = ['class']
-    attrs['td'] = ['align']
-    attrs['th'] = ['align']
-    if not ignore or 'img' not in ignore:
+    return tuple(bleach_v)
+
+
+_BLEACH_VERSION = _get_bleach_version()
+
+_BLEACH_TAGS = bleach.ALLOWED_TAGS + [
+    'p', 'br', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'table', 'td', 'tr', 'th', 'thead', 'tbody',
+    'col', 'pre', 'img', 'hr', 'dl', 'dt', 'dd', 'span',
+    'kbd', 'var', 'del', 'cite',
+]
+_BLEACH_ATTRIBUTES = bleach.ALLOWED_ATTRIBUTES.copy()
+_BLEACH_ATTRIBUTES.update({
+    'table': ['class'],
+    'span': ['class', 'id'],
+    'div': ['class'],
+    'td': ['align'],
+    'th': ['align'],
+})
+# Arguments given to bleach.clean, per tags to ignore
+_BLEACH_KWARGS = {}
+
+
+def _get_bleach_kwargs(ignore):
+    """ Return the arguments to give to bleach.clean to ignore the
+    specified tags. """
+    ignore = tuple(sorted(ignore or []))
+    if ignore in _BLEACH_KWARGS:
+        return _BLEACH_KWARGS[ignore]
+
+    attrs = _BLEACH_ATTRIBUTES.copy()
+    if 'img' not in ignore:
         # newer bleach need three args for attribute callable
-        if tuple(bleach_v) >= (2, 0, 0):  # pragma: no cover
+        if _BLEACH_VERSION >= (2, 0, 0):  # pragma: no cover
             attrs['img'] = lambda tag, name, val: filter_img_src(name, val)
         else:
             attrs['img'] = filter_img_src
 
-    tags = bleach.ALLOWED_TAGS + [
-        'p', 'br', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-        'table', 'td', 'tr', 'th', 'thead', 'tbody',
-        'col', 'pre', 'img', 'hr', 'dl', 'dt', 'dd', 'span',
-        'kbd', 'var', 'del', 'cite',
-    ]
-    if ignore:
-        for tag in ignore:
-            if tag in tags:
-                tags.remove(tag)
+    tags = [tag for tag in _BLEACH_TAGS if tag not in ignore]
 
     kwargs = {
         'tags': tags,
@@ -3763,11 +3925,22 @@ def clean_input(text, ignore=None):
     }
 
     # newer bleach allow to customize the protocol supported
-    if tuple(bleach_v) >= (1, 5, 0):  # pragma: no cover
+    if _BLEACH_VERSION >= (1, 5, 0):  # pragma: no cover
         protocols = bleach.ALLOWED_PROTOCOLS + ['irc', 'ircs']
         kwargs['protocols'] = protocols
 
-    return bleach.clean(text, **kwargs)
+    _BLEACH_KWARGS[ignore] = kwargs
+    return kwargs
+
+
+def clean_input(text, ignore=None):
+    """ For a given html text, escape everything we do not want to support
+    to avoid potential security breach.
+    """
+    if ignore and not isinstance(ignore, (tuple, set, list)):
+        ignore = [ignore]
+
+    return bleach.clean(text, **_get_bleach_kwargs(ignore))
 
 
 def could_be_text(text):
@@ -4361,8 +4534,9 @@ def get_user_activity_day(session, user, date):
     return query.all()
 
 
-def log_action(session, action, obj, user_obj):
-    ''' Log an user action on a project/issue/PR. '''
+def log_action(session, action, obj, user_obj, commit=True):
+    ''' Log an user action on a project/issue/PR.
+    See ``new_issue`` for ``commit``. '''
     project_id = None
     if obj.isa in ['issue', 'pull-request']:
         project_id = obj.project_id
@@ -4388,7 +4562,7 @@ def log_action(session, action, obj, user_obj):
         setattr(log, 'pull_request_uid', obj.uid)
 
     session.add(log)
-    session.commit()
+    _commit(session, commit)
 
 
 def email_logs_count(session, email):
@@ -4447,9 +4621,11 @@ def get_active_milestones(session, project):
     return sorted([item[0] for item in query.distinct()])
 
 
-def add_metadata_update_notif(session, obj, messages, user, gitfolder):
+def add_metadata_update_notif(
+        session, obj, messages, user, gitfolder, commit=True):
     ''' Add a notification to the specified issue with the given messages
     which should reflect changes made to the meta-data of the issue.
+    See ``new_issue`` for ``commit``.
     '''
     if not messages:
         return
@@ -4482,7 +4658,7 @@ def add_metadata_update_notif(session, obj, messages, user, gitfolder):
     session.add(obj)
     session.add(obj_comment)
     # Make sure we won't have SQLAlchemy error before we continue
-    session.commit()
+    _commit(session, commit)
 
     if REDIS:
         REDIS.publish(
@@ -4508,7 +4684,9 @@ def add_metadata_update_notif(session, obj, messages, user, gitfolder):
 def tokenize_search_string(pattern):
     """This function tokenizes search patterns into key:value and rest.
 
-    It will also correctly parse key values between quotes.
+    It will also correctly parse key values between quotes, the phrases
+    between quotes are kept quoted in the rest so they can be searched as
+    such.
     """
     if pattern is None:
         return {}, None
@@ -4519,6 +4697,9 @@ def tokenize_search_string(pattern):
             key, value = token.split(':', 1)
             custom_search[key] = value
             return ''
+        elif ' ' in token:
+            # This was a phrase between quotes, thus a search pattern
+            return '"%s" ' % token
         else:
             # This was a token without colon, thus a search pattern
             return '%s ' % token
@@ -4837,45 +5018,17 @@ def issues_history_stats(session, project):
     :arg repo: model.Project object to get the issues stats about
 
     '''
+    return pagure.lib.history_stats.get_history_stats(
+        session, 'issues', project)
 
-    # Some ticket got imported as closed but without a closed_at date, so
-    # let's ignore them all
-    to_ignore = session.query(
-        model.Issue
-    ).filter(
-        model.Issue.project_id == project.id
-    ).filter(
-        model.Issue.closed_at == None,  # noqa
-    ).filter(
-        model.Issue.status == 'Closed'
-    ).count()
-
-    # For each week from tomorrow, get the number of open tickets
-    tomorrow = datetime.datetime.utcnow() + datetime.timedelta(days=1)
-    output = {}
-    for week in range(53):
-        start = tomorrow - datetime.timedelta(days=(week * 7))
-        closed_ticket = session.query(
-            model.Issue
-        ).filter(
-            model.Issue.project_id == project.id
-        ).filter(
-            model.Issue.closed_at >= start
-        ).filter(
-            model.Issue.date_created <= start
-        )
-        open_ticket = session.query(
-            model.Issue
-        ).filter(
-            model.Issue.project_id == project.id
-        ).filter(
-            model.Issue.status == 'Open'
-        ).filter(
-            model.Issue.date_created <= start
-        )
-        cnt = open_ticket.count() + closed_ticket.count() - to_ignore
-        if cnt < 0:
-            cnt = 0
-        output[start.isoformat()] = cnt
 
-    return output
+def pull_requests_history_stats(session, project):
+    ''' Returns the number of opened pull-requests on the specified project
+    over the last 365 days
+
+    :arg session: The session object to query the db with
+    :arg repo: model.Project object to get the pull-requests stats about
+
+    '''
+    return pagure.lib.history_stats.get_history_stats(
+        session, 'pull_requests', project)
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+Cache of the API tokens and of the access the users have to the projects.
+
+Every call to the API made with a token looks up the token, its ACLs and its
+user, and checking whether a user has access to a project walks the users
+and the groups given access to it. Both are kept for ``ACL_CACHE_TTL``
+seconds, in redis if it is configured or in a LRU cache of
+``ACL_CACHE_SIZE`` entries otherwise.
+
+A cached token is dropped when it is created, changed (its expiration or its
+ACLs) or removed.
+The access of a user to a project, read from the ``projects_access`` table,
+is dropped when the rows of this user in that table are re-built (see
+pagure.lib.project_access) and when the project is created, removed or
+changes read-only mode. To do so, the entries record the generation of the
+user and of the project: a counter incremented on each of these changes.
+
+Without redis, the changes made by the other processes are only seen once
+the entries cached expire.
+
+"""
+
+import collections
+import datetime
+import hashlib
+import json
+import threading
+import time
+
+import six
+import sqlalchemy as sa
+import sqlalchemy.orm
+
+import pagure
+import pagure.lib
+import pagure.lib.project_access
+from pagure.lib import model
+
+
+_CACHE = collections.OrderedDict()
+_GENERATIONS = {}
+_LOCK = threading.Lock()
+_SESSION_KEY = 'pagure_acl_cache'
+
+
+def _ttl():
+    return pagure.APP.config.get('ACL_CACHE_TTL', 60)
+
+
+def _get(key):
+    """ Return the value cached under the specified key, if any. """
+    if pagure.lib.REDIS:
+        cached = pagure.lib.REDIS.get(key)
+        return json.loads(cached) if cached else None
+
+    with _LOCK:
+        cached = _CACHE.get(key)
+        if cached is None:
+            return None
+        if cached['time'] + _ttl() < time.time():
+            del _CACHE[key]
+            return None
+        # Keep the most recently used entries last
+        del _CACHE[key]
+        _CACHE[key] = cached
+        return cached['value']
+
+
+def _set(key, value):
+    """ Cache the specified value under the specified key. """
+    if pagure.lib.REDIS:
+        pagure.lib.REDIS.set(key, json.dumps(value), ex=_ttl())
+        return
+
+    size = pagure.APP.config.get('ACL_CACHE_SIZE', 1000)
+    with _LOCK:
+        _CACHE.pop(key, None)
+        _CACHE[key] = {'value': value, 'time': time.time()}
+        while len(_CACHE) > size:
+            _CACHE.popitem(last=False)
+
+
+def _delete(keys):
+    if pagure.lib.REDIS:
+        pagure.lib.REDIS.delete(*keys)
+    with _LOCK:
+        for key in keys:
+            _CACHE.pop(key, None)
+
+
+def _get_generation_key(kind, name):
+    return 'pagure.acl.generation.%s.%s' % (kind, name)
+
+
+def _get_generations(keys):
+    """ Return the current generation of each of the specified keys. """
+    if pagure.lib.REDIS:
+        values = pagure.lib.REDIS.mget(keys)
+        return [int(value or 0) for value in values]
+    with _LOCK:
+        return [_GENERATIONS.get(key, 0) for key in keys]
+
+
+def _incr_generations(keys):
+    if pagure.lib.REDIS:
+        pipe = pagure.lib.REDIS.pipeline()
+        for key in keys:
+            pipe.incr(key)
+        pipe.execute()
+    with _LOCK:
+        for key in keys:
+            _GENERATIONS[key] = _GENERATIONS.get(key, 0) + 1
+
+
+class CachedToken(object):
+    """ The information of an API token needed to authorize the calls made
+    with it, standing for its ``model.Token``. """
+
+    def __init__(self, session, data):
+        self._session = session
+        self.id = data['id']
+        self.user_id = data['user_id']
+        self.project_id = data['project_id']
+        self.acls_list = data['acls']
+        self.expiration = datetime.datetime.strptime(
+            data['expiration'], '%Y-%m-%dT%H:%M:%S')
+
+    @property
+    def expired(self):
+        ''' Returns whether a token has expired or not. '''
+        return datetime.datetime.utcnow().date() >= self.expiration.date()
+
+    @property
+    def user(self):
+        ''' The user the token belongs to. '''
+        return self._session.query(model.User).get(self.user_id)
+
+    @property
+    def project(self):
+        ''' The project the token is restricted to, if any. '''
+        if self.project_id is None:
+            return None
+        return self._session.query(model.Project).get(self.project_id)
+
+
+def _get_token_key(token_id):
+    # The tokens are secrets, they are not stored as such
+    if isinstance(token_id, six.text_type):
+        token_id = token_id.encode('utf-8')
+    return 'pagure.acl.token.%s' % hashlib.sha1(token_id).hexdigest()
+
+
+def get_api_token(session, token_str):
+    """ Return the token corresponding to the provided token string if
+    there is any, returns None otherwise.
+
+    :arg session: the session to use to connect to the database.
+    :arg token_str: the token provided with the API call.
+    :return: a CachedToken or None
+
+    """
+    if not _ttl():
+        return pagure.lib.get_api_token(session, token_str)
+
+    key = _get_token_key(token_str)
+    data = _get(key)
+    if data is None:
+        token = pagure.lib.get_api_token(session, token_str)
+        if token is None:
+            return None
+        data = {
+            'id': token.id,
+            'user_id': token.user_id,
+            'project_id': token.project_id,
+            'acls': token.acls_list,
+            'expiration': token.expiration.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        _set(key, data)
+    return CachedToken(session, data)
+
+
+def _get_access_key(username, project_id):
+    return 'pagure.acl.access.%s.%s' % (project_id, username)
+
+
+def get_access_levels(username, project):
+    """ Return the access levels the specified user has to the specified
+    project, as owner, directly or via one of their groups.
+
+    :arg username: the username of the user.
+    :arg project: the model.Project object of the project, the database is
+        queried via its session if it has one.
+    :return: a set of 'owner', 'admin', 'commit' and 'ticket'
+
+    """
+    generation_keys = [
+        _get_generation_key('user', username),
+        _get_generation_key('project', project.id),
+    ]
+    key = _get_access_key(username, project.id)
+    if _ttl():
+        generations = _get_generations(generation_keys)
+        cached = _get(key)
+        if cached is not None and cached['generations'] == generations:
+            return set(cached['levels'])
+
+    session = sa.orm.object_session(project) or pagure.SESSION
+    query = session.query(
+        sa.distinct(model.ProjectAccess.access)
+    ).filter(
+        model.ProjectAccess.user_id == model.User.id
+    ).filter(
+        model.User.user == username
+    ).filter(
+        model.ProjectAccess.project_id == project.id
+    )
+    levels = set(access for access, in query)
+
+    if _ttl():
+        _set(key, {'levels': sorted(levels), 'generations': generations})
+    return levels
+
+
+def has_access(username, project, acl):
+    """ Return whether the specified user has the specified access to the
+    specified project, 'admin', 'commit' or 'ticket', see
+    ``get_access_levels``. """
+    levels = pagure.lib.project_access.ACCESS_LEVELS[acl]
+    return not get_access_levels(username, project).isdisjoint(levels)
+
+
+def _get_marks(session):
+    return session.info.setdefault(
+        _SESSION_KEY, {'tokens': set(), 'generations': set()})
+
+
+def _invalidate(marks):
+    if marks['tokens']:
+        _delete([_get_token_key(token_id) for token_id in marks['tokens']])
+    if marks['generations']:
+        _incr_generations(sorted(marks['generations']))
+
+
+def _mark(session, tokens=(), generations=()):
+    """ Drop the specified entries now and once the current transaction is
+    committed, so they are not cached again in between from the data being
+    changed. """
+    marks = {'tokens': set(tokens), 'generations': set(generations)}
+    _invalidate(marks)
+    if session is not None:
+        session_marks = _get_marks(session)
+        session_marks['tokens'].update(marks['tokens'])
+        session_marks['generations'].update(marks['generations'])
+
+
+def invalidate_users(session, user_ids):
+    """ Drop the cached access of the specified users, called once their
+    rows in the ``projects_access`` table are re-built. """
+    query = session.query(
+        model.User.user
+    ).filter(
+        model.User.id.in_(list(user_ids))
+    )
+    _mark(session, generations=[
+        _get_generation_key('user', username) for username, in query])
+
+
+def _on_commit(session):
+    marks = session.info.pop(_SESSION_KEY, None)
+    if marks:
+        _invalidate(marks)
+
+
+def _on_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def _on_token_change(mapper, connection, target):
+    _mark(sa.orm.object_session(target), tokens=[target.id])
+
+
+def _on_token_acl_change(mapper, connection, target):
+    _mark(sa.orm.object_session(target), tokens=[target.token_id])
+
+
+def _on_project_change(mapper, connection, target):
+    _mark(
+        sa.orm.object_session(target),
+        generations=[_get_generation_key('project', target.id)])
+
+
+def _on_read_only_set(target, value, oldvalue, initiator):
+    if value != oldvalue and target.id is not None:
+        _mark(
+            sa.orm.object_session(target),
+            generations=[_get_generation_key('project', target.id)])
+
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    sa.event.listen(model.Token, _event, _on_token_change)
+    sa.event.listen(model.TokenAcl, _event, _on_token_acl_change)
+sa.event.listen(model.Project, 'after_insert', _on_project_change)
+sa.event.listen(model.Project, 'after_delete', _on_project_change)
+sa.event.listen(model.Project.read_only, 'set', _on_read_only_set)
+
+sa.event.listen(sa.orm.Session, 'after_commit', _on_commit)
+sa.event.listen(sa.orm.Session, 'after_rollback', _on_rollback)
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+Persistent commit-graph index of the git repositories.
+
+For each commit, the index stores its generation number (one more than the
+highest generation number of its parents, root commits having 1), its commit
+time and its parents. This allows finding merge-bases and computing how far
+ahead or behind two commits are by only looking at the commits that differ
+between them instead of walking the entire history.
+
+The index is stored, in an append-only binary file, in the git repository
+itself. It is updated incrementally by the default post-receive hook or, for
+the commits missing from it when it is used, by a celery task: it is never
+built while answering a web request, the history is then walked as if there
+were no index.
+
+"""
+
+import binascii
+import collections
+import heapq
+import logging
+import os
+import struct
+import threading
+import time
+
+import pagure
+import pagure.lib.tasks
+
+
+_log = logging.getLogger(__name__)
+
+# The format of the entries changed with the version 2 of the file
+GRAPH_FILENAME = 'pagure-commit-graph.v2'
+
+# Header of each entry: commit oid, generation, commit time (which can be
+# negative or past 2038), parent count
+_ENTRY = struct.Struct('!20sIqI')
+_OID_SIZE = 20
+
+# Flags used while painting the graph
+_FROM_A = 1
+_FROM_B = 2
+_STALE = 4
+
+# Number of seconds during which an update of the index requested for a
+# commit is not requested again
+_SCHEDULE_DELAY = 300
+
+_GRAPHS = collections.OrderedDict()
+_GRAPHS_LOCK = threading.Lock()
+
+
+class CommitGraph(object):
+    """ In-memory representation of the commit-graph index of one git
+    repository.
+    """
+
+    def __init__(self, repopath):
+        self.repopath = repopath
+        self.path = os.path.join(repopath, GRAPH_FILENAME)
+        # hex oid -> (generation, commit_time, tuple of hex parents)
+        self.commits = {}
+        self._offset = 0
+        self._lock = threading.Lock()
+        # hex oid -> time at which an update was requested for it
+        self._scheduled = {}
+
+    def __contains__(self, oid):
+        return oid in self.commits
+
+    def __len__(self):
+        return len(self.commits)
+
+    def get(self, oid):
+        """ Return the (generation, commit_time, parents) of the specified
+        commit or None if it is not in the index.
+        """
+        return self.commits.get(oid)
+
+    def refresh(self):
+        """ Load the entries added to the index file since it was last read.
+        """
+        with self._lock:
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                return
+            if size < self._offset:
+                # The file was re-created, reload everything
+                self.commits = {}
+                self._offset = 0
+            if size == self._offset:
+                return
+
+            with open(self.path, 'rb') as stream:
+                stream.seek(self._offset)
+                data = stream.read()
+
+            pos = 0
+            while pos + _ENTRY.size <= len(data):
+                oid, gen, ctime, nparents = _ENTRY.unpack_from(data, pos)
+                end = pos + _ENTRY.size + nparents * _OID_SIZE
+                if end > len(data):
+                    # Partially written entry, we will read it next time
+                    break
+                parents = tuple(
+                    binascii.hexlify(data[idx:idx + _OID_SIZE])
+                    for idx in range(pos + _ENTRY.size, end, _OID_SIZE)
+                )
+                self.commits[binascii.hexlify(oid)] = (gen, ctime, parents)
+                pos = end
+            self._offset += pos
+
+    def update(self, repo_obj, heads):
+        """ Add to the index all the commits reachable from the specified
+        heads which are not in it already.
+
+        :arg repo_obj: the pygit2.Repository object of the git repository
+        :arg heads: a list of commit identifiers (hex strings)
+        :return: the number of commits added to the index
+
+        """
+        self.refresh()
+
+        new = []
+        known = {}
+        stack = [oid for oid in heads if oid not in self.commits]
+        while stack:
+            oid = stack[-1]
+            if oid in self.commits or oid in known:
+                stack.pop()
+                continue
+            commit = repo_obj[oid]
+            parents = [parent.oid.hex for parent in commit.parents]
+            missing = [
+                parent for parent in parents
+                if parent not in self.commits and parent not in known]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            gen = 1
+            for parent in parents:
+                entry = self.commits.get(parent) or known[parent]
+                gen = max(gen, entry[0] + 1)
+            known[oid] = (gen, commit.commit_time, tuple(parents))
+            new.append(oid)
+
+        if not new:
+            return 0
+
+        self._write(new, known)
+        return len(new)
+
+    def schedule_update(self, oid):
+        """ Request the celery task adding the specified commit, and its
+        ancestors, to the index, unless it was requested recently. """
+        now = time.time()
+        with self._lock:
+            for key, when in list(self._scheduled.items()):
+                if when < now - _SCHEDULE_DELAY:
+                    del self._scheduled[key]
+            if oid in self._scheduled:
+                return
+            self._scheduled[oid] = now
+        _log.info(
+            'Commit %s missing from the commit-graph of %s, updating it',
+            oid, self.repopath)
+        pagure.lib.tasks.update_commit_graph.delay(self.repopath, [oid])
+
+    def _write(self, oids, entries):
+        """ Append the specified commits to the index file.
+        Commits are written after their parents.
+        """
+        chunks = []
+        for oid in oids:
+            gen, ctime, parents = entries[oid]
+            chunks.append(_ENTRY.pack(
+                binascii.unhexlify(oid), gen, ctime, len(parents)))
+            chunks.extend(binascii.unhexlify(parent) for parent in parents)
+
+        data = b''.join(chunks)
+        with self._lock:
+            self.commits.update(entries)
+            try:
+                with open(self.path, 'ab') as stream:
+                    stream.seek(0, os.SEEK_END)
+                    size = stream.tell()
+                    stream.write(data)
+            except (IOError, OSError) as err:
+                # The commits are kept in memory for this process
+                _log.info(
+                    'Could not write the commit-graph of %s: %s',
+                    self.repopath, err)
+                return
+            # If someone else appended to the file in the mean time, their
+            # entries (and ours) will be read at the next refresh
+            if size == self._offset:
+                self._offset = size + len(data)
+
+
+def get_commit_graph(repopath):
+    """ Return the CommitGraph object of the git repository at the specified
+    path, it is kept in memory and refreshed across calls.
+
+    The indexes of the ``COMMIT_GRAPH_CACHE_SIZE`` repositories most
+    recently used are kept in memory.
+    """
+    repopath = os.path.abspath(repopath)
+    size = pagure.APP.config.get('COMMIT_GRAPH_CACHE_SIZE', 32)
+    with _GRAPHS_LOCK:
+        graph = _GRAPHS.pop(repopath, None)
+        if graph is None:
+            graph = CommitGraph(repopath)
+        _GRAPHS[repopath] = graph
+        while len(_GRAPHS) > size:
+            _GRAPHS.popitem(last=False)
+    graph.refresh()
+    return graph
+
+
+def update_commit_graph(repo_obj, heads=None):
+    """ Update the commit-graph index of the specified repository with the
+    commits reachable from the specified heads or, if no heads are
+    specified, from all the branches of the repository.
+    """
+    if heads is None:
+        heads = []
+        for branchname in repo_obj.listall_branches():
+            branch = repo_obj.lookup_branch(branchname)
+            heads.append(branch.get_object().hex)
+    graph = get_commit_graph(repo_obj.path)
+    return graph.update(repo_obj, heads)
+
+
+def _lookup(graphs, oid):
+    """ Return the entry of the specified commit in the first of the
+    specified graphs containing it. """
+    for graph in graphs:
+        entry = graph.get(oid)
+        if entry is not None:
+            return entry
+    raise KeyError('Commit %s not found in the commit-graph' % oid)
+
+
+def _paint(graphs, oid_a, oid_b):
+    """ Paint the commits reachable from oid_a and from oid_b, highest
+    generation first, until only commits reachable from both remain.
+
+    :return: a tuple (only_a, only_b, bases) of the list of commits only
+        reachable from oid_a, the list of commits only reachable from
+        oid_b and the list of merge-bases of the two commits.
+
+    """
+    flags = {oid_a: _FROM_A}
+    flags[oid_b] = flags.get(oid_b, 0) | _FROM_B
+    queue = []
+    for oid in set([oid_a, oid_b]):
+        heapq.heappush(queue, (-_lookup(graphs, oid)[0], oid))
+    # Number of commits in the queue not reachable from both sides
+    pending = len([oid for oid in flags if flags[oid] & 3 != 3])
+
+    only_a = []
+    only_b = []
+    bases = []
+    while queue and pending:
+        _, oid = heapq.heappop(queue)
+        flag = flags[oid]
+        if flag & 3 == 3:
+            if not flag & _STALE:
+                bases.append(oid)
+                flag |= _STALE
+        else:
+            pending -= 1
+            if flag & _FROM_A:
+                only_a.append(oid)
+            else:
+                only_b.append(oid)
+
+        for parent in _lookup(graphs, oid)[2]:
+            old = flags.get(parent)
+            new = (old or 0) | flag
+            if old is None:
+                heapq.heappush(queue, (-_lookup(graphs, parent)[0], parent))
+                if new & 3 != 3:
+                    pending += 1
+            elif old & 3 != 3 and new & 3 == 3:
+                pending -= 1
+            flags[parent] = new
+
+    # Whatever is left in the queue is reachable from both sides
+    for _, oid in queue:
+        if not flags[oid] & _STALE:
+            bases.append(oid)
+
+    return (only_a, only_b, bases)
+
+
+def _get_graph(repo_obj, oid):
+    """ Return the commit-graph of the specified repository if it contains
+    the specified commit, otherwise request its update and raise a
+    KeyError. """
+    graph = get_commit_graph(repo_obj.path)
+    if oid not in graph:
+        graph.schedule_update(oid)
+        raise KeyError('Commit %s not found in the commit-graph' % oid)
+    return graph
+
+
+def _get_graphs(repo_obj, oid, orig_repo=None, orig_oid=None):
+    """ Return the commit-graphs of the specified repositories, which must
+    contain the specified commits (see ``_get_graph``). """
+    graphs = [_get_graph(repo_obj, oid)]
+    if orig_repo is not None \
+            and os.path.abspath(orig_repo.path) != graphs[0].repopath:
+        graphs.append(_get_graph(orig_repo, orig_oid))
+    elif orig_oid is not None and orig_oid not in graphs[0]:
+        graphs[0].schedule_update(orig_oid)
+        raise KeyError('Commit %s not found in the commit-graph' % orig_oid)
+    return graphs
+
+
+def merge_bases(repo_obj, oid, orig_repo, orig_oid):
+    """ Return the merge-bases of the two specified commits, which may be
+    in two different (but related) git repositories.
+
+    :arg repo_obj: the pygit2.Repository object containing ``oid``
+    :arg oid: the identifier of the first commit
+    :arg orig_repo: the pygit2.Repository object containing ``orig_oid``
+    :arg orig_oid: the identifier of the second commit
+    :return: the list of the identifiers of the merge-bases, empty if the
+        two commits have no common history. When there are several
+        merge-bases, some of them may be ancestors of the others.
+
+    """
+    graphs = _get_graphs(repo_obj, oid, orig_repo, orig_oid)
+    return _paint(graphs, oid, orig_oid)[2]
+
+
+def ahead_behind(repo_obj, oid, orig_repo, orig_oid):
+    """ Return the commits reachable from ``oid`` and not from ``orig_oid``
+    (ahead) as well as the commits reachable from ``orig_oid`` and not from
+    ``oid`` (behind), highest generation first.
+
+    :return: a tuple (ahead, behind) of lists of commit identifiers
+
+    """
+    graphs = _get_graphs(repo_obj, oid, orig_repo, orig_oid)
+    only_a, only_b, _ = _paint(graphs, oid, orig_oid)
+    return (only_a, only_b)
+
+
+def is_ancestor(repo_obj, ancestor, descendant):
+    """ Return whether the commit ``ancestor`` is reachable from the commit
+    ``descendant``. Only the commits whose generation number is higher than
+    the one of ``ancestor`` are looked at.
+    """
+    graphs = _get_graphs(repo_obj, descendant)
+    if ancestor not in graphs[0]:
+        return False
+    if ancestor == descendant:
+        return True
+    min_gen = _lookup(graphs, ancestor)[0]
+
+    seen = set([descendant])
+    stack = [descendant]
+    while stack:
+        oid = stack.pop()
+        for parent in _lookup(graphs, oid)[2]:
+            if parent == ancestor:
+                return True
+            if parent in seen or _lookup(graphs, parent)[0] <= min_gen:
+                continue
+            seen.add(parent)
+            stack.append(parent)
+    return False
+
+
+def enabled():
+    """ Return whether the commit-graph should be used. """
+    return pagure.APP.config.get('COMMIT_GRAPH', True)
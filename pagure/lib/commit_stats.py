@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+Persistent statistics about the commits of the git repositories.
+
+The statistics (number of commits per author and per day) are stored, as
+JSON, in the git repository itself together with the identifier of the
+head they were computed for. When the head moves forward only the new
+commits are processed, if it was rewritten (force-push) the statistics are
+re-computed from scratch.
+
+"""
+
+import collections
+import datetime
+import json
+import logging
+import os
+import struct
+import tempfile
+
+import arrow
+import pygit2
+
+import pagure.lib.commit_graph
+
+
+_log = logging.getLogger(__name__)
+
+STATS_FILENAME = 'pagure-commit-stats'
+
+
+def _empty_stats():
+    """ Return the statistics of a repository without commits. """
+    return {
+        'head': None,
+        'count': 0,
+        'authors': [],
+        'dates': {},
+        'first_commit_time': None,
+    }
+
+
+def load_stats(repopath):
+    """ Return the statistics stored in the specified git repository or
+    None if there are none (or they cannot be read).
+    """
+    path = os.path.join(repopath, STATS_FILENAME)
+    try:
+        with open(path) as stream:
+            return json.load(stream)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def save_stats(repopath, stats):
+    """ Store the specified statistics in the specified git repository. """
+    path = os.path.join(repopath, STATS_FILENAME)
+    try:
+        fd, tmppath = tempfile.mkstemp(
+            prefix='.%s-' % STATS_FILENAME, dir=repopath)
+        with os.fdopen(fd, 'w') as stream:
+            json.dump(stats, stream)
+        os.rename(tmppath, path)
+    except (IOError, OSError) as err:
+        _log.info('Could not store the commit stats of %s: %s', repopath, err)
+
+
+def _is_ancestor(repo_obj, ancestor, descendant):
+    """ Return whether the commit ``ancestor`` is reachable from the commit
+    ``descendant``. """
+    if pagure.lib.commit_graph.enabled():
+        try:
+            return pagure.lib.commit_graph.is_ancestor(
+                repo_obj, ancestor, descendant)
+        except (KeyError, IOError, OSError, struct.error) as err:
+            _log.info('Could not use the commit-graph: %s', err)
+    try:
+        base = repo_obj.merge_base(ancestor, descendant)
+    except (KeyError, ValueError, pygit2.GitError):
+        return False
+    return base is not None and base.hex == ancestor
+
+
+def _add_commits(stats, walker):
+    """ Add the commits returned by the specified walker to the specified
+    statistics. """
+    authors = collections.defaultdict(int)
+    for name, email, cnt in stats['authors']:
+        authors[(name, email)] = cnt
+    dates = collections.defaultdict(int, stats['dates'])
+    first_commit_time = stats['first_commit_time']
+
+    for commit in walker:
+        stats['count'] += 1
+        authors[(commit.author.name, commit.author.email)] += 1
+        dates[arrow.get(commit.commit_time).date().isoformat()] += 1
+        if first_commit_time is None \
+                or commit.commit_time < first_commit_time:
+            first_commit_time = commit.commit_time
+
+    stats['authors'] = [
+        [name, email, authors[(name, email)]]
+        for (name, email) in sorted(authors)
+    ]
+    stats['dates'] = dict(dates)
+    stats['first_commit_time'] = first_commit_time
+
+
+def update_stats(repo_obj, head=None):
+    """ Update the statistics stored in the specified git repository so
+    they match the specified head (defaults to the HEAD of the repository).
+
+    :arg repo_obj: the pygit2.Repository object of the git repository
+    :kwarg head: the identifier of the commit to compute the stats for
+    :return: the up to date statistics
+
+    """
+    if head is None:
+        head = repo_obj.head.get_object().oid.hex
+
+    repopath = repo_obj.path
+    stats = load_stats(repopath)
+    if stats and stats['head'] == head:
+        return stats
+
+    walker = repo_obj.walk(head, pygit2.GIT_SORT_NONE)
+    if stats and stats['head'] \
+            and _is_ancestor(repo_obj, stats['head'], head):
+        walker.hide(stats['head'])
+    else:
+        if stats:
+            _log.info('History of %s was rewritten, re-computing its '
+                      'commit stats', repopath)
+        stats = _empty_stats()
+
+    _add_commits(stats, walker)
+    stats['head'] = head
+    save_stats(repopath, stats)
+    return stats
+
+
+def get_author_stats(repo_obj):
+    """ Return the number of commits, the authors sorted by number of
+    commits, the number of distinct authors emails and the time of the
+    oldest commit of the HEAD of the specified git repository.
+    """
+    stats = update_stats(repo_obj)
+
+    emails = set()
+    out_stats = collections.defaultdict(list)
+    for name, email, cnt in stats['authors']:
+        out_stats[cnt].append((name, email))
+        emails.add(email)
+    out_list = [
+        (key, out_stats[key])
+        for key in sorted(out_stats, reverse=True)
+    ]
+
+    return (
+        stats['count'], out_list, len(emails), stats['first_commit_time'])
+
+
+def get_history_stats(repo_obj):
+    """ Return the number of commits made per day, over the last year, on
+    the HEAD of the specified git repository.
+    """
+    stats = update_stats(repo_obj)
+
+    today = datetime.datetime.utcnow().date()
+    dates = []
+    for key in sorted(stats['dates']):
+        delta = today - arrow.get(key).date()
+        if delta.days > 365:
+            continue
+        dates.append((key, stats['dates'][key]))
+    return dates
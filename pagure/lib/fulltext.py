@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+Full-text search over the issues and pull-requests.
+
+The title, the content and the comments of each ticket are kept in the
+``search_index`` table. The rows of a ticket are re-built at the end of the
+flush in which it, or one of its comments, was created, edited or removed.
+
+The search itself relies on the database:
+
+- on PostgreSQL, the ``search_index`` table has a GIN index on the
+  ``tsvector`` of the title and the content which is queried with
+  ``to_tsquery`` and ranked with ``ts_rank``,
+- on SQLite, the title and the content are copied in a FTS5 virtual table
+  queried with ``MATCH`` and ranked with ``bm25``,
+- otherwise (or if FTS5 is not available) the ``search_index`` table is
+  searched using ``LIKE``.
+
+In all cases, the title weighs more than the content in the ranking.
+
+"""
+
+import collections
+import logging
+import re
+
+import sqlalchemy as sa
+import sqlalchemy.orm
+from sqlalchemy import func
+
+from pagure.lib import model
+
+
+_log = logging.getLogger(__name__)
+
+_SESSION_KEY = 'pagure_fulltext'
+
+# Kind of tickets -> (model, comment model, content column, column linking
+# the comments to the ticket)
+KINDS = {
+    'issue': (
+        model.Issue, model.IssueComment,
+        model.Issue.content, model.IssueComment.issue_uid),
+    'pull_request': (
+        model.PullRequest, model.PullRequestComment,
+        model.PullRequest.initial_comment,
+        model.PullRequestComment.pull_request_uid),
+}
+
+_FTS_TABLE = 'search_index_fts'
+_FTS_CREATE = 'CREATE VIRTUAL TABLE %s USING fts5(title, content)' % (
+    _FTS_TABLE)
+
+# The text search configuration used on PostgreSQL, the index of the
+# search_index table is built using it
+_PG_CONFIG = "'english'::regconfig"
+_PG_INDEX = 'search_index_document_idx'
+
+_TERM_RE = re.compile(r'"([^"]*)"|(\S+)', re.UNICODE)
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _fts_table():
+    return sa.table(
+        _FTS_TABLE,
+        sa.column('rowid'),
+        sa.column('title'),
+        sa.column('content'),
+    )
+
+
+def _pg_document(table):
+    ''' Return the tsvector of the title and the content of the tickets. '''
+    def _vector(column, weight):
+        return func.setweight(
+            func.to_tsvector(sa.literal_column(_PG_CONFIG), column),
+            sa.literal_column("'%s'" % weight))
+    return _vector(table.c.title, 'A').op('||')(
+        _vector(table.c.content, 'B'))
+
+
+def _dialect_name(connection):
+    ''' Return the name of the database used by the specified session or
+    connection. '''
+    bind = getattr(connection, 'bind', None) or connection
+    return bind.dialect.name
+
+
+def create_backend(connection):
+    ''' Create the full-text index of the search_index table, if the
+    database supports it.
+
+    :arg connection: the connection to the database to use
+
+    '''
+    table = model.SearchIndex.__table__
+    dialect = _dialect_name(connection)
+    if dialect == 'postgresql':
+        ddl = sa.schema.CreateIndex(
+            sa.Index(_PG_INDEX, _pg_document(table), postgresql_using='gin'))
+        connection.execute(ddl)
+    elif dialect == 'sqlite':
+        try:
+            connection.execute(_FTS_CREATE)
+        except sa.exc.OperationalError as err:
+            _log.warning(
+                'Full-text search will fall back to LIKE queries, FTS5 '
+                'is not available: %s', err)
+
+
+def _has_fts(connection):
+    ''' Return whether the FTS5 table of the search_index table exists. '''
+    if _dialect_name(connection) != 'sqlite':
+        return False
+    query = sa.text(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name=:name")
+    return connection.execute(
+        query, params={'name': _FTS_TABLE}).first() is not None
+
+
+def _delete_rows(connection, condition):
+    ''' Delete the rows of the search_index table matching the specified
+    condition. '''
+    table = model.SearchIndex.__table__
+    if _has_fts(connection):
+        fts = _fts_table()
+        connection.execute(fts.delete().where(
+            fts.c.rowid.in_(sa.select([table.c.id]).where(condition))))
+    connection.execute(table.delete().where(condition))
+
+
+def index_tickets(session, kind, uids):
+    ''' (Re-)index the specified tickets, the tickets which no longer exist
+    are removed from the index.
+
+    :arg session: the session to use to connect to the database.
+    :arg kind: the kind of tickets, 'issue' or 'pull_request'
+    :arg uids: the uids of the tickets to index
+
+    '''
+    ticket_cls, comment_cls, content_col, ticket_col = KINDS[kind]
+    table = model.SearchIndex.__table__
+    uids = sorted(set(uids))
+    if not uids:
+        return
+
+    comments = collections.defaultdict(list)
+    query = session.query(
+        ticket_col, comment_cls.comment
+    ).filter(
+        ticket_col.in_(uids)
+    ).filter(
+        comment_cls.notification == False  # noqa: E712
+    ).order_by(
+        comment_cls.id
+    )
+    for uid, comment in query:
+        comments[uid].append(comment)
+
+    rows = []
+    query = session.query(
+        ticket_cls.uid,
+        ticket_cls.project_id,
+        ticket_cls.title,
+        content_col,
+    ).filter(
+        ticket_cls.uid.in_(uids)
+    )
+    for uid, project_id, title, content in query:
+        rows.append({
+            'project_id': project_id,
+            'kind': kind,
+            'ticket_uid': uid,
+            'title': title or '',
+            'content': '\n\n'.join([content or ''] + comments[uid]),
+        })
+
+    condition = sa.and_(table.c.kind == kind, table.c.ticket_uid.in_(uids))
+    _delete_rows(session, condition)
+    if rows:
+        session.execute(table.insert(), rows)
+        if _has_fts(session):
+            fts = _fts_table()
+            session.execute(fts.insert().from_select(
+                ['rowid', 'title', 'content'],
+                sa.select([
+                    table.c.id, table.c.title, table.c.content
+                ]).where(condition)
+            ))
+
+
+def reindex_all(session):
+    ''' Re-build the index of all the issues and pull-requests. '''
+    if _has_fts(session):
+        session.execute(_fts_table().delete())
+    session.execute(model.SearchIndex.__table__.delete())
+    for kind, (ticket_cls, _, _, _) in KINDS.items():
+        uids = [uid for uid, in session.query(ticket_cls.uid)]
+        index_tickets(session, kind, uids)
+
+
+def _parse_pattern(pattern):
+    ''' Return the terms of the specified search pattern, a term being
+    either a single word or a phrase between quotes. '''
+    terms = []
+    for phrase, word in _TERM_RE.findall(pattern or ''):
+        term = (phrase or word).strip()
+        if term:
+            terms.append(term)
+    return terms
+
+
+def _fts_query(terms):
+    ''' Return the FTS5 query matching the specified terms, the last word
+    of each term may only be the start of a word. '''
+    query = []
+    for term in terms:
+        query.append('"%s"*' % ' '.join(_WORD_RE.findall(term)))
+    return ' '.join(query)
+
+
+def _pg_query(terms):
+    ''' Return the tsquery matching the specified terms, see _fts_query. '''
+    query = []
+    for term in terms:
+        words = _WORD_RE.findall(term)
+        words[-1] += ':*'
+        query.append('(%s)' % ' <-> '.join(words))
+    return ' & '.join(query)
+
+
+def search(session, kind, pattern, project_id=None):
+    ''' Return the tickets of the specified kind matching the specified
+    search pattern.
+
+    :arg session: the session to use to connect to the database.
+    :arg kind: the kind of tickets, 'issue' or 'pull_request'
+    :arg pattern: the words to search, words between quotes are searched
+        as a phrase
+    :kwarg project_id: restrict the search to the tickets of this project
+    :return: a selectable with the ``ticket_uid`` and the ``rank`` (the
+        higher the more relevant) of the matching tickets
+
+    '''
+    table = model.SearchIndex.__table__
+    terms = _parse_pattern(pattern)
+    # Terms without any word (ie: only symbols) can only be found by LIKE
+    indexed = terms and all(_WORD_RE.search(term) for term in terms)
+    dialect = _dialect_name(session)
+
+    if indexed and dialect == 'postgresql':
+        document = _pg_document(table)
+        tsquery = func.to_tsquery(
+            sa.literal_column(_PG_CONFIG), _pg_query(terms))
+        query = sa.select([
+            table.c.ticket_uid,
+            func.ts_rank(document, tsquery).label('rank'),
+        ]).where(
+            document.op('@@')(tsquery)
+        )
+    elif indexed and _has_fts(session):
+        # bm25 is lower for the more relevant results
+        matches = sa.text(
+            'SELECT rowid AS id, -bm25(%s, 10.0, 1.0) AS rank FROM %s '
+            'WHERE %s MATCH :query' % (_FTS_TABLE, _FTS_TABLE, _FTS_TABLE)
+        ).bindparams(
+            query=_fts_query(terms)
+        ).columns(
+            id=sa.Integer, rank=sa.Float
+        ).alias('fts_matches')
+        query = sa.select([
+            table.c.ticket_uid,
+            matches.c.rank,
+        ]).where(
+            table.c.id == matches.c.id
+        )
+    else:
+        in_title = []
+        in_ticket = []
+        for term in terms:
+            term = '%%%s%%' % term
+            in_title.append(table.c.title.ilike(term))
+            in_ticket.append(sa.or_(
+                table.c.title.ilike(term), table.c.content.ilike(term)))
+        query = sa.select([
+            table.c.ticket_uid,
+            sa.case([(sa.and_(*in_title), 2)], else_=1).label('rank'),
+        ]).where(
+            sa.and_(*in_ticket)
+        )
+
+    query = query.where(table.c.kind == kind)
+    if project_id is not None:
+        query = query.where(table.c.project_id == project_id)
+    return query.alias('search_matches')
+
+
+def _mark(target, kind, uid):
+    ''' Mark the specified ticket to be re-indexed at the end of the flush.
+    '''
+    session = sa.orm.object_session(target)
+    if session is not None and uid is not None:
+        session.info.setdefault(_SESSION_KEY, set()).add((kind, uid))
+
+
+def _on_flush(session, flush_context):
+    ''' Re-index the tickets marked during the flush. '''
+    marks = session.info.pop(_SESSION_KEY, None)
+    if not marks:
+        return
+
+    uids = collections.defaultdict(set)
+    for kind, uid in marks:
+        uids[kind].add(uid)
+    for kind in sorted(uids):
+        index_tickets(session, kind, uids[kind])
+
+
+def _on_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def _register(kind):
+    ''' Re-index the tickets when they or their comments change. '''
+    ticket_cls, comment_cls, content_col, ticket_col = KINDS[kind]
+    attrs = ('project_id', 'title', content_col.key)
+
+    def _on_ticket_change(mapper, connection, target):
+        _mark(target, kind, target.uid)
+
+    def _on_ticket_update(mapper, connection, target):
+        state = sa.inspect(target)
+        if any(state.attrs[attr].history.has_changes() for attr in attrs):
+            _mark(target, kind, target.uid)
+
+    def _on_comment_change(mapper, connection, target):
+        _mark(target, kind, getattr(target, ticket_col.key))
+
+    sa.event.listen(ticket_cls, 'after_insert', _on_ticket_change)
+    sa.event.listen(ticket_cls, 'after_update', _on_ticket_update)
+    sa.event.listen(ticket_cls, 'after_delete', _on_ticket_change)
+    for event in ('after_insert', 'after_update', 'after_delete'):
+        sa.event.listen(comment_cls, event, _on_comment_change)
+
+
+def _on_project_delete(mapper, connection, target):
+    _delete_rows(
+        connection, model.SearchIndex.__table__.c.project_id == target.id)
+
+
+def _on_table_create(target, connection, **kw):
+    create_backend(connection)
+
+
+def _on_table_drop(target, connection, **kw):
+    if _dialect_name(connection) == 'sqlite':
+        connection.execute('DROP TABLE IF EXISTS %s' % _FTS_TABLE)
+
+
+for _kind in KINDS:
+    _register(_kind)
+
+sa.event.listen(model.Project, 'after_delete', _on_project_delete)
+sa.event.listen(model.SearchIndex.__table__, 'after_create', _on_table_create)
+sa.event.listen(model.SearchIndex.__table__, 'after_drop', _on_table_drop)
+
+sa.event.listen(sa.orm.Session, 'after_flush_postexec', _on_flush)
+sa.event.listen(sa.orm.Session, 'after_rollback', _on_rollback)
@@ -14,13 +14,18 @@
 # pylint: disable=too-many-statements
 # pylint: disable=too-many-lines
 
+import collections
+import contextlib
 import datetime
+import itertools
 import json
 import logging
 import os
 import shutil
+import struct
 import subprocess
 import tempfile
+import threading
 
 import arrow
 import pygit2
@@ -31,6 +36,7 @@ from pygit2.remote import RemoteCollection
 import pagure
 import pagure.exceptions
 import pagure.lib
+import pagure.lib.commit_graph
 import pagure.lib.notify
 from pagure.lib import model
 from pagure.lib.repo import PagureRepo
@@ -144,6 +150,12 @@ def update_git(obj, repo, repofolder):
     else:
         raise NotImplementedError('Unknown object type %s' % obj.isa)
 
+    if pagure.APP.config.get('GIT_METADATA_BATCH_DELAY') \
+            and pagure.lib.REDIS:
+        queued = _queue_batch_update_git(obj, repo)
+        _maybe_wait(queued)
+        return queued
+
     queued = pagure.lib.tasks.update_git.delay(
         repo.name, repo.namespace,
         repo.user.username if repo.is_fork else None,
@@ -152,6 +164,87 @@ def update_git(obj, repo, repofolder):
     return queued
 
 
+def _get_batch_update_key(isa, repo):
+    """ Returns the redis key of the set holding the uids of the objects of
+    the specified type whose JSON representation is waiting to be updated
+    in the git repo of the specified project.
+    """
+    return 'pagure.update_git.%s.%s' % (isa, repo.fullname)
+
+
+def _queue_batch_update_git(obj, repo):
+    """ Add the specified object to the list of objects waiting for their
+    JSON representation to be updated in the git repo of the project and,
+    if there is not already one pending, schedule a batch_update_git task
+    which will commit all of them at once after GIT_METADATA_BATCH_DELAY
+    seconds.
+    """
+    queued = _add_batch_update_git(obj.isa, repo, [obj.uid])
+    if queued is None:
+        _log.debug('Update of %s %s added to the pending batch', obj.isa,
+                   obj.uid)
+    return queued
+
+
+def _add_batch_update_git(isa, repo, uids):
+    """ Add the specified objects to the list of objects of the specified
+    type waiting to be updated in the git repo of the project and, if there
+    is not already one pending, schedule a batch_update_git task.
+
+    :return: the task scheduled or None if there was one pending already
+
+    """
+    delay = pagure.APP.config['GIT_METADATA_BATCH_DELAY']
+    key = _get_batch_update_key(isa, repo)
+
+    pipe = pagure.lib.REDIS.pipeline()
+    pipe.sadd(key, *uids)
+    # The flag expires in case the task got lost somehow
+    pipe.set('%s.scheduled' % key, '1', nx=True, ex=max(delay * 10, 60))
+    _, scheduled = pipe.execute()
+
+    if not scheduled:
+        return None
+
+    return pagure.lib.tasks.batch_update_git.apply_async(
+        args=(
+            repo.name, repo.namespace,
+            repo.user.username if repo.is_fork else None,
+            isa),
+        countdown=delay)
+
+
+@contextlib.contextmanager
+def _take_batch_update_git(isa, repo):
+    """ Take the uids of the objects of the specified type waiting to be
+    updated in the git repo of the specified project out of that list, and
+    yield them.
+
+    The scheduled flag is removed first so that any update arriving while
+    the batch is being processed schedules a new task.
+    If updating the git repo fails, the uids are put back in the list, and
+    a new task scheduled, so these updates are not lost.
+    """
+    key = _get_batch_update_key(isa, repo)
+    pagure.lib.REDIS.delete('%s.scheduled' % key)
+
+    pipe = pagure.lib.REDIS.pipeline()
+    pipe.smembers(key)
+    pipe.delete(key)
+    uids, _ = pipe.execute()
+    uids = sorted(uids)
+
+    try:
+        yield uids
+    except Exception:
+        if uids:
+            _log.info(
+                'Could not update %s %ss of %s in git, putting them back',
+                len(uids), isa, repo.fullname)
+            _add_batch_update_git(isa, repo, uids)
+        raise
+
+
 def _maybe_wait(result):
     """ Function to patch if one wants to wait for finish.
 
@@ -160,6 +253,108 @@ def _maybe_wait(result):
     pass
 
 
+def _set_ref_if_unchanged(repo_obj, refname, new_oid, old_oid):
+    """ Point the specified reference to ``new_oid`` only if it still points
+    to ``old_oid`` (or, if ``old_oid`` is None, if it does not exist yet).
+
+    Writers of the metadata repositories are serialized via the project's
+    ``WORKER`` lock, this check protects us against the reference having
+    been moved by someone pushing directly to the git repository.
+
+    The comparison and the update are done by ``git update-ref`` while
+    holding the lock of the reference, so a push landing in between cannot
+    be overwritten.
+
+    :arg repo_obj: the pygit2.Repository object in which to update the ref
+    :arg refname: the full name of the reference to update
+    :arg new_oid: the oid the reference should point to
+    :arg old_oid: the oid the reference is expected to point to currently
+    :return: a boolean specifying whether the reference was updated or not
+
+    """
+    cmd = [
+        'git', '--git-dir', repo_obj.path, 'update-ref', refname,
+        new_oid.hex, old_oid.hex if old_oid else '0' * 40,
+    ]
+    proc = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = proc.communicate()
+    if proc.returncode:
+        _log.info(
+            'Could not update %s in %s: %s', refname, repo_obj.path,
+            err.strip())
+        return False
+    return True
+
+
+def _commit_files_in_memory(repopath, files, message):
+    """ Commit the given files at the root of the specified bare git
+    repository without having to clone it.
+
+    The blobs and the tree are written directly into the object database
+    of the repository and `refs/heads/master` is then moved to the new
+    commit if it has not changed in the mean time.
+
+    :arg repopath: the path to the bare git repository to commit into
+    :arg files: a dictionary of filename: content, if the content is
+        ``None`` the file is removed from the repository
+    :arg message: the message of the git commit
+    :return: the oid of the commit created or None if nothing changed
+
+    """
+    repo_obj = PagureRepo(repopath)
+    refname = 'refs/heads/master'
+
+    # Author/commiter will always be this one
+    author = pygit2.Signature(name='pagure', email='pagure')
+
+    for _ in range(pagure.APP.config.get('GIT_METADATA_MAX_RETRIES', 5)):
+        parent = None
+        try:
+            parent = repo_obj[repo_obj.lookup_reference(refname).target]
+        except KeyError:
+            pass
+
+        if parent:
+            builder = repo_obj.TreeBuilder(parent.tree)
+        else:
+            builder = repo_obj.TreeBuilder()
+
+        changed = False
+        for filename, content in files.items():
+            entry = builder.get(filename)
+            if content is None:
+                if entry is not None:
+                    builder.remove(filename)
+                    changed = True
+                continue
+
+            blob_id = repo_obj.create_blob(content)
+            if entry is not None and entry.id == blob_id:
+                continue
+            builder.insert(filename, blob_id, pygit2.GIT_FILEMODE_BLOB)
+            changed = True
+
+        # If not change, return
+        if not changed:
+            return None
+
+        parents = [parent.oid] if parent else []
+        commit = repo_obj.create_commit(
+            None, author, author, message, builder.write(), parents)
+
+        if _set_ref_if_unchanged(
+                repo_obj, refname, commit, parent.oid if parent else None):
+            return commit
+
+        _log.info(
+            'The git repo: %s was updated in the mean time, retrying',
+            repopath)
+
+    raise pagure.exceptions.PagureException(
+        'Could not update the git repo: %s, it kept changing' % repopath)
+
+
 def _update_git(obj, repo, repofolder):
     """ Update the given issue in its git.
 
@@ -167,6 +362,9 @@ def _update_git(obj, repo, repofolder):
     is defined by the uid field of the issue and if there are additions/
     changes commit them and push them back to the original repo.
 
+    If ``GIT_METADATA_IN_MEMORY`` is enabled, the changes are written
+    directly in the bare repository instead of using a clone.
+
     """
     _log.info('Update the git repo: %s for: %s', repo.path, obj)
 
@@ -176,6 +374,15 @@ def _update_git(obj, repo, repofolder):
     # Get the fork
     repopath = os.path.join(repofolder, repo.path)
 
+    if pagure.APP.config.get('GIT_METADATA_IN_MEMORY', True):
+        content = json.dumps(
+            obj.to_json(), sort_keys=True, indent=4,
+            separators=(',', ': '))
+        _commit_files_in_memory(
+            repopath, {obj.uid: content},
+            'Updated %s %s: %s' % (obj.isa, obj.uid, obj.title))
+        return
+
     # Clone the repo into a temp folder
     newpath = tempfile.mkdtemp(prefix='pagure-')
     new_repo = pygit2.clone_repository(repopath, newpath)
@@ -251,6 +458,40 @@ def _update_git(obj, repo, repofolder):
     shutil.rmtree(newpath)
 
 
+def _update_git_batch(objs, repo, repofolder):
+    """ Update the given issues or pull-requests in their git, all in a
+    single commit when possible.
+
+    :arg objs: the list of issues or pull-requests to update, they should
+        all be of the same type
+    :arg repo: the Project object from the database
+    :arg repofolder: the folder containing the git repos of these objects
+
+    """
+    if not repofolder or not objs:
+        return
+
+    if len(objs) == 1 \
+            or not pagure.APP.config.get('GIT_METADATA_IN_MEMORY', True):
+        for obj in objs:
+            _update_git(obj, repo, repofolder)
+        return
+
+    _log.info(
+        'Update the git repo: %s for %s objects', repo.path, len(objs))
+
+    repopath = os.path.join(repofolder, repo.path)
+    files = {}
+    message = ['Updated %s %ss' % (len(objs), objs[0].isa), '']
+    for obj in objs:
+        files[obj.uid] = json.dumps(
+            obj.to_json(), sort_keys=True, indent=4,
+            separators=(',', ': '))
+        message.append('%s: %s' % (obj.uid, obj.title))
+
+    _commit_files_in_memory(repopath, files, '\n'.join(message))
+
+
 def clean_git(obj, repo, repofolder):
     if not repofolder:
         return
@@ -266,6 +507,9 @@ def clean_git(obj, repo, repofolder):
 def _clean_git(obj, repo, repofolder):
     """ Update the given issue remove it from its git.
 
+    If ``GIT_METADATA_IN_MEMORY`` is enabled, the file is removed directly
+    from the bare repository instead of using a clone.
+
     """
 
     if not repofolder:
@@ -276,6 +520,12 @@ def _clean_git(obj, repo, repofolder):
     # Get the fork
     repopath = os.path.join(repofolder, repo.path)
 
+    if pagure.APP.config.get('GIT_METADATA_IN_MEMORY', True):
+        _commit_files_in_memory(
+            repopath, {obj.uid: None},
+            'Removed %s %s: %s' % (obj.isa, obj.uid, obj.title))
+        return
+
     # Clone the repo into a temp folder
     newpath = tempfile.mkdtemp(prefix='pagure-')
     new_repo = pygit2.clone_repository(repopath, newpath)
@@ -329,9 +579,13 @@ def _clean_git(obj, repo, repofolder):
     shutil.rmtree(newpath)
 
 
-def get_user_from_json(session, jsondata, key='user'):
+def get_user_from_json(session, jsondata, key='user', users=None):
     """ From the given json blob, retrieve the user info and search for it
     in the db and create the user if it does not already exist.
+
+    :kwarg users: a dict of the users already retrieved from the db, as
+        returned by ``get_users_from_json``, to search the user in instead
+        of the db. The user created, if any, is added to it.
     """
     user = None
 
@@ -351,12 +605,17 @@ def get_user_from_json(session, jsondata, key='user'):
     if not username and not useremails:
         return
 
-    user = pagure.lib.search_user(session, username=username)
-    if not user:
-        for email in useremails:
-            user = pagure.lib.search_user(session, email=email)
-            if user:
-                break
+    if users is not None:
+        user = users.get(('name', username))
+        for email in useremails or []:
+            user = user or users.get(('email', email))
+    else:
+        user = pagure.lib.search_user(session, username=username)
+        if not user:
+            for email in useremails:
+                user = pagure.lib.search_user(session, email=email)
+                if user:
+                    break
 
     if not user:
         user = pagure.lib.set_up_user(
@@ -368,10 +627,65 @@ def get_user_from_json(session, jsondata, key='user'):
             keydir=pagure.APP.config.get('GITOLITE_KEYDIR', None),
         )
         session.commit()
+        if users is not None:
+            users[('name', user.username)] = user
+            for useremail in user.emails:
+                users[('email', useremail.email)] = user
 
     return user
 
 
+def _get_json_users(jsondata):
+    """ Return the user info present in the given json blob of an issue:
+    its author, its assignee and the authors of its comments. """
+    output = [jsondata.get('user'), jsondata.get('assignee')]
+    for comment in jsondata.get('comments') or []:
+        output.append(comment.get('user'))
+    return [data for data in output if data]
+
+
+def get_users_from_json(session, jsondata_list):
+    """ Retrieve from the db, in two queries, the users referred to in the
+    given json blobs of issues.
+
+    :arg session: the session to connect to the database with.
+    :arg jsondata_list: a list of json representations of issues.
+    :return: a dict of the users found, keyed by ``('name', username)`` and
+        ``('email', email)``, to give to ``get_user_from_json``.
+
+    """
+    usernames = set()
+    emails = set()
+    for jsondata in jsondata_list:
+        for data in _get_json_users(jsondata):
+            if data.get('name'):
+                usernames.add(data['name'])
+            emails.update(data.get('emails') or [])
+
+    users = {}
+    if usernames:
+        query = session.query(
+            model.User
+        ).filter(
+            model.User.user.in_(usernames)
+        )
+        for user in query.all():
+            users[('name', user.user)] = user
+
+    if emails:
+        query = session.query(
+            model.UserEmail.email, model.User
+        ).filter(
+            model.UserEmail.user_id == model.User.id
+        ).filter(
+            model.UserEmail.email.in_(emails)
+        )
+        for email, user in query.all():
+            users[('email', email)] = user
+
+    return users
+
+
 def get_project_from_json(
         session, jsondata,
         gitfolder, docfolder, ticketfolder, requestfolder):
@@ -441,7 +755,8 @@ def get_project_from_json(
     return project
 
 
-def update_custom_field_from_json(session, repo, issue, json_data):
+def update_custom_field_from_json(session, repo, issue, json_data,
+                                  commit=True):
     ''' Update the custom fields according to the custom fields of
     the issue. If the custom field is not present for the repo in
     it's settings, this will create them.
@@ -451,6 +766,8 @@ def update_custom_field_from_json(session, repo, issue, json_data):
     :arg issue: the sqlalchemy object of the issue
     :arg json_data: the json representation of the issue taken from the git
         and used to update the data in the database.
+    :kwarg commit: whether to commit the changes or only flush them, in
+        which case the errors are raised instead of rolled back.
     '''
 
     # Update custom key value, if present
@@ -471,8 +788,10 @@ def update_custom_field_from_json(session, repo, issue, json_data):
             )
             try:
                 session.add(issuekey)
-                session.commit()
+                pagure.lib._commit(session, commit)
             except SQLAlchemyError:
+                if not commit:
+                    raise
                 session.rollback()
                 continue
 
@@ -489,8 +808,10 @@ def update_custom_field_from_json(session, repo, issue, json_data):
             value=value,
         )
         try:
-            session.commit()
+            pagure.lib._commit(session, commit)
         except SQLAlchemyError:
+            if not commit:
+                raise
             session.rollback()
 
 
@@ -521,16 +842,130 @@ def update_ticket_from_git(
             'Unknown repo %s of username: %s in namespace: %s' % (
                 reponame, username, namespace))
 
-    user = get_user_from_json(session, json_data)
+    _update_ticket(
+        session, repo, issue_uid, json_data,
+        agent=pagure.lib.search_user(session, username=agent))
+
+
+def update_tickets_from_git(
+        session, reponame, namespace, username, tickets, agent,
+        batch_size=100):
+    """ Update the specified issues with the data present in the json blobs
+    provided, in batches.
+
+    The users and issues of a batch are retrieved from the database at once
+    and its changes are committed together, in a single transaction. If the
+    update of a batch fails, it is rolled back and its issues are updated
+    one at a time, each in its own transaction, to find the one failing,
+    and the update stops there.
+
+    :arg session: the session to connect to the database with.
+    :arg repo: the name of the project to update
+    :arg namespace: the namespace of the project to update
+    :arg username: the username of the project to update (if the project
+        is a fork)
+    :arg tickets: an iterable of (issue_uid, json_data) of the issues to
+        update
+    :arg agent: the username of the person who pushed the changes (and thus
+        is assumed did the action).
+    :kwarg batch_size: the number of issues updated per batch
+    :return: a generator yielding, once the changes of a batch are
+        committed, the list of (issue_uid, error) of its issues, the error
+        being None if the issue was updated and the exception raised
+        otherwise.
+
+    """
+
+    repo = pagure.lib._get_project(
+        session, reponame, user=username, namespace=namespace,
+        case=pagure.APP.config.get('CASE_SENSITIVE', False))
+
+    if not repo:
+        raise pagure.exceptions.PagureException(
+            'Unknown repo %s of username: %s in namespace: %s' % (
+                reponame, username, namespace))
+
+    agent = pagure.lib.search_user(session, username=agent)
+
+    tickets = iter(tickets)
+    while True:
+        batch = list(itertools.islice(tickets, batch_size))
+        if not batch:
+            break
+        results = _update_tickets(session, repo, batch, agent)
+        yield results
+        if results[-1][1] is not None:
+            break
+
+
+def _update_tickets(session, repo, tickets, agent):
+    """ Update a batch of issues, see ``update_tickets_from_git``. """
+    try:
+        users = get_users_from_json(
+            session, [json_data for _, json_data in tickets])
+        query = session.query(
+            model.Issue
+        ).filter(
+            model.Issue.uid.in_([issue_uid for issue_uid, _ in tickets])
+        )
+        issues = dict((issue.uid, issue) for issue in query.all())
+
+        for issue_uid, json_data in tickets:
+            _update_ticket(
+                session, repo, issue_uid, json_data, agent,
+                users=users, issues=issues, commit=False)
+        session.commit()
+        return [(issue_uid, None) for issue_uid, _ in tickets]
+    except Exception:
+        session.rollback()
+        _log.info(
+            'Could not update the %s issues of the batch at once, updating '
+            'them one at a time', len(tickets))
+
+    results = []
+    for issue_uid, json_data in tickets:
+        try:
+            _update_ticket(
+                session, repo, issue_uid, json_data, agent, commit=False)
+            session.commit()
+        except Exception as err:
+            _log.exception('Could not update the issue %s', issue_uid)
+            session.rollback()
+            results.append((issue_uid, err))
+            break
+        results.append((issue_uid, None))
+    return results
+
+
+def _update_ticket(
+        session, repo, issue_uid, json_data, agent, users=None,
+        issues=None, commit=True):
+    """ Update the specified issue of the specified project with the data
+    present in the json blob provided, see ``update_ticket_from_git``.
+
+    :kwarg users: the users already retrieved from the database, see
+        ``get_user_from_json``
+    :kwarg issues: a dict of the issues already retrieved from the database,
+        keyed by their unique identifier, the issue created (if any) is
+        added to it
+    :kwarg commit: whether to commit the changes or only flush them, in
+        which case the errors are raised instead of rolled back.
+
+    """
+
+    user = get_user_from_json(session, json_data, users=users)
     # rely on the agent provided, but if something goes wrong, behave as
     # ticket creator
-    agent = pagure.lib.search_user(session, username=agent) or user
+    agent = agent or user
 
-    issue = pagure.lib.get_issue_by_uid(session, issue_uid=issue_uid)
+    if issues is None:
+        issue = pagure.lib.get_issue_by_uid(session, issue_uid=issue_uid)
+    else:
+        issue = issues.get(issue_uid)
     messages = []
     if not issue:
         # Create new issue
-        pagure.lib.new_issue(
+        issue = pagure.lib.new_issue(
             session,
             repo=repo,
             title=json_data.get('title'),
@@ -546,7 +981,10 @@ def update_ticket_from_git(
             date_created=datetime.datetime.utcfromtimestamp(
                 float(json_data.get('date_created'))),
             notify=False,
+            commit=commit,
         )
+        if issues is not None:
+            issues[issue_uid] = issue
 
     else:
         # Edit existing issue
@@ -561,19 +999,19 @@ def update_ticket_from_git(
             status=json_data.get('status'),
             close_status=json_data.get('close_status'),
             private=json_data.get('private'),
+            commit=commit,
         )
         if msgs:
             messages.extend(msgs)
 
-    session.commit()
-
-    issue = pagure.lib.get_issue_by_uid(session, issue_uid=issue_uid)
+    pagure.lib._commit(session, commit)
 
     update_custom_field_from_json(
         session,
         repo=repo,
         issue=issue,
         json_data=json_data,
+        commit=commit,
     )
 
     # Update milestone
@@ -587,8 +1025,10 @@ def update_ticket_from_git(
                 tmp_milestone[milestone.strip()] = None
                 repo.milestones = tmp_milestone
                 session.add(repo)
-                session.commit()
+                pagure.lib._commit(session, commit)
             except SQLAlchemyError:
+                if not commit:
+                    raise
                 session.rollback()
     try:
         msgs = pagure.lib.edit_issue(
@@ -602,10 +1042,13 @@ def update_ticket_from_git(
             status=json_data.get('status'),
             close_status=json_data.get('close_status'),
             private=json_data.get('private'),
+            commit=commit,
         )
         if msgs:
             messages.extend(msgs)
     except SQLAlchemyError:
+        if not commit:
+            raise
         session.rollback()
 
     # Update close_status
@@ -616,23 +1059,28 @@ def update_ticket_from_git(
             try:
                 repo.close_status.append(close_status.strip())
                 session.add(repo)
-                session.commit()
+                pagure.lib._commit(session, commit)
             except SQLAlchemyError:
+                if not commit:
+                    raise
                 session.rollback()
 
     # Update tags
     tags = json_data.get('tags', [])
     msgs = pagure.lib.update_tags(
-        session, issue, tags, username=user.user, gitfolder=None)
+        session, issue, tags, username=user.user, gitfolder=None,
+        commit=commit)
     if msgs:
         messages.extend(msgs)
 
     # Update assignee
-    assignee = get_user_from_json(session, json_data, key='assignee')
+    assignee = get_user_from_json(
+        session, json_data, key='assignee', users=users)
     if assignee:
         msg = pagure.lib.add_issue_assignee(
             session, issue, assignee.username,
-            user=agent.user, ticketfolder=None, notify=False)
+            user=agent.user, ticketfolder=None, notify=False,
+            commit=commit)
         if msg:
             messages.append(msg)
 
@@ -640,7 +1088,7 @@ def update_ticket_from_git(
     depends = json_data.get('depends', [])
     msgs = pagure.lib.update_dependency_issue(
         session, issue.project, issue, depends,
-        username=agent.user, ticketfolder=None)
+        username=agent.user, ticketfolder=None, commit=commit)
     if msgs:
         messages.extend(msgs)
 
@@ -648,25 +1096,29 @@ def update_ticket_from_git(
     blocks = json_data.get('blocks', [])
     msgs = pagure.lib.update_blocked_issue(
         session, issue.project, issue, blocks,
-        username=agent.user, ticketfolder=None)
+        username=agent.user, ticketfolder=None, commit=commit)
     if msgs:
         messages.extend(msgs)
 
+    # Retrieve the comments already present at once
+    comments = set(
+        (comment.user_id, comment.comment) for comment in issue.comments)
     for comment in json_data['comments']:
-        usercomment = get_user_from_json(session, comment)
-        commentobj = pagure.lib.get_issue_comment_by_user_and_comment(
-            session, issue_uid, usercomment.id, comment['comment'])
-        if not commentobj:
-            pagure.lib.add_issue_comment(
-                session,
-                issue=issue,
-                comment=comment['comment'],
-                user=usercomment.username,
-                ticketfolder=None,
-                notify=False,
-                date_created=datetime.datetime.fromtimestamp(
-                    float(comment['date_created'])),
-            )
+        usercomment = get_user_from_json(session, comment, users=users)
+        if (usercomment.id, comment['comment']) in comments:
+            continue
+        pagure.lib.add_issue_comment(
+            session,
+            issue=issue,
+            comment=comment['comment'],
+            user=usercomment.username,
+            ticketfolder=None,
+            notify=False,
+            date_created=datetime.datetime.fromtimestamp(
+                float(comment['date_created'])),
+            commit=commit,
+        )
+        comments.add((usercomment.id, comment['comment']))
 
     if messages:
         pagure.lib.add_metadata_update_notif(
@@ -674,9 +1126,10 @@ def update_ticket_from_git(
             obj=issue,
             messages=messages,
             user=agent.username,
-            gitfolder=None
+            gitfolder=None,
+            commit=commit,
         )
-    session.commit()
+    pagure.lib._commit(session, commit)
 
 
 def update_request_from_git(
@@ -1024,21 +1477,232 @@ def read_git_lines(args, abspath, keepends=False, **kw):
     ).splitlines(keepends)
 
 
+def _is_null_rev(rev):
+    """ Return whether the specified revision is the null revision git
+    sends for created or deleted references. """
+    return set(rev.lstrip('^')) == set('0')
+
+
+def _get_commit(repo_obj, rev):
+    """ Return the commit the specified revision points to, or None. """
+    try:
+        obj = repo_obj.revparse_single(rev)
+    except (KeyError, ValueError):
+        return None
+    while obj.type == pygit2.GIT_OBJ_TAG:
+        obj = repo_obj[obj.target]
+    if obj.type != pygit2.GIT_OBJ_COMMIT:
+        return None
+    return obj
+
+
+def iter_revs_between(oldrev, newrev, abspath, refname, forced=False):
+    """ Yield the revisions pushed to a reference, from the most recent one,
+    as ``get_revs_between`` returns them.
+
+    This walks the history in a single pygit2 repository, for very large
+    pushes the revisions can be processed as they are found.
+    """
+    repo_obj = pygit2.Repository(abspath)
+
+    def _default_branch():
+        if repo_obj.is_empty or repo_obj.head_is_unborn:
+            return 'master'
+        return repo_obj.head.shorthand
+
+    include = [newrev]
+    exclude = []
+    if _is_null_rev(newrev):
+        include = [oldrev]
+    elif _is_null_rev(oldrev):
+        head = _default_branch()
+        if head not in refname:
+            exclude.append(head)
+    else:
+        # The commits reachable from either revision but not from both
+        include.append(oldrev)
+        old_commit = _get_commit(repo_obj, oldrev)
+        new_commit = _get_commit(repo_obj, newrev)
+        if old_commit is not None and new_commit is not None:
+            base = repo_obj.merge_base(old_commit.oid, new_commit.oid)
+            if base is not None:
+                exclude.append(base.hex)
+        if forced:
+            exclude.append(_default_branch())
+
+    walker = None
+    for rev in include:
+        commit = _get_commit(repo_obj, rev)
+        if commit is None:
+            _log.info('Unknown revision %s in %s', rev, abspath)
+            return
+        if walker is None:
+            walker = repo_obj.walk(commit.oid, pygit2.GIT_SORT_TIME)
+        else:
+            walker.push(commit.oid)
+    for rev in exclude:
+        commit = _get_commit(repo_obj, rev)
+        if commit is not None:
+            walker.hide(commit.oid)
+
+    for commit in walker:
+        yield commit.oid.hex
+
+
 def get_revs_between(oldrev, newrev, abspath, refname, forced=False):
     """ Yield revisions between HEAD and BASE. """
+    return list(iter_revs_between(
+        oldrev, newrev, abspath, refname, forced=forced))
 
-    cmd = ['rev-list', '%s...%s' % (oldrev, newrev)]
-    if forced:
-        head = get_default_branch(abspath)
-        cmd.append('^%s' % head)
-    if set(newrev) == set('0'):
-        cmd = ['rev-list', '%s' % oldrev]
-    elif set(oldrev) == set('0') or set(oldrev) == set('^0'):
-        head = get_default_branch(abspath)
-        cmd = ['rev-list', '%s' % newrev, '^%s' % head]
-        if head in refname:
-            cmd = ['rev-list', '%s' % newrev]
-    return pagure.lib.git.read_git_lines(cmd, abspath)
+
+CommitInfo = collections.namedtuple('CommitInfo', [
+    'commit', 'parents', 'author', 'author_email', 'author_time',
+    'author_offset', 'subject', 'message', 'paths'])
+
+
+def _get_subject(message):
+    """ Return the subject of a commit message, as ``git log`` shows it:
+    its first paragraph on a single line. """
+    paragraph = message.strip().split('\n\n', 1)[0]
+    return ' '.join(line.strip() for line in paragraph.splitlines())
+
+
+def _get_changed_paths(commit, root=False):
+    """ Return the paths changed by the specified commit compared to its
+    parent, as ``git diff-tree -r`` lists them: none for a merge commit, and
+    none for a root commit unless ``root`` is True (``--root``), all its
+    files then. """
+    if len(commit.parents) > 1:
+        return []
+    if commit.parents:
+        diff = commit.parents[0].tree.diff_to_tree(commit.tree)
+    elif root:
+        diff = commit.tree.diff_to_tree(swap=True)
+    else:
+        return []
+    return _get_diff_paths(diff)
+
+
+def _get_diff_paths(diff):
+    deltas = getattr(diff, 'deltas', None)
+    if deltas is None:
+        # Older pygit2
+        return [patch.new_file_path for patch in diff]
+    return [delta.new_file.path for delta in deltas]
+
+
+def read_commits(abspath, commits, paths=False, root=False):
+    """ Yield the metadata of the specified commits, all read from the same
+    repository rather than via a git process per commit.
+
+    This is a generator, so a very large number of commits can be processed
+    as they are read.
+
+    :arg abspath: the path to the git repository
+    :arg commits: an iterable of commit hashes, for example as returned by
+        ``iter_revs_between``
+    :kwarg paths: whether to retrieve the paths changed by each commit
+    :kwarg root: whether the paths changed by a root commit are all its
+        files, rather than none
+    :return: a generator of ``CommitInfo``, the commits which cannot be
+        found in the repository are skipped
+
+    """
+    repo_obj = pygit2.Repository(abspath)
+    for commitid in commits:
+        commit = _get_commit(repo_obj, commitid)
+        if commit is None:
+            _log.info('Unknown commit %s in %s', commitid, abspath)
+            continue
+        yield CommitInfo(
+            commit=commit.oid.hex,
+            parents=[parent.hex for parent in commit.parents],
+            author=commit.author.name,
+            author_email=commit.author.email,
+            author_time=commit.author.time,
+            author_offset=commit.author.offset,
+            subject=_get_subject(commit.message),
+            message=commit.message,
+            paths=_get_changed_paths(commit, root=root) if paths else None,
+        )
+
+
+def get_changed_paths(abspath, commits):
+    """ Return the paths changed by the specified commits.
+
+    When the commits are a range of the history with a single base and a
+    single head, as the commits of a push, the tree of the head is diffed
+    once with the tree of the base rather than each commit with its parent.
+
+    :arg abspath: the path to the git repository
+    :arg commits: an iterable of commit hashes
+    :return: the set of the paths changed, the commits which cannot be
+        found in the repository are skipped
+
+    """
+    repo_obj = pygit2.Repository(abspath)
+    commit_objs = {}
+    for commitid in commits:
+        commit = _get_commit(repo_obj, commitid)
+        if commit is None:
+            _log.info('Unknown commit %s in %s', commitid, abspath)
+            continue
+        commit_objs[commit.oid.hex] = commit
+
+    parents = set()
+    for commit in commit_objs.values():
+        parents.update(parent.hex for parent in commit.parents)
+    heads = [
+        commit for commitid, commit in commit_objs.items()
+        if commitid not in parents]
+    bases = parents - set(commit_objs)
+
+    if len(heads) == 1 and len(bases) <= 1:
+        head = heads[0]
+        if bases:
+            diff = repo_obj[bases.pop()].tree.diff_to_tree(head.tree)
+        else:
+            diff = head.tree.diff_to_tree(swap=True)
+        return set(_get_diff_paths(diff))
+
+    paths = set()
+    for commit in commit_objs.values():
+        paths.update(_get_changed_paths(commit, root=True))
+    return paths
+
+
+def read_blobs(abspath, paths, rev='HEAD'):
+    """ Yield the content of the specified files at the specified revision,
+    all read from the same repository rather than via a git process per
+    file.
+
+    :arg abspath: the path to the git repository
+    :arg paths: an iterable of paths of files in the repository
+    :kwarg rev: the revision to read the files at
+    :return: a generator of (path, blob_id, data), blob_id and data being
+        None for the paths which are not files at this revision
+
+    """
+    repo_obj = pygit2.Repository(abspath)
+    commit = _get_commit(repo_obj, rev)
+    for path in paths:
+        blob = None
+        if commit is not None:
+            try:
+                blob = repo_obj.get(commit.tree[path].id)
+            except KeyError:
+                pass
+        if not isinstance(blob, pygit2.Blob):
+            yield path, None, None
+        else:
+            yield path, blob.hex, blob.data
+
+
+def _read_commit(commit, abspath):
+    for info in read_commits(abspath, [commit]):
+        return info
+    raise pagure.exceptions.PagureException(
+        'Commit %s not found in %s' % (commit, abspath))
 
 
 def is_forced_push(oldrev, newrev, abspath):
@@ -1072,26 +1736,17 @@ def get_default_branch(abspath):
 
 def get_author(commit, abspath):
     ''' Return the name of the person that authored the commit. '''
-    user = pagure.lib.git.read_git_lines(
-        ['log', '-1', '--pretty=format:"%an"', commit],
-        abspath)[0].replace('"', '')
-    return user
+    return _read_commit(commit, abspath).author
 
 
 def get_author_email(commit, abspath):
     ''' Return the email of the person that authored the commit. '''
-    user = pagure.lib.git.read_git_lines(
-        ['log', '-1', '--pretty=format:"%ae"', commit],
-        abspath)[0].replace('"', '')
-    return user
+    return _read_commit(commit, abspath).author_email
 
 
 def get_commit_subject(commit, abspath):
     ''' Return the subject of the commit. '''
-    subject = pagure.lib.git.read_git_lines(
-        ['log', '-1', '--pretty=format:"%s"', commit],
-        abspath)[0].replace('"', '')
-    return subject
+    return _read_commit(commit, abspath).subject
 
 
 def get_repo_name(abspath):
@@ -1148,70 +1803,197 @@ def get_branch_ref(repo, branchname):
     return branch_ref.resolve()
 
 
+def _get_fork_path(request):
+    ''' Return the path to the git repository the pull-request is opened
+    from.
+    '''
+    if request.remote:
+        return pagure.get_remote_repo_path(
+            request.remote_git, request.branch_from)
+    return pagure.get_repo_path(request.project_from)
+
+
+def _check_signed_off(request, diff_commits):
+    ''' Raise an exception if the project enforces signed-off commits in
+    pull-requests and one of the specified commits is not signed-off.
+    '''
+    if request.project.settings.get(
+            'Enforce_signed-off_commits_in_pull-request', False):
+        for commit in diff_commits:
+            if 'signed-off-by' not in commit.message.lower():
+                _log.info('  Missing a required: signed-off-by: Bailing')
+                raise pagure.exceptions.PagureException(
+                    'This repo enforces that all commits are '
+                    'signed off by their author. ')
+
+
+def _add_alternate(repo_obj, request, fork_obj, oid, in_memory=True):
+    ''' Make sure the specified commit of the fork can be read from
+    ``repo_obj``.
+
+    Nothing needs to be done if the commit is already there, for example
+    when the fork shares its storage with ``repo_obj`` via alternates.
+    Otherwise, if ``in_memory`` is True and pygit2 supports it, the object
+    database of the fork is added as an in-memory alternate. This is only
+    suitable to read objects: anything written must not depend on them.
+    Lastly, the branch of the pull-request is pushed to its
+    ``refs/pull/<id>/head`` reference which only copies the missing objects.
+    '''
+    if oid in repo_obj:
+        return
+    odb = getattr(repo_obj, 'odb', None)
+    if in_memory and odb is not None \
+            and hasattr(odb, 'add_disk_alternate'):
+        _log.debug('  Adding %s as alternate', fork_obj.path)
+        odb.add_disk_alternate(os.path.join(fork_obj.path, 'objects'))
+        if oid in repo_obj:
+            return
+    update_pull_ref(request, fork_obj)
+
+
+def _merge_commits(repo_obj, target, commit):
+    ''' Merge in memory the specified commit onto the specified target
+    commit.
+
+    :return: a tuple (merge_status, index) where index is the
+        pygit2.Index of the merge, only set if merge_status is ``MERGE`` or
+        ``CONFLICTS``
+
+    '''
+    if target == commit:
+        return ('NO_CHANGE', None)
+
+    base = repo_obj.merge_base(target, commit)
+    base = base.hex if base is not None else None
+    if base == commit:
+        return ('NO_CHANGE', None)
+    elif base == target:
+        return ('FFORWARD', None)
+
+    index = repo_obj.merge_commits(repo_obj[target], repo_obj[commit])
+    if index.conflicts is None:
+        return ('MERGE', index)
+    return ('CONFLICTS', index)
+
+
+def compute_merge_status(repo_obj, target, commit):
+    ''' Return how the specified commit would merge onto the specified
+    target commit, computing the merge in memory.
+
+    :arg repo_obj: the pygit2.Repository object containing both commits
+    :arg target: the hash of the head of the branch to merge into
+    :arg commit: the hash of the commit to merge
+    :return: a tuple (merge_status, conflicts) where merge_status is one of
+        ``NO_CHANGE``, ``FFORWARD``, ``MERGE`` or ``CONFLICTS`` and conflicts
+        the sorted list of the files conflicting
+
+    '''
+    merge_status, index = _merge_commits(repo_obj, target, commit)
+    if merge_status != 'CONFLICTS':
+        return (merge_status, [])
+
+    conflicts = set()
+    for entries in index.conflicts:
+        for entry in entries:
+            if entry is not None:
+                conflicts.add(entry.path)
+                break
+    return ('CONFLICTS', sorted(conflicts))
+
+
+def get_merge_status(session, request, request_folder=None, force=False):
+    ''' Return whether the specified pull-request can be merged.
+
+    The merge is done in memory on the bare repositories and the result is
+    stored on the pull-request with the head of the pull-request and the
+    head of the target branch it was computed for, it is only computed
+    again when one of them changes (or if ``force`` is True).
+
+    :return: a tuple (merge_status, conflicts), see
+        ``compute_merge_status``
+
+    '''
+    fork_obj = PagureRepo(_get_fork_path(request))
+    parent_obj = PagureRepo(pagure.get_repo_path(request.project))
+
+    commit = get_branch_ref(fork_obj, request.branch_from).get_object().hex
+    target = get_branch_ref(parent_obj, request.branch).get_object().hex
+
+    if not force and request.merge_status \
+            and request.merge_status_commit == commit \
+            and request.merge_status_target == target:
+        return (request.merge_status, request.merge_conflicts)
+
+    _log.info('Computing the merge status of the pull-request: %s', request)
+    if request.status != 'Open':
+        _log.info(
+            '  This pull-request has already been merged or closed by %s '
+            'on %s' % (request.closed_by.user, request.closed_at))
+        raise pagure.exceptions.PagureException(
+            'This pull-request was merged or closed by %s' %
+            request.closed_by.user)
+
+    # Update the start and stop commits in the DB
+    diff_commits = diff_pull_request(
+        session, request, fork_obj, parent_obj,
+        requestfolder=request_folder, with_diff=False)
+    _check_signed_off(request, diff_commits)
+
+    _add_alternate(parent_obj, request, fork_obj, commit)
+    merge_status, conflicts = compute_merge_status(
+        parent_obj, target, commit)
+    _log.info('  Merge status: %s', merge_status)
+
+    request.merge_status = merge_status
+    request.merge_status_commit = commit
+    request.merge_status_target = target
+    request.merge_conflicts = conflicts
+    session.add(request)
+    session.commit()
+
+    return (merge_status, conflicts)
+
+
 def merge_pull_request(
         session, request, username, request_folder, domerge=True):
     ''' Merge the specified pull-request.
+
+    When ``domerge`` is False, only the merge status of the pull-request
+    is returned, see ``get_merge_status``.
     '''
-    if domerge:
-        _log.info(
-            '%s asked to merge the pull-request: %s', username, request)
-    else:
+    if not domerge:
         _log.info(
             '%s asked to diff the pull-request: %s', username, request)
+        return get_merge_status(
+            session, request, request_folder=request_folder, force=True)[0]
 
-    if request.remote:
-        # Get the fork
-        repopath = pagure.get_remote_repo_path(
-            request.remote_git, request.branch_from)
-    else:
-        # Get the fork
-        repopath = pagure.get_repo_path(request.project_from)
-
-    fork_obj = PagureRepo(repopath)
-
-    # Get the original repo
-    parentpath = pagure.get_repo_path(request.project)
-
-    # Clone the original repo into a temp folder
-    newpath = tempfile.mkdtemp(prefix='pagure-pr-merge')
-    _log.info('  working directory: %s', newpath)
-    new_repo = pygit2.clone_repository(parentpath, newpath)
+    _log.info(
+        '%s asked to merge the pull-request: %s', username, request)
 
-    # Main repo, bare version
-    mainrepopath = pagure.get_repo_path(request.project)
-    bare_main_repo = PagureRepo(mainrepopath)
+    # The merge is done directly in the bare repos, without any clone
+    fork_obj = PagureRepo(_get_fork_path(request))
+    parent_obj = PagureRepo(pagure.get_repo_path(request.project))
 
     # Update the start and stop commits in the DB, one last time
     diff_commits = diff_pull_request(
-        session, request, fork_obj, PagureRepo(parentpath),
+        session, request, fork_obj, parent_obj,
         requestfolder=request_folder, with_diff=False)
     _log.info('  %s commit to merge', len(diff_commits))
 
-    if request.project.settings.get(
-            'Enforce_signed-off_commits_in_pull-request', False):
-        for commit in diff_commits:
-            if 'signed-off-by' not in commit.message.lower():
-                shutil.rmtree(newpath)
-                _log.info('  Missing a required: signed-off-by: Bailing')
-                raise pagure.exceptions.PagureException(
-                    'This repo enforces that all commits are '
-                    'signed off by their author. ')
+    _check_signed_off(request, diff_commits)
 
-    # Checkout the correct branch
-    branch_ref = get_branch_ref(new_repo, request.branch)
-    if not branch_ref:
-        shutil.rmtree(newpath)
+    try:
+        branch_ref = get_branch_ref(parent_obj, request.branch)
+    except pagure.exceptions.PagureException:
         _log.info('  Target branch could not be found')
         raise pagure.exceptions.BranchNotFoundException(
             'Branch %s could not be found in the repo %s' % (
                 request.branch, request.project.fullname
             ))
 
-    new_repo.checkout(branch_ref)
-
-    branch = get_branch_ref(fork_obj, request.branch_from)
-    if not branch:
-        shutil.rmtree(newpath)
+    try:
+        branch = get_branch_ref(fork_obj, request.branch_from)
+    except pagure.exceptions.PagureException:
         _log.info('  Branch of origin could not be found')
         raise pagure.exceptions.BranchNotFoundException(
             'Branch %s could not be found in the repo %s' % (
@@ -1219,28 +2001,20 @@ def merge_pull_request(
                 if request.project_from else request.remote_git
             ))
 
-    repo_commit = fork_obj[branch.get_object().hex]
-
-    ori_remote = new_repo.remotes[0]
-    # Add the fork as remote repo
-    reponame = '%s_%s' % (request.user.user, request.uid)
-
-    _log.info('  Adding remote: %s pointing to: %s', reponame, repopath)
-    remote = new_repo.create_remote(reponame, repopath)
+    head = branch_ref.get_object().hex
+    repo_commit = branch.get_object().hex
 
-    # Fetch the commits
-    remote.fetch()
+    # The merge commit is written in the parent repo so the commits of the
+    # fork need to be there as well
+    _add_alternate(parent_obj, request, fork_obj, repo_commit,
+                   in_memory=False)
 
-    merge = new_repo.merge(repo_commit.oid)
-    _log.debug('  Merge: %s', merge)
-    if merge is None:
-        mergecode = new_repo.merge_analysis(repo_commit.oid)[0]
-        _log.debug('  Mergecode: %s', mergecode)
+    merge_status, index = _merge_commits(parent_obj, head, repo_commit)
+    _log.debug('  Merge status: %s', merge_status)
 
     # Wait until the last minute then check if the PR was already closed
     # by someone else in the mean while and if so, just bail
     if request.status != 'Open':
-        shutil.rmtree(newpath)
         _log.info(
             '  This pull-request has already been merged or closed by %s '
             'on %s' % (request.closed_by.user, request.closed_at))
@@ -1248,127 +2022,63 @@ def merge_pull_request(
             'This pull-request was merged or closed by %s' %
             request.closed_by.user)
 
-    refname = '%s:refs/heads/%s' % (branch_ref.name, request.branch)
-    if (
-            (merge is not None and merge.is_uptodate)
-            or  # noqa
-            (merge is None and
-             mergecode & pygit2.GIT_MERGE_ANALYSIS_UP_TO_DATE)):
-
-        if domerge:
-            _log.info('  PR up to date, closing it')
-            pagure.lib.close_pull_request(
-                session, request, username,
-                requestfolder=request_folder)
-            shutil.rmtree(newpath)
-            try:
-                session.commit()
-            except SQLAlchemyError as err:  # pragma: no cover
-                session.rollback()
-                _log.exception('  Could not merge the PR in the DB')
-                pagure.APP.logger.exception(err)
-                raise pagure.exceptions.PagureException(
-                    'Could not close this pull-request')
-            raise pagure.exceptions.PagureException(
-                'Nothing to do, changes were already merged')
-        else:
-            _log.info('  PR up to date, reporting it')
-            request.merge_status = 'NO_CHANGE'
-            session.commit()
-            shutil.rmtree(newpath)
-            return 'NO_CHANGE'
-
-    elif (
-            (merge is not None and merge.is_fastforward)
-            or  # noqa
-            (merge is None and
-             mergecode & pygit2.GIT_MERGE_ANALYSIS_FASTFORWARD)):
-
-        if domerge:
-            _log.info('  PR merged using fast-forward')
-            head = new_repo.lookup_reference('HEAD').get_object()
-            if not request.project.settings.get('always_merge', False):
-                if merge is not None:
-                    # This is depending on the pygit2 version
-                    branch_ref.target = merge.fastforward_oid
-                elif merge is None and mergecode is not None:
-                    branch_ref.set_target(repo_commit.oid.hex)
-                commit = repo_commit.oid.hex
-            else:
-                tree = new_repo.index.write_tree()
-                user_obj = pagure.lib.get_user(session, username)
-                author = pygit2.Signature(
-                    user_obj.fullname.encode('utf-8'),
-                    user_obj.default_email.encode('utf-8'))
-                commit = new_repo.create_commit(
-                    'refs/heads/%s' % request.branch,
-                    author,
-                    author,
-                    'Merge #%s `%s`' % (request.id, request.title),
-                    tree,
-                    [head.hex, repo_commit.oid.hex])
-
-            _log.info('  New head: %s', commit)
-            PagureRepo.push(ori_remote, refname)
-            bare_main_repo.run_hook(
-                head.hex, commit, 'refs/heads/%s' % request.branch,
-                username)
-        else:
-            _log.info('  PR merged using fast-forward, reporting it')
-            request.merge_status = 'FFORWARD'
+    if merge_status == 'NO_CHANGE':
+        _log.info('  PR up to date, closing it')
+        pagure.lib.close_pull_request(
+            session, request, username,
+            requestfolder=request_folder)
+        try:
             session.commit()
-            shutil.rmtree(newpath)
-            return 'FFORWARD'
+        except SQLAlchemyError as err:  # pragma: no cover
+            session.rollback()
+            _log.exception('  Could not merge the PR in the DB')
+            pagure.APP.logger.exception(err)
+            raise pagure.exceptions.PagureException(
+                'Could not close this pull-request')
+        raise pagure.exceptions.PagureException(
+            'Nothing to do, changes were already merged')
 
-    else:
-        tree = None
-        try:
-            tree = new_repo.index.write_tree()
-        except pygit2.GitError as err:
-            _log.debug(
-                '  Could not write down the new tree: merge conflicts')
-            shutil.rmtree(newpath)
-            if domerge:
-                _log.info('  Merge conflict: Bailing')
-                raise pagure.exceptions.PagureException('Merge conflicts!')
-            else:
-                _log.info('  Merge conflict, reporting it')
-                request.merge_status = 'CONFLICTS'
-                session.commit()
-                return 'CONFLICTS'
-
-        if domerge:
-            _log.info('  Writing down merge commit')
-            head = new_repo.lookup_reference('HEAD').get_object()
-            _log.info('  Basing on: %s - %s', head.hex, repo_commit.oid.hex)
-            user_obj = pagure.lib.get_user(session, username)
-            author = pygit2.Signature(
-                user_obj.fullname.encode('utf-8'),
-                user_obj.default_email.encode('utf-8'))
-            commit = new_repo.create_commit(
-                'refs/heads/%s' % request.branch,
-                author,
-                author,
-                'Merge #%s `%s`' % (request.id, request.title),
-                tree,
-                [head.hex, repo_commit.oid.hex])
-
-            _log.info('  New head: %s', commit)
-            local_ref = 'refs/heads/_pagure_topush'
-            new_repo.create_reference(local_ref, commit)
-            refname = '%s:refs/heads/%s' % (local_ref, request.branch)
-            PagureRepo.push(ori_remote, refname)
-            _log.info('  Pushing to: %s to %s', refname, ori_remote)
-            bare_main_repo.run_hook(
-                head.hex, commit, 'refs/heads/%s' % request.branch,
-                username)
+    elif merge_status == 'CONFLICTS':
+        _log.info('  Merge conflict: Bailing')
+        raise pagure.exceptions.PagureException('Merge conflicts!')
+
+    elif merge_status == 'FFORWARD' \
+            and not request.project.settings.get('always_merge', False):
+        _log.info('  PR merged using fast-forward')
+        commit = repo_commit
 
+    else:
+        if merge_status == 'FFORWARD':
+            tree = parent_obj[repo_commit].tree.oid
         else:
-            _log.info('  PR can be merged with a merge commit, reporting it')
-            request.merge_status = 'MERGE'
-            session.commit()
-            shutil.rmtree(newpath)
-            return 'MERGE'
+            tree = index.write_tree(parent_obj)
+
+        _log.info('  Writing down merge commit')
+        _log.info('  Basing on: %s - %s', head, repo_commit)
+        user_obj = pagure.lib.get_user(session, username)
+        author = pygit2.Signature(
+            user_obj.fullname.encode('utf-8'),
+            user_obj.default_email.encode('utf-8'))
+        commit = parent_obj.create_commit(
+            None,
+            author,
+            author,
+            'Merge #%s `%s`' % (request.id, request.title),
+            tree,
+            [head, repo_commit]).hex
+
+    _log.info('  New head: %s', commit)
+    refname = 'refs/heads/%s' % request.branch
+    if not _set_ref_if_unchanged(
+            parent_obj, refname, pygit2.Oid(hex=commit),
+            pygit2.Oid(hex=head)):
+        _log.info('  %s was updated while merging: Bailing', refname)
+        # Check the merge again against the new head of the branch
+        pagure.lib.tasks.refresh_merge_status.delay(request.uid)
+        raise pagure.exceptions.PagureException(
+            'The branch %s was updated in the mean time, please try '
+            'again' % request.branch)
+    parent_obj.run_hook(head, commit, refname, username)
 
     # Update status
     _log.info('  Closing the PR in the DB')
@@ -1376,7 +2086,6 @@ def merge_pull_request(
         session, request, username,
         requestfolder=request_folder,
     )
-    shutil.rmtree(newpath)
 
     return 'Changes merged!'
 
@@ -1436,48 +2145,18 @@ def get_diff_info(repo_obj, orig_repo, branch_from, branch_to, prid=None):
     if not repo_obj.is_empty and not orig_repo.is_empty:
         if branch:
             orig_commit = orig_repo[branch.get_object().hex]
-            main_walker = orig_repo.walk(
-                orig_commit.oid.hex, pygit2.GIT_SORT_TIME)
 
         repo_commit = repo_obj[commitid]
-        branch_walker = repo_obj.walk(
-            repo_commit.oid.hex, pygit2.GIT_SORT_TIME)
 
-        main_commits = set()
-        branch_commits = set()
-
-        while 1:
-            com = None
-            if branch:
-                try:
-                    com = main_walker.next()
-                    main_commits.add(com.oid.hex)
-                except StopIteration:
-                    com = None
-
-            try:
-                branch_commit = branch_walker.next()
-            except StopIteration:
-                branch_commit = None
-
-            # We sure never end up here but better safe than sorry
-            if com is None and branch_commit is None:
-                break
-
-            if branch_commit:
-                branch_commits.add(branch_commit.oid.hex)
-                diff_commits.append(branch_commit)
-            if main_commits.intersection(branch_commits):
-                break
+        if branch and pagure.lib.commit_graph.enabled():
+            diff_commits = _get_commits_ahead(
+                repo_obj, repo_commit, orig_repo, orig_commit)
+        else:
+            diff_commits = None
 
-        # If master is ahead of branch, we need to remove the commits
-        # that are after the first one found in master
-        i = 0
-        if diff_commits and main_commits:
-            for i in range(len(diff_commits)):
-                if diff_commits[i].oid.hex in main_commits:
-                    break
-            diff_commits = diff_commits[:i]
+        if diff_commits is None:
+            diff_commits = _walk_commits_ahead(
+                repo_obj, repo_commit, orig_repo, orig_commit)
 
         if diff_commits:
             first_commit = repo_obj[diff_commits[-1].oid.hex]
@@ -1507,6 +2186,194 @@ def get_diff_info(repo_obj, orig_repo, branch_from, branch_to, prid=None):
     return(diff, diff_commits, orig_commit)
 
 
+def _get_commits_ahead(repo_obj, repo_commit, orig_repo, orig_commit):
+    """ Return the commits reachable from repo_commit but not from
+    orig_commit, most recent first, using the commit-graph index to find
+    where to stop the walk.
+
+    :return: the list of pygit2.Commit objects or None if the commit-graph
+        could not be used
+
+    """
+    try:
+        bases = pagure.lib.commit_graph.merge_bases(
+            repo_obj, repo_commit.oid.hex, orig_repo, orig_commit.oid.hex)
+    except (KeyError, IOError, OSError, struct.error) as err:
+        _log.info('Could not use the commit-graph: %s', err)
+        return None
+
+    walker = repo_obj.walk(repo_commit.oid.hex, pygit2.GIT_SORT_TIME)
+    for base in bases:
+        walker.hide(base)
+    return list(walker)
+
+
+def _walk_commits_ahead(repo_obj, repo_commit, orig_repo, orig_commit):
+    """ Return the commits reachable from repo_commit but not from
+    orig_commit, most recent first, by walking both histories in parallel.
+    If orig_commit is None, all the commits reachable from repo_commit are
+    returned.
+
+    :return: the list of pygit2.Commit objects
+
+    """
+    diff_commits = []
+    branch = orig_commit is not None
+    if branch:
+        main_walker = orig_repo.walk(
+            orig_commit.oid.hex, pygit2.GIT_SORT_TIME)
+
+    branch_walker = repo_obj.walk(
+        repo_commit.oid.hex, pygit2.GIT_SORT_TIME)
+
+    main_commits = set()
+    branch_commits = set()
+
+    while 1:
+        com = None
+        if branch:
+            try:
+                com = main_walker.next()
+                main_commits.add(com.oid.hex)
+            except StopIteration:
+                com = None
+
+        try:
+            branch_commit = branch_walker.next()
+        except StopIteration:
+            branch_commit = None
+
+        # We sure never end up here but better safe than sorry
+        if com is None and branch_commit is None:
+            break
+
+        if branch_commit:
+            branch_commits.add(branch_commit.oid.hex)
+            diff_commits.append(branch_commit)
+        if main_commits.intersection(branch_commits):
+            break
+
+    # If master is ahead of branch, we need to remove the commits
+    # that are after the first one found in master
+    i = 0
+    if diff_commits and main_commits:
+        for i in range(len(diff_commits)):
+            if diff_commits[i].oid.hex in main_commits:
+                break
+        diff_commits = diff_commits[:i]
+
+    return diff_commits
+
+
+# (repo path, head, emails) -> number of commits, most recently used last
+_COMMITS_COUNT = collections.OrderedDict()
+# (repo path, branch, emails) -> last head counted for that branch
+_COMMITS_COUNT_HEADS = {}
+_COMMITS_COUNT_LOCK = threading.Lock()
+_COMMITS_COUNT_SIZE = 1024
+
+
+def log_commits(repo_obj, head, offset=0, limit=None, emails=None):
+    """ Return the commits reachable from the specified head, most recent
+    first, skipping the ``offset`` first ones and stopping as soon as
+    ``limit`` commits have been found.
+
+    :arg repo_obj: the pygit2.Repository object of the git repository
+    :arg head: the identifier of the commit to start from
+    :kwarg offset: the number of (matching) commits to skip
+    :kwarg limit: the maximum number of commits to return, None for all
+    :kwarg emails: a set of email addresses, if specified only the commits
+        authored by one of them are returned
+    :return: the list of pygit2.Commit objects
+
+    """
+    commits = []
+    if limit is not None and limit <= 0:
+        return commits
+
+    idx = 0
+    for commit in repo_obj.walk(head, pygit2.GIT_SORT_TIME):
+        if emails is not None and commit.author.email not in emails:
+            continue
+        if idx >= offset:
+            commits.append(commit)
+            if limit is not None and len(commits) >= limit:
+                break
+        idx += 1
+    return commits
+
+
+def _count_commits_between(repo_obj, head, hide=None, emails=None):
+    """ Return the number of commits reachable from head and not from hide
+    authored by one of the specified emails (if any). """
+    walker = repo_obj.walk(head, pygit2.GIT_SORT_NONE)
+    if hide:
+        walker.hide(hide)
+    if emails is None:
+        return sum(1 for _ in walker)
+    return sum(1 for commit in walker if commit.author.email in emails)
+
+
+def count_commits(repo_obj, head, branchname=None, emails=None):
+    """ Return the number of commits reachable from the specified head,
+    optionally only counting the ones authored by one of the specified
+    emails.
+
+    The counts are cached per head. When a branch name is given and the
+    branch moved forward since it was last counted, only the commits added
+    to it are counted.
+
+    :arg repo_obj: the pygit2.Repository object of the git repository
+    :arg head: the identifier of the commit to start from
+    :kwarg branchname: the name of the branch whose head is ``head``
+    :kwarg emails: a set of email addresses
+    :return: the number of commits
+
+    """
+    path = os.path.abspath(repo_obj.path)
+    emails_key = frozenset(emails) if emails is not None else None
+    key = (path, head, emails_key)
+    branch_key = (path, branchname, emails_key)
+
+    with _COMMITS_COUNT_LOCK:
+        count = _COMMITS_COUNT.pop(key, None)
+        if count is not None:
+            _COMMITS_COUNT[key] = count
+            return count
+        old_head = None
+        if branchname:
+            old_head = _COMMITS_COUNT_HEADS.get(branch_key)
+        old_count = _COMMITS_COUNT.get((path, old_head, emails_key))
+
+    count = None
+    if old_count is not None:
+        try:
+            forward = pagure.lib.commit_graph.enabled() \
+                and pagure.lib.commit_graph.is_ancestor(
+                    repo_obj, old_head, head)
+        except (KeyError, IOError, OSError, struct.error) as err:
+            _log.info('Could not use the commit-graph: %s', err)
+            forward = False
+        if forward:
+            count = old_count + _count_commits_between(
+                repo_obj, head, hide=old_head, emails=emails)
+
+    if count is None:
+        count = _count_commits_between(repo_obj, head, emails=emails)
+
+    with _COMMITS_COUNT_LOCK:
+        _COMMITS_COUNT.pop(key, None)
+        _COMMITS_COUNT[key] = count
+        if branchname:
+            _COMMITS_COUNT_HEADS[branch_key] = head
+        while len(_COMMITS_COUNT) > _COMMITS_COUNT_SIZE:
+            _COMMITS_COUNT.popitem(last=False)
+        if len(_COMMITS_COUNT_HEADS) > _COMMITS_COUNT_SIZE:
+            _COMMITS_COUNT_HEADS.clear()
+
+    return count
+
+
 def diff_pull_request(
         session, request, repo_obj, orig_repo, requestfolder,
         with_diff=True):
@@ -106,6 +106,47 @@ def _read_file(filename):
             return stream.read()
 
 
+def _write_if_changed(filename, content):
+    """ Writes the specified content to the specified file unless it
+    already has this exact content.
+    Returns whether the file was written.
+    """
+    if os.path.exists(filename):
+        with open(filename) as stream:
+            if stream.read() == content:
+                return False
+    else:
+        folder = os.path.dirname(filename)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    tmpfile = '%s.tmp' % filename
+    with open(tmpfile, 'w') as stream:
+        stream.write(content)
+    os.rename(tmpfile, filename)
+    return True
+
+
+def _iter_projects(session, chunk_size=500):
+    """ Yields all the projects of the database, ordered by id, loading
+    them from the database ``chunk_size`` at a time.
+    """
+    last_id = 0
+    while True:
+        projects = session.query(
+            model.Project
+        ).filter(
+            model.Project.id > last_id
+        ).order_by(
+            model.Project.id
+        ).limit(chunk_size).all()
+        if not projects:
+            break
+        for project in projects:
+            yield project
+        last_id = projects[-1].id
+
+
 class Gitolite2Auth(GitAuthHelper):
     """ A gitolite 2 authentication module. """
 
@@ -326,6 +367,183 @@ class Gitolite2Auth(GitAuthHelper):
 
         return current_config
 
+    @classmethod
+    def _get_fragments_folder(cls, configfile):
+        """ Return the folder in which the configuration of each project is
+        stored in its own file or None if the entire configuration is
+        stored in the configuration file.
+
+        :arg configfile: the name of the gitolite configuration file
+        :type configfile: str
+
+        """
+        folder = pagure.APP.config.get('GITOLITE_FRAGMENTS_FOLDER')
+        if folder:
+            folder = os.path.join(
+                os.path.dirname(os.path.abspath(configfile)), folder)
+        return folder
+
+    @staticmethod
+    def _get_fragment_filename(fragments, project):
+        """ Return the name of the file storing the configuration of the
+        specified project.
+
+        The file is named after the identifier of the project, which, unlike
+        its name, does not change when the project is renamed.
+        """
+        return os.path.join(fragments, 'projects', '%s.conf' % project.id)
+
+    @staticmethod
+    def _include(configfile, filename):
+        """ Return the include statement for the specified file, relative
+        to the folder of the gitolite configuration file if possible. """
+        folder = os.path.dirname(os.path.abspath(configfile))
+        if filename.startswith(folder + os.path.sep):
+            filename = os.path.relpath(filename, folder)
+        return 'include "%s"' % filename
+
+    @classmethod
+    def _write_index(
+            cls, configfile, fragments, add=None, remove=None,
+            rebuild=False):
+        """ Update the index file including the configuration file of each
+        project.
+
+        :arg configfile: the name of the gitolite configuration file
+        :type configfile: str
+        :arg fragments: the folder storing the configuration of the projects
+        :type fragments: str
+        :kwarg add: the names of the files to add to the index
+        :type add: None or list
+        :kwarg remove: the names of the files to remove from the index
+        :type remove: None or list
+        :kwarg rebuild: whether to build the index from the files present
+            in the fragments folder even if it already exists
+        :type rebuild: bool
+        :return: whether the index was changed
+        :return type: bool
+
+        """
+        index = os.path.join(fragments, 'index.conf')
+        if os.path.exists(index) and not rebuild:
+            with open(index) as stream:
+                rows = set(line.rstrip('\n') for line in stream)
+        else:
+            rows = set()
+            for folder, _, files in os.walk(
+                    os.path.join(fragments, 'projects')):
+                for filename in files:
+                    if filename.endswith('.conf'):
+                        rows.add(cls._include(
+                            configfile, os.path.join(folder, filename)))
+        rows.discard('')
+
+        for filename in add or []:
+            rows.add(cls._include(configfile, filename))
+        for filename in remove or []:
+            rows.discard(cls._include(configfile, filename))
+
+        content = ''.join('%s\n' % row for row in sorted(rows))
+        return _write_if_changed(index, content)
+
+    @classmethod
+    def _write_fragments(
+            cls, session, configfile, fragments, project, preconfig=None,
+            postconfig=None):
+        """ Write the gitolite configuration using one file per project.
+
+        The gitolite configuration file only includes the groups file and
+        the index file which in turn includes the file of each project.
+        Only the files whose content changed are written.
+
+        :arg session: a session to connect to the database with
+        :arg configfile: the name of the gitolite configuration file
+        :type configfile: str
+        :arg fragments: the folder storing the configuration of the projects
+        :type fragments: str
+        :arg project: the project to update, see ``write_gitolite_acls``
+        :type project: None, int or pagure.lib.model.Project
+        :kwarg preconfig: the content to include at the top of the
+            configuration file
+        :type preconfig: None or str
+        :kwarg postconfig: the content to include at the bottom of the
+            configuration file
+        :type postconfig: None or str
+        :return: whether any of the files was changed
+        :return type: bool
+
+        """
+        global_pr_only = pagure.APP.config.get('PR_ONLY', False)
+        groups_file = os.path.join(fragments, 'groups.conf')
+        index_file = os.path.join(fragments, 'index.conf')
+
+        changed = False
+        groups = cls._generate_groups_config(session)
+        content = ''.join(
+            '@%s  = %s\n' % (key, ' '.join(groups[key]))
+            for key in sorted(groups)
+        )
+        changed |= _write_if_changed(groups_file, content)
+
+        if project == -1 or not os.path.exists(index_file):
+            _log.info('Refreshing the configuration for all projects')
+            seen = set()
+            for proj in _iter_projects(session):
+                filename = cls._get_fragment_filename(fragments, proj)
+                seen.add(filename)
+                config = cls._process_project(proj, [], global_pr_only)
+                changed |= _write_if_changed(filename, '\n'.join(config))
+
+            # Remove the files of the projects which no longer exist
+            stale = False
+            for folder, _, files in os.walk(
+                    os.path.join(fragments, 'projects')):
+                for filename in files:
+                    filename = os.path.join(folder, filename)
+                    if filename not in seen:
+                        os.unlink(filename)
+                        stale = True
+            changed |= bool(stale)
+            changed |= cls._write_index(configfile, fragments, rebuild=True)
+        elif project:
+            _log.info('Refreshing the configuration for one project')
+            filename = cls._get_fragment_filename(fragments, project)
+            config = cls._process_project(project, [], global_pr_only)
+            changed |= _write_if_changed(filename, '\n'.join(config))
+            changed |= cls._write_index(configfile, fragments, add=[filename])
+
+        content = []
+        if preconfig:
+            content.append(preconfig)
+            content.append('# end of header')
+        content.append(cls._include(configfile, groups_file))
+        content.append(cls._include(configfile, index_file))
+        content.append('# end of body')
+        if postconfig:
+            content.append(postconfig)
+        changed |= _write_if_changed(
+            configfile, ''.join('%s\n' % row for row in content))
+
+        return changed
+
+    @classmethod
+    def _remove_fragment(cls, configfile, fragments, project):
+        """ Remove the configuration file of the specified project and its
+        entry in the index.
+
+        :arg configfile: the name of the gitolite configuration file
+        :type configfile: str
+        :arg fragments: the folder storing the configuration of the projects
+        :type fragments: str
+        :arg project: the project to remove from the gitolite configuration
+        :type project: pagure.lib.model.Project
+
+        """
+        filename = cls._get_fragment_filename(fragments, project)
+        if os.path.exists(filename):
+            os.unlink(filename)
+        cls._write_index(configfile, fragments, remove=[filename])
+
     @classmethod
     def write_gitolite_acls(
             cls, session, configfile, project, preconf=None, postconf=None,
@@ -372,6 +590,12 @@ class Gitolite2Auth(GitAuthHelper):
                 'Loading the file to include at the end of the generated one')
             postconfig = _read_file(postconf)
 
+        fragments = cls._get_fragments_folder(configfile)
+        if fragments:
+            return cls._write_fragments(
+                session, configfile, fragments, project,
+                preconfig=preconfig, postconfig=postconfig)
+
         global_pr_only = pagure.APP.config.get('PR_ONLY', False)
         config = []
         groups = {}
@@ -380,8 +604,7 @@ class Gitolite2Auth(GitAuthHelper):
 
         if project == -1 or not os.path.exists(configfile):
             _log.info('Refreshing the configuration for all projects')
-            query = session.query(model.Project).order_by(model.Project.id)
-            for project in query.all():
+            for project in _iter_projects(session):
                 config = cls._process_project(
                     project, config, global_pr_only)
         elif project:
@@ -462,6 +685,12 @@ class Gitolite2Auth(GitAuthHelper):
                 'Not configuration file found at: %s... bailing' % configfile)
             return
 
+        fragments = cls._get_fragments_folder(configfile)
+        if fragments:
+            _log.info('Removing the project from the configuration')
+            cls._remove_fragment(configfile, fragments, project)
+            return
+
         preconfig = None
         if preconf:
             _log.info(
@@ -561,8 +790,9 @@ class Gitolite2Auth(GitAuthHelper):
         """
         _log.info('Refresh gitolite configuration')
 
+        changed = None
         if project is not None or group is not None:
-            cls.write_gitolite_acls(
+            changed = cls.write_gitolite_acls(
                 pagure.SESSION,
                 project=project,
                 configfile=pagure.APP.config['GITOLITE_CONFIG'],
@@ -571,6 +801,10 @@ class Gitolite2Auth(GitAuthHelper):
                 group=group,
             )
 
+        if changed is False:
+            _log.info('Configuration unchanged, not re-compiling it')
+            return
+
         cmd = cls._get_gitolite_command()
         if cmd:
             proc = subprocess.Popen(
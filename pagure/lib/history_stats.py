@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+Weekly history of the number of opened issues or pull-requests of a
+project.
+
+All the buckets are computed from a single query: either a SQL aggregate
+(on PostgreSQL) or by going once over the creation and closing dates of
+the tickets. The results are memoized per project and day until the status
+of one of its tickets changes. They are kept in redis if it is configured,
+or in a LRU cache of ``HISTORY_STATS_CACHE_SIZE`` entries otherwise.
+Without redis, the changes made by the other processes are not seen, so the
+results are then only kept for ``HISTORY_STATS_CACHE_TTL`` seconds.
+
+"""
+
+import bisect
+import collections
+import datetime
+import json
+import logging
+import threading
+import time
+
+import sqlalchemy as sa
+import sqlalchemy.orm
+from sqlalchemy import func
+
+import pagure.lib
+from pagure.lib import model
+
+
+_log = logging.getLogger(__name__)
+
+# Kind of tickets -> model
+KINDS = {
+    'issues': model.Issue,
+    'pull_requests': model.PullRequest,
+}
+
+_CACHE = collections.OrderedDict()
+_CACHE_LOCK = threading.Lock()
+_SESSION_KEY = 'pagure_history_stats'
+
+
+def _week_starts(weeks, now=None):
+    """ Return the datetimes at which the buckets start, from tomorrow
+    going back one week at a time. """
+    now = now or datetime.datetime.utcnow()
+    tomorrow = now + datetime.timedelta(days=1)
+    return [
+        tomorrow - datetime.timedelta(days=(week * 7))
+        for week in range(weeks)
+    ]
+
+
+def _compute_sql(session, model_cls, project_id, starts):
+    """ Compute the buckets using a single aggregate query. """
+    def _sum(condition):
+        return func.coalesce(func.sum(sa.case([(condition, 1)], else_=0)), 0)
+
+    columns = [
+        # Some ticket got imported as closed but without a closed_at date,
+        # so let's ignore them all
+        _sum(sa.and_(
+            model_cls.closed_at == None,  # noqa
+            model_cls.status != 'Open')),
+    ]
+    for start in starts:
+        columns.append(_sum(sa.and_(
+            model_cls.status == 'Open',
+            model_cls.date_created <= start)))
+        columns.append(_sum(sa.and_(
+            model_cls.closed_at >= start,
+            model_cls.date_created <= start)))
+
+    row = session.query(
+        *columns
+    ).filter(
+        model_cls.project_id == project_id
+    ).one()
+
+    to_ignore = row[0]
+    return [
+        row[1 + idx * 2] + row[2 + idx * 2] - to_ignore
+        for idx in range(len(starts))
+    ]
+
+
+def _compute_python(session, model_cls, project_id, starts):
+    """ Compute the buckets going once over the dates of the tickets. """
+    query = session.query(
+        model_cls.status,
+        model_cls.date_created,
+        model_cls.closed_at,
+    ).filter(
+        model_cls.project_id == project_id
+    )
+
+    # Each ticket is counted in the buckets whose start falls between its
+    # creation and either its closing or now if it is still open
+    ordered = sorted(starts)
+    delta = [0] * (len(ordered) + 1)
+    to_ignore = 0
+    for status, date_created, closed_at in query:
+        if closed_at is None and status != 'Open':
+            to_ignore += 1
+        first = bisect.bisect_left(ordered, date_created)
+        if status == 'Open':
+            delta[first] += 1
+        if closed_at is not None:
+            delta[first] += 1
+            delta[max(first, bisect.bisect_right(ordered, closed_at))] -= 1
+
+    counts = {}
+    cnt = 0
+    for idx, start in enumerate(ordered):
+        cnt += delta[idx]
+        counts[start] = cnt - to_ignore
+    return [counts[start] for start in starts]
+
+
+def compute_history_stats(session, model_cls, project_id, weeks=53,
+                          now=None):
+    """ Return the number of opened tickets of the specified project at the
+    start of each of the specified number of weeks.
+
+    :arg session: the session to use to connect to the database.
+    :arg model_cls: the model of the tickets, ``model.Issue`` or
+        ``model.PullRequest``
+    :arg project_id: the identifier of the project
+    :kwarg weeks: the number of weeks to return
+    :kwarg now: the datetime the weeks are counted from, defaults to now
+    :return: a dict associating the start of each week, as an ISO 8601
+        string, to the number of tickets opened then
+
+    """
+    starts = _week_starts(weeks, now=now)
+    if session.bind.dialect.name == 'postgresql':
+        counts = _compute_sql(session, model_cls, project_id, starts)
+    else:
+        counts = _compute_python(session, model_cls, project_id, starts)
+
+    return dict(
+        (start.isoformat(), max(cnt, 0))
+        for start, cnt in zip(starts, counts)
+    )
+
+
+def _get_cache_key(kind, project_id):
+    return 'pagure.history_stats.%s.%s' % (kind, project_id)
+
+
+def _get(key):
+    """ Return the history cached in process under the specified key, if
+    any. """
+    ttl = pagure.APP.config.get('HISTORY_STATS_CACHE_TTL', 300)
+    with _CACHE_LOCK:
+        cached = _CACHE.pop(key, None)
+        if cached is None or cached['time'] + ttl < time.time():
+            return None
+        # Keep the most recently used entries last
+        _CACHE[key] = cached
+        return cached['value']
+
+
+def _set(key, value):
+    """ Cache in process the specified history under the specified key. """
+    size = pagure.APP.config.get('HISTORY_STATS_CACHE_SIZE', 1000)
+    with _CACHE_LOCK:
+        _CACHE.pop(key, None)
+        _CACHE[key] = {'value': value, 'time': time.time()}
+        while len(_CACHE) > size:
+            _CACHE.popitem(last=False)
+
+
+def get_history_stats(session, kind, project):
+    """ Return the weekly history of the number of opened tickets of the
+    specified kind ('issues' or 'pull_requests') for the specified project,
+    memoized until the status of one of these tickets changes.
+    """
+    key = _get_cache_key(kind, project.id)
+    today = datetime.datetime.utcnow().date().isoformat()
+
+    if pagure.lib.REDIS:
+        cached = pagure.lib.REDIS.get(key)
+        if cached:
+            cached = json.loads(cached)
+            if cached['day'] == today:
+                return cached['stats']
+    else:
+        cached = _get(key)
+        if cached and cached['day'] == today:
+            return dict(cached['stats'])
+
+    stats = compute_history_stats(session, KINDS[kind], project.id)
+    cached = {'day': today, 'stats': stats}
+    if pagure.lib.REDIS:
+        # No need to keep it past tomorrow
+        pagure.lib.REDIS.set(key, json.dumps(cached), ex=2 * 24 * 3600)
+    else:
+        _set(key, cached)
+    return dict(stats)
+
+
+def invalidate(kind, project_id):
+    """ Drop the memoized history of the specified kind of tickets of the
+    specified project. """
+    key = _get_cache_key(kind, project_id)
+    if pagure.lib.REDIS:
+        pagure.lib.REDIS.delete(key)
+    with _CACHE_LOCK:
+        _CACHE.pop(key, None)
+
+
+def _mark(kind, target):
+    """ Invalidate the history of the project of the specified ticket now
+    and once the current transaction is committed. """
+    if target.project_id is None:
+        return
+    invalidate(kind, target.project_id)
+    session = sa.orm.object_session(target)
+    if session is not None:
+        session.info.setdefault(_SESSION_KEY, set()).add(
+            (kind, target.project_id))
+
+
+def _on_commit(session):
+    for kind, project_id in session.info.pop(_SESSION_KEY, ()):
+        invalidate(kind, project_id)
+
+
+def _on_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def _register(kind, model_cls):
+    """ Invalidate the history when tickets are added, removed or when their
+    status change. """
+    def _on_change(mapper, connection, target):
+        _mark(kind, target)
+
+    def _on_set(target, value, oldvalue, initiator):
+        if value != oldvalue:
+            _mark(kind, target)
+
+    sa.event.listen(model_cls, 'after_insert', _on_change)
+    sa.event.listen(model_cls, 'after_delete', _on_change)
+    sa.event.listen(model_cls.status, 'set', _on_set)
+    sa.event.listen(model_cls.closed_at, 'set', _on_set)
+
+
+def _on_project_change(mapper, connection, target):
+    for kind in KINDS:
+        invalidate(kind, target.id)
+
+
+for _kind, _model_cls in KINDS.items():
+    _register(_kind, _model_cls)
+
+sa.event.listen(model.Project, 'after_insert', _on_project_change)
+sa.event.listen(model.Project, 'after_delete', _on_project_change)
+
+sa.event.listen(sa.orm.Session, 'after_commit', _on_commit)
+sa.event.listen(sa.orm.Session, 'after_rollback', _on_rollback)
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+Run the git hooks of the projects in a long-lived process.
+
+Each hook of pagure is a python script importing pagure, which means
+creating the flask application and connecting to the database before doing
+its work. Ran as their own process for every push, this startup cost is
+paid by every enabled hook.
+
+The hook runner (pagure-hookrunner) imports pagure once and executes the
+hooks in its worker processes, with the environment, working directory,
+arguments and input of the git process which triggered them. The
+``hookrunner_client.py`` shim forwards them over a UNIX socket and streams
+back the output of the hooks to the pusher.
+
+The protocol is:
+
+- the client sends the request, serialized in JSON on a single line,
+  then closes its side of the connection. The input of the hook is sent
+  encoded in base64, as the ref names it contains are arbitrary bytes;
+- the server sends back frames, made of a type (one byte), a length (four
+  bytes, big-endian) and the data, for the output of the hooks (``STDOUT``
+  and ``STDERR``) and, at last, their exit status (``EXIT``).
+
+"""
+
+from __future__ import print_function
+
+import base64
+import contextlib
+import importlib
+import json
+import logging
+import os
+import select
+import struct
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+import six
+
+import pagure
+
+
+_log = logging.getLogger(__name__)
+
+# The folder containing the hooks shipped with pagure, these are ran
+# in-process, the others via a sub-process
+HOOKS_FOLDER = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'hooks', 'files')
+
+STDOUT = b'1'
+STDERR = b'2'
+EXIT = b'x'
+_HEADER = struct.Struct('!cI')
+
+_CODE_LOCK = threading.Lock()
+_CODE = {}
+
+
+def send_frame(conn, kind, data):
+    """ Send a frame of the specified type over the specified socket. """
+    if isinstance(data, six.text_type):
+        data = data.encode('utf-8')
+    conn.sendall(_HEADER.pack(kind, len(data)) + data)
+
+
+def read_request(conn):
+    """ Read and return the request sent over the specified socket. """
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return json.loads(b''.join(chunks).decode('utf-8'))
+
+
+def find_hooks(git_dir, hookname):
+    """ Return the path of the hooks to run, in the order in which the
+    ``post-receive`` dispatcher runs them.
+
+    :arg git_dir: the path to the git repository
+    :arg hookname: the type of hook, for example: ``post-receive``
+    :return: the list of the path of the executable
+        ``hooks/<hookname>.*`` files of the repository
+
+    """
+    folder = os.path.join(git_dir, 'hooks')
+    if not os.path.isdir(folder):
+        return []
+    prefix = hookname + '.'
+    return [
+        os.path.join(folder, filename)
+        for filename in sorted(os.listdir(folder))
+        if filename.startswith(prefix)
+        and os.access(os.path.join(folder, filename), os.X_OK)
+    ]
+
+
+def _get_code(path):
+    """ Return the compiled code of the specified python script, compiled
+    once for as long as the file does not change. """
+    mtime = os.stat(path).st_mtime
+    with _CODE_LOCK:
+        cached = _CODE.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path) as stream:
+        # Do not inherit the __future__ imports of this module
+        code = compile(stream.read(), path, 'exec', dont_inherit=True)
+    with _CODE_LOCK:
+        _CODE[path] = (mtime, code)
+    return code
+
+
+def warm_up():
+    """ Import the modules used by the hooks shipped with pagure and compile
+    them, before the workers are started. """
+    for module in (
+            'pagure.lib.commit_graph', 'pagure.lib.git', 'pagure.lib.link',
+            'pagure.lib.plugins', 'pagure.lib.tasks', 'pagure.ui.plugins'):
+        importlib.import_module(module)
+    for filename in sorted(os.listdir(HOOKS_FOLDER)):
+        if filename.endswith('.py'):
+            _get_code(os.path.join(HOOKS_FOLDER, filename))
+
+
+def runs_in_process(path):
+    """ Return whether the specified hook is ran in-process or not. """
+    realpath = os.path.realpath(path)
+    return realpath.endswith('.py') \
+        and os.path.dirname(realpath) == os.path.realpath(HOOKS_FOLDER)
+
+
+class _Output(object):
+    """ File-like object sending what is written to it to the client. """
+
+    encoding = 'utf-8'
+
+    def __init__(self, conn, kind):
+        self.conn = conn
+        self.kind = kind
+
+    def write(self, data):
+        if data:
+            send_frame(self.conn, self.kind, data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def _native(value):
+    """ Return the specified text as a native string, as the environment and
+    the input of a process are. """
+    if six.PY2 and isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return value
+
+
+def _get_stdin(request):
+    """ Return the input of the git process, as bytes. """
+    return base64.b64decode(request['stdin'])
+
+
+def _get_env(request):
+    """ Return the environment of the git process. """
+    return dict(
+        (_native(key), _native(value))
+        for key, value in request['env'].items())
+
+
+@contextlib.contextmanager
+def _hook_environment(path, request, conn):
+    """ Give the hook the environment, working directory, arguments and
+    input of the git process, and send its output to the client.
+
+    This changes the state of the whole process, so a worker must only run
+    one hook at a time.
+    """
+    environ = dict(os.environ)
+    cwd = os.getcwd()
+    streams = (sys.stdin, sys.stdout, sys.stderr, sys.argv)
+
+    os.environ.clear()
+    os.environ.update(_get_env(request))
+    os.chdir(request['cwd'])
+    stdin = _get_stdin(request)
+    if not six.PY2:
+        stdin = stdin.decode('utf-8', 'surrogateescape')
+    sys.stdin = six.StringIO(stdin)
+    sys.stdout = _Output(conn, STDOUT)
+    sys.stderr = _Output(conn, STDERR)
+    sys.argv = [path] + [_native(arg) for arg in request['args']]
+    try:
+        yield
+    finally:
+        sys.stdin, sys.stdout, sys.stderr, sys.argv = streams
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+def _exit_status(code):
+    """ Return the exit status corresponding to the argument of
+    ``sys.exit``. """
+    if code is None:
+        return 0
+    if isinstance(code, six.integer_types):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _run_process(path, request, conn):
+    """ Run the specified hook in a sub-process, sending its output to the
+    client as it is produced and killing it if it runs for longer than
+    ``HOOKRUNNER_HOOK_TIMEOUT`` seconds.
+
+    :return: the exit status of the hook
+
+    """
+    timeout = pagure.APP.config.get('HOOKRUNNER_HOOK_TIMEOUT', 600)
+    deadline = time.time() + timeout
+    proc = subprocess.Popen(
+        [path] + [_native(arg) for arg in request['args']],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        cwd=request['cwd'],
+        env=_get_env(request),
+    )
+
+    def feed():
+        # In a thread, so a hook writing before reading its input does not
+        # block on its output
+        try:
+            proc.stdin.write(_get_stdin(request))
+            proc.stdin.close()
+        except (IOError, OSError):
+            # The hook exited without reading all its input
+            pass
+
+    feeder = threading.Thread(target=feed)
+    feeder.daemon = True
+    feeder.start()
+
+    fileno = proc.stdout.fileno()
+    try:
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0 \
+                    or not select.select([fileno], [], [], remaining)[0]:
+                break
+            chunk = os.read(fileno, 65536)
+            if not chunk:
+                break
+            send_frame(conn, STDOUT, chunk)
+
+        # The hook may keep running after closing its output
+        while proc.poll() is None and time.time() < deadline:
+            time.sleep(0.1)
+    finally:
+        proc.stdout.close()
+
+    if proc.poll() is None:
+        proc.kill()
+        proc.wait()
+        _log.warning('%s: killed after %ss', path, timeout)
+        send_frame(
+            conn, STDOUT,
+            'Hook %s killed after running for %s seconds\n' % (
+                path, timeout))
+        return 1
+    return proc.returncode
+
+
+def run_hook(path, request, conn):
+    """ Run the specified hook for the specified request.
+
+    :arg path: the path to the hook
+    :arg request: the request sent by the client, see
+        ``hookrunner_client.py``
+    :arg conn: the socket connected to the client, to which the output of
+        the hook is sent
+    :return: the exit status of the hook
+
+    """
+    if not runs_in_process(path):
+        return _run_process(path, request, conn)
+
+    code = _get_code(os.path.realpath(path))
+    with _hook_environment(path, request, conn):
+        try:
+            exec(code, {'__name__': '__main__', '__file__': path})
+            status = 0
+        except SystemExit as err:
+            status = _exit_status(err.code)
+        except Exception:
+            traceback.print_exc()
+            status = 1
+        finally:
+            pagure.SESSION.remove()
+    return status
+
+
+def handle(conn):
+    """ Run the hooks requested over the specified connection, stopping at
+    the first one failing as the ``post-receive`` dispatcher does.
+
+    :arg conn: the socket connected to the client
+    :return: the exit status sent to the client
+
+    """
+    request = read_request(conn)
+    git_dir = os.path.join(request['cwd'], request['env']['GIT_DIR'])
+
+    status = 0
+    for path in find_hooks(git_dir, request['hook']):
+        start = time.time()
+        status = run_hook(path, request, conn)
+        _log.info(
+            '%s: ran %s in %.3fs, status: %s', git_dir,
+            os.path.basename(path), time.time() - start, status)
+        if status != 0:
+            send_frame(
+                conn, STDOUT,
+                'Hook %s failed with error code %s\n' % (path, status))
+            break
+
+    send_frame(conn, EXIT, str(status))
+    return status
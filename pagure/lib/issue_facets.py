@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+Number of issues of a project matching a filter, per status and per tag.
+
+The counts are retrieved using a single statement grouping the issues
+matching the filter by status and close status, and by status, close
+status and tag. The number of issues having any status (or any tag) is
+then computed from these groups.
+
+The counts are memoized per project and filter until one of the issues of
+the project, or their tags, comments or custom fields, changes. They are
+kept in redis if it is configured, or in a LRU cache of
+``ISSUE_FACETS_CACHE_SIZE`` entries otherwise. Without redis, the changes
+made by the other processes are not seen, so the counts are then only kept
+for ``ISSUE_FACETS_CACHE_TTL`` seconds.
+
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import sqlalchemy as sa
+import sqlalchemy.orm
+from sqlalchemy import func
+
+import pagure.lib
+from pagure.lib import model
+
+
+_log = logging.getLogger(__name__)
+
+_CACHE = collections.OrderedDict()
+_CACHE_LOCK = threading.Lock()
+_SESSION_KEY = 'pagure_issue_facets'
+# The counts kept in redis are re-computed at least once a day
+_CACHE_TTL = 24 * 3600
+
+
+def compute_facets(query):
+    """ Return the number of issues retrieved by the specified query per
+    status and per tag.
+
+    :arg query: the query retrieving the issues, as returned by
+        ``pagure.lib._get_issues_query``
+    :return: a dict with the list of (status, close status, count) under
+        'statuses' and the list of (status, close status, tag, count) under
+        'tags'
+
+    """
+    statuses = query.with_entities(
+        model.Issue.status,
+        model.Issue.close_status,
+        sa.null().label('tag'),
+        func.count(model.Issue.uid),
+    ).group_by(
+        model.Issue.status,
+        model.Issue.close_status,
+    )
+    tags = query.join(
+        model.TagIssueColored,
+        model.TagIssueColored.issue_uid == model.Issue.uid
+    ).join(
+        model.TagColored,
+        model.TagColored.id == model.TagIssueColored.tag_id
+    ).with_entities(
+        model.Issue.status,
+        model.Issue.close_status,
+        model.TagColored.tag,
+        func.count(model.Issue.uid),
+    ).group_by(
+        model.Issue.status,
+        model.Issue.close_status,
+        model.TagColored.tag,
+    )
+
+    output = {'statuses': [], 'tags': []}
+    rows = query.session.execute(
+        sa.union_all(statuses.statement, tags.statement))
+    for status, close_status, tag, cnt in rows:
+        if tag is None:
+            output['statuses'].append((status, close_status, cnt))
+        else:
+            output['tags'].append((status, close_status, tag, cnt))
+    return output
+
+
+def _matches(row_status, row_close_status, status=None, closed=False):
+    """ Return whether the issues of the specified status and close status
+    match the specified filter, the same way ``search_issues`` does. """
+    if status is not None:
+        if status in ['Open', 'Closed']:
+            if row_status != status:
+                return False
+        elif row_close_status != status:
+            return False
+    if closed and row_status == 'Open':
+        return False
+    return True
+
+
+def count(facets, status=None, closed=False):
+    """ Return the number of issues of the specified status.
+
+    :arg facets: the counts as returned by ``get_facets``
+    :kwarg status: the status or close status of the issues to count
+    :kwarg closed: only count the issues which are not open
+    :return: the number of issues
+
+    """
+    return sum(
+        cnt for row_status, row_close_status, cnt in facets['statuses']
+        if _matches(row_status, row_close_status, status, closed)
+    )
+
+
+def count_tags(facets, status=None, closed=False):
+    """ Return the number of issues of the specified status per tag, see
+    ``count``. """
+    output = {}
+    for row_status, row_close_status, tag, cnt in facets['tags']:
+        if _matches(row_status, row_close_status, status, closed):
+            output[tag] = output.get(tag, 0) + cnt
+    return output
+
+
+def _get_cache_key(project_id):
+    return 'pagure.issue_facets.%s' % project_id
+
+
+def _get(key, field):
+    """ Return the counts cached in process under the specified key and
+    field, if any. """
+    ttl = pagure.APP.config.get('ISSUE_FACETS_CACHE_TTL', 300)
+    with _CACHE_LOCK:
+        cached = _CACHE.get((key, field))
+        if cached is None:
+            return None
+        del _CACHE[(key, field)]
+        if cached['time'] + ttl < time.time():
+            return None
+        # Keep the most recently used entries last
+        _CACHE[(key, field)] = cached
+        return cached['value']
+
+
+def _set(key, field, value):
+    """ Cache in process the specified counts under the specified key and
+    field. """
+    size = pagure.APP.config.get('ISSUE_FACETS_CACHE_SIZE', 1000)
+    with _CACHE_LOCK:
+        _CACHE.pop((key, field), None)
+        _CACHE[(key, field)] = {'value': value, 'time': time.time()}
+        while len(_CACHE) > size:
+            _CACHE.popitem(last=False)
+
+
+def get_facets(project, query, filters):
+    """ Return the number of issues retrieved by the specified query per
+    status and per tag, memoized until one of the issues of the project
+    changes.
+
+    :arg project: the project the issues belong to
+    :arg query: the query retrieving the issues
+    :arg filters: a dict of the filters the query was built with, used to
+        identify it in the cache
+    :return: the counts, see ``compute_facets``
+
+    """
+    key = _get_cache_key(project.id)
+    field = hashlib.sha1(
+        json.dumps(filters, sort_keys=True).encode('utf-8')).hexdigest()
+
+    if pagure.lib.REDIS:
+        cached = pagure.lib.REDIS.hget(key, field)
+        if cached:
+            return json.loads(cached)
+    else:
+        cached = _get(key, field)
+        if cached:
+            return cached
+
+    facets = compute_facets(query)
+    if pagure.lib.REDIS:
+        pagure.lib.REDIS.hset(key, field, json.dumps(facets))
+        pagure.lib.REDIS.expire(key, _CACHE_TTL)
+    else:
+        _set(key, field, facets)
+    return facets
+
+
+def invalidate(project_id):
+    """ Drop the memoized counts of the issues of the specified project. """
+    key = _get_cache_key(project_id)
+    if pagure.lib.REDIS:
+        pagure.lib.REDIS.delete(key)
+    with _CACHE_LOCK:
+        for cache_key in [
+                cache_key for cache_key in _CACHE if cache_key[0] == key]:
+            del _CACHE[cache_key]
+
+
+def _mark(target, project_id):
+    """ Invalidate the counts of the specified project now and once the
+    current transaction is committed. """
+    if project_id is None:
+        return
+    invalidate(project_id)
+    session = sa.orm.object_session(target)
+    if session is not None:
+        session.info.setdefault(_SESSION_KEY, set()).add(project_id)
+
+
+def _on_commit(session):
+    for project_id in session.info.pop(_SESSION_KEY, ()):
+        invalidate(project_id)
+
+
+def _on_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def _on_issue_change(mapper, connection, target):
+    _mark(target, target.project_id)
+
+
+def _on_issue_child_change(mapper, connection, target):
+    """ A tag, comment or custom field of an issue changed. """
+    table = model.Issue.__table__
+    project_id = connection.execute(
+        sa.select([table.c.project_id]).where(
+            table.c.uid == target.issue_uid)
+    ).scalar()
+    _mark(target, project_id)
+
+
+def _on_project_change(mapper, connection, target):
+    invalidate(target.id)
+
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    sa.event.listen(model.Issue, _event, _on_issue_change)
+    # Renaming or removing a tag changes the counts per tag
+    sa.event.listen(model.TagColored, _event, _on_issue_change)
+    for _model_cls in (
+            model.TagIssueColored, model.IssueComment, model.IssueValues):
+        sa.event.listen(_model_cls, _event, _on_issue_child_change)
+
+sa.event.listen(model.Project, 'after_insert', _on_project_change)
+sa.event.listen(model.Project, 'after_delete', _on_project_change)
+
+sa.event.listen(sa.orm.Session, 'after_commit', _on_commit)
+sa.event.listen(sa.orm.Session, 'after_rollback', _on_rollback)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+Delivery of the emails sent by pagure.
+
+Emails are handed over as a list of (from, recipients, message) tuples to
+the configured backend:
+
+- ``smtp`` sends them via the configured SMTP server, re-using the same
+  connection (and login) across calls. The connection is only checked when
+  it was not used for a while, and opened again if the server closed it,
+- ``maildir`` stores them in a local maildir, which is convenient for
+  development and testing.
+
+"""
+
+import logging
+import mailbox
+import smtplib
+import socket
+import threading
+import time
+
+import pagure
+import pagure.exceptions
+
+
+_log = logging.getLogger(__name__)
+
+# Errors after which the delivery of an email can be attempted again later
+_TRANSIENT_ERRORS = (
+    smtplib.SMTPServerDisconnected,
+    smtplib.SMTPConnectError,
+    smtplib.SMTPHeloError,
+    socket.error,
+)
+
+
+class SMTPBackend(object):
+    """ Sends the emails via a SMTP server, keeping the connection open
+    between calls. """
+
+    # Number of seconds after which an idle connection is checked before
+    # being used again
+    idle_check = 30
+
+    def __init__(self, server, port, ssl=False, username=None,
+                 password=None):
+        self.server = server
+        self.port = port
+        self.ssl = ssl
+        self.username = username
+        self.password = password
+        self._smtp = None
+        self._used_at = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """ Open and authenticate a new connection to the SMTP server. """
+        if self.ssl:
+            smtp = smtplib.SMTP_SSL(self.server, self.port)
+        else:
+            smtp = smtplib.SMTP(self.server, self.port)
+        if self.username and self.password:
+            smtp.login(self.username, self.password)
+        return smtp
+
+    def _get_connection(self):
+        """ Return the opened connection or a new one. The connection is
+        only checked if it was not used in the last ``idle_check`` seconds.
+        """
+        if self._smtp is not None \
+                and time.time() - self._used_at > self.idle_check:
+            try:
+                status = self._smtp.noop()[0]
+            except _TRANSIENT_ERRORS:
+                status = None
+            if status != 250:
+                self.close()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        return self._smtp
+
+    def _sendmail(self, from_email, to_emails, msg):
+        """ Send the specified email, opening the connection again if the
+        server closed it since it was last used. """
+        try:
+            self._get_connection().sendmail(from_email, to_emails, msg)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self._get_connection().sendmail(from_email, to_emails, msg)
+        self._used_at = time.time()
+
+    def close(self):
+        """ Close the connection to the SMTP server, if any. """
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except _TRANSIENT_ERRORS + (smtplib.SMTPException,):
+                pass
+
+    def send(self, messages):
+        """ Send the specified emails.
+
+        :arg messages: a list of (from, recipients, message) tuples
+        :return: the list of the emails which could not be sent because of
+            a transient error and should be tried again later
+
+        """
+        failed = []
+        with self._lock:
+            for idx, (from_email, to_emails, msg) in enumerate(messages):
+                try:
+                    self._sendmail(from_email, to_emails, msg)
+                except _TRANSIENT_ERRORS as err:
+                    _log.warning('Could not send email to %s: %s',
+                                 to_emails, err)
+                    self.close()
+                    failed.append(messages[idx])
+                except smtplib.SMTPException as err:
+                    # The email was refused, no need to try again
+                    _log.exception(err)
+        return failed
+
+
+class MaildirBackend(object):
+    """ Stores the emails in a local maildir instead of sending them. """
+
+    def __init__(self, path):
+        self.path = path
+
+    def close(self):
+        pass
+
+    def send(self, messages):
+        """ Store the specified emails, see ``SMTPBackend.send``. """
+        box = mailbox.Maildir(self.path, factory=None, create=True)
+        for _, _, msg in messages:
+            box.add(msg)
+        return []
+
+
+_BACKEND = None
+_BACKEND_CONFIG = None
+_BACKEND_LOCK = threading.Lock()
+
+
+def _backend_config():
+    config = pagure.APP.config
+    return (
+        config.get('EMAIL_BACKEND', 'smtp'),
+        config.get('EMAIL_MAILDIR'),
+        config['SMTP_SERVER'],
+        config['SMTP_PORT'],
+        config['SMTP_SSL'],
+        config['SMTP_USERNAME'],
+        config['SMTP_PASSWORD'],
+    )
+
+
+def get_backend():
+    """ Return the backend to use to deliver the emails, it is kept across
+    calls as long as the configuration does not change. """
+    global _BACKEND, _BACKEND_CONFIG
+    config = _backend_config()
+    with _BACKEND_LOCK:
+        if _BACKEND is None or config != _BACKEND_CONFIG:
+            if _BACKEND is not None:
+                _BACKEND.close()
+            name, maildir = config[:2]
+            if name == 'maildir':
+                _BACKEND = MaildirBackend(maildir)
+            elif name == 'smtp':
+                _BACKEND = SMTPBackend(*config[2:])
+            else:
+                raise pagure.exceptions.PagureException(
+                    'Unknown email backend: %s' % name)
+            _BACKEND_CONFIG = config
+        return _BACKEND
+
+
+def deliver(messages):
+    """ Deliver the specified emails using the configured backend.
+
+    :arg messages: a list of (from, recipients, message) tuples
+    :return: the list of the emails which could not be delivered because of
+        a transient error
+
+    """
+    if not messages:
+        return []
+    return get_backend().send(messages)
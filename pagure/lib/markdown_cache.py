@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+Cache of the html rendered from markdown.
+
+The sanitized html is kept, in redis if it is configured or in a LRU cache
+otherwise, under a key built from the hash of the text, the rendering
+options and the project whose page is being rendered (which is used to
+resolve implicit references such as ``#3``).
+
+The links added by pagure's markdown extension depend on the issues,
+pull-requests and commits of the projects they refer to. While rendering,
+the extension records the projects it looked into, along with their
+generation: a counter incremented every time one of their issues or
+pull-requests is created, removed, renamed or changes status and every time
+commits are pushed to them. A cached rendering is only used if the
+generation of all these projects is still the same.
+Renderings whose links depend on something which is not tracked (a project
+or a user which does not exist, yet) are not cached.
+
+Without redis, the generations are kept in memory by each process, which
+does not see the changes made via the other processes: these keep using
+their cached renderings until they expire (after ``MARKDOWN_CACHE_TTL``
+seconds).
+
+"""
+
+import collections
+import contextlib
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import six
+import sqlalchemy as sa
+import sqlalchemy.orm
+
+import pagure
+import pagure.lib
+from pagure.lib import model
+
+
+_log = logging.getLogger(__name__)
+
+_CACHE = collections.OrderedDict()
+_GENERATIONS = {}
+_LOCK = threading.Lock()
+_LOCAL = threading.local()
+_SESSION_KEY = 'pagure_markdown_cache'
+
+
+class Rendering(object):
+    """ The projects a rendering depends on and whether it can be cached.
+    """
+
+    def __init__(self):
+        self.projects = {}
+        self.cacheable = True
+
+    def depends_on(self, project_id):
+        """ Record that the rendering depends on the state of the specified
+        project, this must be called before this state is looked at. """
+        if project_id not in self.projects:
+            self.projects[project_id] = _get_generations([project_id])[0]
+
+
+def _ttl():
+    return pagure.APP.config.get('MARKDOWN_CACHE_TTL', 3600)
+
+
+def _get_generation_key(project_id):
+    return 'pagure.markdown.generation.%s' % project_id
+
+
+def _get_generations(project_ids):
+    """ Return the current generation of each of the specified projects. """
+    if not project_ids:
+        return []
+    if pagure.lib.REDIS:
+        values = pagure.lib.REDIS.mget(
+            [_get_generation_key(project_id) for project_id in project_ids])
+        return [int(value or 0) for value in values]
+    with _LOCK:
+        return [_GENERATIONS.get(project_id, 0) for project_id in project_ids]
+
+
+def get_key(text, *args):
+    """ Return the key under which the rendering of the specified text with
+    the specified options is cached. """
+    if isinstance(text, six.text_type):
+        text = text.encode('utf-8')
+    digest = hashlib.sha1(text)
+    digest.update(json.dumps(args).encode('utf-8'))
+    return 'pagure.markdown.%s' % digest.hexdigest()
+
+
+def get(key):
+    """ Return the html cached under the specified key, if any and if it is
+    still valid. """
+    if not _ttl():
+        return None
+
+    if pagure.lib.REDIS:
+        cached = pagure.lib.REDIS.get(key)
+        if not cached:
+            return None
+        cached = json.loads(cached)
+    else:
+        with _LOCK:
+            cached = _CACHE.get(key)
+            if cached is None:
+                return None
+            if cached['time'] + _ttl() < time.time():
+                del _CACHE[key]
+                return None
+            # Keep the most recently used entries last
+            del _CACHE[key]
+            _CACHE[key] = cached
+
+    projects = list(cached['projects'].items())
+    generations = _get_generations(
+        [int(project_id) for project_id, _ in projects])
+    if generations != [generation for _, generation in projects]:
+        return None
+    return cached['html']
+
+
+def store(key, html, rendering):
+    """ Cache the specified html under the specified key, unless the
+    rendering cannot be cached. """
+    ttl = _ttl()
+    if not ttl or not rendering.cacheable:
+        return
+
+    cached = {
+        'html': html,
+        'projects': dict(
+            (str(project_id), generation)
+            for project_id, generation in rendering.projects.items()),
+        'time': time.time(),
+    }
+    if pagure.lib.REDIS:
+        pagure.lib.REDIS.set(key, json.dumps(cached), ex=ttl)
+    else:
+        size = pagure.APP.config.get('MARKDOWN_CACHE_SIZE', 1000)
+        with _LOCK:
+            _CACHE.pop(key, None)
+            _CACHE[key] = cached
+            while len(_CACHE) > size:
+                _CACHE.popitem(last=False)
+
+
+@contextlib.contextmanager
+def recording():
+    """ Record the projects the markdown rendered in this context depends
+    on, see ``depends_on`` and ``not_cacheable``. """
+    previous = getattr(_LOCAL, 'rendering', None)
+    _LOCAL.rendering = Rendering()
+    try:
+        yield _LOCAL.rendering
+    finally:
+        _LOCAL.rendering = previous
+
+
+def depends_on(project_id):
+    """ Record that the markdown being rendered depends on the issues,
+    pull-requests or commits of the specified project. """
+    rendering = getattr(_LOCAL, 'rendering', None)
+    if rendering is not None:
+        rendering.depends_on(project_id)
+
+
+def not_cacheable():
+    """ Record that the markdown being rendered should not be cached. """
+    rendering = getattr(_LOCAL, 'rendering', None)
+    if rendering is not None:
+        rendering.cacheable = False
+
+
+def invalidate(project_id):
+    """ Invalidate the cached renderings depending on the specified
+    project. """
+    if pagure.lib.REDIS:
+        pagure.lib.REDIS.incr(_get_generation_key(project_id))
+    with _LOCK:
+        _GENERATIONS[project_id] = _GENERATIONS.get(project_id, 0) + 1
+
+
+def _mark(target):
+    """ Invalidate the renderings depending on the project of the specified
+    ticket now and once the current transaction is committed. """
+    if target.project_id is None:
+        return
+    invalidate(target.project_id)
+    session = sa.orm.object_session(target)
+    if session is not None:
+        session.info.setdefault(_SESSION_KEY, set()).add(target.project_id)
+
+
+def _on_commit(session):
+    for project_id in session.info.pop(_SESSION_KEY, ()):
+        invalidate(project_id)
+
+
+def _on_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def _on_change(mapper, connection, target):
+    _mark(target)
+
+
+def _on_set(target, value, oldvalue, initiator):
+    if value != oldvalue:
+        _mark(target)
+
+
+def _on_project_change(mapper, connection, target):
+    invalidate(target.id)
+
+
+for _model_cls in (model.Issue, model.PullRequest):
+    sa.event.listen(_model_cls, 'after_insert', _on_change)
+    sa.event.listen(_model_cls, 'after_delete', _on_change)
+    # These are shown in the title of the links
+    sa.event.listen(_model_cls.status, 'set', _on_set)
+    sa.event.listen(_model_cls.title, 'set', _on_set)
+sa.event.listen(model.Issue.private, 'set', _on_set)
+
+sa.event.listen(model.Project, 'after_insert', _on_project_change)
+sa.event.listen(model.Project, 'after_delete', _on_project_change)
+
+sa.event.listen(sa.orm.Session, 'after_commit', _on_commit)
+sa.event.listen(sa.orm.Session, 'after_rollback', _on_rollback)
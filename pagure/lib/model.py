@@ -1689,6 +1689,11 @@ class PullRequest(BASE):
             name='merge_status_enum',
         ),
         nullable=True)
+    # The commits the merge_status was computed for: the head of the PR and
+    # the head of the target branch
+    merge_status_commit = sa.Column(sa.Text(), nullable=True)
+    merge_status_target = sa.Column(sa.Text(), nullable=True)
+    _merge_conflicts = sa.Column('merge_conflicts', sa.Text, nullable=True)
 
     # While present this column isn't used anywhere yet
     private = sa.Column(sa.Boolean, nullable=False, default=False)
@@ -1767,6 +1772,20 @@ class PullRequest(BASE):
         ''' Return the list of tags in a simple text form. '''
         return [tag.tag for tag in self.tags]
 
+    @property
+    def merge_conflicts(self):
+        ''' Return the list of the files conflicting when merging this
+        pull-request, as found when computing its merge_status.
+        '''
+        if self._merge_conflicts:
+            return json.loads(self._merge_conflicts)
+        return []
+
+    @merge_conflicts.setter
+    def merge_conflicts(self, conflicts):
+        ''' Ensures the list of conflicting files is properly saved. '''
+        self._merge_conflicts = json.dumps(conflicts) if conflicts else None
+
     @property
     def discussion(self):
         ''' Return the list of comments related to the pull-request itself,
@@ -2278,6 +2297,79 @@ class ProjectGroup(BASE):
     __table_args__ = (sa.UniqueConstraint('project_id', 'group_id'),)
 
 
+class ProjectAccess(BASE):
+    """
+    Denormalized list of the projects each user has access to, either as
+    owner, directly or via one of their groups.
+    This table is maintained by pagure.lib.project_access, it should not be
+    changed directly.
+
+    Table -- projects_access
+    """
+
+    __tablename__ = 'projects_access'
+    __table_args__ = (
+        sa.Index(
+            'projects_access_user_id_access_idx', 'user_id', 'access'),
+    )
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    user_id = sa.Column(
+        sa.Integer,
+        sa.ForeignKey(
+            'users.id', onupdate='CASCADE', ondelete='CASCADE',
+        ),
+        nullable=False)
+    project_id = sa.Column(
+        sa.Integer,
+        sa.ForeignKey(
+            'projects.id', onupdate='CASCADE', ondelete='CASCADE',
+        ),
+        nullable=False,
+        index=True)
+    # The group giving the access, if any
+    group_id = sa.Column(
+        sa.Integer,
+        sa.ForeignKey(
+            'pagure_group.id', onupdate='CASCADE', ondelete='CASCADE',
+        ),
+        nullable=True)
+    # One of 'owner', 'admin', 'commit' or 'ticket'
+    access = sa.Column(sa.String(255), nullable=False)
+
+
+class SearchIndex(BASE):
+    """
+    Text of the issues and pull-requests, with their comments, as indexed
+    for the full-text search.
+    This table is maintained by pagure.lib.fulltext, it should not be
+    changed directly.
+
+    Table -- search_index
+    """
+
+    __tablename__ = 'search_index'
+    __table_args__ = (
+        sa.UniqueConstraint(
+            'kind', 'ticket_uid', name='search_index_kind_ticket_uid_key'),
+    )
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    project_id = sa.Column(
+        sa.Integer,
+        sa.ForeignKey(
+            'projects.id', onupdate='CASCADE', ondelete='CASCADE',
+        ),
+        nullable=False,
+        index=True)
+    # Either 'issue' or 'pull_request'
+    kind = sa.Column(sa.String(32), nullable=False)
+    ticket_uid = sa.Column(sa.String(32), nullable=False)
+    title = sa.Column(sa.Text, nullable=False, default='')
+    # The content of the ticket followed by its comments
+    content = sa.Column(sa.Text, nullable=False, default='')
+
+
 class Star(BASE):
     """ Stores users association with the all the projects which
     they have starred
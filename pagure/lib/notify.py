@@ -16,15 +16,15 @@ from __future__ import print_function
 
 import datetime
 import hashlib
-import json
 import logging
 import urlparse
 import re
-import smtplib
 import time
 
 import flask
 import pagure
+import pagure.lib.mail
+import pagure.lib.work_queue
 
 from email.header import Header
 from email.mime.text import MIMEText
@@ -65,13 +65,14 @@ def log(project, topic, msg, redis=None):
         fedmsg_publish(topic, msg)
 
     if redis and project and not project.private:
-        redis.publish(
-            'pagure.hook',
-            json.dumps({
+        pagure.lib.work_queue.publish(
+            redis,
+            pagure.lib.work_queue.WEBHOOK,
+            {
                 'project': project.fullname,
                 'topic': topic,
                 'msg': msg,
-            }))
+            })
 
 
 def _add_mentioned_users(emails, comment):
@@ -245,7 +246,13 @@ def send_email(text, subject, to_mail,
         in_reply_to = in_reply_to + "@%s" %\
             pagure.APP.config['DOMAIN_EMAIL_NOTIFICATIONS']
 
-    smtp = None
+    salt = pagure.APP.config.get('SALT_EMAIL')
+    if isinstance(mail_id, unicode):
+        mail_id = mail_id.encode('utf-8')
+    # The Reply-To hash only differs by the recipient appended to it
+    base_hash = hashlib.sha512('<%s>%s' % (mail_id, salt))
+
+    messages = []
     for mailto in to_mail.split(','):
         msg = MIMEText(text.encode('utf-8'), 'plain', 'utf-8')
         msg['Subject'] = header = Header(
@@ -273,10 +280,8 @@ def send_email(text, subject, to_mail,
         if isinstance(mailto, unicode):
             mailto = mailto.encode('utf-8')
         msg['To'] = mailto
-        salt = pagure.APP.config.get('SALT_EMAIL')
-        if isinstance(mail_id, unicode):
-            mail_id = mail_id.encode('utf-8')
-        mhash = hashlib.sha512('<%s>%s%s' % (mail_id, salt, mailto))
+        mhash = base_hash.copy()
+        mhash.update(mailto)
         msg['Reply-To'] = 'reply+%s@%s' % (
             mhash.hexdigest(),
             pagure.APP.config['DOMAIN_EMAIL_NOTIFICATIONS'])
@@ -294,31 +299,14 @@ def send_email(text, subject, to_mail,
             print(msg.as_string())
             print('*****/EMAIL******')
             continue
-        try:
-            if smtp is None:
-                if pagure.APP.config['SMTP_SSL']:
-                    smtp = smtplib.SMTP_SSL(
-                        pagure.APP.config['SMTP_SERVER'],
-                        pagure.APP.config['SMTP_PORT'])
-                else:
-                    smtp = smtplib.SMTP(
-                        pagure.APP.config['SMTP_SERVER'],
-                        pagure.APP.config['SMTP_PORT'])
-            if pagure.APP.config['SMTP_USERNAME'] \
-                    and pagure.APP.config['SMTP_PASSWORD']:
-                smtp.login(
-                    pagure.APP.config['SMTP_USERNAME'],
-                    pagure.APP.config['SMTP_PASSWORD']
-                )
-
-            smtp.sendmail(
-                from_email,
-                [mailto],
-                msg.as_string())
-        except smtplib.SMTPException as err:
-            _log.exception(err)
-    if smtp:
-        smtp.quit()
+        messages.append((from_email, [mailto], msg.as_string()))
+
+    if messages:
+        if pagure.APP.config.get('EMAIL_ASYNC', True):
+            pagure.lib.tasks.send_emails.delay(messages)
+        else:
+            for message in pagure.lib.mail.deliver(messages):
+                _log.error('Could not send email to %s', message[1])
     return msg
 
 
@@ -710,22 +698,14 @@ def notify_new_commits(abspath, project, branch, commits):
     ''' Notify the people following a project's commits that new commits have
     been added.
     '''
-    commits_info = []
-    for commit in commits:
-        commits_info.append({
-            'commit': commit,
-            'author': pagure.lib.git.get_author(commit, abspath),
-            'subject': pagure.lib.git.get_commit_subject(commit, abspath)
-        })
-
-    commits_string = '\n'.join('{0}    {1}    {2}'.format(
-        commit_info['commit'], commit_info['author'], commit_info['subject'])
-        for commit_info in commits_info)
+    commits_string = u'\n'.join(u'{0}    {1}    {2}'.format(
+        commit_info.commit, commit_info.author, commit_info.subject)
+        for commit_info in pagure.lib.git.read_commits(abspath, commits))
     commit_url = _build_url(
         pagure.APP.config['APP_URL'], _fullname_to_url(project.fullname),
         'commits', branch)
 
-    email_body = '''
+    email_body = u'''
 The following commits were pushed to the repo "{repo}" on branch
 "{branch}", which you are following:
 {commits}
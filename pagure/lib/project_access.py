@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+Denormalized list of the projects each user has access to.
+
+Finding the projects a user has access to means looking at the projects
+they own, the ones they were given access to and the ones one of their
+groups was given access to. Instead of querying these four tables every
+time, the result is kept in the ``projects_access`` table.
+
+The rows of a user are re-built at the end of the flush in which their
+access changed: when they are added to or removed from a project, when
+one of their groups is added to or removed from a project, when they join
+or leave a group and when a project is created or changes owner.
+
+"""
+
+import logging
+
+import sqlalchemy as sa
+import sqlalchemy.orm
+
+import pagure.lib.acl_cache
+from pagure.lib import model
+
+
+_log = logging.getLogger(__name__)
+
+_SESSION_KEY = 'pagure_project_access'
+
+# Access levels stored -> access levels they grant
+ACCESS_LEVELS = {
+    'main admin': ('owner',),
+    'admin': ('owner', 'admin'),
+    'commit': ('owner', 'admin', 'commit'),
+    'ticket': ('owner', 'admin', 'commit', 'ticket'),
+}
+
+
+def _get_access_rows(session, user_id):
+    ''' Return the set of (project_id, group_id, access) the specified user
+    has, computed from the tables defining the access to the projects.
+    '''
+    rows = set()
+
+    # User created the project
+    query = session.query(
+        model.Project.id
+    ).filter(
+        model.Project.user_id == user_id
+    )
+    for project_id, in query:
+        rows.add((project_id, None, 'owner'))
+
+    # User was given access to the project
+    query = session.query(
+        model.ProjectUser.project_id,
+        model.ProjectUser.access,
+    ).filter(
+        model.ProjectUser.user_id == user_id
+    )
+    for project_id, access in query:
+        rows.add((project_id, None, access))
+
+    # User created or is part of a group that was given access to the
+    # project
+    members = session.query(
+        model.PagureUserGroup.group_id
+    ).filter(
+        model.PagureUserGroup.user_id == user_id
+    )
+    query = session.query(
+        model.ProjectGroup.project_id,
+        model.ProjectGroup.group_id,
+        model.ProjectGroup.access,
+    ).filter(
+        model.ProjectGroup.group_id == model.PagureGroup.id
+    ).filter(
+        model.PagureGroup.group_type == 'user'
+    ).filter(
+        sa.or_(
+            model.PagureGroup.user_id == user_id,
+            model.PagureGroup.id.in_(members.subquery()),
+        )
+    )
+    for project_id, group_id, access in query:
+        rows.add((project_id, group_id, access))
+
+    return rows
+
+
+def refresh_user_access(session, user_ids):
+    ''' Re-build the list of the projects the specified users have access
+    to.
+
+    :arg session: the session to use to connect to the database.
+    :arg user_ids: the identifiers of the users to update
+
+    '''
+    table = model.ProjectAccess.__table__
+    for user_id in sorted(set(user_ids)):
+        rows = _get_access_rows(session, user_id)
+        session.execute(
+            table.delete().where(table.c.user_id == user_id))
+        if rows:
+            session.execute(table.insert(), [
+                {
+                    'user_id': user_id,
+                    'project_id': project_id,
+                    'group_id': group_id,
+                    'access': access,
+                }
+                for project_id, group_id, access in sorted(
+                    rows, key=lambda row: (row[0], row[1] or 0, row[2]))
+            ])
+
+
+def refresh_all(session):
+    ''' Re-build the list of the projects all the users have access to. '''
+    user_ids = [user_id for user_id, in session.query(model.User.id)]
+    refresh_user_access(session, user_ids)
+
+
+def _get_id(obj):
+    ''' Return the identifier of the given object, which may not have been
+    known when it was marked. '''
+    return getattr(obj, 'id', obj)
+
+
+def _get_marks(target):
+    session = sa.orm.object_session(target)
+    if session is None:
+        return None
+    return session.info.setdefault(
+        _SESSION_KEY, {'users': set(), 'groups': set()})
+
+
+def _mark_user(target, user):
+    ''' Mark the specified user (or user identifier) as having its access
+    changed in the session of ``target``. '''
+    marks = _get_marks(target)
+    if marks is not None and user is not None:
+        marks['users'].add(user)
+
+
+def _mark_group(target, group):
+    ''' Mark the members of the specified group (or group identifier) as
+    having their access changed in the session of ``target``. '''
+    marks = _get_marks(target)
+    if marks is not None and group is not None:
+        marks['groups'].add(group)
+
+
+def _on_flush(session, flush_context):
+    ''' Re-build the access of the users marked during the flush. '''
+    marks = session.info.pop(_SESSION_KEY, None)
+    if not marks:
+        return
+
+    user_ids = set(_get_id(user) for user in marks['users'])
+    group_ids = set(_get_id(group) for group in marks['groups'])
+    user_ids.discard(None)
+    group_ids.discard(None)
+    if group_ids:
+        query = session.query(
+            model.PagureUserGroup.user_id
+        ).filter(
+            model.PagureUserGroup.group_id.in_(group_ids)
+        ).union(
+            session.query(
+                model.PagureGroup.user_id
+            ).filter(
+                model.PagureGroup.id.in_(group_ids)
+            )
+        )
+        user_ids.update(user_id for user_id, in query)
+
+    if user_ids:
+        _log.debug('Refreshing the projects access of: %s', user_ids)
+        refresh_user_access(session, user_ids)
+        pagure.lib.acl_cache.invalidate_users(session, user_ids)
+
+
+def _on_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def _on_project_insert(mapper, connection, target):
+    _mark_user(target, target.user_id)
+
+
+def _on_project_delete(mapper, connection, target):
+    table = model.ProjectAccess.__table__
+    connection.execute(
+        table.delete().where(table.c.project_id == target.id))
+
+
+def _on_owner_set(target, value, oldvalue, initiator):
+    for user in (value, oldvalue):
+        if user is not None and user is not sa.orm.attributes.NO_VALUE \
+                and user is not sa.orm.attributes.NEVER_SET:
+            _mark_user(target, user)
+
+
+def _on_project_user_change(mapper, connection, target):
+    _mark_user(target, target.user_id)
+
+
+def _on_project_group_change(mapper, connection, target):
+    _mark_group(target, target.group_id)
+
+
+def _on_user_group_change(mapper, connection, target):
+    _mark_user(target, target.user_id)
+
+
+def _on_group_insert(mapper, connection, target):
+    _mark_group(target, target.id)
+
+
+def _on_group_delete(mapper, connection, target):
+    _mark_user(target, target.user_id)
+    for user in target.users:
+        _mark_user(target, user)
+
+
+def _on_project_users(target, value, initiator):
+    ''' A user was added to or removed from ``Project.users``. '''
+    _mark_user(target, value)
+
+
+def _on_project_groups(target, value, initiator):
+    ''' A group was added to or removed from ``Project.groups``. '''
+    _mark_group(target, value)
+
+
+def _on_user_groups(target, value, initiator):
+    ''' A group was added to or removed from ``User.group_objs``. '''
+    _mark_user(target, target)
+
+
+def _on_group_users(target, value, initiator):
+    ''' A user was added to or removed from ``PagureGroup.users``. '''
+    _mark_user(target, value)
+
+
+sa.event.listen(model.Project, 'after_insert', _on_project_insert)
+sa.event.listen(model.Project, 'after_delete', _on_project_delete)
+# Load the previous owner so their access is updated as well
+sa.event.listen(
+    model.Project.user_id, 'set', _on_owner_set, active_history=True)
+sa.event.listen(
+    model.Project.user, 'set', _on_owner_set, active_history=True)
+
+for _model_cls, _func in (
+        (model.ProjectUser, _on_project_user_change),
+        (model.ProjectGroup, _on_project_group_change),
+        (model.PagureUserGroup, _on_user_group_change)):
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        sa.event.listen(_model_cls, _event, _func)
+
+sa.event.listen(model.PagureGroup, 'after_insert', _on_group_insert)
+sa.event.listen(model.PagureGroup, 'before_delete', _on_group_delete)
+sa.event.listen(
+    model.PagureGroup.user_id, 'set', _on_owner_set, active_history=True)
+
+# The association tables may also be changed via the relations using them,
+# some of which are backrefs only available once the mappers are configured
+sa.orm.configure_mappers()
+for _attr, _func in (
+        (model.Project.users, _on_project_users),
+        (model.Project.groups, _on_project_groups),
+        (model.User.group_objs, _on_user_groups),
+        (model.PagureGroup.users, _on_group_users)):
+    sa.event.listen(_attr, 'append', _func)
+    sa.event.listen(_attr, 'remove', _func)
+
+sa.event.listen(sa.orm.Session, 'after_flush_postexec', _on_flush)
+sa.event.listen(sa.orm.Session, 'after_rollback', _on_rollback)
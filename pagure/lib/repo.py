@@ -8,9 +8,11 @@
 
 """
 
+import collections
 import logging
 import os
 import subprocess
+import threading
 
 import pygit2
 
@@ -115,3 +117,146 @@ class PagureRepo(pygit2.Repository):
             print out
             print err
             out = out.rstrip('\n\r')
+
+
+def _repo_signature(path):
+    """ Return a tuple describing the on-disk state of the git repository at
+    the specified path: the inode of the folder and the modification time
+    of the packed-refs file and of the pack folder.
+
+    This allows noticing that a repository was re-created or repacked since
+    it was opened.
+    """
+    signature = []
+    for subpath in ['', 'packed-refs', os.path.join('objects', 'pack')]:
+        try:
+            stat = os.stat(os.path.join(path, subpath))
+            signature.append((stat.st_ino, stat.st_mtime))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def close_repo(repo_obj):
+    """ Release the file handles a pygit2.Repository object keeps open
+    without waiting for the garbage collector.
+    """
+    free = getattr(repo_obj, 'free', None)
+    if free is not None:
+        free()
+
+
+class RepositoryPool(object):
+    """ A process-level pool of opened pygit2.Repository objects, keyed by
+    the path of the git repository.
+
+    Repositories are checked out of the pool and released back into it once
+    they are no longer used. A repository checked out is never handed to
+    anyone else until it is released.
+    Released repositories are kept open, at most ``size`` of them, the least
+    recently used ones being closed when there are more.
+    """
+
+    def __init__(self, size=32):
+        self.size = size
+        # (path, signature) -> list of idle pygit2.Repository objects
+        self._idle = collections.OrderedDict()
+        self._checked_out = collections.defaultdict(int)
+        # id of the pygit2.Repository objects -> (path, signature)
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def checkout(self, path):
+        """ Return a pygit2.Repository object for the specified path, either
+        one from the pool or a newly opened one.
+        """
+        path = os.path.abspath(path)
+        key = (path, _repo_signature(path))
+        repo_obj = None
+        with self._lock:
+            idle = self._idle.pop(key, None)
+            if idle:
+                repo_obj = idle.pop()
+                if idle:
+                    self._idle[key] = idle
+            self._checked_out[path] += 1
+
+        if repo_obj is None:
+            try:
+                repo_obj = pygit2.Repository(path)
+            except Exception:
+                with self._lock:
+                    self._release_count(path)
+                raise
+            with self._lock:
+                self._keys[id(repo_obj)] = key
+        return repo_obj
+
+    def release(self, repo_obj):
+        """ Return the specified repository, obtained via ``checkout``, into
+        the pool.
+        """
+        to_close = []
+        with self._lock:
+            key = self._keys.get(id(repo_obj))
+            if key is None:
+                return
+
+            path = key[0]
+            self._release_count(path)
+            if _repo_signature(path) != key[1]:
+                # The repo changed on disk since it was opened
+                del self._keys[id(repo_obj)]
+                to_close.append(repo_obj)
+            else:
+                idle = self._idle.pop(key, [])
+                idle.append(repo_obj)
+                self._idle[key] = idle
+            to_close.extend(self._shrink())
+
+        for obj in to_close:
+            close_repo(obj)
+
+    def close(self):
+        """ Close all the idle repositories of the pool. """
+        with self._lock:
+            to_close = [
+                obj for idle in self._idle.values() for obj in idle]
+            self._idle.clear()
+            for obj in to_close:
+                del self._keys[id(obj)]
+
+        for obj in to_close:
+            close_repo(obj)
+
+    def stats(self):
+        """ Return the number of idle and checked out repositories. """
+        with self._lock:
+            return {
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'checked_out': sum(self._checked_out.values()),
+            }
+
+    def _release_count(self, path):
+        """ Decrement the number of repositories checked out for the
+        specified path. Must be called with the lock held. """
+        self._checked_out[path] -= 1
+        if self._checked_out[path] <= 0:
+            del self._checked_out[path]
+
+    def _shrink(self):
+        """ Remove from the pool the least recently used repositories that
+        do not fit in it and return them. Must be called with the lock held.
+        """
+        extra = sum(len(idle) for idle in self._idle.values()) - self.size
+        removed = []
+        while extra > 0 and self._idle:
+            key, idle = self._idle.popitem(last=False)
+            while idle and extra > 0:
+                removed.append(idle.pop(0))
+                extra -= 1
+            if idle:
+                self._idle[key] = idle
+        for obj in removed:
+            self._keys.pop(id(obj), None)
+        return removed
@@ -8,8 +8,6 @@
 
 """
 
-import collections
-import datetime
 import gc
 import hashlib
 import logging
@@ -21,7 +19,6 @@ import time
 
 from functools import wraps
 
-import arrow
 import pygit2
 import six
 
@@ -32,8 +29,12 @@ from sqlalchemy.exc import SQLAlchemyError
 import pagure
 from pagure import APP
 import pagure.lib
+import pagure.lib.commit_graph
+import pagure.lib.commit_stats
 import pagure.lib.git
 import pagure.lib.git_auth
+import pagure.lib.mail
+import pagure.lib.markdown_cache
 import pagure.lib.repo
 
 logging.config.dictConfig(APP.config.get('LOGGING') or {'version': 1})
@@ -387,6 +388,47 @@ def update_git(self, name, namespace, user, ticketuid=None, requestuid=None):
     return result
 
 
+@conn.task(bind=True)
+@set_status
+def batch_update_git(self, name, namespace, user, isa):
+    """ Update the JSON representation of all the tickets or pull-requests
+    of a project which have been modified since this task was scheduled.
+    """
+
+    session = pagure.lib.create_session()
+
+    project = pagure.lib._get_project(
+        session, namespace=namespace, name=name, user=user,
+        case=APP.config.get('CASE_SENSITIVE', False))
+
+    if isa == 'issue':
+        getter = pagure.lib.get_issue_by_uid
+        folder = APP.config['TICKETS_FOLDER']
+    elif isa == 'pull-request':
+        getter = pagure.lib.get_request_by_uid
+        folder = APP.config['REQUESTS_FOLDER']
+    else:
+        raise NotImplementedError('Unknown object type %s' % isa)
+
+    with project.lock('WORKER'), \
+            pagure.lib.git._take_batch_update_git(isa, project) as uids:
+        objs = []
+        for uid in uids:
+            obj = getter(session, uid)
+            if obj is None:
+                _log.info('Unable to find %s %s, skipping it', isa, uid)
+                continue
+            objs.append(obj)
+
+        _log.info(
+            'Updating %s %ss of %s in git', len(objs), isa, project.fullname)
+        result = pagure.lib.git._update_git_batch(objs, project, folder)
+
+    session.remove()
+    gc_clean()
+    return result
+
+
 @conn.task(bind=True)
 @set_status
 def clean_git(self, name, namespace, user, ticketuid):
@@ -621,7 +663,8 @@ def refresh_remote_pr(self, name, namespace, user, requestid):
     repo = pagure.lib.repo.PagureRepo(clonepath)
     repo.pull(branch=request.branch_from, force=True)
 
-    refresh_pr_cache.delay(name, namespace, user)
+    # Only this pull-request is affected by the remote branch moving
+    refresh_merge_status.delay(request.uid)
     session.remove()
     del repo
     gc_clean()
@@ -631,8 +674,12 @@ def refresh_remote_pr(self, name, namespace, user, requestid):
 
 @conn.task(bind=True)
 @set_status
-def refresh_pr_cache(self, name, namespace, user):
+def refresh_pr_cache(self, name, namespace, user, branches=None):
     """ Refresh the merge status cached of pull-requests.
+
+    Only the pull-requests opened against, or from, the specified branches
+    of the project are reset (all of them if branches is None), their merge
+    status is then computed again in the background.
     """
 
     session = pagure.lib.create_session()
@@ -641,7 +688,51 @@ def refresh_pr_cache(self, name, namespace, user):
         session, namespace=namespace, name=name, user=user,
         case=APP.config.get('CASE_SENSITIVE', False))
 
-    pagure.lib.reset_status_pull_request(session, project)
+    # The commits pushed may be linked from the issues and pull-requests
+    pagure.lib.markdown_cache.invalidate(project.id)
+
+    uids = pagure.lib.reset_status_pull_request(
+        session, project, branches=branches)
+    for uid in uids:
+        refresh_merge_status.delay(uid)
+
+    session.remove()
+    gc_clean()
+
+
+@conn.task(queue=APP.config.get('MERGE_STATUS_CELERY_QUEUE', None),
+           bind=True)
+@set_status
+def refresh_merge_status(self, requestuid):
+    """ Compute the merge status of the specified pull-request, if it is
+    still opened.
+    """
+
+    session = pagure.lib.create_session()
+
+    request = pagure.lib.get_request_by_uid(session, request_uid=requestuid)
+    if request and request.status == 'Open':
+        # Computing the merge status may update refs/pull/<id>/head in the
+        # repository of the project
+        with request.project.lock('WORKER'):
+            # The pull-request may have been merged or closed meanwhile
+            session.refresh(request)
+            if request.status == 'Open':
+                _log.debug(
+                    'Computing the merge status of: %s/#%s',
+                    request.project.fullname, request.id)
+                try:
+                    # Nothing changed on the pull-request itself, there is
+                    # no need to write it again in the requests git repository
+                    pagure.lib.git.get_merge_status(
+                        session, request, request_folder=None)
+                except (pygit2.GitError,
+                        pagure.exceptions.PagureException) as err:
+                    # The status will be computed when the pull-request is
+                    # viewed
+                    _log.info(
+                        'Could not compute the merge status of %s: %s',
+                        requestuid, err)
 
     session.remove()
     gc_clean()
@@ -667,8 +758,9 @@ def merge_pull_request(self, name, namespace, user, requestid, user_merger):
             request.id)
         pagure.lib.git.merge_pull_request(
             session, request, user_merger, APP.config['REQUESTS_FOLDER'])
+        branch = request.branch
 
-    refresh_pr_cache.delay(name, namespace, user)
+    refresh_pr_cache.delay(name, namespace, user, branches=[branch])
     session.remove()
     gc_clean()
     return ret('view_repo', repo=name, username=user, namespace=namespace)
@@ -821,26 +913,22 @@ def commits_author_stats(self, repopath):
 
     repo_obj = pygit2.Repository(repopath)
 
-    stats = collections.defaultdict(int)
-    cnt = 0
-    authors_email = set()
-    for commit in repo_obj.walk(
-            repo_obj.head.get_object().oid.hex, pygit2.GIT_SORT_TIME):
-        cnt += 1
-        email = commit.author.email
-        author = commit.author.name
-        stats[(author, email)] += 1
-        authors_email.add(email)
-
-    out_stats = collections.defaultdict(list)
-    for authors, val in stats.items():
-        out_stats[val].append(authors)
-    out_list = [
-        (key, out_stats[key])
-        for key in sorted(out_stats, reverse=True)
-    ]
+    return pagure.lib.commit_stats.get_author_stats(repo_obj)
+
 
-    return (cnt, out_list, len(authors_email), commit.commit_time)
+@conn.task(bind=True)
+@set_status
+def update_commit_graph(self, repopath, heads=None):
+    """ Add the commits reachable from the specified heads, or from all the
+    branches, of the specified git repository to its commit-graph index.
+    """
+
+    if not os.path.exists(repopath):
+        raise ValueError('Git repository not found.')
+
+    repo_obj = pygit2.Repository(repopath)
+
+    return pagure.lib.commit_graph.update_commit_graph(repo_obj, heads=heads)
 
 
 @conn.task(bind=True)
@@ -855,13 +943,45 @@ def commits_history_stats(self, repopath):
 
     repo_obj = pygit2.Repository(repopath)
 
-    dates = collections.defaultdict(int)
-    for commit in repo_obj.walk(
-            repo_obj.head.get_object().oid.hex, pygit2.GIT_SORT_TIME):
-        delta = datetime.datetime.utcnow() \
-            - arrow.get(commit.commit_time).naive
-        if delta.days > 365:
-            break
-        dates[arrow.get(commit.commit_time).date().isoformat()] += 1
+    return pagure.lib.commit_stats.get_history_stats(repo_obj)
+
+
+def _encode(text):
+    """ Return the specified text as utf-8 encoded bytes. """
+    if isinstance(text, six.text_type):
+        return text.encode('utf-8')
+    return text
+
+
+@conn.task(queue=APP.config.get('EMAIL_CELERY_QUEUE', None), bind=True)
+@set_status
+def send_emails(self, messages):
+    """ Deliver the specified emails, the ones which could not be sent are
+    tried again later, waiting longer after each failure.
+
+    :arg messages: a list of (from, recipients, message) tuples
+    :type messages: list
+
+    """
+    messages = [
+        [
+            _encode(from_email),
+            [_encode(to_email) for to_email in to_emails],
+            _encode(msg),
+        ]
+        for from_email, to_emails, msg in messages
+    ]
+
+    failed = pagure.lib.mail.deliver(messages)
+    if not failed:
+        return
+
+    max_retries = APP.config.get('EMAIL_MAX_RETRIES', 5)
+    if self.request.retries >= max_retries:
+        _log.error(
+            'Giving up sending %s emails after %s attempts',
+            len(failed), self.request.retries + 1)
+        return
 
-    return [(key, dates[key]) for key in sorted(dates)]
+    delay = APP.config.get('EMAIL_RETRY_DELAY', 60) * 2 ** self.request.retries
+    raise self.retry(args=(failed,), countdown=delay, max_retries=max_retries)
@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+Delivery of the web-hook notifications.
+
+The web-hook server sends the notifications via a pool of worker threads.
+Each endpoint has its own queue, processed one notification at a time, so a
+slow or unavailable endpoint only holds a single worker.
+
+Failed deliveries are retried with an exponential back-off, the deliveries
+to retry and their number of attempts are stored in redis so they survive a
+restart of the server. An endpoint failing repeatedly is not called for a
+while (its circuit is opened), the notifications sent to it in the meantime
+are kept for later.
+
+The web-hook settings of the projects are cached by the server, the cache
+is invalidated via redis when they change.
+
+"""
+
+import collections
+import datetime
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+import uuid
+
+import requests
+import six
+import sqlalchemy as sa
+import sqlalchemy.orm
+
+import pagure
+import pagure.lib
+from pagure.lib import model
+
+
+_log = logging.getLogger(__name__)
+
+# Channel on which the web-hook server is told to forget the settings of a
+# project
+INVALIDATE_CHANNEL = 'pagure.webhook.invalidate'
+# Sorted set of the deliveries to retry, scored by the time of the next
+# attempt
+_RETRY_KEY = 'pagure.webhook.retries'
+_METRICS_KEY = 'pagure.webhook.metrics'
+_SESSION_KEY = 'pagure_webhook'
+
+_LOCAL = threading.local()
+_COUNTER_LOCK = threading.Lock()
+_i = 0
+
+
+def _config(key, default):
+    return pagure.APP.config.get(key, default)
+
+
+def get_hooks(session, fullname):
+    """ Return the web-hook settings of the project with the specified
+    full name.
+
+    :arg session: the session with which to connect to the database
+    :arg fullname: the full name of the project, as sent by
+        ``pagure.lib.notify.log``
+    :return: a dict with the full name, the hook token and the list of the
+        web-hook urls of the project, or None if the project does not exist
+
+    """
+    username = None
+    projectname = fullname
+    if fullname.startswith('forks/'):
+        username, projectname = fullname.split('/', 2)[1:]
+
+    namespace = None
+    if '/' in projectname:
+        namespace, projectname = projectname.split('/', 1)
+
+    project = pagure.lib._get_project(
+        session=session, name=projectname, user=username,
+        namespace=namespace,
+        case=_config('CASE_SENSITIVE', False))
+    if not project:
+        return None
+
+    urls = project.settings.get('Web-hooks') or ''
+    return {
+        'fullname': project.fullname,
+        'hook_token': project.hook_token,
+        'urls': [url.strip() for url in urls.split('\n') if url.strip()],
+    }
+
+
+class HooksCache(object):
+    """ Cache of the web-hook settings of the projects.
+
+    :arg loader: callable returning the settings of the project with the
+        specified full name, see ``get_hooks``
+    :kwarg ttl: the number of seconds after which the settings are loaded
+        again, even if they were not invalidated
+
+    """
+
+    def __init__(self, loader, ttl=300):
+        self.loader = loader
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, fullname):
+        """ Return the web-hook settings of the specified project. """
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(fullname)
+        if cached and cached[1] + self.ttl > now:
+            return cached[0]
+
+        hooks = self.loader(fullname)
+        # Projects which do not exist are not cached, they can be created
+        if hooks is not None:
+            with self._lock:
+                self._cache[fullname] = (hooks, now)
+        return hooks
+
+    def invalidate(self, fullname=None):
+        """ Forget the settings of the specified project, or of all the
+        projects. """
+        with self._lock:
+            if fullname is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(fullname, None)
+
+
+def build_request(hooks, topic, msg):
+    """ Return the content and the headers of the request notifying the
+    web-hooks of the specified project.
+
+    :arg hooks: the web-hook settings of the project, see ``get_hooks``
+    :arg topic: the topic of the notification
+    :arg msg: the content of the notification
+    :return: a tuple with the content and the headers of the request
+
+    """
+    global _i
+    with _COUNTER_LOCK:
+        _i += 1
+        i = _i
+
+    year = datetime.datetime.now().year
+    if isinstance(topic, six.text_type):
+        topic = topic.encode('utf-8')
+    msg['pagure_instance'] = pagure.APP.config['APP_URL']
+    msg['project_fullname'] = hooks['fullname']
+    msg = dict(
+        topic=topic.decode('utf-8'),
+        msg=msg,
+        timestamp=int(time.time()),
+        msg_id=str(year) + '-' + str(uuid.uuid4()),
+        i=i,
+    )
+
+    content = json.dumps(msg)
+    token = str(hooks['hook_token'])
+    hashhex = hmac.new(token, content, hashlib.sha1).hexdigest()
+    hashhex256 = hmac.new(token, content, hashlib.sha256).hexdigest()
+    headers = {
+        'X-Pagure': pagure.APP.config['APP_URL'],
+        'X-Pagure-project': hooks['fullname'],
+        'X-Pagure-Signature': hashhex,
+        'X-Pagure-Signature-256': hashhex256,
+        'X-Pagure-Topic': topic,
+        'Content-Type': 'application/json',
+    }
+    return content, headers
+
+
+def new_delivery(url, content, headers):
+    """ Return the delivery of the specified request to the specified url.
+    """
+    return {
+        'url': url,
+        'content': content,
+        'headers': headers,
+        'attempt': 0,
+        'created': time.time(),
+    }
+
+
+# The outcome of a delivery
+DELIVERED = 'delivered'
+# The endpoint refused the notification, sending it again will not help
+REJECTED = 'rejected'
+FAILED = 'failed'
+
+
+def deliver(delivery, timeout=60):
+    """ Send the specified delivery, this is blocking.
+
+    :arg delivery: the delivery to send, see ``new_delivery``
+    :kwarg timeout: the number of seconds to wait for the endpoint
+    :return: DELIVERED, REJECTED or FAILED
+
+    """
+    # Connections to the endpoints are kept open and re-used, per thread
+    if getattr(_LOCAL, 'http', None) is None:
+        _LOCAL.http = requests.Session()
+
+    url = delivery['url']
+    _log.info('Calling url %s', url)
+    try:
+        req = _LOCAL.http.post(
+            url,
+            headers=delivery['headers'],
+            data=delivery['content'],
+            timeout=timeout,
+        )
+    except Exception as err:
+        _log.info(
+            'An error occured while querying: %s - Error: %s', url, err)
+        return FAILED
+
+    if req:
+        return DELIVERED
+
+    _log.info(
+        'An error occured while querying: %s - Error code: %s',
+        url, req.status_code)
+    # Timeouts, rate-limits and server errors are retried
+    if req.status_code in (408, 429) or req.status_code >= 500:
+        return FAILED
+    return REJECTED
+
+
+def retry_delay(attempt):
+    """ Return the number of seconds to wait before the specified attempt
+    at delivering a notification. """
+    delay = _config('WEBHOOK_RETRY_DELAY', 30) * 2 ** (attempt - 1)
+    return min(delay, 24 * 3600)
+
+
+class CircuitBreaker(object):
+    """ Keep track of the failures of an endpoint, it is not called for
+    ``cooldown`` seconds once it failed ``threshold`` times in a row.
+    After that, a single delivery is attempted and the endpoint is called
+    normally again if it succeeds.
+    """
+
+    def __init__(self, threshold=5, cooldown=300):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_until = None
+
+    def allow(self, now=None):
+        """ Return whether the endpoint can be called. """
+        if self.opened_until is None:
+            return True
+        return (now or time.time()) >= self.opened_until
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_until = None
+
+    def record_failure(self, now=None):
+        self.failures += 1
+        # Once half-opened, a single failure re-opens the circuit
+        if self.failures >= self.threshold or self.opened_until is not None:
+            self.opened_until = (now or time.time()) + self.cooldown
+
+
+class RetryStore(object):
+    """ The deliveries to retry, in redis if it is configured or in memory
+    otherwise. """
+
+    def __init__(self, redis=None):
+        self.redis = redis
+        self._pending = []
+
+    def add(self, delivery, due):
+        """ Store the specified delivery, to be retried at ``due``. """
+        if self.redis:
+            self.redis.zadd(
+                _RETRY_KEY, due, json.dumps(delivery, sort_keys=True))
+        else:
+            self._pending.append((due, delivery))
+
+    def pop_due(self, now=None):
+        """ Return and remove the deliveries to retry by now. """
+        now = now or time.time()
+        if not self.redis:
+            output = [item for item in self._pending if item[0] <= now]
+            self._pending = [
+                item for item in self._pending if item[0] > now]
+            return [delivery for _, delivery in sorted(
+                output, key=lambda item: item[0])]
+
+        output = []
+        for member in self.redis.zrangebyscore(_RETRY_KEY, 0, now):
+            # Only the server removing the delivery sends it
+            if self.redis.zrem(_RETRY_KEY, member):
+                output.append(json.loads(member))
+        return output
+
+    def __len__(self):
+        if self.redis:
+            return self.redis.zcard(_RETRY_KEY)
+        return len(self._pending)
+
+
+class Metrics(object):
+    """ The number of deliveries and their latency, per endpoint. """
+
+    def __init__(self):
+        self.endpoints = collections.defaultdict(lambda: {
+            'delivered': 0,
+            'rejected': 0,
+            'failed': 0,
+            'latency_total': 0.0,
+            'latency_max': 0.0,
+        })
+
+    def record(self, url, outcome, latency):
+        """ Record a delivery attempt to the specified url. """
+        stats = self.endpoints[url]
+        stats[outcome] += 1
+        stats['latency_total'] += latency
+        stats['latency_max'] = max(stats['latency_max'], latency)
+
+    def report(self):
+        """ Return the metrics per endpoint, with their average latency. """
+        output = {}
+        for url, stats in self.endpoints.items():
+            stats = dict(stats)
+            attempts = stats['delivered'] + stats['rejected'] \
+                + stats['failed']
+            stats['latency_avg'] = \
+                stats['latency_total'] / attempts if attempts else 0.0
+            output[url] = stats
+        return output
+
+    def publish(self, redis):
+        """ Store the metrics in redis, for monitoring. """
+        report = self.report()
+        if redis and report:
+            redis.hmset(_METRICS_KEY, dict(
+                (url, json.dumps(stats)) for url, stats in report.items()))
+        return report
+
+
+def _mark(target):
+    """ Tell the web-hook server to forget the settings of the specified
+    project once the current transaction is committed. """
+    if target.id is None:
+        return
+    session = sa.orm.object_session(target)
+    if session is not None:
+        session.info.setdefault(_SESSION_KEY, set()).add(target.fullname)
+
+
+def _on_commit(session):
+    fullnames = session.info.pop(_SESSION_KEY, ())
+    if pagure.lib.REDIS:
+        for fullname in fullnames:
+            pagure.lib.REDIS.publish(INVALIDATE_CHANNEL, fullname)
+
+
+def _on_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def _on_set(target, value, oldvalue, initiator):
+    if value != oldvalue:
+        _mark(target)
+
+
+def _on_delete(mapper, connection, target):
+    _mark(target)
+
+
+# The full name of the project is the one before the change
+for _attr in (
+        model.Project._settings, model.Project.hook_token,
+        model.Project.name, model.Project.namespace):
+    sa.event.listen(_attr, 'set', _on_set)
+sa.event.listen(model.Project, 'before_delete', _on_delete)
+
+sa.event.listen(sa.orm.Session, 'after_commit', _on_commit)
+sa.event.listen(sa.orm.Session, 'after_rollback', _on_rollback)
@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+Durable queues between pagure and its daemons (pagure-logcom,
+pagure-loadjson, pagure-ci and the web-hook server).
+
+The messages are added to redis streams, each daemon reads them as a
+consumer group and acknowledges them once they are processed. So messages
+sent while a daemon is stopped are processed when it starts again and the
+messages a daemon was processing when it crashed or failed to process are
+processed again (up to a number of attempts, after which they are moved to
+the ``<stream>.failed`` stream).
+
+The number of attempts is the delivery count redis keeps for each pending
+message, so it survives restarts. The messages left pending by a consumer
+which no longer runs are claimed by the other consumers of its group.
+
+Acknowledged messages are removed from the stream, so its length is the
+number of messages waiting to be processed. None of them is ever dropped,
+a warning is logged instead when there are too many of them.
+
+This requires redis >= 5.0.
+
+"""
+
+import collections
+import json
+import logging
+import socket
+import threading
+import time
+
+import redis
+import six
+
+import pagure
+
+
+_log = logging.getLogger(__name__)
+
+LOGCOM = 'pagure.logcom'
+LOADJSON = 'pagure.loadjson'
+CI = 'pagure.ci'
+WEBHOOK = 'pagure.hook'
+
+_METRICS_KEY = 'pagure.queue.metrics'
+# Interval, in seconds, at which the metrics of the queues are reported
+METRICS_INTERVAL = 60
+
+
+def _config(key, default):
+    return pagure.APP.config.get(key, default)
+
+
+def get_redis():
+    """ Return a connection to the redis server holding the queues. """
+    return redis.StrictRedis(
+        host=_config('REDIS_HOST', '0.0.0.0'),
+        port=_config('REDIS_PORT', 6379),
+        db=_config('REDIS_DB', 0),
+    )
+
+
+def publish(redis_conn, stream, data, maxlen=None):
+    """ Add a message to the specified queue.
+
+    A warning is logged each time the number of messages waiting in the
+    queue reaches a multiple of ``QUEUE_BACKLOG_WARNING``.
+
+    :arg redis_conn: the connection to redis
+    :arg stream: the name of the queue, one of LOGCOM, LOADJSON, CI or
+        WEBHOOK
+    :arg data: the content of the message, serialized in JSON
+    :kwarg maxlen: the approximate number of messages above which the
+        oldest ones are dropped. Only for the queues nothing consumes, such
+        as the ``<stream>.failed`` ones: the length of the others is the
+        number of messages not processed yet.
+    :return: the number of messages in the queue
+
+    """
+    args = ['XADD', stream]
+    if maxlen:
+        args.extend(['MAXLEN', '~', maxlen])
+    args.extend(['*', 'data', json.dumps(data)])
+
+    pipe = redis_conn.pipeline()
+    pipe.execute_command(*args)
+    pipe.execute_command('XLEN', stream)
+    length = pipe.execute()[1]
+
+    threshold = _config('QUEUE_BACKLOG_WARNING', 10000)
+    if not maxlen and threshold and length >= threshold \
+            and length % threshold == 0:
+        _log.warning(
+            '%s messages waiting in %s, are its consumers running?',
+            length, stream)
+    return length
+
+
+def _decode(value):
+    if isinstance(value, six.binary_type):
+        return value.decode('utf-8')
+    return value
+
+
+def _parse_stream(entries):
+    """ Return the list of (id, fields) of the specified entries of a
+    stream, whether they were parsed by redis-py or not. """
+    output = []
+    for entry in entries or []:
+        if entry is None:
+            # Removed from the stream
+            continue
+        entry_id, fields = entry
+        if entry_id is None:
+            continue
+        if fields and not isinstance(fields, dict):
+            fields = dict(zip(fields[::2], fields[1::2]))
+        fields = dict(
+            (_decode(key), _decode(value))
+            for key, value in (fields or {}).items())
+        output.append((_decode(entry_id), fields))
+    return output
+
+
+def _parse_entries(reply):
+    """ Return the list of (id, fields) of the entries returned by
+    XREADGROUP, whether the reply was parsed by redis-py or not. """
+    output = []
+    for _, entries in reply or []:
+        output.extend(_parse_stream(entries))
+    return output
+
+
+def _parse_pending(reply):
+    """ Return the list of (id, consumer, idle time in milliseconds,
+    delivery count) of the entries returned by XPENDING, whether the reply
+    was parsed by redis-py or not. """
+    output = []
+    for entry in reply or []:
+        if isinstance(entry, dict):
+            entry = (
+                entry['message_id'], entry['consumer'],
+                entry['time_since_delivered'], entry['times_delivered'])
+        entry_id, consumer, idle, count = entry
+        output.append(
+            (_decode(entry_id), _decode(consumer), int(idle), int(count)))
+    return output
+
+
+def group_messages(messages, key=None):
+    """ Split the specified messages in batches of messages sharing the same
+    key, keeping their order.
+
+    :arg messages: a list of (id, data)
+    :kwarg key: a callable returning the key of a message from its data, if
+        None every message is its own batch
+    :return: a list of lists of (id, data)
+
+    """
+    if key is None:
+        return [[message] for message in messages]
+
+    batches = collections.OrderedDict()
+    for message in messages:
+        batches.setdefault(key(message[1]), []).append(message)
+    return list(batches.values())
+
+
+class Stats(object):
+    """ The number of messages processed by the consumers of a queue and the
+    time it took. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self.duration_total = 0.0
+        self.duration_max = 0.0
+
+    def record(self, count, duration, failed=False):
+        """ Record the processing of a batch of ``count`` messages. """
+        with self._lock:
+            if failed:
+                self.failed += count
+            else:
+                self.processed += count
+            self.batches += 1
+            self.duration_total += duration
+            self.duration_max = max(self.duration_max, duration)
+
+    def report(self):
+        with self._lock:
+            return {
+                'processed': self.processed,
+                'failed': self.failed,
+                'batches': self.batches,
+                'duration_avg':
+                    self.duration_total / self.batches
+                    if self.batches else 0.0,
+                'duration_max': self.duration_max,
+            }
+
+
+def backlog(redis_conn, stream, group):
+    """ Return the number of messages waiting in the specified queue and the
+    number of those being processed by a consumer. """
+    length = redis_conn.execute_command('XLEN', stream)
+    try:
+        pending = redis_conn.execute_command('XPENDING', stream, group)
+    except redis.exceptions.ResponseError:
+        # The consumer group does not exist yet
+        pending = None
+    if isinstance(pending, dict):
+        pending = pending.get('pending')
+    elif pending:
+        pending = pending[0]
+    return {'length': int(length or 0), 'pending': int(pending or 0)}
+
+
+class Consumer(object):
+    """ A consumer of a queue.
+
+    :arg redis_conn: the connection to redis
+    :arg stream: the name of the queue
+    :arg group: the name of the consumer group, the consumers of the same
+        group share the messages of the queue
+    :arg name: the name of the consumer, it must be unique in its group.
+        The messages it did not acknowledge are processed again by the
+        consumer of the same name once the daemon restarts, or claimed by
+        another consumer of the group after ``QUEUE_CLAIM_IDLE`` seconds
+    :kwarg stats: the Stats object keeping track of the messages processed
+
+    """
+
+    def __init__(self, redis_conn, stream, group, name, stats=None):
+        self.redis = redis_conn
+        self.stream = stream
+        self.group = group
+        self.name = name
+        self.stats = stats or Stats()
+        self.batch_size = _config('QUEUE_BATCH_SIZE', 20)
+        self.max_attempts = _config('QUEUE_MAX_ATTEMPTS', 5)
+        self.retry_delay = _config('QUEUE_RETRY_DELAY', 30)
+        self.claim_idle = _config('QUEUE_CLAIM_IDLE', 600)
+        self.block = 5000
+        # Time of the next look at the pending messages, starting by those
+        # left by a crash
+        self._pending_at = 0
+        # The messages read and not yet acknowledged or failed
+        self._processing = set()
+
+    def setup(self):
+        """ Create the consumer group, and the queue, if needed. """
+        try:
+            self.redis.execute_command(
+                'XGROUP', 'CREATE', self.stream, self.group, '0',
+                'MKSTREAM')
+        except redis.exceptions.ResponseError as err:
+            if 'BUSYGROUP' not in str(err):
+                raise
+
+    def _read(self, start, block):
+        args = [
+            'XREADGROUP', 'GROUP', self.group, self.name,
+            'COUNT', self.batch_size]
+        if block:
+            args.extend(['BLOCK', self.block])
+        args.extend(['STREAMS', self.stream, start])
+
+        messages = []
+        deleted = []
+        for entry_id, fields in _parse_entries(
+                self.redis.execute_command(*args)):
+            if 'data' not in fields:
+                # Removed from the queue while it was pending
+                deleted.append(entry_id)
+                continue
+            messages.append((entry_id, json.loads(fields['data'])))
+        if deleted:
+            self.ack(deleted)
+        return messages
+
+    def _claim(self):
+        """ Claim the pending messages of the group which are due to be
+        processed again: those of this consumer once ``retry_delay``
+        seconds elapsed since they were last read, and those of the other
+        consumers once ``claim_idle`` seconds elapsed, their consumer being
+        likely gone.
+
+        The messages which were already read ``max_attempts`` times are
+        moved to the ``<stream>.failed`` queue instead.
+
+        :return: the list of (id, data) of the messages claimed and whether
+            any pending message was due
+
+        """
+        pending = _parse_pending(self.redis.execute_command(
+            'XPENDING', self.stream, self.group, '-', '+',
+            self.batch_size * 10, parse_detail=True))
+
+        due = collections.OrderedDict()
+        counts = {}
+        for entry_id, consumer, idle, count in pending:
+            if consumer == self.name:
+                min_idle = self.retry_delay * 1000
+            else:
+                min_idle = self.claim_idle * 1000
+            if idle < min_idle or entry_id in self._processing \
+                    or len(counts) >= self.batch_size:
+                continue
+            due.setdefault(min_idle, []).append(entry_id)
+            counts[entry_id] = count
+
+        messages = []
+        discard = []
+        for min_idle, ids in due.items():
+            # Only the entries still idle for that long are claimed, so an
+            # entry is not claimed by two consumers at once
+            for entry_id, fields in _parse_stream(self.redis.execute_command(
+                    'XCLAIM', self.stream, self.group, self.name, min_idle,
+                    *ids)):
+                if 'data' not in fields:
+                    # Removed from the queue while it was pending
+                    discard.append(entry_id)
+                elif counts[entry_id] >= self.max_attempts:
+                    _log.error(
+                        'Giving up on message %s of %s after %s attempts',
+                        entry_id, self.stream, counts[entry_id])
+                    publish(
+                        self.redis, '%s.failed' % self.stream,
+                        json.loads(fields['data']),
+                        maxlen=_config('QUEUE_FAILED_MAXLEN', 100000))
+                    discard.append(entry_id)
+                else:
+                    messages.append((entry_id, json.loads(fields['data'])))
+        self.ack(discard)
+        return messages, bool(counts)
+
+    def read(self):
+        """ Return the next messages to process, as a list of (id, data).
+
+        The pending messages due to be processed again, because the daemon
+        crashed or failed to process them, are returned first, see
+        ``_claim``. They are looked for every ``retry_delay`` seconds.
+        Then this blocks until new messages arrive, for up to 5 seconds.
+
+        The messages returned are not claimed again until they are
+        acknowledged or failed, however long they take to process.
+        """
+        messages = []
+        if time.time() >= self._pending_at:
+            messages, due = self._claim()
+            if not due:
+                self._pending_at = time.time() + self.retry_delay
+        if not messages:
+            messages = self._read('>', block=True)
+        self._processing.update(entry_id for entry_id, _ in messages)
+        return messages
+
+    def ack(self, ids):
+        """ Acknowledge the specified messages and remove them from the
+        queue. """
+        if not ids:
+            return
+        pipe = self.redis.pipeline()
+        pipe.execute_command('XACK', self.stream, self.group, *ids)
+        pipe.execute_command('XDEL', self.stream, *ids)
+        pipe.execute()
+        self._processing.difference_update(ids)
+
+    def fail(self, messages):
+        """ Record that the specified messages could not be processed.
+
+        They are left pending and processed again in ``retry_delay``
+        seconds or, after too many attempts, moved to the
+        ``<stream>.failed`` queue, see ``_claim``.
+        """
+        _log.info(
+            '%s messages of %s to process again in %s seconds',
+            len(messages), self.stream, self.retry_delay)
+        self._processing.difference_update(
+            entry_id for entry_id, _ in messages)
+        self._pending_at = time.time() + self.retry_delay
+
+    def process(self, handler, key=None):
+        """ Read the next messages and process them.
+
+        :arg handler: a callable processing a list of messages, given by
+            their data, sharing the same key. If it raises an exception the
+            messages are processed again later
+        :kwarg key: a callable returning the key of a message from its
+            data, used to process together the messages of a same project,
+            see ``group_messages``
+        :return: the number of messages read
+
+        """
+        messages = self.read()
+        for batch in group_messages(messages, key):
+            start = time.time()
+            try:
+                handler([data for _, data in batch])
+            except Exception:
+                _log.exception(
+                    'Could not process %s messages of %s',
+                    len(batch), self.stream)
+                self.fail(batch)
+                self.stats.record(
+                    len(batch), time.time() - start, failed=True)
+            else:
+                self.ack([entry_id for entry_id, _ in batch])
+                self.stats.record(len(batch), time.time() - start)
+        return len(messages)
+
+    def run(self, handler, key=None):
+        """ Process the messages of the queue, forever. """
+        self.setup()
+        while True:
+            try:
+                self.process(handler, key)
+            except redis.exceptions.ConnectionError:
+                _log.exception('Lost the connection to redis')
+                time.sleep(1)
+
+
+def report_metrics(redis_conn, stream, group, stats):
+    """ Log and store in redis the metrics of the specified queue. """
+    report = backlog(redis_conn, stream, group)
+    report.update(stats.report())
+    _log.info(
+        '%s - waiting: %s, being processed: %s, processed: %s, failed: %s, '
+        'duration avg: %.3fs, max: %.3fs', stream, report['length'],
+        report['pending'], report['processed'], report['failed'],
+        report['duration_avg'], report['duration_max'])
+    redis_conn.hset(_METRICS_KEY, stream, json.dumps(report))
+    return report
+
+
+def run_workers(stream, group, handler, key=None):
+    """ Process the messages of the specified queue with QUEUE_WORKERS
+    threads, and report the metrics of the queue every minute. This does
+    not return.
+
+    See ``Consumer.process`` for the ``handler`` and ``key`` arguments.
+    """
+    redis_conn = get_redis()
+    stats = Stats()
+    hostname = socket.gethostname()
+    for idx in range(_config('QUEUE_WORKERS', 2)):
+        consumer = Consumer(
+            redis_conn, stream, group, '%s-%s' % (hostname, idx),
+            stats=stats)
+        thread = threading.Thread(
+            target=consumer.run, args=(handler, key),
+            name='%s-%s' % (group, idx))
+        thread.daemon = True
+        thread.start()
+
+    while True:
+        time.sleep(METRICS_INTERVAL)
+        try:
+            report_metrics(redis_conn, stream, group, stats)
+        except redis.exceptions.RedisError:
+            _log.exception('Could not report the metrics of %s', stream)
@@ -19,14 +19,18 @@ Author: Ralph Bean <rbean@redhat.com>
         Pierre-Yves Chibon <pingou@pingoured.fr>
 """
 
+import re
+
 import flask
 
 import markdown.inlinepatterns
+import markdown.preprocessors
 import markdown.util
-import pygit2
 
 import pagure
 import pagure.lib
+import pagure.lib.markdown_cache
+from pagure.lib import model
 
 
 MENTION_RE = r'@(\w+)'
@@ -66,6 +70,8 @@ class MentionPattern(markdown.inlinepatterns.Pattern):
         text = ' @%s' % name
         user = pagure.lib.search_user(pagure.SESSION, username=name)
         if not user:
+            # The user may be created later on
+            pagure.lib.markdown_cache.not_cacheable()
             return text
 
         element = markdown.util.etree.Element("a")
@@ -78,80 +84,69 @@ class MentionPattern(markdown.inlinepatterns.Pattern):
         return element
 
 
-class ExplicitLinkPattern(markdown.inlinepatterns.Pattern):
+class ReferencePattern(markdown.inlinepatterns.Pattern):
+    """ Base class of the patterns linking to issues, pull-requests and
+    commits, which are looked up in the references of the document. """
+
+    def __init__(self, pattern, references):
+        markdown.inlinepatterns.Pattern.__init__(self, pattern)
+        self.references = references
+
+    def ticket_anchor(self, user, namespace, repo, idx, text):
+        """ Return the link to the specified issue or pull-request if it
+        exists, the text otherwise. """
+        ticket = self.references.get_ticket(user, namespace, repo, idx)
+        if ticket:
+            return _obj_anchor_tag(user, namespace, repo, ticket, text)
+        return text
+
+
+class ExplicitLinkPattern(ReferencePattern):
     """ Explicit link pattern. """
 
     def handleMatch(self, m):
         """ When the pattern matches, update the text. """
-        is_fork = m.group(2)
-        user = m.group(3)
-        namespace = m.group(4)
-        repo = m.group(5)
+        user, namespace, repo = _get_explicit_project(
+            m.group(2), m.group(3), m.group(4), m.group(5))
         idx = m.group(6)
         text = '%s#%s' % (repo, idx)
 
-        if not is_fork and user:
-            namespace = user
-            user = None
-
         if namespace:
-            namespace = namespace.rstrip('/')
             text = '%s/%s' % (namespace, text)
         if user:
-            user = user.rstrip('/')
-            text = '%s/%s' % (user.rstrip('/'), text)
+            text = '%s/%s' % (user, text)
 
         try:
             idx = int(idx)
         except (ValueError, TypeError):
             return text
 
-        issue = _issue_exists(user, namespace, repo, idx)
-        if issue:
-            return _obj_anchor_tag(user, namespace, repo, issue, text)
-
-        request = _pr_exists(user, namespace, repo, idx)
-        if request:
-            return _obj_anchor_tag(user, namespace, repo, request, text)
-
-        return text
+        return self.ticket_anchor(user, namespace, repo, idx, text)
 
 
-class CommitLinkPattern(markdown.inlinepatterns.Pattern):
+class CommitLinkPattern(ReferencePattern):
     """ Commit link pattern. """
 
     def handleMatch(self, m):
         """ When the pattern matches, update the text. """
         is_fork = m.group(2)
-        user = m.group(3)
-        namespace = m.group(4)
-        repo = m.group(5)
+        user, namespace, repo = _get_explicit_project(
+            is_fork, m.group(3), m.group(4), m.group(5))
         commitid = m.group(6)
         text = '%s#%s' % (repo, commitid)
 
-        if not is_fork and user:
-            namespace = user
-            user = None
-
         if namespace:
-            namespace = namespace.rstrip('/')
             text = '%s/%s' % (namespace, text)
         if user:
-            user = user.rstrip('/')
-            text = '%s/%s' % (user.rstrip('/'), text)
+            text = '%s/%s' % (user, text)
 
-        if pagure.lib.search_projects(
-                pagure.SESSION,
-                username=user,
-                fork=is_fork,
-                namespace=namespace,
-                pattern=repo):
+        if self.references.project_exists(user, namespace, repo, is_fork):
             return _obj_anchor_tag(user, namespace, repo, commitid, text)
 
         return text
 
 
-class ImplicitIssuePattern(markdown.inlinepatterns.Pattern):
+class ImplicitIssuePattern(ReferencePattern):
     """ Implicit issue pattern. """
 
     def handleMatch(self, m):
@@ -168,18 +163,10 @@ class ImplicitIssuePattern(markdown.inlinepatterns.Pattern):
         except RuntimeError:
             return text
 
-        issue = _issue_exists(user, namespace, repo, idx)
-        if issue:
-            return _obj_anchor_tag(user, namespace, repo, issue, text)
+        return self.ticket_anchor(user, namespace, repo, idx, text)
 
-        request = _pr_exists(user, namespace, repo, idx)
-        if request:
-            return _obj_anchor_tag(user, namespace, repo, request, text)
-
-        return text
 
-
-class ImplicitPRPattern(markdown.inlinepatterns.Pattern):
+class ImplicitPRPattern(ReferencePattern):
     """ Implicit pull-request pattern. """
 
     def handleMatch(self, m):
@@ -196,18 +183,10 @@ class ImplicitPRPattern(markdown.inlinepatterns.Pattern):
         except RuntimeError:
             return text
 
-        issue = _issue_exists(user, namespace, repo, idx)
-        if issue:
-            return _obj_anchor_tag(user, namespace, repo, issue, text)
-
-        request = _pr_exists(user, namespace, repo, idx)
-        if request:
-            return _obj_anchor_tag(user, namespace, repo, request, text)
+        return self.ticket_anchor(user, namespace, repo, idx, text)
 
-        return text
 
-
-class ImplicitCommitPattern(markdown.inlinepatterns.Pattern):
+class ImplicitCommitPattern(ReferencePattern):
     """ Implicit commit pattern. """
 
     def handleMatch(self, m):
@@ -221,12 +200,9 @@ class ImplicitCommitPattern(markdown.inlinepatterns.Pattern):
         except RuntimeError:
             return text
 
-        if pagure.lib.search_projects(
-                pagure.SESSION,
-                username=user,
-                namespace=namespace,
-                pattern=repo) \
-                and _commit_exists(user, namespace, repo, githash):
+        if self.references.project_exists(user, namespace, repo) \
+                and self.references.has_commit(
+                    user, namespace, repo, githash):
             return _obj_anchor_tag(user, namespace, repo, githash, text[:7])
 
         return text
@@ -244,6 +220,148 @@ class StrikeThroughPattern(markdown.inlinepatterns.Pattern):
         return element
 
 
+class References(object):
+    """ The issues, pull-requests and commits referenced in a document.
+
+    The references are collected before the document is rendered and those
+    of a project are all resolved the first time one of them is looked up:
+    using one query for the issues, one for the pull-requests and a single
+    handle on the git repository for the commits.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """ Forget all the references. """
+        self._projects = {}
+        self._found = {}
+        self._tickets = {}
+        self._commits = {}
+        self._pending_tickets = {}
+        self._pending_commits = {}
+
+    def add_ticket(self, user, namespace, repo, idx):
+        """ Record a reference to an issue or pull-request. """
+        key = (user, namespace, repo)
+        self._pending_tickets.setdefault(key, set()).add(idx)
+
+    def add_commit(self, user, namespace, repo, githash):
+        """ Record a reference to a commit. """
+        key = (user, namespace, repo)
+        self._pending_commits.setdefault(key, set()).add(githash)
+
+    def get_project(self, user, namespace, repo):
+        """ Return the specified project and record that the markdown
+        being rendered depends on it. """
+        key = (user, namespace, repo)
+        if key not in self._projects:
+            self._projects[key] = pagure.get_authorized_project(
+                pagure.SESSION, project_name=repo, user=user,
+                namespace=namespace)
+
+        repo_obj = self._projects[key]
+        if not repo_obj or repo_obj.private:
+            # The project may be created later on and whether a private
+            # project is found depends on the user
+            pagure.lib.markdown_cache.not_cacheable()
+        else:
+            pagure.lib.markdown_cache.depends_on(repo_obj.id)
+        return repo_obj
+
+    def project_exists(self, user, namespace, repo, fork=None):
+        """ Return whether the specified project exists, the same way
+        ``search_projects`` does. """
+        key = (user, namespace, repo, fork)
+        if key not in self._found:
+            self._found[key] = bool(pagure.lib.search_projects(
+                pagure.SESSION,
+                username=user,
+                fork=fork,
+                namespace=namespace,
+                pattern=repo))
+
+        if not self._found[key]:
+            # The project may be created later on
+            pagure.lib.markdown_cache.not_cacheable()
+        return self._found[key]
+
+    def get_ticket(self, user, namespace, repo, idx):
+        """ Return the issue or pull-request of the specified project with
+        the specified identifier, if there is one. """
+        key = (user, namespace, repo)
+        repo_obj = self.get_project(user, namespace, repo)
+        if not repo_obj:
+            return None
+
+        if (key, idx) not in self._tickets:
+            ids = self._pending_tickets.pop(key, set())
+            ids.add(idx)
+            tickets = dict.fromkeys(ids)
+            # Issues and pull-requests share their identifiers, when both
+            # exist the issue is linked to
+            for model_cls in (model.PullRequest, model.Issue):
+                query = pagure.SESSION.query(model_cls).filter(
+                    model_cls.project_id == repo_obj.id
+                ).filter(
+                    model_cls.id.in_(ids)
+                )
+                for obj in query.all():
+                    tickets[obj.id] = obj
+            for ticket_id, obj in tickets.items():
+                self._tickets[(key, ticket_id)] = obj
+
+        return self._tickets[(key, idx)]
+
+    def has_commit(self, user, namespace, repo, githash):
+        """ Return whether the git repository of the specified project
+        contains the specified commit. """
+        key = (user, namespace, repo)
+        repo_obj = self.get_project(user, namespace, repo)
+        if not repo_obj:
+            return False
+
+        if (key, githash) not in self._commits:
+            hashes = self._pending_commits.pop(key, set())
+            hashes.add(githash)
+            git_repo = pagure.open_repo(pagure.get_repo_path(repo_obj))
+            for commit_hash in hashes:
+                self._commits[(key, commit_hash)] = commit_hash in git_repo
+
+        return self._commits[(key, githash)]
+
+
+class ReferencesPreprocessor(markdown.preprocessors.Preprocessor):
+    """ Collect the issues, pull-requests and commits referenced in the
+    document, the lines are returned unchanged. """
+
+    def __init__(self, md, references):
+        markdown.preprocessors.Preprocessor.__init__(self, md)
+        self.references = references
+
+    def run(self, lines):
+        self.references.reset()
+        text = '\n'.join(lines)
+
+        for match in re.finditer(EXPLICIT_LINK_RE, text):
+            user, namespace, repo = _get_explicit_project(
+                *match.groups()[:4])
+            self.references.add_ticket(
+                user, namespace, repo, int(match.group('id')))
+
+        try:
+            namespace, repo, user = _get_ns_repo_user()
+        except RuntimeError:
+            return lines
+
+        for idx in re.findall(r'#([0-9]+)', text):
+            self.references.add_ticket(user, namespace, repo, int(idx))
+        for githash in re.findall(IMPLICIT_COMMIT_RE, text):
+            self.references.add_commit(user, namespace, repo, githash)
+
+        return lines
+
+
 class PagureExtension(markdown.extensions.Extension):
 
     def extendMarkdown(self, md, md_globals):
@@ -255,74 +373,54 @@ class PagureExtension(markdown.extensions.Extension):
             r'\b[Ii][Rr][Cc][Ss]?://[^)<>\s]+[^.,)<>\s]',
         ])
 
+        # Collect the references of the document before it is rendered
+        # so they can be resolved in bulk
+        references = self.references = References()
+        md.preprocessors['pagure_references'] = ReferencesPreprocessor(
+            md, references)
+
         md.inlinePatterns['mention'] = MentionPattern(MENTION_RE)
 
         md.inlinePatterns['implicit_commit'] = ImplicitCommitPattern(
-            IMPLICIT_COMMIT_RE)
+            IMPLICIT_COMMIT_RE, references)
         md.inlinePatterns['commit_links'] = CommitLinkPattern(
-            COMMIT_LINK_RE)
+            COMMIT_LINK_RE, references)
 
         if pagure.APP.config.get('ENABLE_TICKETS', True):
             md.inlinePatterns['implicit_pr'] = \
-                ImplicitPRPattern(IMPLICIT_PR_RE)
+                ImplicitPRPattern(IMPLICIT_PR_RE, references)
             md.inlinePatterns['explicit_fork_issue'] = \
-                ExplicitLinkPattern(EXPLICIT_LINK_RE)
+                ExplicitLinkPattern(EXPLICIT_LINK_RE, references)
             md.inlinePatterns['implicit_issue'] = \
-                ImplicitIssuePattern(IMPLICIT_ISSUE_RE)
+                ImplicitIssuePattern(IMPLICIT_ISSUE_RE, references)
 
         md.inlinePatterns['striked'] = StrikeThroughPattern(
             STRIKE_THROUGH_RE)
 
         md.registerExtension(self)
 
+    def reset(self):
+        """ Forget the references of the previous document. """
+        self.references.reset()
+
 
 def makeExtension(*arg, **kwargs):
     return PagureExtension(**kwargs)
 
 
-def _issue_exists(user, namespace, repo, idx):
-    """ Utility method checking if a given issue exists. """
-
-    repo_obj = pagure.get_authorized_project(
-        pagure.SESSION, project_name=repo, user=user, namespace=namespace)
-
-    if not repo_obj:
-        return False
-
-    issue_obj = pagure.lib.search_issues(
-        pagure.SESSION, repo=repo_obj, issueid=idx)
-    if not issue_obj:
-        return False
-
-    return issue_obj
-
-
-def _pr_exists(user, namespace, repo, idx):
-    """ Utility method checking if a given PR exists. """
-    repo_obj = pagure.get_authorized_project(
-        pagure.SESSION, project_name=repo, user=user, namespace=namespace)
-
-    if not repo_obj:
-        return False
-
-    pr_obj = pagure.lib.search_pull_requests(
-        pagure.SESSION, project_id=repo_obj.id, requestid=idx)
-    if not pr_obj:
-        return False
-
-    return pr_obj
-
-
-def _commit_exists(user, namespace, repo, githash):
-    """ Utility method checking if a given commit exists. """
-    repo_obj = pagure.get_authorized_project(
-        pagure.SESSION, project_name=repo, user=user, namespace=namespace)
-    if not repo_obj:
-        return False
+def _get_explicit_project(is_fork, user, namespace, repo):
+    """ Return the user, namespace and name of the project referenced
+    explicitly, from the corresponding groups of EXPLICIT_LINK_RE or
+    COMMIT_LINK_RE. """
+    if not is_fork and user:
+        namespace = user
+        user = None
 
-    reponame = pagure.get_repo_path(repo_obj)
-    git_repo = pygit2.Repository(reponame)
-    return githash in git_repo
+    if namespace:
+        namespace = namespace.rstrip('/')
+    if user:
+        user = user.rstrip('/')
+    return (user, namespace, repo)
 
 
 def _obj_anchor_tag(user, namespace, repo, obj, text):
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+Request globals (``flask.g``) computed the first time they are used.
+
+``set_variables`` provides, for the project in the URL, values such as its
+git repository, its branches or the access the user has to it. Most
+endpoints only use a few of them, so they are declared with
+``flask.g.set_lazy()`` and only computed, then kept for the rest of the
+request, when they are accessed.
+
+The attributes computed during each request are recorded per endpoint, see
+``get_report()``.
+
+"""
+
+import logging
+import threading
+
+import flask
+
+
+_log = logging.getLogger(__name__)
+
+_REPORT = {}
+_LOCK = threading.Lock()
+
+
+class LazyGlobals(flask.Flask.app_ctx_globals_class):
+    """ The ``flask.g`` object of pagure, supporting attributes computed
+    the first time they are accessed. """
+
+    def set_lazy(self, name, function):
+        """ Set the attribute ``name`` to the value returned by calling
+        ``function`` the first time this attribute is accessed.
+
+        :arg name: the name of the attribute.
+        :arg function: a callable taking no argument.
+
+        """
+        self.__dict__.pop(name, None)
+        self.__dict__.setdefault('_lazy', {})[name] = function
+        self.__dict__.setdefault('_lazy_declared', set()).add(name)
+
+    def __getattr__(self, name):
+        lazy = self.__dict__.get('_lazy', {})
+        if name not in lazy:
+            raise AttributeError(name)
+        value = lazy[name]()
+        del lazy[name]
+        setattr(self, name, value)
+        self.__dict__.setdefault('_lazy_computed', []).append(name)
+        return value
+
+    def __contains__(self, name):
+        return name in self.__dict__ \
+            or name in self.__dict__.get('_lazy', {})
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+
+def record_request(endpoint, globs):
+    """ Record which of the lazy attributes declared during a request have
+    been computed.
+
+    :arg endpoint: the endpoint of the request.
+    :arg globs: the ``flask.g`` object of the request.
+
+    """
+    globs.__dict__.pop('_lazy', None)
+    declared = globs.__dict__.pop('_lazy_declared', None)
+    computed = globs.__dict__.pop('_lazy_computed', [])
+    if not declared:
+        return
+    _log.debug(
+        '%s computed %s of the lazy attributes: %s',
+        endpoint, len(computed), ', '.join(computed) or '-')
+
+    with _LOCK:
+        stats = _REPORT.setdefault(
+            endpoint, {'requests': 0, 'declared': {}, 'computed': {}})
+        stats['requests'] += 1
+        for name in declared:
+            stats['declared'][name] = stats['declared'].get(name, 0) + 1
+        for name in computed:
+            stats['computed'][name] = stats['computed'].get(name, 0) + 1
+
+
+def get_report():
+    """ Return, for each endpoint, the number of requests made to it and
+    how many times each lazy attribute was declared and computed.
+
+    :return: a dict of endpoint: {'requests': int, 'declared': dict,
+        'computed': dict}
+
+    """
+    with _LOCK:
+        return dict(
+            (endpoint, {
+                'requests': stats['requests'],
+                'declared': dict(stats['declared']),
+                'computed': dict(stats['computed']),
+            })
+            for endpoint, stats in _REPORT.items()
+        )
+
+
+def reset_report():
+    """ Forget the requests recorded so far. """
+    with _LOCK:
+        _REPORT.clear()
@@ -37,32 +37,15 @@ def _get_user(username):
         flask.abort(404, e.message)
 
 
-def _filter_acls(repos, acl, user):
-    """ Filter the given list of repositories to return only the ones where
-    the user has the specified acl.
+def _get_acl():
+    """ Return the access level the list of projects should be restricted
+    to, as specified in the ``acl`` argument of the request, if it is a
+    valid one.
     """
-    if acl == 'commit':
-        repos = [
-            repo
-            for repo in repos
-            if user in repo.committers
-            or user.username == repo.user.username
-        ]
-    elif acl == 'admin':
-        repos = [
-            repo
-            for repo in repos
-            if user in repo.admins
-            or user.username == repo.user.username
-        ]
-    elif acl == 'main admin':
-        repos = [
-            repo
-            for repo in repos
-            if user.username == repo.user.username
-        ]
-
-    return repos
+    acl = flask.request.args.get('acl', '').strip().lower() or None
+    if acl not in ('main admin', 'admin', 'commit'):
+        acl = None
+    return acl
 
 
 @APP.route('/browse/projects', endpoint='browse_projects')
@@ -115,7 +98,7 @@ def index_auth():
     """
     user = _get_user(username=flask.g.fas_user.username)
 
-    acl = flask.request.args.get('acl', '').strip().lower() or None
+    acl = _get_acl()
 
     repopage = flask.request.args.get('repopage', 1)
     try:
@@ -133,23 +116,33 @@ def index_auth():
     except ValueError:
         forkpage = 1
 
+    limit = APP.config['ITEM_PER_PAGE']
+
+    repos_length = pagure.lib.search_projects(
+        SESSION,
+        username=flask.g.fas_user.username,
+        exclude_groups=APP.config.get('EXCLUDE_GROUP_INDEX'),
+        fork=False, private=flask.g.fas_user.username,
+        acl=acl, count=True)
     repos = pagure.lib.search_projects(
         SESSION,
         username=flask.g.fas_user.username,
         exclude_groups=APP.config.get('EXCLUDE_GROUP_INDEX'),
-        fork=False, private=flask.g.fas_user.username)
-    if repos and acl:
-        repos = _filter_acls(repos, acl, user)
-
-    repos_length = len(repos)
+        fork=False, private=flask.g.fas_user.username,
+        acl=acl, start=limit * (repopage - 1), limit=limit)
 
+    forks_length = pagure.lib.search_projects(
+        SESSION,
+        username=flask.g.fas_user.username,
+        fork=True,
+        private=flask.g.fas_user.username,
+        count=True)
     forks = pagure.lib.search_projects(
         SESSION,
         username=flask.g.fas_user.username,
         fork=True,
-        private=flask.g.fas_user.username)
-
-    forks_length = len(forks)
+        private=flask.g.fas_user.username,
+        start=limit * (forkpage - 1), limit=limit)
 
     watch_list = pagure.lib.user_watch_list(
         SESSION,
@@ -168,6 +161,8 @@ def index_auth():
         forkpage=forkpage,
         repos_length=repos_length,
         forks_length=forks_length,
+        total_page_repos=int(ceil(repos_length / float(limit)) or 1),
+        total_page_forks=int(ceil(forks_length / float(limit)) or 1),
     )
 
 
@@ -337,7 +332,7 @@ def view_user(username):
     """
     user = _get_user(username=username)
 
-    acl = flask.request.args.get('acl', '').strip().lower() or None
+    acl = _get_acl()
 
     repopage = flask.request.args.get('repopage', 1)
     try:
@@ -370,12 +365,16 @@ def view_user(username):
         exclude_groups=APP.config.get('EXCLUDE_GROUP_INDEX'),
         start=repo_start,
         limit=limit,
-        private=private)
-
-    if repos and acl:
-        repos = _filter_acls(repos, acl, user)
-
-    repos_length = len(repos)
+        private=private,
+        acl=acl)
+    repos_length = pagure.lib.search_projects(
+        SESSION,
+        username=username,
+        fork=False,
+        exclude_groups=APP.config.get('EXCLUDE_GROUP_INDEX'),
+        private=private,
+        acl=acl,
+        count=True)
 
     forks = pagure.lib.search_projects(
         SESSION,
@@ -384,7 +383,12 @@ def view_user(username):
         start=fork_start,
         limit=limit,
         private=private)
-    forks_length = len(forks)
+    forks_length = pagure.lib.search_projects(
+        SESSION,
+        username=username,
+        fork=True,
+        private=private,
+        count=True)
 
     total_page_repos = int(ceil(repos_length / float(limit)))
     total_page_forks = int(ceil(forks_length / float(limit)))
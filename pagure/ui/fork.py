@@ -199,8 +199,8 @@ def request_pull(repo, requestid, username=None, namespace=None):
         else:
             repopath = pagure.get_repo_path(request.project)
 
-    repo_obj = pygit2.Repository(repopath)
-    orig_repo = pygit2.Repository(parentpath)
+    repo_obj = pagure.open_repo(repopath)
+    orig_repo = pagure.open_repo(parentpath)
 
     diff_commits = []
     diff = None
@@ -324,8 +324,8 @@ def request_pull_to_diff_or_patch(
         repopath = pagure.get_repo_path(repo_from)
         parentpath = _get_parent_repo_path(repo_from)
 
-    repo_obj = pygit2.Repository(repopath)
-    orig_repo = pygit2.Repository(parentpath)
+    repo_obj = pagure.open_repo(repopath)
+    orig_repo = pagure.open_repo(parentpath)
 
     branch = repo_obj.lookup_branch(request.branch_from)
     commitid = None
@@ -1085,7 +1085,7 @@ def new_request_pull(
     repo_obj = flask.g.repo_obj
 
     parentpath = _get_parent_repo_path(repo)
-    orig_repo = pygit2.Repository(parentpath)
+    orig_repo = pagure.open_repo(parentpath)
 
     try:
         diff, diff_commits, orig_commit = pagure.lib.git.get_diff_info(
@@ -1257,7 +1257,7 @@ def new_remote_request_pull(repo, username=None, namespace=None):
                 repo=repo.name, username=username, namespace=namespace,
                 initial=True)
 
-        repo_obj = pygit2.Repository(repopath)
+        repo_obj = pagure.open_repo(repopath)
 
         try:
             diff, diff_commits, orig_commit = pagure.lib.git.get_diff_info(
@@ -31,6 +31,7 @@ from binaryornot.helpers import is_binary_string
 import pagure.doc_utils
 import pagure.exceptions
 import pagure.lib
+import pagure.lib.issue_facets
 import pagure.lib.mimetype
 import pagure.forms
 from pagure import (APP, SESSION, __get_file_in_tree,
@@ -627,6 +628,12 @@ def view_issues(repo, username=None, namespace=None):
         search_pattern)
     custom_search.update(extra_fields)
 
+    # When searching, show the most relevant issues first unless asked
+    # otherwise
+    sort_key = order_key
+    if search_pattern and 'order_key' not in flask.request.args:
+        sort_key = None
+
     repo = flask.g.repo
 
     try:
@@ -646,16 +653,40 @@ def view_issues(repo, username=None, namespace=None):
     if str(status).lower() in ['all']:
         status = None
 
+    # The counts come from grouped queries, memoized until the next change
+    # to the issues of the project. The total number of issues ignores the
+    # search, the custom fields and the milestones
+    total_facets = pagure.lib.get_issue_facets(
+        SESSION, repo, tags=tags, assignee=assignee, author=author,
+        private=private, priority=priority)
+    total_issues_cnt = pagure.lib.issue_facets.count(total_facets)
+
+    # The milestones only filter the issues of a given status
+    if status is not None and (milestones or no_stone):
+        facets = pagure.lib.get_issue_facets(
+            SESSION, repo, tags=tags, assignee=assignee, author=author,
+            private=private, priority=priority,
+            search_pattern=search_pattern, custom_search=custom_search,
+            milestones=milestones, no_milestones=no_stone)
+    elif search_pattern or custom_search:
+        facets = pagure.lib.get_issue_facets(
+            SESSION, repo, tags=tags, assignee=assignee, author=author,
+            private=private, priority=priority,
+            search_pattern=search_pattern, custom_search=custom_search)
+    else:
+        facets = total_facets
+
     oth_issues_cnt = None
-    total_issues_cnt = pagure.lib.search_issues(
-        SESSION, repo, tags=tags, assignee=assignee,
-        author=author, private=private, priority=priority, count=True)
     if status is not None:
+        closed = status.lower() != 'open'
+        status_filter = None
+        if status.lower() != 'closed':
+            status_filter = status.capitalize()
         issues = pagure.lib.search_issues(
             SESSION,
             repo,
-            closed=True if status.lower() != 'open' else False,
-            status=status.capitalize() if status.lower() != 'closed' else None,
+            closed=closed,
+            status=status_filter,
             tags=tags,
             assignee=assignee,
             author=author,
@@ -668,39 +699,13 @@ def view_issues(repo, username=None, namespace=None):
             milestones=milestones,
             no_milestones=no_stone,
             order=order,
-            order_key=order_key
-        )
-        issues_cnt = pagure.lib.search_issues(
-            SESSION,
-            repo,
-            closed=True if status.lower() != 'open' else False,
-            status=status.capitalize() if status.lower() != 'closed' else None,
-            tags=tags,
-            assignee=assignee,
-            author=author,
-            private=private,
-            priority=priority,
-            search_pattern=search_pattern,
-            custom_search=custom_search,
-            milestones=milestones,
-            no_milestones=no_stone,
-            count=True
-        )
-        oth_issues_cnt = pagure.lib.search_issues(
-            SESSION,
-            repo,
-            closed=True if status.lower() != 'open' else False,
-            tags=tags,
-            assignee=assignee,
-            author=author,
-            private=private,
-            priority=priority,
-            search_pattern=search_pattern,
-            custom_search=custom_search,
-            no_milestones=no_stone,
-            milestones=milestones,
-            count=True,
+            order_key=sort_key
         )
+        issues_cnt = pagure.lib.issue_facets.count(
+            facets, status=status_filter, closed=closed)
+        oth_issues_cnt = pagure.lib.issue_facets.count(facets, closed=closed)
+        tag_counts = pagure.lib.issue_facets.count_tags(
+            facets, status=status_filter, closed=closed)
     else:
         issues = pagure.lib.search_issues(
             SESSION, repo, tags=tags, assignee=assignee,
@@ -709,15 +714,10 @@ def view_issues(repo, username=None, namespace=None):
             search_pattern=search_pattern,
             custom_search=custom_search,
             order=order,
-            order_key=order_key
-        )
-        issues_cnt = pagure.lib.search_issues(
-            SESSION, repo, tags=tags, assignee=assignee,
-            author=author, private=private, priority=priority,
-            search_pattern=search_pattern,
-            custom_search=custom_search,
-            count=True,
+            order_key=sort_key
         )
+        issues_cnt = pagure.lib.issue_facets.count(facets)
+        tag_counts = pagure.lib.issue_facets.count_tags(facets)
     tag_list = pagure.lib.get_tags_of_project(SESSION, repo)
 
     total_page = 1
@@ -730,6 +730,7 @@ def view_issues(repo, username=None, namespace=None):
         repo=repo,
         username=username,
         tag_list=tag_list,
+        tag_counts=tag_counts,
         status=status,
         issues=issues,
         issues_cnt=issues_cnt,
@@ -18,7 +18,6 @@
 
 
 import datetime
-import json
 import logging
 import os
 from cStringIO import StringIO
@@ -46,6 +45,7 @@ import pagure.lib.git
 import pagure.lib.mimetype
 import pagure.lib.plugins
 import pagure.lib.tasks
+import pagure.lib.work_queue
 import pagure.forms
 import pagure
 import pagure.ui.plugins
@@ -181,7 +181,7 @@ def view_repo_branch(repo, branchname, username=None, namespace=None):
     else:
         parentname = os.path.join(APP.config['GIT_FOLDER'], repo.path)
 
-    orig_repo = pygit2.Repository(parentname)
+    orig_repo = pagure.open_repo(parentname)
 
     tree = None
     safe = False
@@ -283,6 +283,7 @@ def view_commits(repo, branchname=None, username=None, namespace=None):
 
     author = flask.request.args.get('author', None)
     author_obj = None
+    emails = None
     if author:
         try:
             author_obj = pagure.lib.get_user(SESSION, author)
@@ -291,30 +292,20 @@ def view_commits(repo, branchname=None, username=None, namespace=None):
         if not author_obj:
             flask.flash(
                 'No user found for the author: %s' % author, 'error')
+        else:
+            emails = set(email.email for email in author_obj.emails)
 
     limit = APP.config['ITEM_PER_PAGE']
     start = limit * (page - 1)
-    end = limit * page
 
     n_commits = 0
     last_commits = []
     if branch:
-        for commit in repo_obj.walk(
-                branch.get_object().hex, pygit2.GIT_SORT_TIME):
-
-            # Filters the commits for a user
-            if author_obj:
-                tmp = False
-                for email in author_obj.emails:
-                    if email.email == commit.author.email:
-                        tmp = True
-                        break
-                if not tmp:
-                    continue
-
-            if n_commits >= start and n_commits <= end:
-                last_commits.append(commit)
-            n_commits += 1
+        head_oid = branch.get_object().hex
+        last_commits = pagure.lib.git.log_commits(
+            repo_obj, head_oid, offset=start, limit=limit, emails=emails)
+        n_commits = pagure.lib.git.count_commits(
+            repo_obj, head_oid, branchname=branchname, emails=emails)
 
     total_page = int(ceil(n_commits / float(limit)) if n_commits > 0 else 1)
 
@@ -326,7 +317,7 @@ def view_commits(repo, branchname=None, username=None, namespace=None):
     else:
         parentname = os.path.join(APP.config['GIT_FOLDER'], repo.path)
 
-    orig_repo = pygit2.Repository(parentname)
+    orig_repo = pagure.open_repo(parentname)
 
     if not repo_obj.is_empty and not orig_repo.is_empty \
             and repo_obj.listall_branches() > 1:
@@ -1103,13 +1094,14 @@ def test_web_hook(repo, username=None, namespace=None):
     form = pagure.forms.ConfirmationForm()
     if form.validate_on_submit():
         if pagure.lib.REDIS:
-            pagure.lib.REDIS.publish(
-                'pagure.hook',
-                json.dumps({
+            pagure.lib.work_queue.publish(
+                pagure.lib.REDIS,
+                pagure.lib.work_queue.WEBHOOK,
+                {
                     'project': repo.fullname,
                     'topic': 'Test.notification',
                     'msg': {'content': 'Test message'},
-                })
+                }
             )
             flask.flash('Notification triggered')
         else:
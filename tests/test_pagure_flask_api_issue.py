@@ -871,6 +871,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": [],
@@ -912,6 +913,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": []
@@ -955,6 +957,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": []
@@ -987,6 +990,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": []
@@ -1030,6 +1034,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": []
@@ -1058,6 +1063,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": []
@@ -1083,6 +1089,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 "no_stones": None,
                 'order': None,
                 "priority": None,
+                "search_pattern": None,
                 "since": None,
                 "status": "Closed",
                 "tags": []
@@ -1106,6 +1113,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": "Invalid",
                 "tags": []
@@ -1132,6 +1140,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": "All",
                 "tags": []
@@ -1165,6 +1174,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': 'asc',
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": []
@@ -1232,6 +1242,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": [],
@@ -1258,6 +1269,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": [],
@@ -1330,6 +1342,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": [],
@@ -1356,6 +1369,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': 'high',
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": [],
@@ -1381,6 +1395,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': '1',
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": [],
@@ -1470,6 +1485,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": [],
@@ -1496,6 +1512,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': True,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": [],
@@ -1522,6 +1539,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': False,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": [],
@@ -1617,6 +1635,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": None,
                 "status": None,
                 "tags": []
@@ -1646,6 +1665,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": start,
                 "status": None,
                 "tags": []
@@ -1672,6 +1692,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": middle,
                 "status": None,
                 "tags": []
@@ -1698,6 +1719,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": final,
                 "status": None,
                 "tags": []
@@ -1727,6 +1749,7 @@ class PagureFlaskApiIssuetests(tests.SimplePagureTest):
                 'no_stones': None,
                 'order': None,
                 'priority': None,
+                'search_pattern': None,
                 "since": final,
                 "status": None,
                 "tags": []
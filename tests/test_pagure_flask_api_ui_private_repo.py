@@ -2229,6 +2229,7 @@ class PagurePrivateRepotest(tests.Modeltests):
                         "no_stones": None,
                         "order": None,
                         "priority": None,
+                        "search_pattern": None,
                         "since": None,
                         "status": None,
                         "tags": []
@@ -2297,6 +2298,7 @@ class PagurePrivateRepotest(tests.Modeltests):
                         "no_stones": None,
                         "order": None,
                         "priority": None,
+                        "search_pattern": None,
                         "status": None,
                         "since": None,
                         "tags": []
@@ -2379,6 +2381,7 @@ class PagurePrivateRepotest(tests.Modeltests):
                     "no_stones": None,
                     "order": None,
                     "priority": None,
+                    "search_pattern": None,
                     "status": None,
                     "since": None,
                     "tags": []
@@ -2451,6 +2454,7 @@ class PagurePrivateRepotest(tests.Modeltests):
                     "no_stones": None,
                     "order": None,
                     "priority": None,
+                    "search_pattern": None,
                     "status": "Closed",
                     "since": None,
                     "tags": []
@@ -2475,6 +2479,7 @@ class PagurePrivateRepotest(tests.Modeltests):
                     "no_stones": None,
                     "order": None,
                     "priority": None,
+                    "search_pattern": None,
                     "status": "Invalid",
                     "since": None,
                     "tags": []
@@ -2503,6 +2508,7 @@ class PagurePrivateRepotest(tests.Modeltests):
                     "no_stones": None,
                     "order": None,
                     "priority": None,
+                    "search_pattern": None,
                     "since": None,
                     "status": "All",
                     "tags": []
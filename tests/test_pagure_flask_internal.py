@@ -556,7 +556,8 @@ class PagureFlaskInternaltests(tests.Modeltests):
             exp = {
               "code": "FFORWARD",
               "message": "The pull-request can be merged and fast-forwarded",
-              "short_code": "Ok"
+              "short_code": "Ok",
+              "conflicts": []
             }
 
             js_data = json.loads(output.data)
@@ -678,7 +679,8 @@ class PagureFlaskInternaltests(tests.Modeltests):
             exp = {
               "code": "NO_CHANGE",
               "message": "Nothing to change, git is up to date",
-              "short_code": "No changes"
+              "short_code": "No changes",
+              "conflicts": []
             }
 
             js_data = json.loads(output.data)
@@ -831,7 +833,8 @@ class PagureFlaskInternaltests(tests.Modeltests):
             exp = {
               "code": "MERGE",
               "message": "The pull-request can be merged with a merge commit",
-              "short_code": "With merge"
+              "short_code": "With merge",
+              "conflicts": []
             }
 
             js_data = json.loads(output.data)
@@ -983,7 +986,8 @@ class PagureFlaskInternaltests(tests.Modeltests):
             exp = {
               "code": "CONFLICTS",
               "message": "The pull-request cannot be merged due to conflicts",
-              "short_code": "Conflicts"
+              "short_code": "Conflicts",
+              "conflicts": ["sources"]
             }
 
             js_data = json.loads(output.data)
@@ -823,6 +823,14 @@ class PagureFlaskIssuestests(tests.Modeltests):
         self.assertEqual(output.status_code, 200)
         self.assertIn('<title>Issues - test - Pagure</title>', output.data)
         self.assertIn('1 Open Issues (of 1)', output.data)
+        # The total ignores the milestones
+        self.assertIn('issues of total 3 issues', output.data)
+
+        # The milestones do not filter the list of all the issues
+        output = self.app.get(
+            '/test/issues?status=all&milestone=none')
+        self.assertEqual(output.status_code, 200)
+        self.assertIn('<h2>\n      3 Issues (of 3)', output.data)
 
         # Search for issues with no milestone and milestone 1.1
         output = self.app.get(
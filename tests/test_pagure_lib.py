@@ -12,6 +12,7 @@ __requires__ = ['SQLAlchemy >= 0.8']
 import pkg_resources
 
 import datetime
+import json
 import unittest
 import shutil
 import sys
@@ -237,6 +238,67 @@ class PagureLibtests_search_projects(tests.Modeltests):
         projects = pagure.lib.search_projects(self.session, username='foo')
         self.assertEqual(len(projects), 0)
 
+    def test_search_projects_access_table(self):
+        """
+        Test that the projects_access table follows the changes of access
+        """
+        def get_projects(username, **kwargs):
+            return [
+                project.fullname
+                for project in pagure.lib.search_projects(
+                    self.session, username=username, **kwargs)
+            ]
+
+        self.assertEqual(get_projects('foo'), [])
+
+        project = pagure.get_authorized_project(self.session, 'test')
+        pagure.lib.add_user_to_project(
+            self.session, project=project, new_user='foo', user='pingou',
+            access='commit')
+        self.session.commit()
+        self.assertEqual(get_projects('foo'), ['test'])
+        self.assertEqual(get_projects('foo', acl='commit'), ['test'])
+        self.assertEqual(get_projects('foo', acl='admin'), [])
+
+        # Access given via a group
+        project2 = pagure.get_authorized_project(self.session, 'test2')
+        pagure.lib.add_group_to_project(
+            self.session, project=project2, new_group='JL', user='pingou',
+            access='admin', create=True)
+        self.session.commit()
+        self.assertEqual(get_projects('foo'), ['test'])
+
+        group = pagure.lib.search_groups(self.session, group_name='JL')
+        pagure.lib.add_user_to_group(
+            self.session, username='foo', group=group, user='pingou',
+            is_admin=False)
+        self.session.commit()
+        self.assertEqual(get_projects('foo'), ['test', 'test2'])
+        self.assertEqual(
+            get_projects('foo', exclude_groups=['JL']), ['test'])
+        self.assertEqual(get_projects('foo', acl='admin'), [])
+        self.assertEqual(
+            pagure.lib.search_projects(
+                self.session, username='foo', count=True),
+            2)
+        self.assertEqual(get_projects('foo', limit=1, start=1), ['test2'])
+
+        # Group removed from the project
+        project2.groups.remove(group)
+        self.session.add(project2)
+        self.session.commit()
+        self.assertEqual(get_projects('foo'), ['test'])
+
+        # Change of owner
+        project3 = pagure.get_authorized_project(
+            self.session, 'test3', namespace='somenamespace')
+        pagure.lib.set_project_owner(
+            self.session, project3, pagure.lib.get_user(self.session, 'foo'))
+        self.session.commit()
+        self.assertEqual(
+            get_projects('foo', acl='main admin'), ['somenamespace/test3'])
+        self.assertEqual(get_projects('pingou'), ['test', 'test2'])
+
     def test_search_project_forked(self):
         """
         Test the search_project for forked projects in pagure.lib.
@@ -928,7 +990,7 @@ class PagureLibtests(tests.Modeltests):
             folder=None)
         self.session.commit()
         self.assertEqual(msg, 'Comment updated')
-        self.assertEqual(mock_redis.publish.call_count, 2)
+        self.assertEqual(mock_redis.publish.call_count, 1)
 
         # After
         issue = pagure.lib.search_issues(self.session, repo, issueid=1)
@@ -985,7 +1047,7 @@ class PagureLibtests(tests.Modeltests):
         self.assertFalse(issue.project.private)
 
         args = mock_redis.publish.call_args_list
-        self.assertEqual(len(args), 8)
+        self.assertEqual(len(args), 4)
 
         # Add a tag to the issue
         msg = pagure.lib.add_tag_obj(
@@ -998,13 +1060,18 @@ class PagureLibtests(tests.Modeltests):
         self.assertEqual(msg, 'Issue tagged with: tag1')
 
         args = mock_redis.publish.call_args_list
-        self.assertEqual(len(args), 10)
+        self.assertEqual(len(args), 5)
         # Get the arguments of the last call and get the second of these
         # arguments (the first one changing for each test run)
         self.assertEqual(
             args[-1:][0][0][1],
             '{"added_tags_color": ["DeepSkyBlue"], "added_tags": ["tag1"]}'
         )
+        # The web-hook notification is queued
+        args = mock_redis.execute_command.call_args_list[-1][0]
+        self.assertEqual(args[:2], ('XADD', 'pagure.hook'))
+        self.assertEqual(
+            json.loads(args[-1])['topic'], 'issue.tag.added')
 
         # Try a second time
         msg = pagure.lib.add_tag_obj(
@@ -2544,7 +2611,7 @@ class PagureLibtests(tests.Modeltests):
         mock_redis.return_value = True
 
         self.test_new_pull_request()
-        self.assertEqual(mock_redis.publish.call_count, 3)
+        self.assertEqual(mock_redis.publish.call_count, 0)
 
         # Let's pretend we turned on the CI hook for the project
         project = pagure.lib._get_project(self.session, 'test')
@@ -2576,7 +2643,12 @@ class PagureLibtests(tests.Modeltests):
         self.assertEqual(len(request.discussion), 0)
         self.assertEqual(len(request.comments), 1)
         self.assertEqual(request.score, 0)
-        self.assertEqual(mock_redis.publish.call_count, 7)
+        self.assertEqual(mock_redis.publish.call_count, 1)
+        # The CI build is queued
+        queued = [
+            call[0][1] for call in mock_redis.execute_command.call_args_list
+            if call[0][0] == 'XADD']
+        self.assertIn('pagure.ci', queued)
 
     @patch('pagure.lib.notify.send_email')
     def test_add_pull_request_flag(self, mockemail):
@@ -2781,6 +2853,66 @@ class PagureLibtests(tests.Modeltests):
         )
         self.assertEqual(len(prs), 1)
 
+    @patch('pagure.lib.notify.send_email', MagicMock(return_value=True))
+    def test_reset_status_pull_request(self):
+        """ Test reset_status_pull_request of pagure.lib. """
+        self.test_new_pull_request()
+
+        repo = pagure.lib._get_project(self.session, 'test')
+        forked_repo = pagure.lib._get_project(
+            self.session, 'test', user='pingou')
+        req = pagure.lib.new_pull_request(
+            session=self.session,
+            repo_from=forked_repo,
+            branch_from='feature',
+            repo_to=repo,
+            branch_to='devel',
+            title='test pull-request #2',
+            user='pingou',
+            requestfolder=None,
+        )
+        self.session.commit()
+        self.assertEqual(req.id, 2)
+
+        def set_status():
+            for request in repo.requests:
+                request.merge_status = 'MERGE'
+                self.session.add(request)
+            self.session.commit()
+
+        def get_status():
+            self.session.expire_all()
+            return [
+                request.merge_status
+                for request in sorted(repo.requests, key=lambda r: r.id)
+            ]
+
+        # Only the PRs against the branch that moved are reset
+        set_status()
+        output = pagure.lib.reset_status_pull_request(
+            self.session, repo, branches=['devel'])
+        self.assertEqual(output, [req.uid])
+        self.assertEqual(get_status(), ['MERGE', None])
+
+        # Or from it
+        set_status()
+        output = pagure.lib.reset_status_pull_request(
+            self.session, forked_repo, branches=['master'])
+        self.assertEqual(len(output), 1)
+        self.assertEqual(get_status(), [None, 'MERGE'])
+
+        # No branch moved
+        set_status()
+        output = pagure.lib.reset_status_pull_request(
+            self.session, repo, branches=[])
+        self.assertEqual(output, [])
+        self.assertEqual(get_status(), ['MERGE', 'MERGE'])
+
+        # All of them
+        output = pagure.lib.reset_status_pull_request(self.session, repo)
+        self.assertEqual(len(output), 2)
+        self.assertEqual(get_status(), [None, None])
+
     @patch('pagure.lib.REDIS', MagicMock(return_value=True))
     @patch('pagure.lib.git.update_git', MagicMock(return_value=True))
     @patch('pagure.lib.notify.send_email', MagicMock(return_value=True))
@@ -4982,7 +5114,9 @@ class PagureLibtests(tests.Modeltests):
             ('test123 test:key test456', {'test': 'key'}, 'test123 test456'),
             ('test123 test:"key with spaces" key2:value12 test456',
              {'test': 'key with spaces', 'key2': 'value12'},
-             'test123 test456')
+             'test123 test456'),
+            ('test123 "a phrase" test:key', {'test': 'key'},
+             'test123 "a phrase"'),
             ]
         for inp, flds, rem in tests:
             self.assertEqual(pagure.lib.tokenize_search_string(inp),
@@ -5663,7 +5797,7 @@ foo bar
             self.assertEqual(
                 msg, 'Custom field tested reset (from true)')
 
-        self.assertEqual(mock_redis.publish.call_count, 3)
+        self.assertEqual(mock_redis.publish.call_count, 2)
 
     @patch('pagure.lib.REDIS')
     def test_set_custom_key_value_boolean_private_issue(self, mock_redis):
@@ -5785,7 +5919,7 @@ foo bar
         self.assertEqual(
             msg, 'Custom field tested adjusted to Done (was: In progress)')
 
-        self.assertEqual(mock_redis.publish.call_count, 3)
+        self.assertEqual(mock_redis.publish.call_count, 2)
 
     def test_log_action_invalid(self):
         """ Test the log_action function of pagure.lib. """
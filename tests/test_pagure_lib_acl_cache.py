@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+"""
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import datetime
+import unittest
+import sys
+import os
+
+from mock import patch, MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pagure
+import pagure.lib
+import pagure.lib.acl_cache
+import tests
+
+
+@patch('pagure.lib.notify.send_email', MagicMock(return_value=True))
+class PagureLibAclCachetests(tests.Modeltests):
+    """ Tests for pagure.lib.acl_cache """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        super(PagureLibAclCachetests, self).setUp()
+        pagure.SESSION = self.session
+        pagure.lib.SESSION = self.session
+
+        tests.create_projects(self.session)
+        tests.create_tokens(self.session)
+        tests.create_tokens_acl(self.session, acl_name='issue_create')
+        self.repo = pagure.get_authorized_project(self.session, 'test')
+
+    @patch('pagure.lib.get_api_token', wraps=pagure.lib.get_api_token)
+    def test_get_api_token(self, get_api_token):
+        """ Test that the tokens are cached until they change. """
+        token = pagure.lib.acl_cache.get_api_token(
+            self.session, 'aaabbbcccddd')
+        self.assertEqual(token.acls_list, ['issue_create'])
+        self.assertEqual(token.user.username, 'pingou')
+        self.assertIs(token.project, self.repo)
+        self.assertFalse(token.expired)
+
+        token = pagure.lib.acl_cache.get_api_token(
+            self.session, 'aaabbbcccddd')
+        self.assertEqual(token.acls_list, ['issue_create'])
+        self.assertEqual(get_api_token.call_count, 1)
+
+        # Unknown tokens are not cached
+        self.assertIsNone(
+            pagure.lib.acl_cache.get_api_token(self.session, 'unknown'))
+        self.assertIsNone(
+            pagure.lib.acl_cache.get_api_token(self.session, 'unknown'))
+        self.assertEqual(get_api_token.call_count, 3)
+
+        # Adding an ACL to the token
+        tests.create_tokens_acl(self.session, acl_name='issue_comment')
+        token = pagure.lib.acl_cache.get_api_token(
+            self.session, 'aaabbbcccddd')
+        self.assertEqual(token.acls_list, ['issue_comment', 'issue_create'])
+        self.assertEqual(get_api_token.call_count, 4)
+
+        # Revoking the token
+        token_obj = pagure.lib.get_api_token(self.session, 'aaabbbcccddd')
+        token_obj.expiration = datetime.datetime.utcnow()
+        self.session.add(token_obj)
+        self.session.commit()
+        token = pagure.lib.acl_cache.get_api_token(
+            self.session, 'aaabbbcccddd')
+        self.assertTrue(token.expired)
+
+    def test_get_access_levels(self):
+        """ Test that the access of the users is cached until it changes.
+        """
+        self.assertEqual(
+            pagure.lib.acl_cache.get_access_levels('pingou', self.repo),
+            set(['owner']))
+        self.assertEqual(
+            pagure.lib.acl_cache.get_access_levels('foo', self.repo),
+            set())
+
+        with patch('pagure.lib.acl_cache._set') as set_cache:
+            self.assertEqual(
+                pagure.lib.acl_cache.get_access_levels('pingou', self.repo),
+                set(['owner']))
+            self.assertFalse(set_cache.called)
+
+        # Giving access to the project
+        pagure.lib.add_user_to_project(
+            self.session, self.repo, new_user='foo', user='pingou',
+            access='commit')
+        self.session.commit()
+        self.assertEqual(
+            pagure.lib.acl_cache.get_access_levels('foo', self.repo),
+            set(['commit']))
+        self.assertTrue(
+            pagure.lib.acl_cache.has_access('foo', self.repo, 'commit'))
+        self.assertFalse(
+            pagure.lib.acl_cache.has_access('foo', self.repo, 'admin'))
+
+        # Giving access via a group
+        msg = pagure.lib.add_group(
+            self.session,
+            group_name='admins',
+            display_name='admins group',
+            description=None,
+            group_type='bar',
+            user='foo',
+            is_admin=False,
+            blacklist=[],
+        )
+        self.assertEqual(msg, 'User `foo` added to the group `admins`.')
+        pagure.lib.add_group_to_project(
+            self.session, self.repo, new_group='admins', user='pingou',
+            access='admin')
+        self.session.commit()
+        self.assertTrue(
+            pagure.lib.acl_cache.has_access('foo', self.repo, 'admin'))
+
+    def test_read_only_mode(self):
+        """ Test that the access to a project is not cached across changes
+        of its read-only mode. """
+        pagure.lib.acl_cache.get_access_levels('pingou', self.repo)
+        pagure.lib.update_read_only_mode(
+            self.session, self.repo, read_only=not self.repo.read_only)
+        self.session.commit()
+
+        with patch('pagure.lib.acl_cache._set') as set_cache:
+            pagure.lib.acl_cache.get_access_levels('pingou', self.repo)
+            self.assertTrue(set_cache.called)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+"""
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import os
+import sys
+import unittest
+
+import pygit2
+from mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pagure.lib.commit_graph
+import tests
+
+
+class PagureLibCommitGraphtests(tests.SimplePagureTest):
+    """ Tests for pagure.lib.commit_graph """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        super(PagureLibCommitGraphtests, self).setUp()
+
+        self.gitpath = os.path.join(self.path, 'repos', 'test.git')
+        tests.add_commit_git_repo(self.gitpath, ncommits=3)
+        tests.add_commit_git_repo(
+            self.gitpath, ncommits=2, filename='feature', branch='feature')
+        tests.add_commit_git_repo(self.gitpath, ncommits=1)
+        self.repo_obj = pygit2.Repository(self.gitpath)
+        self.master = self.repo_obj.lookup_branch('master').get_object()
+        self.feature = self.repo_obj.lookup_branch('feature').get_object()
+
+    def test_update_commit_graph(self):
+        """ Test the update_commit_graph function. """
+        added = pagure.lib.commit_graph.update_commit_graph(self.repo_obj)
+        self.assertEqual(added, 6)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.gitpath, 'pagure-commit-graph.v2')))
+
+        # Nothing new
+        added = pagure.lib.commit_graph.update_commit_graph(self.repo_obj)
+        self.assertEqual(added, 0)
+
+        # A fresh index reads the same content from the disk
+        graph = pagure.lib.commit_graph.CommitGraph(self.gitpath)
+        graph.refresh()
+        self.assertEqual(len(graph), 6)
+        self.assertEqual(graph.get(self.feature.oid.hex)[0], 5)
+        self.assertEqual(graph.get(self.master.oid.hex)[0], 4)
+
+    def test_commit_time_range(self):
+        """ Test indexing commits dated before 1970 and after 2106. """
+        tree = self.master.tree.oid
+        parent = self.master.oid
+        for ctime in (-86400, 2 ** 32 + 1):
+            sig = pygit2.Signature(
+                'Alice Author', 'alice@authors.tld', ctime, 0)
+            parent = self.repo_obj.create_commit(
+                None, sig, sig, 'Commit at %s' % ctime, tree, [parent])
+        pagure.lib.commit_graph.update_commit_graph(
+            self.repo_obj, heads=[parent.hex])
+
+        graph = pagure.lib.commit_graph.CommitGraph(self.gitpath)
+        graph.refresh()
+        self.assertEqual(len(graph), 8)
+        self.assertEqual(graph.get(parent.hex)[1], 2 ** 32 + 1)
+        self.assertEqual(
+            graph.get(self.repo_obj[parent].parents[0].hex)[1], -86400)
+
+    @patch('pagure.lib.tasks.update_commit_graph')
+    def test_missing_commits(self, update):
+        """ Test that the commits missing from the index are not added to it
+        when it is used, but by a celery task. """
+        self.assertRaises(
+            KeyError, pagure.lib.commit_graph.merge_bases,
+            self.repo_obj, self.feature.oid.hex,
+            self.repo_obj, self.master.oid.hex)
+        self.assertRaises(
+            KeyError, pagure.lib.commit_graph.is_ancestor,
+            self.repo_obj, self.master.oid.hex, self.feature.oid.hex)
+        self.assertEqual(
+            len(pagure.lib.commit_graph.get_commit_graph(self.gitpath)), 0)
+
+        # The update of the index is only requested once per commit
+        update.delay.assert_called_once_with(
+            self.gitpath, [self.feature.oid.hex])
+
+    def test_graphs_bounded(self):
+        """ Test that only the most recently used indexes are kept in
+        memory. """
+        with patch.dict(
+                'pagure.APP.config', {'COMMIT_GRAPH_CACHE_SIZE': 1}):
+            graph = pagure.lib.commit_graph.get_commit_graph(self.gitpath)
+            self.assertIs(
+                pagure.lib.commit_graph.get_commit_graph(self.gitpath), graph)
+            pagure.lib.commit_graph.get_commit_graph(
+                os.path.join(self.path, 'repos', 'test2.git'))
+            self.assertIsNot(
+                pagure.lib.commit_graph.get_commit_graph(self.gitpath), graph)
+
+    def test_merge_bases_ahead_behind(self):
+        """ Test the merge_bases and ahead_behind functions. """
+        pagure.lib.commit_graph.update_commit_graph(self.repo_obj)
+        base = self.master.parents[0].oid.hex
+        bases = pagure.lib.commit_graph.merge_bases(
+            self.repo_obj, self.feature.oid.hex,
+            self.repo_obj, self.master.oid.hex)
+        self.assertEqual(bases, [base])
+
+        ahead, behind = pagure.lib.commit_graph.ahead_behind(
+            self.repo_obj, self.feature.oid.hex,
+            self.repo_obj, self.master.oid.hex)
+        self.assertEqual(
+            ahead,
+            [self.feature.oid.hex, self.feature.parents[0].oid.hex])
+        self.assertEqual(behind, [self.master.oid.hex])
+
+    def test_is_ancestor(self):
+        """ Test the is_ancestor function. """
+        pagure.lib.commit_graph.update_commit_graph(self.repo_obj)
+        base = self.master.parents[0].oid.hex
+        self.assertTrue(pagure.lib.commit_graph.is_ancestor(
+            self.repo_obj, base, self.feature.oid.hex))
+        self.assertFalse(pagure.lib.commit_graph.is_ancestor(
+            self.repo_obj, self.master.oid.hex, self.feature.oid.hex))
+        self.assertFalse(pagure.lib.commit_graph.is_ancestor(
+            self.repo_obj, self.feature.oid.hex, self.master.oid.hex))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+"""
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import datetime
+import os
+import sys
+import unittest
+
+import pygit2
+from mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pagure.lib.commit_stats
+import tests
+
+
+class PagureLibCommitStatstests(tests.SimplePagureTest):
+    """ Tests for pagure.lib.commit_stats """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        super(PagureLibCommitStatstests, self).setUp()
+
+        self.gitpath = os.path.join(self.path, 'repos', 'test.git')
+        tests.add_commit_git_repo(self.gitpath, ncommits=3)
+        self.repo_obj = pygit2.Repository(self.gitpath)
+
+    def test_update_stats(self):
+        """ Test the update_stats function. """
+        head = self.repo_obj.head.get_object().oid.hex
+        stats = pagure.lib.commit_stats.update_stats(self.repo_obj)
+        self.assertEqual(stats['head'], head)
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(
+            stats['authors'], [['Alice Author', 'alice@authors.tld', 3]])
+        self.assertEqual(
+            stats, pagure.lib.commit_stats.load_stats(self.gitpath))
+
+        # The head moved forward, only the new commits are processed
+        tests.add_commit_git_repo(self.gitpath, ncommits=2)
+        with patch('pagure.lib.commit_stats._add_commits',
+                   wraps=pagure.lib.commit_stats._add_commits) as add:
+            stats = pagure.lib.commit_stats.update_stats(self.repo_obj)
+            walker = add.call_args[0][1]
+        self.assertEqual(stats['count'], 5)
+        self.assertEqual(list(walker), [])
+
+        # Nothing new
+        with patch('pagure.lib.commit_stats._add_commits') as add:
+            stats = pagure.lib.commit_stats.update_stats(self.repo_obj)
+            self.assertFalse(add.called)
+        self.assertEqual(stats['count'], 5)
+
+    def test_update_stats_force_push(self):
+        """ Test the update_stats function when the history is rewritten.
+        """
+        pagure.lib.commit_stats.update_stats(self.repo_obj)
+
+        parent = self.repo_obj.head.get_object().parents[0]
+        self.repo_obj.lookup_reference('refs/heads/master').set_target(
+            parent.oid)
+
+        stats = pagure.lib.commit_stats.update_stats(self.repo_obj)
+        self.assertEqual(stats['head'], parent.oid.hex)
+        self.assertEqual(stats['count'], 2)
+
+    def test_get_author_stats(self):
+        """ Test the get_author_stats function. """
+        output = pagure.lib.commit_stats.get_author_stats(self.repo_obj)
+        self.assertEqual(output[0], 3)
+        self.assertEqual(
+            output[1], [(3, [('Alice Author', 'alice@authors.tld')])])
+        self.assertEqual(output[2], 1)
+        self.assertEqual(
+            output[3],
+            min(com.commit_time for com in self.repo_obj.walk(
+                self.repo_obj.head.target)))
+
+    def test_get_history_stats(self):
+        """ Test the get_history_stats function. """
+        output = pagure.lib.commit_stats.get_history_stats(self.repo_obj)
+        today = datetime.datetime.utcnow().date().isoformat()
+        self.assertEqual(output, [(today, 3)])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+"""
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import unittest
+import sys
+import os
+
+from mock import patch, MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pagure
+import pagure.lib
+import pagure.lib.fulltext
+import tests
+
+
+@patch('pagure.lib.notify.send_email', MagicMock(return_value=True))
+class PagureLibFulltexttests(tests.Modeltests):
+    """ Tests for pagure.lib.fulltext """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        super(PagureLibFulltexttests, self).setUp()
+
+        tests.create_projects(self.session)
+        self.repo = pagure.get_authorized_project(self.session, 'test')
+
+        for title, content in (
+                ('Crash on startup', 'The server does not start'),
+                ('Improve the documentation',
+                 'Document the startup of the server'),
+                ('Test issue ☃', 'Snowman')):
+            pagure.lib.new_issue(
+                session=self.session,
+                repo=self.repo,
+                title=title,
+                content=content,
+                user='pingou',
+                ticketfolder=None,
+            )
+        self.session.commit()
+
+    def _search(self, pattern, **kwargs):
+        issues = pagure.lib.search_issues(
+            self.session, self.repo, search_pattern=pattern, **kwargs)
+        return [issue.id for issue in issues]
+
+    def test_search_issues(self):
+        """ Test searching the title and the content of the issues. """
+        self.assertEqual(self._search('crash'), [1])
+        # The words may be incomplete
+        self.assertEqual(self._search('docu'), [2])
+        # The issues whose title match come first
+        self.assertEqual(self._search('startup'), [1, 2])
+        self.assertEqual(self._search('startup', order_key='id'), [2, 1])
+        self.assertEqual(
+            self._search('startup', order_key='id', order='asc'), [1, 2])
+        # All the words must match
+        self.assertEqual(self._search('server crash'), [1])
+        self.assertEqual(sorted(self._search('"the server"')), [1, 2])
+        self.assertEqual(self._search('"server the"'), [])
+        # Symbols are searched as is
+        self.assertEqual(self._search('☃'), [3])
+        self.assertEqual(self._search('foobar'), [])
+        self.assertEqual(
+            pagure.lib.search_issues(
+                self.session, self.repo, search_pattern='server',
+                count=True),
+            2)
+
+    def test_index_comments_and_edits(self):
+        """ Test that the index follows the changes made to the issues. """
+        issue = pagure.lib.search_issues(self.session, self.repo, issueid=3)
+        pagure.lib.add_issue_comment(
+            session=self.session,
+            issue=issue,
+            comment='Seen on the frobnicator too',
+            user='pingou',
+            ticketfolder=None,
+        )
+        self.session.commit()
+        self.assertEqual(self._search('frobnicator'), [3])
+
+        issue = pagure.lib.search_issues(self.session, self.repo, issueid=1)
+        pagure.lib.edit_issue(
+            self.session,
+            issue=issue,
+            ticketfolder=None,
+            user='pingou',
+            title='Segfault on startup',
+        )
+        self.session.commit()
+        self.assertEqual(self._search('crash'), [])
+        self.assertEqual(self._search('segfault'), [1])
+
+        # Issues of other projects are not returned
+        repo = pagure.get_authorized_project(self.session, 'test2')
+        self.assertEqual(
+            pagure.lib.search_issues(
+                self.session, repo, search_pattern='segfault'),
+            [])
+
+        # Removed issues are removed from the index
+        self.session.delete(issue)
+        self.session.commit()
+        self.assertEqual(
+            self.session.query(pagure.lib.model.SearchIndex).filter_by(
+                kind='issue').count(),
+            2)
+
+    def test_search_without_fts(self):
+        """ Test searching the issues when the database does not provide a
+        full-text index. """
+        with patch('pagure.lib.fulltext._has_fts', return_value=False):
+            self.assertEqual(self._search('startup'), [1, 2])
+            self.assertEqual(self._search('server crash'), [1])
+            self.assertEqual(self._search('foobar'), [])
+
+    def test_reindex_all(self):
+        """ Test re-building the whole index. """
+        self.session.query(pagure.lib.model.SearchIndex).delete()
+        self.session.commit()
+        self.assertEqual(self._search('server'), [])
+
+        pagure.lib.fulltext.reindex_all(self.session)
+        self.session.commit()
+        self.assertEqual(sorted(self._search('server')), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -21,6 +21,7 @@ import time
 import unittest
 
 import pygit2
+import redis
 from mock import patch, MagicMock
 
 sys.path.insert(0, os.path.join(os.path.dirname(
@@ -1788,6 +1789,202 @@ index 458821a..77674a8
         files = [entry.name for entry in commit.tree]
         self.assertEqual(files, [])
 
+    @patch.dict('pagure.APP.config', {'GIT_METADATA_IN_MEMORY': False})
+    def test_update_git_clone(self):
+        """ Test the update_git of pagure.lib.git using a clone of the
+        repo. """
+        self.test_update_git()
+
+    def test_commit_files_in_memory(self):
+        """ Test the _commit_files_in_memory method of pagure.lib.git. """
+        gitpath = os.path.join(self.path, 'tickets', 'test_in_memory.git')
+        gitrepo = pygit2.init_repository(gitpath, bare=True)
+
+        commit = pagure.lib.git._commit_files_in_memory(
+            gitpath, {'foo': 'bar', 'baz': 'qux'}, 'Add files')
+        self.assertIsNotNone(commit)
+        head = gitrepo.revparse_single('HEAD')
+        self.assertEqual(head.oid, commit)
+        self.assertEqual(head.parents, [])
+        self.assertEqual(
+            sorted(entry.name for entry in head.tree), ['baz', 'foo'])
+
+        # Same content: nothing to commit
+        commit = pagure.lib.git._commit_files_in_memory(
+            gitpath, {'foo': 'bar'}, 'Nothing changed')
+        self.assertIsNone(commit)
+        self.assertEqual(gitrepo.revparse_single('HEAD').oid, head.oid)
+
+        # Remove a file
+        commit = pagure.lib.git._commit_files_in_memory(
+            gitpath, {'baz': None}, 'Remove baz')
+        new_head = gitrepo.revparse_single('HEAD')
+        self.assertEqual(new_head.oid, commit)
+        self.assertEqual([p.oid for p in new_head.parents], [head.oid])
+        self.assertEqual([entry.name for entry in new_head.tree], ['foo'])
+
+    def test_update_git_batch(self):
+        """ Test the _update_git_batch method of pagure.lib.git. """
+        tests.create_projects(self.session)
+        gitpath = os.path.join(self.path, 'tickets', 'test.git')
+        gitrepo = pygit2.init_repository(gitpath, bare=True)
+
+        repo = pagure.get_authorized_project(self.session, 'test')
+        issues = []
+        for title in ['Test issue', 'Test issue #2']:
+            issues.append(pagure.lib.new_issue(
+                session=self.session,
+                repo=repo,
+                title=title,
+                content='We should work on this',
+                user='pingou',
+                ticketfolder=None,
+            ))
+        self.session.commit()
+
+        pagure.lib.git._update_git_batch(
+            issues, repo, os.path.join(self.path, 'tickets'))
+
+        # Both issues were committed at once
+        commit = gitrepo.revparse_single('HEAD')
+        self.assertEqual(commit.parents, [])
+        self.assertEqual(
+            sorted(entry.name for entry in commit.tree),
+            sorted(issue.uid for issue in issues))
+        self.assertTrue(commit.message.startswith('Updated 2 issues\n'))
+
+    @patch.dict('pagure.APP.config', {'GIT_METADATA_BATCH_DELAY': 5})
+    @patch('pagure.lib.tasks.batch_update_git')
+    def test_batch_update_git_queue(self, task):
+        """ Test queuing the updates of the git repos and taking them out of
+        the queue. """
+        tests.create_projects(self.session)
+        repo = pagure.get_authorized_project(self.session, 'test')
+        # The broker of the tests is a redis server
+        pagure.lib.REDIS = redis.StrictRedis(
+            unix_socket_path=os.path.join(self.path, 'broker'))
+        self.addCleanup(setattr, pagure.lib, 'REDIS', None)
+        key = pagure.lib.git._get_batch_update_key('issue', repo)
+
+        def queue(uid):
+            obj = MagicMock(isa='issue', uid=uid)
+            return pagure.lib.git._queue_batch_update_git(obj, repo)
+
+        # Only the first update schedules a task
+        self.assertIsNotNone(queue('b'))
+        self.assertIsNone(queue('a'))
+        self.assertIsNone(queue('b'))
+        task.apply_async.assert_called_once_with(
+            args=('test', None, None, 'issue'), countdown=5)
+
+        with pagure.lib.git._take_batch_update_git('issue', repo) as uids:
+            self.assertEqual(uids, ['a', 'b'])
+            self.assertEqual(pagure.lib.REDIS.smembers(key), set())
+            # An update arriving in the mean time schedules a new task
+            self.assertIsNotNone(queue('c'))
+        self.assertEqual(task.apply_async.call_count, 2)
+
+        # The updates are put back in the queue if the git repo could not
+        # be updated
+        with self.assertRaises(pygit2.GitError):
+            with pagure.lib.git._take_batch_update_git(
+                    'issue', repo) as uids:
+                self.assertEqual(uids, ['c'])
+                raise pygit2.GitError('Could not write the commit')
+        self.assertEqual(pagure.lib.REDIS.smembers(key), set(['c']))
+        self.assertEqual(task.apply_async.call_count, 3)
+
+        # Until they are
+        with pagure.lib.git._take_batch_update_git('issue', repo) as uids:
+            self.assertEqual(uids, ['c'])
+        self.assertEqual(pagure.lib.REDIS.smembers(key), set())
+        self.assertEqual(task.apply_async.call_count, 3)
+
+    def test_set_ref_if_unchanged(self):
+        """ Test the _set_ref_if_unchanged method of pagure.lib.git. """
+        gitpath = os.path.join(self.path, 'tickets', 'test_in_memory.git')
+        gitrepo = pygit2.init_repository(gitpath, bare=True)
+        first = pagure.lib.git._commit_files_in_memory(
+            gitpath, {'foo': 'bar'}, 'Add foo')
+        second = pagure.lib.git._commit_files_in_memory(
+            gitpath, {'foo': 'baz'}, 'Update foo')
+
+        # The ref does not point to the expected commit: no update
+        self.assertFalse(pagure.lib.git._set_ref_if_unchanged(
+            gitrepo, 'refs/heads/master', first, None))
+        self.assertEqual(gitrepo.revparse_single('HEAD').oid, second)
+
+        self.assertTrue(pagure.lib.git._set_ref_if_unchanged(
+            gitrepo, 'refs/heads/master', first, second))
+        self.assertEqual(gitrepo.revparse_single('HEAD').oid, first)
+
+        # The reference is locked while it is updated
+        lockfile = os.path.join(gitpath, 'refs', 'heads', 'master.lock')
+        open(lockfile, 'w').close()
+        self.assertFalse(pagure.lib.git._set_ref_if_unchanged(
+            gitrepo, 'refs/heads/master', second, first))
+        os.unlink(lockfile)
+        self.assertEqual(gitrepo.revparse_single('HEAD').oid, first)
+
+        # Creating a reference which does not exist yet
+        self.assertTrue(pagure.lib.git._set_ref_if_unchanged(
+            gitrepo, 'refs/heads/feature', second, None))
+        self.assertEqual(
+            gitrepo.revparse_single('feature').oid, second)
+
+    def test_log_commits(self):
+        """ Test the log_commits method of pagure.lib.git. """
+        gitpath = os.path.join(self.path, 'tickets', 'test_log.git')
+        gitrepo = pygit2.init_repository(gitpath, bare=True)
+        commits = []
+        for idx in range(5):
+            commits.append(pagure.lib.git._commit_files_in_memory(
+                gitpath, {'foo': 'bar%s' % idx}, 'Commit %s' % idx).hex)
+        commits.reverse()
+
+        output = pagure.lib.git.log_commits(gitrepo, commits[0])
+        self.assertEqual([com.oid.hex for com in output], commits)
+
+        output = pagure.lib.git.log_commits(
+            gitrepo, commits[0], offset=2, limit=2)
+        self.assertEqual([com.oid.hex for com in output], commits[2:4])
+
+        output = pagure.lib.git.log_commits(
+            gitrepo, commits[0], offset=4, limit=2)
+        self.assertEqual([com.oid.hex for com in output], commits[4:])
+
+        output = pagure.lib.git.log_commits(
+            gitrepo, commits[0], emails=set(['foo@bar.com']))
+        self.assertEqual(output, [])
+
+    def test_count_commits(self):
+        """ Test the count_commits method of pagure.lib.git. """
+        gitpath = os.path.join(self.path, 'tickets', 'test_count.git')
+        gitrepo = pygit2.init_repository(gitpath, bare=True)
+        for idx in range(3):
+            head = pagure.lib.git._commit_files_in_memory(
+                gitpath, {'foo': 'bar%s' % idx}, 'Commit %s' % idx).hex
+
+        self.assertEqual(
+            pagure.lib.git.count_commits(gitrepo, head, 'master'), 3)
+        self.assertEqual(
+            pagure.lib.git.count_commits(
+                gitrepo, head, 'master', emails=set(['pagure'])), 3)
+        self.assertEqual(
+            pagure.lib.git.count_commits(
+                gitrepo, head, 'master', emails=set(['foo@bar.com'])), 0)
+
+        # The branch moved forward, only the new commits are counted
+        for idx in range(2):
+            head = pagure.lib.git._commit_files_in_memory(
+                gitpath, {'foo': 'baz%s' % idx}, 'Commit %s' % idx).hex
+        with patch('pagure.lib.git._count_commits_between',
+                   wraps=pagure.lib.git._count_commits_between) as count:
+            self.assertEqual(
+                pagure.lib.git.count_commits(gitrepo, head, 'master'), 5)
+            self.assertEqual(count.call_count, 1)
+            self.assertIsNotNone(count.call_args[1]['hide'])
+
     @patch('pagure.lib.notify.send_email')
     def test_update_git_requests(self, email_f):
         """ Test the update_git of pagure.lib.git for pull-requests. """
@@ -2302,6 +2499,89 @@ index 0000000..60f7480
         self.assertEqual(repo.issues[1].milestone, 'Future')
         self.assertEqual(repo.milestones, {'Future': None, 'Next Release': None})
 
+    def test_update_tickets_from_git(self):
+        """ Test the update_tickets_from_git method from pagure.lib.git. """
+        tests.create_projects(self.session)
+
+        repo = pagure.get_authorized_project(self.session, 'test')
+        # Set some priorities to the project
+        repo.priorities = {'1': 'High', '2': 'Normal'}
+        self.session.add(repo)
+        self.session.commit()
+
+        def _data(title, **kwargs):
+            data = {
+                "status": "Open", "title": title, "comments": [],
+                "content": "bar", "date_created": "1426500263",
+                "user": {
+                    "name": "pingou", "emails": ["pingou@fedoraproject.org"]},
+            }
+            data.update(kwargs)
+            return data
+
+        comment = {
+            "comment": "Nice", "date_created": "1426595340",
+            "user": {
+                "fullname": "Ralph Bean",
+                "name": "ralph",
+                "default_email": "ralph@fedoraproject.org",
+                "emails": ["ralph@fedoraproject.org"]
+            }
+        }
+        tickets = [
+            ('foobar1', _data('foo1', comments=[comment])),
+            ('foobar2', _data('foo2', priority=1, tags=['tag1'])),
+            ('foobar3', _data('foo3', assignee={
+                "name": "foo", "emails": ["foo@bar.com"]})),
+        ]
+
+        with patch.object(
+                self.session, 'commit', wraps=self.session.commit) as commit:
+            results = list(pagure.lib.git.update_tickets_from_git(
+                self.session, reponame='test', namespace=None, username=None,
+                tickets=tickets, agent='pingou', batch_size=2,
+            ))
+        self.assertEqual(
+            results,
+            [[('foobar1', None), ('foobar2', None)], [('foobar3', None)]])
+        # Each batch is committed once
+        self.assertEqual(commit.call_count, 2)
+
+        issues = dict((issue.uid, issue) for issue in repo.issues)
+        self.assertEqual(
+            sorted(issues), ['foobar1', 'foobar2', 'foobar3'])
+        self.assertEqual(issues['foobar1'].title, 'foo1')
+        self.assertEqual(len(issues['foobar1'].comments), 1)
+        self.assertEqual(issues['foobar1'].comments[0].user.user, 'ralph')
+        self.assertEqual(issues['foobar2'].priority, 1)
+        self.assertEqual(issues['foobar2'].tags_text, ['tag1'])
+        self.assertEqual(issues['foobar3'].assignee.user, 'foo')
+
+        # Loading the same comment again does not duplicate it, and the
+        # load stops at the first issue failing
+        tickets = [
+            ('foobar1', _data('bar1', comments=[comment])),
+            ('foobar4', _data('foo4', priority=3)),
+            ('foobar3', _data('bar3')),
+        ]
+        results = list(pagure.lib.git.update_tickets_from_git(
+            self.session, reponame='test', namespace=None, username=None,
+            tickets=tickets, agent='pingou',
+        ))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][0], ('foobar1', None))
+        self.assertEqual(results[0][1][0], 'foobar4')
+        self.assertIsInstance(
+            results[0][1][1], pagure.exceptions.PagureException)
+        self.assertEqual(len(results[0]), 2)
+
+        issues = dict((issue.uid, issue) for issue in repo.issues)
+        self.assertEqual(
+            sorted(issues), ['foobar1', 'foobar2', 'foobar3'])
+        self.assertEqual(issues['foobar1'].title, 'bar1')
+        self.assertEqual(len(issues['foobar1'].comments), 1)
+        self.assertEqual(issues['foobar3'].title, 'foo3')
+
     def test_update_request_from_git(self):
         """ Test the update_request_from_git method from pagure.lib.git. """
         tests.create_projects(self.session)
@@ -2814,6 +3094,96 @@ index 0000000..60f7480
             output = pagure.lib.git.get_author(githash, gitrepo)
             self.assertEqual(output, 'pagure')
 
+    def test_read_commits(self):
+        """ Test the read_commits method of pagure.lib.git. """
+
+        self.test_update_git()
+
+        gitrepo = os.path.join(self.path, 'tickets', 'test_ticket_repo.git')
+        output = pagure.lib.git.read_git_lines(
+            ['log', '-3', "--pretty='%H %s'"], gitrepo)
+        self.assertEqual(len(output), 2)
+        commits = [line.replace("'", '').split(' ', 1) for line in output]
+
+        # Unknown commits are skipped
+        infos = list(pagure.lib.git.read_commits(
+            gitrepo, [githash for githash, _ in commits] + ['0' * 40],
+            paths=True))
+        self.assertEqual(len(infos), 2)
+        for info, (githash, subject) in zip(infos, commits):
+            self.assertEqual(info.commit, githash)
+            self.assertEqual(info.author, 'pagure')
+            self.assertEqual(info.subject, subject)
+            self.assertEqual(
+                info.paths,
+                pagure.lib.git.read_git_lines(
+                    ['diff-tree', '--no-commit-id', '--name-only', '-r',
+                     githash], gitrepo))
+        self.assertEqual(infos[0].parents, [commits[1][0]])
+        self.assertEqual(infos[1].parents, [])
+        self.assertEqual(infos[1].paths, [])
+
+        # All the files of a root commit are only listed when asked for
+        info = next(pagure.lib.git.read_commits(
+            gitrepo, [commits[1][0]], paths=True, root=True))
+        self.assertEqual(
+            info.paths,
+            pagure.lib.git.read_git_lines(
+                ['diff-tree', '--no-commit-id', '--name-only', '-r',
+                 '--root', commits[1][0]], gitrepo))
+        self.assertNotEqual(info.paths, [])
+
+        # Nor are the paths changed by a merge commit
+        repo = pygit2.Repository(gitrepo)
+        author = pygit2.Signature('Alice Author', 'alice@authors.tld')
+        merge = repo.create_commit(
+            None, author, author, 'Merge', repo[commits[1][0]].tree.oid,
+            [repo[commits[0][0]].oid, repo[commits[1][0]].oid])
+        info = next(pagure.lib.git.read_commits(
+            gitrepo, [merge.hex], paths=True, root=True))
+        self.assertEqual(len(info.parents), 2)
+        self.assertEqual(info.paths, [])
+
+        # The changed paths are only retrieved when asked for
+        info = next(pagure.lib.git.read_commits(gitrepo, [commits[0][0]]))
+        self.assertIsNone(info.paths)
+
+    def test_get_changed_paths(self):
+        """ Test the get_changed_paths and read_blobs methods of
+        pagure.lib.git. """
+
+        self.test_update_git()
+
+        gitrepo = os.path.join(self.path, 'tickets', 'test_ticket_repo.git')
+        output = pagure.lib.git.read_git_lines(
+            ['log', '-3', "--pretty='%H'"], gitrepo)
+        commits = [githash.replace("'", '') for githash in output]
+
+        paths = pagure.lib.git.get_changed_paths(gitrepo, commits)
+        self.assertEqual(
+            paths,
+            set(pagure.lib.git.read_git_lines(
+                ['ls-tree', '--name-only', '-r', 'HEAD'], gitrepo)))
+        self.assertEqual(
+            pagure.lib.git.get_changed_paths(gitrepo, commits[:1]),
+            set(pagure.lib.git.read_git_lines(
+                ['diff-tree', '--no-commit-id', '--name-only', '-r',
+                 commits[0]], gitrepo)))
+
+        blobs = list(pagure.lib.git.read_blobs(
+            gitrepo, sorted(paths) + ['unknown']))
+        self.assertEqual(len(blobs), len(paths) + 1)
+        self.assertEqual(blobs[-1], ('unknown', None, None))
+        for path, blob_id, data in blobs[:-1]:
+            self.assertEqual(
+                blob_id,
+                pagure.lib.git.read_git_lines(
+                    ['rev-parse', 'HEAD:%s' % path], gitrepo)[0])
+            self.assertEqual(
+                data,
+                ''.join(pagure.lib.git.read_git_lines(
+                    ['show', 'HEAD:%s' % path], gitrepo, keepends=True)))
+
     def get_author_email(self):
         """ Test the get_author_email method of pagure.lib.git. """
 
@@ -2985,6 +3355,150 @@ index 0000000..60f7480
         custom_fields_of_issue = updated_issue.to_json().get('custom_fields')
         self.assertEqual(custom_fields_of_issue, custom_fields)
 
+    @staticmethod
+    def _create_commit(repo, files, parents, ref=None):
+        """ Create a commit containing the specified files in the specified
+        bare git repo and return its hash. """
+        builder = repo.TreeBuilder()
+        for filename, content in sorted(files.items()):
+            builder.insert(
+                filename, repo.create_blob(content),
+                pygit2.GIT_FILEMODE_BLOB)
+        author = pygit2.Signature('Alice Author', 'alice@authors.tld')
+        return repo.create_commit(
+            ref, author, author, 'Commit', builder.write(), parents).hex
+
+    def test_compute_merge_status(self):
+        """ Test the compute_merge_status function. """
+        gitrepo = os.path.join(self.path, 'repos', 'test.git')
+        repo = pygit2.init_repository(gitrepo, bare=True)
+
+        base = self._create_commit(repo, {'sources': 'foo\n'}, [])
+        ahead = self._create_commit(
+            repo, {'sources': 'foo\nbar\n'}, [base])
+        other = self._create_commit(
+            repo, {'sources': 'foo\n', 'other': 'baz\n'}, [base])
+        conflict = self._create_commit(
+            repo, {'sources': 'foo\nbaz\n'}, [base])
+
+        self.assertEqual(
+            pagure.lib.git.compute_merge_status(repo, base, base),
+            ('NO_CHANGE', []))
+        self.assertEqual(
+            pagure.lib.git.compute_merge_status(repo, ahead, base),
+            ('NO_CHANGE', []))
+        self.assertEqual(
+            pagure.lib.git.compute_merge_status(repo, base, ahead),
+            ('FFORWARD', []))
+        self.assertEqual(
+            pagure.lib.git.compute_merge_status(repo, ahead, other),
+            ('MERGE', []))
+        self.assertEqual(
+            pagure.lib.git.compute_merge_status(repo, ahead, conflict),
+            ('CONFLICTS', ['sources']))
+
+        # Nothing was written to the repo
+        self.assertEqual(repo.listall_references(), [])
+
+    @patch('pagure.lib.notify.send_email')
+    def test_get_merge_status_cached(self, email_f):
+        """ Test that get_merge_status only computes the merge status again
+        when the pull-request or its target branch changed. """
+        email_f.return_value = True
+        tests.create_projects(self.session)
+        gitrepo = os.path.join(self.path, 'repos', 'test.git')
+        repo = pygit2.init_repository(gitrepo, bare=True)
+
+        base = self._create_commit(
+            repo, {'sources': 'foo\n'}, [], ref='refs/heads/master')
+        feature = self._create_commit(
+            repo, {'sources': 'foo\nbar\n'}, [base],
+            ref='refs/heads/feature')
+
+        project = pagure.get_authorized_project(self.session, 'test')
+        req = pagure.lib.new_pull_request(
+            session=self.session,
+            repo_from=project,
+            branch_from='feature',
+            repo_to=project,
+            branch_to='master',
+            title='PR from the feature branch',
+            user='pingou',
+            requestfolder=None,
+        )
+        self.session.commit()
+
+        output = pagure.lib.git.get_merge_status(self.session, req)
+        self.assertEqual(output, ('FFORWARD', []))
+        self.assertEqual(req.merge_status, 'FFORWARD')
+        self.assertEqual(req.merge_status_commit, feature)
+        self.assertEqual(req.merge_status_target, base)
+
+        with patch('pagure.lib.git.compute_merge_status') as compute:
+            output = pagure.lib.git.get_merge_status(self.session, req)
+            self.assertFalse(compute.called)
+        self.assertEqual(output, ('FFORWARD', []))
+
+        # The target branch moved
+        master = self._create_commit(
+            repo, {'sources': 'foo\nbaz\n'}, [base],
+            ref='refs/heads/master')
+        output = pagure.lib.git.get_merge_status(self.session, req)
+        self.assertEqual(output, ('CONFLICTS', ['sources']))
+        self.assertEqual(req.merge_status_target, master)
+        self.assertEqual(req.merge_conflicts, ['sources'])
+
+    @patch('pagure.lib.notify.send_email')
+    @patch('pagure.lib.git.update_git')
+    def test_merge_pull_request_in_memory(self, email_f, up_git):
+        """ Test that merge_pull_request merges in the bare repo without
+        cloning it. """
+        email_f.return_value = True
+        up_git.return_value = True
+        tests.create_projects(self.session)
+        gitrepo = os.path.join(self.path, 'repos', 'test.git')
+        repo = pygit2.init_repository(gitrepo, bare=True)
+
+        base = self._create_commit(
+            repo, {'sources': 'foo\n'}, [], ref='refs/heads/master')
+        feature = self._create_commit(
+            repo, {'sources': 'foo\nbar\n'}, [base],
+            ref='refs/heads/feature')
+        master = self._create_commit(
+            repo, {'sources': 'foo\n', 'other': 'baz\n'}, [base],
+            ref='refs/heads/master')
+
+        project = pagure.get_authorized_project(self.session, 'test')
+        req = pagure.lib.new_pull_request(
+            session=self.session,
+            repo_from=project,
+            branch_from='feature',
+            repo_to=project,
+            branch_to='master',
+            title='PR from the feature branch',
+            user='pingou',
+            requestfolder=None,
+        )
+        self.session.commit()
+
+        with patch('tempfile.mkdtemp') as mkdtemp:
+            output = pagure.lib.git.merge_pull_request(
+                self.session,
+                request=req,
+                username='pingou',
+                request_folder=None)
+            self.assertFalse(mkdtemp.called)
+        self.assertEqual(output, 'Changes merged!')
+        self.assertEqual(req.status, 'Merged')
+
+        head = repo.lookup_reference('refs/heads/master').get_object()
+        self.assertEqual(head.message, 'Merge #1 `PR from the feature branch`')
+        self.assertEqual(
+            [parent.oid.hex for parent in head.parents], [master, feature])
+        self.assertEqual(
+            sorted(entry.name for entry in head.tree), ['other', 'sources'])
+        self.assertEqual(repo[head.tree['sources'].oid].data, 'foo\nbar\n')
+
     @patch('pagure.lib.notify.send_email')
     @patch('pagure.lib.git.update_git')
     def test_merge_pull_request_no_master(self, email_f, up_git):
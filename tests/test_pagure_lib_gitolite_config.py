@@ -931,5 +931,182 @@ repo requests/somenamespace/test3
         self.assertEqual(data, exp)
 
 
+@patch.dict('pagure.APP.config', {'GITOLITE_FRAGMENTS_FOLDER': 'pagure'})
+class PagureLibGitoliteFragmentsConfigtests(tests.Modeltests):
+    """ Tests for generating the gitolite configuration using one file per
+    project
+
+    """
+
+    maxDiff = None
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        super(PagureLibGitoliteFragmentsConfigtests, self).setUp()
+
+        pagure.lib.git.SESSION = self.session
+        tests.create_projects(self.session)
+
+        pagure.lib.add_group(
+            self.session,
+            group_name='grp',
+            display_name='grp group',
+            description=None,
+            group_type='user',
+            user='pingou',
+            is_admin=False,
+            blacklist=[],
+        )
+        self.session.commit()
+
+        self.outputconf = os.path.join(self.path, 'test_gitolite.conf')
+        self.fragments = os.path.join(self.path, 'pagure')
+        self.helper = pagure.lib.git_auth.get_git_auth_helper('gitolite3')
+
+    def _read(self, *path):
+        with open(os.path.join(self.path, *path)) as stream:
+            return stream.read().decode('utf-8')
+
+    def test_write_gitolite_all_projects(self):
+        """ Test the write_gitolite_acls function when refreshing all the
+        projects. """
+        changed = self.helper.write_gitolite_acls(
+            self.session,
+            self.outputconf,
+            project=-1,
+        )
+        self.assertTrue(changed)
+
+        self.assertEqual(
+            self._read('test_gitolite.conf'),
+            u'include "pagure/groups.conf"\n'
+            u'include "pagure/index.conf"\n'
+            u'# end of body\n'
+        )
+        self.assertEqual(
+            self._read('pagure', 'groups.conf'), u'@grp  = pingou\n')
+        self.assertEqual(
+            self._read('pagure', 'index.conf'),
+            u'include "pagure/projects/1.conf"\n'
+            u'include "pagure/projects/2.conf"\n'
+            u'include "pagure/projects/3.conf"\n'
+        )
+        self.assertEqual(
+            self._read('pagure', 'projects', '1.conf'),
+            u"""repo test
+  R   = @all
+  RW+ = pingou
+
+repo docs/test
+  R   = @all
+  RW+ = pingou
+
+repo tickets/test
+  RW+ = pingou
+
+repo requests/test
+  RW+ = pingou
+""")
+
+        # Nothing changed
+        changed = self.helper.write_gitolite_acls(
+            self.session,
+            self.outputconf,
+            project=-1,
+        )
+        self.assertFalse(changed)
+
+    def test_write_gitolite_one_project(self):
+        """ Test the write_gitolite_acls function when refreshing a single
+        project. """
+        self.helper.write_gitolite_acls(
+            self.session, self.outputconf, project=-1)
+        mtime = os.stat(
+            os.path.join(self.fragments, 'projects', '2.conf')).st_mtime
+
+        project = pagure.lib._get_project(self.session, 'test')
+        changed = self.helper.write_gitolite_acls(
+            self.session, self.outputconf, project=project)
+        self.assertFalse(changed)
+
+        project.private = True
+        self.session.add(project)
+        self.session.commit()
+        changed = self.helper.write_gitolite_acls(
+            self.session, self.outputconf, project=project)
+        self.assertTrue(changed)
+        self.assertNotIn(
+            '@all', self._read('pagure', 'projects', '1.conf'))
+
+        # The other projects were left untouched
+        self.assertEqual(
+            os.stat(os.path.join(
+                self.fragments, 'projects', '2.conf')).st_mtime,
+            mtime)
+
+    def test_write_gitolite_renamed_project(self):
+        """ Test the write_gitolite_acls function when refreshing a project
+        which was renamed. """
+        self.helper.write_gitolite_acls(
+            self.session, self.outputconf, project=-1)
+
+        project = pagure.lib._get_project(self.session, 'test')
+        project.name = 'test_renamed'
+        self.session.add(project)
+        self.session.commit()
+        changed = self.helper.write_gitolite_acls(
+            self.session, self.outputconf, project=project)
+        self.assertTrue(changed)
+
+        # The project keeps its file, no stale configuration is left over
+        config = self._read('pagure', 'projects', '1.conf')
+        self.assertIn('repo test_renamed\n', config)
+        self.assertNotIn('repo test\n', config)
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.fragments, 'projects'))),
+            ['1.conf', '2.conf', '3.conf'])
+        self.assertEqual(
+            self._read('pagure', 'index.conf'),
+            u'include "pagure/projects/1.conf"\n'
+            u'include "pagure/projects/2.conf"\n'
+            u'include "pagure/projects/3.conf"\n'
+        )
+
+    @patch('pagure.lib.git_auth.subprocess.Popen')
+    def test_generate_acls_unchanged(self, popen):
+        """ Test that the configuration is not re-compiled if it did not
+        change. """
+        self.helper.write_gitolite_acls(
+            self.session, self.outputconf, project=-1)
+
+        config = {
+            'GITOLITE_CONFIG': self.outputconf,
+            'GITOLITE_HOME': '/tmp',
+        }
+        project = pagure.lib._get_project(self.session, 'test')
+        with patch.dict('pagure.APP.config', config):
+            with patch('pagure.SESSION', self.session):
+                self.helper.generate_acls(project=project)
+        self.assertFalse(popen.called)
+
+    def test_remove_acls(self):
+        """ Test the remove_acls function when using one file per project.
+        """
+        pagure.APP.config['GITOLITE_CONFIG'] = self.outputconf
+        self.helper.write_gitolite_acls(
+            self.session, self.outputconf, project=-1)
+
+        project = pagure.lib._get_project(self.session, 'test')
+        self.helper.remove_acls(self.session, project=project)
+
+        self.assertFalse(os.path.exists(
+            os.path.join(self.fragments, 'projects', '1.conf')))
+        self.assertEqual(
+            self._read('pagure', 'index.conf'),
+            u'include "pagure/projects/2.conf"\n'
+            u'include "pagure/projects/3.conf"\n'
+        )
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+"""
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import datetime
+import unittest
+import sys
+import os
+
+from mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pagure
+import pagure.lib
+import pagure.lib.history_stats
+import tests
+
+
+class PagureLibHistoryStatstests(tests.Modeltests):
+    """ Tests for pagure.lib.history_stats """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        super(PagureLibHistoryStatstests, self).setUp()
+
+        tests.create_projects(self.session)
+        self.repo = pagure.get_authorized_project(self.session, 'test')
+        self.now = datetime.datetime.utcnow()
+
+        # (days ago created, days ago closed or None, status)
+        tickets = [
+            (400, None, 'Open'),
+            (100, 50, 'Closed'),
+            (30, None, 'Open'),
+            (20, 10, 'Closed'),
+            (5, None, 'Closed'),
+        ]
+        for idx, (created, closed, status) in enumerate(tickets):
+            issue = pagure.lib.model.Issue(
+                id=idx + 1,
+                project_id=self.repo.id,
+                title='Issue #%s' % (idx + 1),
+                content='Ticket content',
+                user_id=1,
+                uid='issue%s' % idx,
+                status=status,
+                date_created=self.now - datetime.timedelta(days=created),
+            )
+            if closed is not None:
+                issue.closed_at = self.now - datetime.timedelta(days=closed)
+            self.session.add(issue)
+        self.session.commit()
+
+    def test_compute_history_stats(self):
+        """ Test the compute_history_stats function. """
+        output = pagure.lib.history_stats.compute_history_stats(
+            self.session, pagure.lib.model.Issue, self.repo.id,
+            now=self.now)
+        self.assertEqual(len(output), 53)
+
+        tomorrow = self.now + datetime.timedelta(days=1)
+        week = lambda idx: (
+            tomorrow - datetime.timedelta(days=idx * 7)).isoformat()
+        # The closed ticket without closed_at date is ignored
+        self.assertEqual(output[week(0)], 1)
+        self.assertEqual(output[week(2)], 2)
+        self.assertEqual(output[week(5)], 0)
+        self.assertEqual(output[week(8)], 1)
+        self.assertEqual(output[week(15)], 0)
+        self.assertEqual(output[week(52)], 0)
+
+        output = pagure.lib.history_stats.compute_history_stats(
+            self.session, pagure.lib.model.PullRequest, self.repo.id,
+            now=self.now)
+        self.assertEqual(set(output.values()), set([0]))
+
+    def test_issues_history_stats_memoized(self):
+        """ Test that issues_history_stats is memoized until the status of
+        an issue changes. """
+        output = pagure.lib.issues_history_stats(self.session, self.repo)
+        self.assertEqual(sorted(output.values())[-1], 2)
+
+        with patch('pagure.lib.history_stats.compute_history_stats') as comp:
+            output2 = pagure.lib.issues_history_stats(
+                self.session, self.repo)
+            self.assertFalse(comp.called)
+        self.assertEqual(output, output2)
+
+        issue = pagure.lib.search_issues(self.session, self.repo, issueid=3)
+        issue.status = 'Closed'
+        issue.closed_at = self.now
+        self.session.add(issue)
+        self.session.commit()
+
+        output = pagure.lib.issues_history_stats(self.session, self.repo)
+        self.assertNotEqual(output, output2)
+
+    def test_history_stats_cache_bounded(self):
+        """ Test that the histories cached in process expire and that the
+        least recently used are dropped first. """
+        config = {
+            'HISTORY_STATS_CACHE_SIZE': 1, 'HISTORY_STATS_CACHE_TTL': 60}
+        pagure.lib.history_stats._CACHE.clear()
+        with patch.dict('pagure.APP.config', config), \
+                patch('pagure.lib.history_stats.time.time', return_value=0):
+            pagure.lib.issues_history_stats(self.session, self.repo)
+            pagure.lib.pull_requests_history_stats(self.session, self.repo)
+            self.assertEqual(len(pagure.lib.history_stats._CACHE), 1)
+
+            with patch('pagure.lib.history_stats.compute_history_stats',
+                       return_value={}) as comp:
+                pagure.lib.pull_requests_history_stats(self.session, self.repo)
+                self.assertFalse(comp.called)
+                pagure.lib.issues_history_stats(self.session, self.repo)
+                self.assertTrue(comp.called)
+
+        with patch.dict('pagure.APP.config', config), \
+                patch('pagure.lib.history_stats.time.time', return_value=61), \
+                patch('pagure.lib.history_stats.compute_history_stats',
+                      return_value={}) as comp:
+            pagure.lib.issues_history_stats(self.session, self.repo)
+            self.assertTrue(comp.called)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
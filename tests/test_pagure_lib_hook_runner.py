@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+"""
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import base64
+import imp
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import unittest
+
+from mock import patch
+import six
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pagure
+import pagure.lib.hook_runner
+
+
+HOOK = '''
+import os
+import sys
+
+for line in sys.stdin:
+    print('%s %s %s' % (sys.argv[1:], os.environ['GL_USER'], line.strip()))
+sys.stderr.write('Running in %s\\n' % os.getcwd())
+sys.exit(int(os.environ.get('HOOK_STATUS', 0)))
+'''
+
+
+class PagureLibHookRunnertests(unittest.TestCase):
+    """ Tests for pagure.lib.hook_runner """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        self.path = tempfile.mkdtemp(prefix='pagure-tests-hooks')
+        self.files = os.path.join(self.path, 'files')
+        self.repo = os.path.join(self.path, 'test.git')
+        os.makedirs(self.files)
+        os.makedirs(os.path.join(self.repo, 'hooks'))
+
+        with open(os.path.join(self.files, 'hook.py'), 'w') as stream:
+            stream.write(HOOK)
+        for name in ('post-receive.a', 'post-receive.b'):
+            os.symlink(
+                os.path.join(self.files, 'hook.py'),
+                os.path.join(self.repo, 'hooks', name))
+        os.chmod(os.path.join(self.files, 'hook.py'), 0o755)
+        # Not executable, so disabled
+        open(os.path.join(self.repo, 'hooks', 'post-receive.c'), 'w').close()
+
+        patcher = patch(
+            'pagure.lib.hook_runner.HOOKS_FOLDER', self.files)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """ Remove the test folder. """
+        shutil.rmtree(self.path)
+
+    def _request(self, **env):
+        env.update({'GIT_DIR': '.', 'GL_USER': 'pingou'})
+        return {
+            'hook': 'post-receive',
+            'args': ['foo'],
+            'cwd': self.repo,
+            'env': env,
+            'stdin': base64.b64encode(
+                b'0000 1111 refs/heads/master\n').decode('ascii'),
+        }
+
+    def test_find_hooks(self):
+        """ Test finding the hooks enabled for a repository. """
+        hooks = pagure.lib.hook_runner.find_hooks(self.repo, 'post-receive')
+        self.assertEqual(
+            [os.path.basename(hook) for hook in hooks],
+            ['post-receive.a', 'post-receive.b'])
+        self.assertTrue(pagure.lib.hook_runner.runs_in_process(hooks[0]))
+        self.assertEqual(
+            pagure.lib.hook_runner.find_hooks(self.repo, 'pre-receive'), [])
+
+    def _run(self, request):
+        """ Run the hooks of the specified request via the client shim and
+        return its exit status and output. """
+        socket_path = os.path.join(self.path, 'hookrunner.sock')
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen(1)
+
+        # The hook runner changes the state of the process it runs in
+        pid = os.fork()
+        if not pid:
+            try:
+                conn, _ = server.accept()
+                pagure.lib.hook_runner.handle(conn)
+                conn.close()
+            finally:
+                os._exit(0)
+        server.close()
+
+        client = imp.load_source('hookrunner_client', os.path.join(
+            os.path.dirname(pagure.__file__), 'hooks', 'files',
+            'hookrunner_client.py'))
+        stdout = six.BytesIO()
+        stderr = six.BytesIO()
+        with patch.object(client, 'SOCKET', socket_path), \
+                patch('os.getcwd', return_value=request['cwd']), \
+                patch.dict('os.environ', request['env']), \
+                patch('sys.stdin', six.BytesIO(
+                    base64.b64decode(request['stdin']))), \
+                patch('sys.stdout', stdout), \
+                patch('sys.stderr', stderr):
+            status = client.main([request['hook']] + request['args'])
+        os.waitpid(pid, 0)
+        return status, stdout.getvalue(), stderr.getvalue()
+
+    def test_run_hooks(self):
+        """ Test running the hooks of a repository via the client shim. """
+        status, stdout, stderr = self._run(self._request())
+
+        self.assertEqual(status, 0)
+        self.assertEqual(
+            stdout,
+            b"['foo'] pingou 0000 1111 refs/heads/master\n" * 2)
+        self.assertEqual(
+            stderr, ('Running in %s\n' % self.repo).encode('utf-8') * 2)
+
+    def test_run_hooks_not_utf8(self):
+        """ Test running the hooks for a ref name which is not valid UTF-8.
+        """
+        request = self._request()
+        request['stdin'] = base64.b64encode(
+            b'0000 1111 refs/heads/caf\xe9\n').decode('ascii')
+        status, stdout, _ = self._run(request)
+
+        self.assertEqual(status, 0)
+        self.assertEqual(stdout.count(b'refs/heads/caf\xe9'), 2)
+
+    def _read_output(self, client):
+        output = b''
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            output += chunk
+        return output
+
+    def test_run_hook_process(self):
+        """ Test running a hook in a sub-process, its output is sent as it
+        is produced and it is killed if it runs for too long. """
+        path = os.path.join(self.repo, 'hooks', 'post-receive.sh')
+        with open(path, 'w') as stream:
+            stream.write('#!/bin/sh\ncat\nsleep 30\n')
+        os.chmod(path, 0o755)
+        self.assertFalse(pagure.lib.hook_runner.runs_in_process(path))
+
+        server, client = socket.socketpair()
+        start = time.time()
+        with patch.dict(
+                'pagure.APP.config', {'HOOKRUNNER_HOOK_TIMEOUT': 1}):
+            status = pagure.lib.hook_runner.run_hook(
+                path, self._request(), server)
+        server.close()
+
+        self.assertEqual(status, 1)
+        self.assertTrue(time.time() - start < 10)
+        output = self._read_output(client)
+        self.assertIn(b'0000 1111 refs/heads/master', output)
+        self.assertIn(
+            ('Hook %s killed after running for 1 seconds' % path).encode(
+                'utf-8'),
+            output)
+
+    def test_run_hook(self):
+        """ Test running a hook in-process and restoring the state of the
+        process afterwards. """
+        cwd = os.getcwd()
+        stdout = sys.stdout
+        server, client = socket.socketpair()
+        hook = pagure.lib.hook_runner.find_hooks(
+            self.repo, 'post-receive')[0]
+
+        status = pagure.lib.hook_runner.run_hook(
+            hook, self._request(HOOK_STATUS='2'), server)
+        server.close()
+
+        self.assertEqual(status, 2)
+        output = self._read_output(client)
+        self.assertIn(b"['foo'] pingou 0000 1111 refs/heads/master", output)
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertNotIn('HOOK_STATUS', os.environ)
+        self.assertIs(sys.stdout, stdout)
+
+    def test_run_hooks_failure(self):
+        """ Test that the hooks stop at the first one failing. """
+        status, stdout, _ = self._run(self._request(HOOK_STATUS='3'))
+
+        self.assertEqual(status, 3)
+        self.assertEqual(
+            stdout.split(b'\n')[1],
+            ('Hook %s failed with error code 3' % os.path.join(
+                self.repo, '.', 'hooks', 'post-receive.a')).encode('utf-8'))
+        # The next hooks are not ran
+        self.assertEqual(stdout.count(b'refs/heads/master'), 1)
+
+    def test_client_unavailable(self):
+        """ Test that the shim tells when the hook runner is not running.
+        """
+        client = imp.load_source('hookrunner_client', os.path.join(
+            os.path.dirname(pagure.__file__), 'hooks', 'files',
+            'hookrunner_client.py'))
+        with patch.object(
+                client, 'SOCKET', os.path.join(self.path, 'missing.sock')), \
+                patch('sys.stdin', six.BytesIO(b'')):
+            self.assertEqual(client.main(['post-receive']), 75)
+
+    @unittest.skipUnless(six.PY2, 'The environment is always text')
+    def test_client_not_utf8(self):
+        """ Test that the shim lets the dispatcher run the hooks when its
+        environment cannot be sent to the hook runner. """
+        client = imp.load_source('hookrunner_client', os.path.join(
+            os.path.dirname(pagure.__file__), 'hooks', 'files',
+            'hookrunner_client.py'))
+        with patch.object(client, 'socket') as sock, \
+                patch.dict('os.environ', {'GL_USER': b'caf\xe9'}), \
+                patch('sys.stdin', six.BytesIO(b'')):
+            self.assertEqual(client.main(['post-receive']), 75)
+        self.assertFalse(sock.socket.called)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
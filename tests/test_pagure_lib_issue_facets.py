@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+"""
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import unittest
+import sys
+import os
+
+from mock import patch, MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pagure
+import pagure.lib
+import pagure.lib.issue_facets
+import tests
+
+
+@patch('pagure.lib.notify.send_email', MagicMock(return_value=True))
+class PagureLibIssueFacetstests(tests.Modeltests):
+    """ Tests for pagure.lib.issue_facets """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        super(PagureLibIssueFacetstests, self).setUp()
+
+        tests.create_projects(self.session)
+        self.repo = pagure.get_authorized_project(self.session, 'test')
+
+        # (title, status, close_status, tags)
+        tickets = [
+            ('Issue #1', 'Open', None, ['bug']),
+            ('Issue #2', 'Open', None, ['bug', 'easyfix']),
+            ('Issue #3', 'Closed', 'Fixed', ['bug']),
+            ('Issue #4', 'Closed', 'Invalid', []),
+        ]
+        for title, status, close_status, tags in tickets:
+            issue = pagure.lib.new_issue(
+                session=self.session,
+                repo=self.repo,
+                title=title,
+                content='Ticket content',
+                user='pingou',
+                status=status,
+                close_status=close_status,
+                ticketfolder=None,
+            )
+            self.session.commit()
+            if tags:
+                pagure.lib.add_tag_obj(
+                    self.session, issue, tags, 'pingou', None)
+                self.session.commit()
+
+    def test_counts(self):
+        """ Test the counts per status and per tag. """
+        facets = pagure.lib.get_issue_facets(self.session, self.repo)
+        count = pagure.lib.issue_facets.count
+        self.assertEqual(count(facets), 4)
+        self.assertEqual(count(facets, status='Open'), 2)
+        self.assertEqual(count(facets, closed=True), 2)
+        self.assertEqual(count(facets, status='Invalid', closed=True), 1)
+        self.assertEqual(
+            pagure.lib.issue_facets.count_tags(facets),
+            {'bug': 3, 'easyfix': 1})
+        self.assertEqual(
+            pagure.lib.issue_facets.count_tags(facets, closed=True),
+            {'bug': 1})
+
+        # The counts match the ones of search_issues
+        for tags in (['bug'], ['!bug'], ['bug', '!easyfix']):
+            facets = pagure.lib.get_issue_facets(
+                self.session, self.repo, tags=tags)
+            self.assertEqual(
+                count(facets, status='Open'),
+                pagure.lib.search_issues(
+                    self.session, self.repo, tags=tags, status='Open',
+                    count=True))
+        self.assertEqual(count(facets), 2)
+
+    def test_counts_memoized(self):
+        """ Test that the counts are memoized until an issue changes. """
+        facets = pagure.lib.get_issue_facets(self.session, self.repo)
+
+        with patch('pagure.lib.issue_facets.compute_facets') as comp:
+            facets2 = pagure.lib.get_issue_facets(self.session, self.repo)
+            self.assertFalse(comp.called)
+            # The filter is part of the cache key
+            pagure.lib.get_issue_facets(
+                self.session, self.repo, author='foo')
+            self.assertTrue(comp.called)
+        self.assertEqual(facets, facets2)
+
+        issue = pagure.lib.search_issues(self.session, self.repo, issueid=1)
+        pagure.lib.edit_issue(
+            self.session,
+            issue=issue,
+            ticketfolder=None,
+            user='pingou',
+            status='Closed',
+            close_status='Fixed',
+        )
+        self.session.commit()
+
+        facets = pagure.lib.get_issue_facets(self.session, self.repo)
+        self.assertEqual(
+            pagure.lib.issue_facets.count(facets, closed=True), 3)
+
+        # Removing a tag from an issue also invalidates the counts
+        issue = pagure.lib.search_issues(self.session, self.repo, issueid=2)
+        pagure.lib.remove_tags_obj(
+            self.session, issue, ['easyfix'], None, 'pingou')
+        self.session.commit()
+
+        facets = pagure.lib.get_issue_facets(self.session, self.repo)
+        self.assertEqual(
+            pagure.lib.issue_facets.count_tags(facets), {'bug': 3})
+
+    def test_counts_cache_bounded(self):
+        """ Test that the counts cached in process expire and that the
+        least recently used are dropped first. """
+        config = {'ISSUE_FACETS_CACHE_SIZE': 2, 'ISSUE_FACETS_CACHE_TTL': 60}
+        with patch.dict('pagure.APP.config', config), \
+                patch('pagure.lib.issue_facets.time.time', return_value=0):
+            for author in ('foo', 'bar', 'baz'):
+                pagure.lib.get_issue_facets(
+                    self.session, self.repo, author=author)
+            self.assertEqual(len(pagure.lib.issue_facets._CACHE), 2)
+
+            with patch('pagure.lib.issue_facets.compute_facets') as comp:
+                pagure.lib.get_issue_facets(
+                    self.session, self.repo, author='baz')
+                self.assertFalse(comp.called)
+
+        with patch.dict('pagure.APP.config', config), \
+                patch('pagure.lib.issue_facets.time.time', return_value=61), \
+                patch('pagure.lib.issue_facets.compute_facets') as comp:
+            pagure.lib.get_issue_facets(self.session, self.repo, author='baz')
+            self.assertTrue(comp.called)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
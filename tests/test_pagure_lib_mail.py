@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+"""
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import mailbox
+import smtplib
+import socket
+import unittest
+import sys
+import os
+
+from mock import patch, MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pagure.lib.mail
+import pagure.lib.notify
+import tests
+
+
+class PagureLibMailtests(tests.SimplePagureTest):
+    """ Tests for pagure.lib.mail """
+
+    @patch('pagure.lib.mail.smtplib.SMTP')
+    def test_smtp_backend_reuses_connection(self, mock_smtp):
+        """ Test that the SMTP backend re-uses its connection. """
+        smtp = MagicMock()
+        smtp.noop.return_value = (250, 'OK')
+        mock_smtp.return_value = smtp
+
+        backend = pagure.lib.mail.SMTPBackend(
+            'localhost', 25, username='foo', password='bar')
+        failed = backend.send([
+            ('pagure@pagure.org', ['foo@bar.com'], 'msg1'),
+            ('pagure@pagure.org', ['bar@foo.com'], 'msg2'),
+        ])
+        self.assertEqual(failed, [])
+        failed = backend.send([
+            ('pagure@pagure.org', ['foo@bar.com'], 'msg3'),
+        ])
+        self.assertEqual(failed, [])
+
+        self.assertEqual(mock_smtp.call_count, 1)
+        self.assertEqual(smtp.login.call_count, 1)
+        self.assertEqual(smtp.sendmail.call_count, 3)
+        # The connection was in use, no need to check it
+        self.assertFalse(smtp.noop.called)
+
+    @patch('pagure.lib.mail.time.time')
+    @patch('pagure.lib.mail.smtplib.SMTP')
+    def test_smtp_backend_idle_connection(self, mock_smtp, mock_time):
+        """ Test that the SMTP backend checks its connection once it was
+        idle for a while. """
+        smtp = MagicMock()
+        smtp.noop.return_value = (421, 'Timeout')
+        mock_smtp.return_value = smtp
+        mock_time.return_value = 0
+
+        backend = pagure.lib.mail.SMTPBackend('localhost', 25)
+        messages = [('pagure@pagure.org', ['foo@bar.com'], 'msg1')]
+        backend.send(messages)
+        mock_time.return_value = 10
+        backend.send(messages)
+        self.assertFalse(smtp.noop.called)
+        self.assertEqual(mock_smtp.call_count, 1)
+
+        mock_time.return_value = 100
+        self.assertEqual(backend.send(messages), [])
+        self.assertEqual(smtp.noop.call_count, 1)
+        # The server closed the connection, a new one was opened
+        self.assertEqual(mock_smtp.call_count, 2)
+        self.assertEqual(smtp.sendmail.call_count, 3)
+
+    @patch('pagure.lib.mail.smtplib.SMTP')
+    def test_smtp_backend_reconnects(self, mock_smtp):
+        """ Test that the SMTP backend opens a new connection when the
+        server closed it. """
+        smtp = MagicMock()
+        smtp.sendmail.side_effect = [
+            None,
+            smtplib.SMTPServerDisconnected('Oops'),
+            None,
+        ]
+        mock_smtp.return_value = smtp
+
+        backend = pagure.lib.mail.SMTPBackend('localhost', 25)
+        failed = backend.send([
+            ('pagure@pagure.org', ['foo@bar.com'], 'msg1'),
+            ('pagure@pagure.org', ['bar@foo.com'], 'msg2'),
+        ])
+        self.assertEqual(failed, [])
+        self.assertEqual(mock_smtp.call_count, 2)
+        self.assertEqual(smtp.sendmail.call_count, 3)
+
+    @patch('pagure.lib.mail.smtplib.SMTP')
+    def test_smtp_backend_transient_error(self, mock_smtp):
+        """ Test that the SMTP backend returns the emails it could not send
+        because of a transient error. """
+        smtp = MagicMock()
+        smtp.sendmail.side_effect = [
+            socket.error('Connection reset by peer'),
+            smtplib.SMTPRecipientsRefused({}),
+            None,
+        ]
+        mock_smtp.return_value = smtp
+
+        messages = [
+            ('pagure@pagure.org', ['foo@bar.com'], 'msg1'),
+            ('pagure@pagure.org', ['bar@foo.com'], 'msg2'),
+            ('pagure@pagure.org', ['foo@foo.com'], 'msg3'),
+        ]
+        backend = pagure.lib.mail.SMTPBackend('localhost', 25)
+        failed = backend.send(messages)
+        self.assertEqual(failed, messages[:1])
+        # The connection was re-opened after being lost
+        self.assertEqual(mock_smtp.call_count, 2)
+
+    def test_send_email_maildir(self):
+        """ Test sending emails to a maildir. """
+        maildir = os.path.join(self.path, 'maildir')
+        config = {
+            'EMAIL_SEND': True,
+            'EMAIL_ASYNC': False,
+            'EMAIL_BACKEND': 'maildir',
+            'EMAIL_MAILDIR': maildir,
+        }
+        with patch.dict('pagure.APP.config', config):
+            pagure.lib.notify.send_email(
+                'Email content',
+                'Email subject',
+                'foo@bar.com,bar@foo.com',
+                mail_id='test-issue-1',
+                project_name='test',
+            )
+
+        box = mailbox.Maildir(maildir, factory=None, create=False)
+        self.assertEqual(
+            sorted(msg['To'] for msg in box),
+            ['bar@foo.com', 'foo@bar.com'])
+        reply_to = set(msg['Reply-To'] for msg in box)
+        self.assertEqual(len(reply_to), 2)
+
+    @patch('pagure.lib.tasks.send_emails')
+    def test_send_email_async(self, send_emails):
+        """ Test that the emails are handed over to the worker. """
+        config = {
+            'EMAIL_SEND': True,
+            'EMAIL_ASYNC': True,
+        }
+        with patch.dict('pagure.APP.config', config):
+            pagure.lib.notify.send_email(
+                'Email content',
+                'Email subject',
+                'foo@bar.com,bar@foo.com',
+            )
+
+        self.assertEqual(send_emails.delay.call_count, 1)
+        messages = send_emails.delay.call_args[0][0]
+        self.assertEqual(
+            [msg[1] for msg in messages],
+            [['foo@bar.com'], ['bar@foo.com']])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+"""
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import unittest
+import sys
+import os
+
+from mock import patch, MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pagure
+import pagure.lib
+import pagure.lib.markdown_cache
+import tests
+
+
+@patch('pagure.lib.notify.send_email', MagicMock(return_value=True))
+class PagureLibMarkdownCachetests(tests.Modeltests):
+    """ Tests for pagure.lib.markdown_cache """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        super(PagureLibMarkdownCachetests, self).setUp()
+        pagure.SESSION = self.session
+        pagure.lib.SESSION = self.session
+
+        tests.create_projects(self.session)
+        self.repo = pagure.get_authorized_project(self.session, 'test')
+        pagure.lib.new_issue(
+            session=self.session,
+            repo=self.repo,
+            title='Test issue',
+            content='We should work on this',
+            user='pingou',
+            ticketfolder=None,
+        )
+        self.session.commit()
+
+    def _render(self, text):
+        with pagure.APP.test_request_context('/test/issues'):
+            return pagure.lib.text2markdown(text)
+
+    @patch('pagure.lib._convert_markdown', wraps=pagure.lib._convert_markdown)
+    def test_rendering_memoized(self, convert):
+        """ Test that the rendering is memoized until the issues it links
+        to change. """
+        html = self._render('See #1 and #5')
+        self.assertIn('title="[Open] Test issue"', html)
+        self.assertEqual(self._render('See #1 and #5'), html)
+        self.assertEqual(convert.call_count, 1)
+
+        # The rendering depends on the page it is made for
+        with pagure.APP.test_request_context('/test2/issues'):
+            html2 = pagure.lib.text2markdown('See #1 and #5')
+        self.assertEqual(convert.call_count, 2)
+        self.assertNotIn('title="[Open] Test issue"', html2)
+
+        # Closing the issue changes the title of its link
+        issue = pagure.lib.search_issues(self.session, self.repo, issueid=1)
+        pagure.lib.edit_issue(
+            self.session,
+            issue=issue,
+            ticketfolder=None,
+            user='pingou',
+            status='Closed',
+            close_status='Fixed',
+        )
+        self.session.commit()
+        html = self._render('See #1 and #5')
+        self.assertEqual(convert.call_count, 3)
+        self.assertIn('title="[Closed] Test issue"', html)
+
+        # Creating the issue #5 adds a link to it
+        pagure.lib.new_issue(
+            session=self.session,
+            repo=self.repo,
+            title='Fifth issue',
+            content='Another issue',
+            user='pingou',
+            issue_id=5,
+            ticketfolder=None,
+        )
+        self.session.commit()
+        html = self._render('See #1 and #5')
+        self.assertEqual(convert.call_count, 4)
+        self.assertIn('title="[Open] Fifth issue"', html)
+
+    @patch('pagure.lib._convert_markdown', wraps=pagure.lib._convert_markdown)
+    def test_rendering_not_cacheable(self, convert):
+        """ Test that the renderings whose links depend on something which
+        does not exist are not memoized. """
+        for text in ('Ping @nobody', 'See foobar#1'):
+            html = self._render(text)
+            self.assertEqual(self._render(text), html)
+        self.assertEqual(convert.call_count, 4)
+
+    @patch('pagure.is_repo_admin', MagicMock(return_value=True))
+    @patch('pagure.lib._convert_markdown', wraps=pagure.lib._convert_markdown)
+    def test_rendering_private_project(self, convert):
+        """ Test that the renderings linking to a private project are not
+        memoized, what they show depends on who can see the project. """
+        self.repo.private = True
+        self.session.add(self.repo)
+        self.session.commit()
+
+        html = self._render('See #1')
+        self.assertIn('title="[Open] Test issue"', html)
+        self.assertEqual(self._render('See #1'), html)
+        self.assertEqual(convert.call_count, 2)
+
+    @patch('pagure.lib._convert_markdown', wraps=pagure.lib._convert_markdown)
+    def test_rendering_cache_disabled(self, convert):
+        """ Test disabling the rendering cache. """
+        with patch.dict('pagure.APP.config', {'MARKDOWN_CACHE_TTL': 0}):
+            self._render('**foo**')
+            self._render('**foo**')
+        self.assertEqual(convert.call_count, 2)
+
+    def test_processor_reused(self):
+        """ Test that the markdown processors are re-used across calls. """
+        with patch('pagure.lib.markdown.Markdown',
+                   wraps=pagure.lib.markdown.Markdown) as mk:
+            pagure.lib._get_markdown_processor(extended=False)
+            pagure.lib._get_markdown_processor(extended=False)
+            pagure.lib._get_markdown_processor(extended=False, readme=True)
+        self.assertTrue(mk.call_count <= 2)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
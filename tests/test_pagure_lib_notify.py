@@ -170,7 +170,7 @@ class PagureLibNotifytests(tests.Modeltests):
         out = pagure.lib.notify._get_emails_for_obj(iss)
         self.assertEqual(out, exp)
 
-    @patch('pagure.lib.notify.smtplib.SMTP')
+    @patch('pagure.lib.mail.smtplib.SMTP')
     def test_get_emails_for_obj_pr(self, mock_smtp):
         """ Test the _get_emails_for_obj method from pagure.lib.notify. """
         mock_smtp.return_value = MagicMock()
@@ -250,7 +250,7 @@ class PagureLibNotifytests(tests.Modeltests):
         out = pagure.lib.notify._get_emails_for_obj(req)
         self.assertEqual(out, exp)
 
-    @patch('pagure.lib.notify.smtplib.SMTP')
+    @patch('pagure.lib.mail.smtplib.SMTP')
     def test_get_emails_for_obj_pr_watching_project(self, mock_smtp):
         """ Test the _get_emails_for_obj method from pagure.lib.notify. """
         mock_smtp.return_value = MagicMock()
@@ -332,7 +332,7 @@ class PagureLibNotifytests(tests.Modeltests):
         out = pagure.lib.notify._get_emails_for_obj(req)
         self.assertEqual(out, exp)
 
-    @patch('pagure.lib.notify.smtplib.SMTP')
+    @patch('pagure.lib.mail.smtplib.SMTP')
     def test_send_email(self, mock_smtp):
         """ Test the notify_new_comment method from pagure.lib.notify. """
         mock_smtp.return_value = MagicMock()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+"""
+
+__requires__ = ['SQLAlchemy >= 0.8']
+
+import pkg_resources
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import pygit2
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pagure
+from pagure.lib.repo import RepositoryPool
+
+
+class TestRepositoryPool(unittest.TestCase):
+    """ Tests for pagure.lib.repo.RepositoryPool """
+
+    def setUp(self):
+        """ Create a few git repositories to put in the pool. """
+        self.path = tempfile.mkdtemp(prefix='pagure-tests-pool-')
+        self.repos = []
+        for name in ['foo.git', 'bar.git', 'baz.git']:
+            repopath = os.path.join(self.path, name)
+            pygit2.init_repository(repopath, bare=True)
+            self.repos.append(repopath)
+
+    def tearDown(self):
+        """ Remove the git repositories. """
+        shutil.rmtree(self.path)
+
+    def test_checkout_release(self):
+        """ Test checking repositories out of the pool and releasing them. """
+        pool = RepositoryPool(size=2)
+        repo_obj = pool.checkout(self.repos[0])
+        self.assertEqual(pool.stats(), {'idle': 0, 'checked_out': 1})
+
+        # A repo checked out is not handed out twice
+        other = pool.checkout(self.repos[0])
+        self.assertIsNot(repo_obj, other)
+        self.assertEqual(pool.stats(), {'idle': 0, 'checked_out': 2})
+
+        pool.release(other)
+        pool.release(repo_obj)
+        self.assertEqual(pool.stats(), {'idle': 2, 'checked_out': 0})
+
+        # Released repos are re-used
+        self.assertIs(pool.checkout(self.repos[0]), repo_obj)
+
+    def test_lru(self):
+        """ Test that the least recently used repositories are closed. """
+        pool = RepositoryPool(size=2)
+        repo_objs = [pool.checkout(path) for path in self.repos]
+        for repo_obj in repo_objs:
+            pool.release(repo_obj)
+
+        # The least recently used repo was closed
+        self.assertEqual(pool.stats(), {'idle': 2, 'checked_out': 0})
+        self.assertIsNot(pool.checkout(self.repos[0]), repo_objs[0])
+        self.assertIs(pool.checkout(self.repos[2]), repo_objs[2])
+
+    def test_recreated_repo(self):
+        """ Test that repos changed on disk are not kept in the pool. """
+        pool = RepositoryPool(size=2)
+        repo_obj = pool.checkout(self.repos[0])
+        shutil.rmtree(self.repos[0])
+        pygit2.init_repository(self.repos[0], bare=True)
+        pool.release(repo_obj)
+        self.assertEqual(pool.stats(), {'idle': 0, 'checked_out': 0})
+
+    def test_close(self):
+        """ Test closing the idle repositories of the pool. """
+        pool = RepositoryPool(size=2)
+        pool.release(pool.checkout(self.repos[0]))
+        pool.close()
+        self.assertEqual(pool.stats(), {'idle': 0, 'checked_out': 0})
+
+    def test_open_repo_outside_request(self):
+        """ Test that open_repo only checks out repos in a request. """
+        # Only the requests release the repos they check out
+        stats = pagure.REPO_POOL.stats()
+        with pagure.APP.app_context():
+            pagure.open_repo(self.repos[0])
+        self.assertEqual(pagure.REPO_POOL.stats(), stats)
+
+        with pagure.APP.test_request_context('/'):
+            pagure.open_repo(self.repos[0])
+            self.assertEqual(
+                pagure.REPO_POOL.stats()['checked_out'],
+                stats['checked_out'] + 1)
+        self.assertEqual(
+            pagure.REPO_POOL.stats()['checked_out'], stats['checked_out'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
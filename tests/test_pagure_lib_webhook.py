@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+"""
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import hashlib
+import hmac
+import json
+import unittest
+import sys
+import os
+
+from mock import patch, MagicMock
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pagure
+import pagure.lib
+import pagure.lib.webhook
+import tests
+
+
+class PagureLibWebhookDeliverytests(unittest.TestCase):
+    """ Tests for the delivery of the notifications in
+    pagure.lib.webhook """
+
+    def test_build_request(self):
+        """ Test the content and the signature of the notifications. """
+        hooks = {
+            'fullname': 'test', 'hook_token': 'aaabbbccc', 'urls': []}
+        content, headers = pagure.lib.webhook.build_request(
+            hooks, u'issue.new', {'issue': 1})
+
+        data = json.loads(content)
+        self.assertEqual(data['topic'], 'issue.new')
+        self.assertEqual(data['msg']['issue'], 1)
+        self.assertEqual(data['msg']['project_fullname'], 'test')
+        self.assertEqual(headers['X-Pagure-project'], 'test')
+        self.assertEqual(
+            headers['X-Pagure-Signature-256'],
+            hmac.new('aaabbbccc', content, hashlib.sha256).hexdigest())
+
+    @patch('pagure.lib.webhook.requests.Session')
+    def test_deliver(self, session):
+        """ Test the outcome of the deliveries. """
+        delivery = pagure.lib.webhook.new_delivery(
+            'http://example.com/hook', '{}', {})
+        post = session.return_value.post
+
+        for status_code, outcome in (
+                (200, 'delivered'), (404, 'rejected'), (429, 'failed'),
+                (502, 'failed')):
+            post.return_value = requests.Response()
+            post.return_value.status_code = status_code
+            self.assertEqual(
+                pagure.lib.webhook.deliver(delivery), outcome)
+
+        post.side_effect = IOError('Connection refused')
+        self.assertEqual(pagure.lib.webhook.deliver(delivery), 'failed')
+
+    def test_retry_delay(self):
+        """ Test the exponential back-off of the retries. """
+        with patch.dict('pagure.APP.config', {'WEBHOOK_RETRY_DELAY': 10}):
+            self.assertEqual(
+                [pagure.lib.webhook.retry_delay(i) for i in range(1, 5)],
+                [10, 20, 40, 80])
+            self.assertEqual(pagure.lib.webhook.retry_delay(20), 24 * 3600)
+
+    def test_circuit_breaker(self):
+        """ Test opening and closing the circuit of an endpoint. """
+        breaker = pagure.lib.webhook.CircuitBreaker(threshold=2, cooldown=60)
+        breaker.record_failure(now=100)
+        self.assertTrue(breaker.allow(now=100))
+        breaker.record_failure(now=100)
+        self.assertFalse(breaker.allow(now=100))
+        self.assertFalse(breaker.allow(now=159))
+
+        # Once the cooldown is over, a single failure re-opens the circuit
+        self.assertTrue(breaker.allow(now=160))
+        breaker.record_failure(now=160)
+        self.assertFalse(breaker.allow(now=161))
+
+        breaker.record_success()
+        self.assertTrue(breaker.allow(now=161))
+        breaker.record_failure(now=161)
+        self.assertTrue(breaker.allow(now=161))
+
+    def test_retry_store(self):
+        """ Test storing the deliveries to retry, in memory and in redis.
+        """
+        for redis in (None, MagicMock()):
+            store = pagure.lib.webhook.RetryStore(redis)
+            first = pagure.lib.webhook.new_delivery('http://a', '{}', {})
+            second = pagure.lib.webhook.new_delivery('http://b', '{}', {})
+            store.add(second, 20)
+            store.add(first, 10)
+
+            if redis:
+                members = [
+                    call[0][2] for call in redis.zadd.call_args_list]
+                redis.zrangebyscore.return_value = members[::-1]
+                redis.zrem.side_effect = [1, 0]
+                self.assertEqual(store.pop_due(now=30), [first])
+            else:
+                self.assertEqual(store.pop_due(now=5), [])
+                self.assertEqual(store.pop_due(now=15), [first])
+                self.assertEqual(len(store), 1)
+                self.assertEqual(store.pop_due(now=30), [second])
+
+    def test_metrics(self):
+        """ Test the latency metrics of the deliveries. """
+        metrics = pagure.lib.webhook.Metrics()
+        metrics.record('http://a', 'delivered', 0.5)
+        metrics.record('http://a', 'failed', 1.5)
+        report = metrics.report()
+        self.assertEqual(report['http://a']['delivered'], 1)
+        self.assertEqual(report['http://a']['failed'], 1)
+        self.assertEqual(report['http://a']['latency_avg'], 1.0)
+        self.assertEqual(report['http://a']['latency_max'], 1.5)
+
+
+class PagureLibWebhookHookstests(tests.Modeltests):
+    """ Tests for the web-hook settings in pagure.lib.webhook """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        super(PagureLibWebhookHookstests, self).setUp()
+        tests.create_projects(self.session)
+        self.repo = pagure.lib._get_project(self.session, 'test')
+
+    def test_hooks_cache(self):
+        """ Test retrieving and caching the web-hook settings. """
+        settings = self.repo.settings
+        settings['Web-hooks'] = 'http://a/hook\n\n http://b/hook '
+        self.repo.settings = settings
+        self.session.commit()
+
+        loader = MagicMock(
+            side_effect=lambda fullname: pagure.lib.webhook.get_hooks(
+                self.session, fullname))
+        cache = pagure.lib.webhook.HooksCache(loader)
+
+        hooks = cache.get('test')
+        self.assertEqual(hooks['urls'], ['http://a/hook', 'http://b/hook'])
+        self.assertEqual(hooks['hook_token'], self.repo.hook_token)
+        self.assertEqual(cache.get('test'), hooks)
+        self.assertEqual(loader.call_count, 1)
+
+        # Unknown projects are not cached
+        self.assertIsNone(cache.get('foo'))
+        self.assertIsNone(cache.get('foo'))
+        self.assertEqual(loader.call_count, 3)
+
+        cache.invalidate('test')
+        cache.get('test')
+        self.assertEqual(loader.call_count, 4)
+
+    @patch('pagure.lib.REDIS')
+    def test_invalidation(self, redis):
+        """ Test that the web-hook server is told when the settings of a
+        project change. """
+        settings = self.repo.settings
+        settings['Web-hooks'] = 'http://a/hook'
+        self.repo.settings = settings
+        self.assertFalse(redis.publish.called)
+        self.session.commit()
+        redis.publish.assert_called_once_with(
+            pagure.lib.webhook.INVALIDATE_CHANNEL, 'test')
+
+        redis.reset_mock()
+        self.repo.hook_token = 'aaabbbcccddd'
+        self.session.rollback()
+        self.assertFalse(redis.publish.called)
+
+        # Renaming the project invalidates its former name
+        self.repo.name = 'test4'
+        self.session.commit()
+        redis.publish.assert_called_once_with(
+            pagure.lib.webhook.INVALIDATE_CHANNEL, 'test')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
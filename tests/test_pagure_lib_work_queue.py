@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+"""
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import json
+import unittest
+import sys
+import os
+
+from mock import patch, MagicMock
+import redis
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pagure
+import pagure.lib.work_queue
+
+
+def _reply(stream, *entries):
+    """ Return a XREADGROUP reply, as returned by redis, containing the
+    specified (id, data) entries. """
+    return [[
+        stream,
+        [
+            [entry_id, ['data', json.dumps(data)]]
+            for entry_id, data in entries
+        ]
+    ]]
+
+
+class PagureLibWorkQueuetests(unittest.TestCase):
+    """ Tests for pagure.lib.work_queue """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        self.redis = MagicMock()
+        self.pipe = self.redis.pipeline.return_value
+        self.pipe.execute.return_value = ['1-0', 1]
+        self.consumer = pagure.lib.work_queue.Consumer(
+            self.redis, 'pagure.logcom', 'pagure-logcom', 'host-0')
+
+    def test_publish(self):
+        """ Test adding a message to a queue. """
+        self.assertEqual(
+            pagure.lib.work_queue.publish(
+                self.redis, pagure.lib.work_queue.CI, {'pr': 1}),
+            1)
+        # The messages waiting are never dropped
+        self.pipe.execute_command.assert_any_call(
+            'XADD', 'pagure.ci', '*', 'data', '{"pr": 1}')
+        self.pipe.execute_command.assert_any_call('XLEN', 'pagure.ci')
+
+        self.pipe.execute_command.reset_mock()
+        pagure.lib.work_queue.publish(
+            self.redis, 'pagure.ci.failed', {'pr': 1}, maxlen=50)
+        self.pipe.execute_command.assert_any_call(
+            'XADD', 'pagure.ci.failed', 'MAXLEN', '~', 50, '*', 'data',
+            '{"pr": 1}')
+
+    @patch('pagure.lib.work_queue._log')
+    def test_publish_backlog(self, log):
+        """ Test that a warning is logged when the messages waiting in a
+        queue pile up. """
+        with patch.dict('pagure.APP.config', {'QUEUE_BACKLOG_WARNING': 5}):
+            for length in range(1, 12):
+                self.pipe.execute.return_value = ['1-0', length]
+                pagure.lib.work_queue.publish(
+                    self.redis, pagure.lib.work_queue.CI, {'pr': 1})
+        self.assertEqual(log.warning.call_count, 2)
+
+    def test_parse_entries(self):
+        """ Test parsing the entries read from redis, whether redis-py
+        parsed them or not. """
+        expected = [('1-0', {'data': '{}'})]
+        self.assertEqual(
+            pagure.lib.work_queue._parse_entries(
+                [[b'stream', [[b'1-0', [b'data', b'{}']]]]]),
+            expected)
+        self.assertEqual(
+            pagure.lib.work_queue._parse_entries(
+                [[b'stream', [(b'1-0', {b'data': b'{}'})]]]),
+            expected)
+        self.assertEqual(pagure.lib.work_queue._parse_entries(None), [])
+
+    def test_group_messages(self):
+        """ Test splitting the messages in batches per key. """
+        messages = [
+            ('1', {'project': 'a'}),
+            ('2', {'project': 'b'}),
+            ('3', {'project': 'a'}),
+        ]
+        self.assertEqual(
+            pagure.lib.work_queue.group_messages(
+                messages, key=lambda data: data['project']),
+            [[messages[0], messages[2]], [messages[1]]])
+        self.assertEqual(
+            pagure.lib.work_queue.group_messages(messages),
+            [[messages[0]], [messages[1]], [messages[2]]])
+
+    def test_setup(self):
+        """ Test creating the consumer group, only once. """
+        self.redis.execute_command.side_effect = [
+            None,
+            redis.exceptions.ResponseError(
+                'BUSYGROUP Consumer Group name already exists'),
+        ]
+        self.consumer.setup()
+        self.consumer.setup()
+        self.redis.execute_command.assert_called_with(
+            'XGROUP', 'CREATE', 'pagure.logcom', 'pagure-logcom', '0',
+            'MKSTREAM')
+
+    def test_process(self):
+        """ Test processing the messages by batches and acknowledging them.
+        """
+        self.redis.execute_command.side_effect = [
+            # No message left pending by a previous run
+            [],
+            _reply(
+                'pagure.logcom',
+                ('1-0', {'project': 'a', 'commit': 1}),
+                ('2-0', {'project': 'b', 'commit': 2}),
+                ('3-0', {'project': 'a', 'commit': 3}),
+            ),
+        ]
+        handler = MagicMock()
+
+        self.assertEqual(
+            self.consumer.process(
+                handler, key=lambda data: data['project']),
+            3)
+
+        self.assertEqual(
+            [call[0][0] for call in handler.call_args_list],
+            [
+                [{'project': 'a', 'commit': 1},
+                 {'project': 'a', 'commit': 3}],
+                [{'project': 'b', 'commit': 2}],
+            ])
+        self.assertEqual(
+            self.redis.execute_command.call_args_list[1][0][-2:],
+            ('pagure.logcom', '>'))
+        self.pipe.execute_command.assert_any_call(
+            'XACK', 'pagure.logcom', 'pagure-logcom', '1-0', '3-0')
+        self.pipe.execute_command.assert_any_call(
+            'XDEL', 'pagure.logcom', '2-0')
+        self.assertEqual(self.consumer.stats.report()['processed'], 3)
+
+    def test_process_failure(self):
+        """ Test that the messages which could not be processed are kept
+        pending and processed again later. """
+        self.redis.execute_command.side_effect = [
+            [],
+            _reply('pagure.logcom', ('1-0', {'project': 'a'})),
+        ]
+        handler = MagicMock(side_effect=ValueError('Oops'))
+
+        self.consumer.process(handler)
+        self.assertFalse(self.pipe.execute_command.called)
+        self.assertEqual(self.consumer.stats.report()['failed'], 1)
+
+        # The failed message is claimed again once the retry delay elapsed
+        self.consumer._pending_at = 0
+        self.redis.execute_command.side_effect = [
+            [['1-0', 'host-0', 30000, 1]],
+            [['1-0', ['data', json.dumps({'project': 'a'})]]],
+        ]
+        handler.side_effect = None
+        self.consumer.process(handler)
+        handler.assert_called_with([{'project': 'a'}])
+        self.assertEqual(
+            self.redis.execute_command.call_args[0],
+            ('XCLAIM', 'pagure.logcom', 'pagure-logcom', 'host-0', 30000,
+             '1-0'))
+        self.pipe.execute_command.assert_any_call(
+            'XACK', 'pagure.logcom', 'pagure-logcom', '1-0')
+
+    def test_claim(self):
+        """ Test claiming the pending messages due to be processed again,
+        whichever consumer read them. """
+        self.consumer.max_attempts = 3
+        self.redis.execute_command.side_effect = [
+            # XPENDING, as parsed by redis-py
+            [
+                {'message_id': '1-0', 'consumer': 'host-0',
+                 'time_since_delivered': 1000, 'times_delivered': 1},
+                {'message_id': '2-0', 'consumer': 'gone-0',
+                 'time_since_delivered': 700000, 'times_delivered': 1},
+                {'message_id': '3-0', 'consumer': 'gone-0',
+                 'time_since_delivered': 1000, 'times_delivered': 1},
+                {'message_id': '4-0', 'consumer': 'host-0',
+                 'time_since_delivered': 40000, 'times_delivered': 3},
+            ],
+            # XCLAIM of the messages of the other consumer
+            [('2-0', {'data': '{"project": "b"}'})],
+            # XCLAIM of the messages of this consumer
+            [('4-0', {'data': '{"project": "d"}'})],
+        ]
+
+        messages, due = self.consumer._claim()
+
+        self.assertTrue(due)
+        self.assertEqual(messages, [('2-0', {'project': 'b'})])
+        self.redis.execute_command.assert_any_call(
+            'XCLAIM', 'pagure.logcom', 'pagure-logcom', 'host-0', 600000,
+            '2-0')
+        self.redis.execute_command.assert_any_call(
+            'XCLAIM', 'pagure.logcom', 'pagure-logcom', 'host-0', 30000,
+            '4-0')
+        # The message read too many times is moved aside
+        self.pipe.execute_command.assert_any_call(
+            'XADD', 'pagure.logcom.failed', 'MAXLEN', '~', 100000, '*',
+            'data', '{"project": "d"}')
+        self.pipe.execute_command.assert_any_call(
+            'XACK', 'pagure.logcom', 'pagure-logcom', '4-0')
+
+    def test_claim_processing(self):
+        """ Test that the messages being processed are not claimed again,
+        however long they take. """
+        self.redis.execute_command.side_effect = [
+            [],
+            _reply('pagure.logcom', ('1-0', {'project': 'a'})),
+            [['1-0', 'host-0', 40000, 1]],
+        ]
+        self.consumer.read()
+        self.consumer._pending_at = 0
+
+        self.assertEqual(self.consumer._claim(), ([], False))
+        self.assertEqual(self.redis.execute_command.call_count, 3)
+
+    def test_backlog(self):
+        """ Test retrieving the number of messages waiting in a queue. """
+        self.redis.execute_command.side_effect = [
+            12, [3, '1-0', '3-0', [['host-0', '3']]]]
+        self.assertEqual(
+            pagure.lib.work_queue.backlog(
+                self.redis, 'pagure.logcom', 'pagure-logcom'),
+            {'length': 12, 'pending': 3})
+
+        self.redis.execute_command.side_effect = [
+            0, redis.exceptions.ResponseError('NOGROUP')]
+        self.assertEqual(
+            pagure.lib.work_queue.backlog(
+                self.redis, 'pagure.logcom', 'pagure-logcom'),
+            {'length': 0, 'pending': 0})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
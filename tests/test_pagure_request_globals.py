@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""
+ (c) 2017 - Copyright Red Hat Inc
+
+ Authors:
+   Pierre-Yves Chibon <pingou@pingoured.fr>
+
+"""
+
+__requires__ = ['SQLAlchemy >= 0.8']
+import pkg_resources
+
+import unittest
+import sys
+import os
+
+import flask
+from mock import MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pagure
+import pagure.request_globals
+import tests
+
+
+class PagureRequestGlobalstests(tests.Modeltests):
+    """ Tests for pagure.request_globals """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        super(PagureRequestGlobalstests, self).setUp()
+        pagure.APP.config['TESTING'] = True
+        pagure.SESSION = self.session
+        pagure.ui.SESSION = self.session
+        pagure.ui.repo.SESSION = self.session
+        pagure.request_globals.reset_report()
+
+    def test_set_lazy(self):
+        """ Test that the lazy attributes are computed once, when used. """
+        function = MagicMock(return_value='bar')
+        with pagure.APP.app_context():
+            flask.g.set_lazy('foo', function)
+            self.assertTrue('foo' in flask.g)
+            self.assertFalse(function.called)
+
+            self.assertEqual(flask.g.foo, 'bar')
+            self.assertEqual(flask.g.get('foo'), 'bar')
+            self.assertEqual(function.call_count, 1)
+
+            self.assertIsNone(flask.g.get('unknown'))
+            self.assertRaises(AttributeError, getattr, flask.g, 'unknown')
+
+            # Setting the attribute replaces the lazy value
+            flask.g.set_lazy('baz', function)
+            flask.g.baz = 'foo'
+            self.assertEqual(flask.g.baz, 'foo')
+            self.assertEqual(function.call_count, 1)
+
+    def test_report(self):
+        """ Test that the attributes computed are recorded per endpoint. """
+        tests.create_projects(self.session)
+        tests.create_projects_git(os.path.join(self.path, 'repos'), bare=True)
+        tests.add_readme_git_repo(os.path.join(self.path, 'repos', 'test.git'))
+
+        output = self.app.get('/test/raw/master')
+        self.assertEqual(output.status_code, 200)
+
+        output = self.app.get('/test')
+        self.assertEqual(output.status_code, 200)
+
+        report = pagure.request_globals.get_report()
+        self.assertEqual(
+            sorted(report), ['view_raw_file', 'view_repo'])
+
+        raw = report['view_raw_file']
+        self.assertEqual(raw['requests'], 1)
+        self.assertEqual(raw['declared']['branches'], 1)
+        self.assertEqual(raw['computed'], {'repo_obj': 1})
+
+        repo = report['view_repo']
+        self.assertEqual(repo['requests'], 1)
+        self.assertEqual(repo['computed']['repo_obj'], 1)
+        self.assertEqual(repo['computed']['branches'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
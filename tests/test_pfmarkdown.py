@@ -1,10 +1,18 @@
 import unittest
+import os
+import sys
 from xml.etree import ElementTree
 
-from mock import patch, Mock
+from mock import patch, Mock, MagicMock
 
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), '..'))
+
+import pagure
+import pagure.lib
 from pagure import pfmarkdown
 from pagure.lib import model
+import tests
 
 
 @patch('pagure.pfmarkdown.flask.url_for', Mock(return_value='http://eh/'))
@@ -51,5 +59,51 @@ class TestObjAnchorTag(unittest.TestCase):
         self.assertEqual(expected_markup, ElementTree.tostring(element))
 
 
+@patch('pagure.lib.notify.send_email', MagicMock(return_value=True))
+class TestReferences(tests.Modeltests):
+    """
+    A set of tests for the resolution of the references to issues and
+    pull-requests
+    """
+
+    def setUp(self):
+        """ Set up the environnment, ran before every tests. """
+        super(TestReferences, self).setUp()
+        pagure.SESSION = self.session
+        pagure.lib.SESSION = self.session
+
+        tests.create_projects(self.session)
+        repo = pagure.get_authorized_project(self.session, 'test')
+        for idx in range(1, 4):
+            pagure.lib.new_issue(
+                session=self.session,
+                repo=repo,
+                title='Test issue #%s' % idx,
+                content='We should work on this',
+                user='pingou',
+                ticketfolder=None,
+            )
+        self.session.commit()
+
+    def test_references_resolved_in_bulk(self):
+        """Assert the references of a document are resolved at once"""
+        text = 'See #1, #2 and #3 but not #7 nor test2#1'
+        with patch('pagure.get_authorized_project',
+                   wraps=pagure.get_authorized_project) as get_project, \
+                patch('pagure.lib.search_issues') as search_issues:
+            with pagure.APP.test_request_context('/test/issues'):
+                html = pagure.lib.text2markdown(text)
+
+        self.assertFalse(search_issues.called)
+        # Once for the project test and once for the project test2
+        self.assertEqual(get_project.call_count, 2)
+        for idx in range(1, 4):
+            self.assertIn('title="[Open] Test issue #%s"' % idx, html)
+        self.assertIn(' #7', html)
+        self.assertNotIn('/test/issue/7', html)
+        self.assertIn('test2#1', html)
+        self.assertNotIn('/test2/issue/1', html)
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -233,5 +233,63 @@ class StreamingServerTests(tests.Modeltests):
         # as it's a backup (current code will never hit it)
 
 
+class StreamingServerHelpersTests(unittest.TestCase):
+    """Tests for the helpers of the streaming server."""
+
+    def test_clients(self):
+        """Tests for the Clients class."""
+        clients = pss.Clients()
+        clients.add('uid1', 'client1')
+        clients.add('uid1', 'client2')
+        clients.add('uid2', 'client3')
+        self.assertEqual(len(clients), 3)
+        self.assertEqual(sorted(clients.get('uid1')), ['client1', 'client2'])
+        self.assertEqual(clients.get('uid3'), [])
+        self.assertEqual(clients.stats(), {'uid1': 2, 'uid2': 1})
+
+        clients.remove('uid2', 'client3')
+        clients.remove('uid3', 'client4')
+        self.assertEqual(clients.stats(), {'uid1': 2})
+
+    def test_timer_wheel(self):
+        """Tests for the TimerWheel class."""
+        wheel = pss.TimerWheel(3)
+        wheel.add('client1')
+        self.assertEqual(wheel.tick(), [])
+        wheel.add('client2')
+        self.assertEqual(wheel.tick(), [])
+        self.assertEqual(wheel.tick(), ['client1'])
+        self.assertEqual(wheel.tick(), ['client2'])
+        wheel.remove('client1')
+        self.assertEqual(wheel.tick(), [])
+        self.assertEqual(wheel.tick(), [])
+        self.assertEqual(wheel.tick(), ['client2'])
+
+    @mock.patch('pagure.SESSION')
+    @mock.patch('pagure_stream_server.get_obj_from_path')
+    def test_object_resolver(self, get_obj, session):
+        """Tests for the ObjectResolver class."""
+        get_obj.return_value = mock.MagicMock(uid='abc')
+        resolver = pss.ObjectResolver(ttl=60)
+        self.assertEqual(resolver.resolve('/test/issue/1'), 'abc')
+        self.assertEqual(resolver.resolve('/test/issue/1'), 'abc')
+        self.assertEqual(get_obj.call_count, 1)
+
+        get_obj.side_effect = PagureEvException("Issue '2' not found")
+        for _ in range(2):
+            self.assertRaisesRegexp(
+                PagureEvException,
+                r"Issue '2' not found",
+                resolver.resolve, '/test/issue/2'
+            )
+        self.assertEqual(get_obj.call_count, 2)
+
+        # Expired entries are looked up again
+        resolver.ttl = -1
+        self.assertRaises(
+            PagureEvException, resolver.resolve, '/test/issue/1')
+        self.assertEqual(get_obj.call_count, 3)
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)